@@ -10,7 +10,6 @@ from Experiment import Experiment               # Main experiment class
 from pUtil import tolog                         # Logging method that sends text to the pilot log
 from pUtil import readpar                       # Used to read values from the schedconfig DB (queuedata)
 from pUtil import isAnalysisJob                 # Is the current job a user analysis job or a production job?
-from pUtil import grep                          # Grep function - reimplement using cli command
 from pUtil import getCmtconfig                  # Get the cmtconfig from the job def or queuedata
 from pUtil import verifyReleaseString           # To verify the release string (move to Experiment later)
 from pUtil import timedCommand                  # Protect cmd with timed_command
@@ -18,11 +17,12 @@ from pUtil import getSiteInformation            # Get the SiteInformation object
 from pUtil import isBuildJob                    # Is the current job a build job?
 from pUtil import remove                        # Used to remove redundant file before log file creation
 from pUtil import isAGreaterOrEqualToB          #
-from pUtil import convert_unicode_string        # Needed to avoid unicode strings in the memory output text file
 from PilotErrors import PilotErrors             # Error codes
 from FileHandling import readFile, writeFile    # File handling methods
 from FileHandling import updatePilotErrorReport # Used to set the priority of an error
 from FileHandling import getJSONDictionary      # Used by getUtilityInfo()
+from LogScanner import scanFile                 # Single pass scanner of the payload output
+from MemoryMonitorReader import getMemoryMonitorReader # Used by getMemoryValues()
 from RunJobUtilities import dumpOutput          # ASCII dump
 from RunJobUtilities import getStdoutFilename   #
 from RunJobUtilities import findVmPeaks         #
@@ -802,7 +802,9 @@ class ATLASExperiment(Experiment):
             N = 0
             if os.path.exists(filename):
                 tolog("Processing stdout file: %s" % (filename))
-                matched_lines = grep(["events processed so far"], filename)
+                # the last match is kept by the log scanner (which only reads the output not scanned by the monitor)
+                scanner = scanFile(filename)
+                matched_lines = scanner.getMatches("events_processed") if scanner else []
                 if len(matched_lines) > 0:
                     if "events read and" in matched_lines[-1]:
                         # event #415044, run #142189 2 events read and 0 events processed so far
@@ -965,9 +967,9 @@ class ATLASExperiment(Experiment):
                 tolog("Processing stderr file: %s" % (filename))
                 if os.path.getsize(filename) > 0:
                     tolog("WARNING: %s produced stderr, will dump to log" % (job.payload))
-                    stderr_output = dumpOutput(filename)
-                    if stderr_output.find("MemoryRescueSvc") >= 0 and \
-                           stderr_output.find("FATAL out of memory: taking the application down") > 0:
+                    dumpOutput(filename)
+                    scanner = scanFile(filename)
+                    if scanner and scanner.getCount("memory_rescue") > 0 and scanner.getCount("fatal_out_of_memory") > 0:
                         out_of_memory = True
             else:
                 tolog("Warning: File %s does not exist" % (filename))
@@ -981,7 +983,8 @@ class ATLASExperiment(Experiment):
             filename = os.path.join(job.workdir, _stdout)
             if os.path.exists(filename):
                 tolog("Processing stdout file: %s" % (filename))
-                matched_lines = grep(["St9bad_alloc", "std::bad_alloc"], filename)
+                scanner = scanFile(filename)
+                matched_lines = scanner.getMatches("bad_alloc") if scanner else []
                 if len(matched_lines) > 0:
                     tolog("Identified an out of memory error in %s stdout:" % (job.payload))
                     for line in matched_lines:
@@ -992,6 +995,19 @@ class ATLASExperiment(Experiment):
 
         return out_of_memory
 
+    # Optional
+    def scanPayloadOutput(self, job, number_of_jobs=1):
+        """ Scan the payload stdout and stderr written since the last scan (used by the monitor while the payload runs) """
+
+        for name in [job.stdout, job.stderr]:
+            for i in range(number_of_jobs):
+                _name = name
+                if number_of_jobs > 1:
+                    _name = _name.replace(".txt", "_%d.txt" % (i + 1))
+                filename = os.path.join(job.workdir, _name)
+                if os.path.exists(filename):
+                    scanFile(filename)
+
     def getCacheInfo(self, m_cacheDirVer, atlasRelease):
         """ Get the cacheDir and cacheVer """
 
@@ -2145,35 +2161,8 @@ class ATLASExperiment(Experiment):
         #    "Avg":{"avgVMEM":19384236,"avgPSS":5023500,"avgRSS":6501489,"avgSwap":5964997},
         #    "Other":{"rchar":NN,"wchar":NN,"rbytes":NN,"wbytes":NN}}
 
-        maxVMEM = -1
-        maxRSS = -1
-        maxPSS = -1
-        maxSwap = -1
-        totRCHAR = -1 # tot=max
-        totWCHAR = -1
-        totRBYTES = -1
-        totWBYTES = -1
-        avgVMEM = 0
-        avgRSS = 0
-
-        avgPSS = 0
-        avgSwap = 0
-        totalVMEM = 0
-        totalRSS = 0
-        totalPSS = 0
-        totalSwap = 0
-        totalRCHAR = 0
-        totalWCHAR = 0
-        totalRBYTES = 0
-        totalWBYTES = 0
-        N = 0
         summary_dictionary = {}
 
-        rchar = None
-        wchar = None
-        rbytes = None
-        wbytes = None
-
         # Get the path to the proper memory info file (priority ordered)
         path = self.getUtilityInfoPath(workdir, pilot_initdir, allowTxtFile=True)
         if os.path.exists(path):
@@ -2185,66 +2174,13 @@ class ATLASExperiment(Experiment):
                 # Read the dictionary from the JSON file
                 summary_dictionary = getJSONDictionary(path)
             else:
-                # Loop over the output file, line by line, and look for the maximum PSS value
-                first = True
-                with open(path) as f:
-                    for line in f:
-                        # Skip the first line
-                        if first:
-                            first = False
-                            continue
-                        line = convert_unicode_string(line)
-                        if line != "":
-                            try:
-                                # Remove empty entries from list (caused by multiple \t)
-                                l = filter(None, line.split('\t'))
-                                Time = l[0]
-                                VMEM = l[1]
-                                PSS = l[2]
-                                RSS = l[3]
-                                Swap = l[4]
-                                # note: the last rchar etc values will be reported
-                                if len(l) == 9:
-                                    rchar = int(l[5])
-                                    wchar = int(l[6])
-                                    rbytes = int(l[7])
-                                    wbytes = int(l[8])
-                                else:
-                                    rchar = None
-                                    wchar = None
-                                    rbytes = None
-                                    wbytes = None
-                            except Exception, e:
-                                tolog("!!WARNING!!4542!! Unexpected format of utility output: %s (expected format: Time, VMEM, PSS, RSS, Swap [, RCHAR, WCHAR, RBYTES, WBYTES])" % (line))
-                            else:
-                                # Convert to int
-                                ec1, maxVMEM, totalVMEM = self.getMaxUtilityValue(VMEM, maxVMEM, totalVMEM)
-                                ec2, maxPSS, totalPSS = self.getMaxUtilityValue(PSS, maxPSS, totalPSS)
-                                ec3, maxRSS, totalRSS = self.getMaxUtilityValue(RSS, maxRSS, totalRSS)
-                                ec4, maxSwap, totalSwap = self.getMaxUtilityValue(Swap, maxSwap, totalSwap)
-                                if ec1 or ec2 or ec3 or ec4:
-                                    tolog("Will skip this row of numbers due to value exception: %s" % (line))
-                                else:
-                                    N += 1
-                    # Calculate averages and store all values
-                    summary_dictionary = { "Max": {}, "Avg": {}, "Other": {} }
-                    summary_dictionary["Max"] = { "maxVMEM":maxVMEM, "maxPSS":maxPSS, "maxRSS":maxRSS, "maxSwap":maxSwap }
-                    if rchar:
-                        summary_dictionary["Other"]["rchar"] = rchar
-                    if wchar:
-                        summary_dictionary["Other"]["wchar"] = wchar
-                    if rbytes:
-                        summary_dictionary["Other"]["rbytes"] = rbytes
-                    if wbytes:
-                        summary_dictionary["Other"]["wbytes"] = wbytes
-                    if N > 0:
-                        avgVMEM = int(float(totalVMEM)/float(N))
-                        avgPSS = int(float(totalPSS)/float(N))
-                        avgRSS = int(float(totalRSS)/float(N))
-                        avgSwap = int(float(totalSwap)/float(N))
-                    summary_dictionary["Avg"] = { "avgVMEM":avgVMEM, "avgPSS":avgPSS, "avgRSS":avgRSS, "avgSwap":avgSwap }
-
-                f.close()
+                # Only read the lines added since the last call (the maximums and totals are kept by the reader)
+                reader = getMemoryMonitorReader(path)
+                if reader.update():
+                    summary_dictionary = reader.getSummary()
+                    slope = reader.getPSSSlope()
+                    if slope is not None:
+                        tolog("PSS growth: %.1f kB/min (%d measurements)" % (slope*60, reader.N))
         else:
             if path == "":
                 tolog("!!WARNING!!4541!! Filename not set for utility output")
@@ -5,6 +5,7 @@ from dircache import listdir
 from glob import glob
 from pUtil import tolog
 from JobState import JobState
+from JobStateIndex import JobStateIndex
 
 class Cleaner:
     """
@@ -95,8 +96,10 @@ class Cleaner:
             tolog("Executing PanDA Pilot dir clean-up, stage 5/5")
             JS = JobState()
 
-            # grab all job state files in all work directories
-            job_state_files = glob(self.path + "/Panda_Pilot_*/jobState-*.pickle")
+            # grab the job state files not updated for longer than the time limit from the job state index of all
+            # work directories (the modification times are checked again below)
+            index = JobStateIndex(self.path)
+            job_state_files = [entry['job_state_file'] for entry in index.getStaleJobs(self.limit*3600)]
             number_of_files = len(job_state_files)
             file_number = 0
             max_cleanups = 30
@@ -122,44 +125,38 @@ class Cleaner:
                         mod_time = current_time - file_modification_time
                         if mod_time > self.limit*3600:
                             tolog("File was last modified %d seconds ago (proceed)" % (mod_time))
-                            cmd = "whoami; ls -lF %s; ls -lF %s" % (file_path, os.path.dirname(file_path))
-                            tolog("Executing command: %s" % (cmd))
-                            ec, rs = commands.getstatusoutput(cmd)
-                            if ec == 0:
-                                tolog("%s" % (rs))
-                            else:
-                                tolog("!!WARNING!!2999!! %d, %s" % (ec, rs))
 
-                            # open the job state file
-                            if JS.get(file_path):
+                            # the header of the job state file has the job state and the work dir, only read the job
+                            # state file if there is no (valid) header
+                            jobId = None
+                            header = JS.getHeader(file_path)
+                            if header:
+                                jobId, jobStatus, workdir = header['jobId'], header['state'], header['workdir']
+                            elif JS.get(file_path):
                                 # decode the job state info
                                 _job, _site, _node, _recoveryAttempt = JS.decode()
-
-                                # add member if it doesn't exist (new Job version)
-                                try:
-                                    _tmp = _job.prodSourceLabel
-                                except:
-                                    _job.prodSourceLabel = ''
-
                                 if _job and _site and _node:
-                                    # query the job state file for job information
-                                    if _job.result[0] == 'running' or _job.result[0] == 'starting' or (_job.result[0] == 'holding' and mod_time > 7*24*3600):
-                                        if _job.result[0] == 'holding':
-                                            tolog("Job %s was found in %s state but has not been modified for a long time - will be cleaned up" % (_job.jobId, _job.result[0]))
-                                        else:
-                                            tolog("Job %s was found in %s state - will be cleaned up" % (_job.jobId, _job.result[0]))
-                                        tolog("Erasing directory: %s" % (_site.workdir))
-                                        cmd = "rm -rf %s" % (_site.workdir)
-                                        try:
-                                            ec, rs = commands.getstatusoutput(cmd)
-                                        except:
-                                            tolog("!!WARNING!!5500!! Could not erase lost job workdir: %d, %s" % (ec, rs))
-                                            status = False
-                                            break
-                                        else:
-                                            tolog("Lost job workdir removed")
+                                    jobId, jobStatus, workdir = _job.jobId, _job.result[0], _site.workdir
+
+                            if jobId is not None:
+                                # query the job state file for job information
+                                if jobStatus == 'running' or jobStatus == 'starting' or (jobStatus == 'holding' and mod_time > 7*24*3600):
+                                    if jobStatus == 'holding':
+                                        tolog("Job %s was found in %s state but has not been modified for a long time - will be cleaned up" % (jobId, jobStatus))
+                                    else:
+                                        tolog("Job %s was found in %s state - will be cleaned up" % (jobId, jobStatus))
+                                    tolog("Erasing directory: %s" % (workdir))
+                                    cmd = "rm -rf %s" % (workdir)
+                                    try:
+                                        ec, rs = commands.getstatusoutput(cmd)
+                                    except:
+                                        tolog("!!WARNING!!5500!! Could not erase lost job workdir: %d, %s" % (ec, rs))
+                                        status = False
+                                        break
                                     else:
-                                        tolog("Job found in state: %s" % (_job.result[0]))
+                                        tolog("Lost job workdir removed")
+                                else:
+                                    tolog("Job found in state: %s" % (jobStatus))
                         else:
                             tolog("File was last modified %d seconds ago (skip)" % (mod_time))
             else:
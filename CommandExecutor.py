@@ -0,0 +1,346 @@
+import os
+import re
+import time
+import fcntl
+import shlex
+import errno
+import select
+import signal
+import atexit
+import threading
+import subprocess
+
+import Instrumentation
+
+class Command(object):
+    """ A command run by the CommandExecutor """
+
+    def __init__(self, cmd, timeout=None, shell=None, mergeStderr=True):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.shell = shell
+        self.mergeStderr = mergeStderr
+        self.name = ""              # name of the executable, used for the statistics
+        self.process = None
+        self.exitcode = None        # exit code, or -N if killed by signal N
+        self.stdout = ""
+        self.stderr = ""
+        self.timedOut = False
+        self.startTime = None
+        self.wallTime = None
+        self.__chunks = {'stdout': [], 'stderr': []}
+        self.__fds = {}             # fd -> (pipe, 'stdout' or 'stderr')
+        self.__killTime = None      # time of the SIGKILL after the SIGTERM of a timed out command
+        self.__done = threading.Event()
+
+    def getStatus(self):
+        """ Return the exit code as a wait status (as commands.getstatusoutput does) """
+
+        if self.exitcode is None:
+            return 256
+        if self.exitcode < 0:
+            return -self.exitcode
+        return self.exitcode << 8
+
+    def wait(self):
+        self.__done.wait()
+
+    def isDone(self):
+        return self.__done.isSet()
+
+    # the methods below are called by the executor thread
+
+    def addPipe(self, pipe, stream):
+        fd = pipe.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        self.__fds[fd] = (pipe, stream)
+
+    def fds(self):
+        return self.__fds.keys()
+
+    def read(self, fd):
+        """ Read the available output of fd, close it at the end of the output """
+
+        try:
+            data = os.read(fd, 65536)
+        except OSError, e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return
+            data = ""
+        pipe, stream = self.__fds[fd]
+        if data:
+            self.__chunks[stream].append(data)
+        else:
+            pipe.close()
+            del self.__fds[fd]
+
+    def check(self, now):
+        """ Kill the process group if the command timed out, return the time of the next check (None if there is none) """
+
+        if self.timeout is None or not self.process:
+            return None
+        if self.__killTime is None:
+            if now < self.startTime + self.timeout:
+                return self.startTime + self.timeout
+            self.timedOut = True
+            self.kill(signal.SIGTERM)
+            self.__killTime = now + 5
+        elif now >= self.__killTime:
+            self.kill(signal.SIGKILL)
+            self.__killTime = now + 5
+        return self.__killTime
+
+    def kill(self, sig):
+        """ Send sig to the process group of the command """
+
+        try:
+            os.killpg(self.process.pid, sig)
+        except OSError:
+            pass
+
+    def finish(self):
+        """ Reap the process once its output is closed, return True if it is done """
+
+        if self.__fds:
+            return False
+        if self.process:
+            exitcode = self.process.poll()
+            if exitcode is None:
+                return False
+            self.exitcode = exitcode
+        self.stdout = "".join(self.__chunks['stdout'])
+        self.stderr = "".join(self.__chunks['stderr'])
+        self.__chunks = None
+        self.wallTime = time.time() - self.startTime
+        self.__done.set()
+        return True
+
+class CommandExecutor(object):
+    """
+    Run shell commands for the whole pilot process.
+
+    A command is run without a shell when it is a plain command line (no redirection, pipe, variable or other shell
+    syntax), in its own process group with stdin from /dev/null. The output of all running commands is collected by one
+    thread polling their pipes, which also reaps the processes and kills the process group (SIGTERM, then SIGKILL
+    after 5 s) of a command reaching its timeout; the calling thread only waits for the command to be done. The wall
+    time, exit code and output size of the commands are summed by executable in self.statistics.
+    """
+
+    # shell syntax, or a shell builtin at the start of the command, needs /bin/sh
+    shellSyntax = re.compile(r"[|&;<>()$`\\\"'*?\[\]#~={}\n]")
+    shellBuiltins = set(["cd", "source", ".", "export", "ulimit", "umask", "eval", "exec", "set", "unset", "alias", "type", "wait"])
+
+    def __init__(self):
+        self.statistics = {}
+        self.__reset()
+
+    def __reset(self):
+        """ Initialize the executor state (again after a fork, the thread does not exist in the child) """
+
+        self.pid = os.getpid()
+        self.__lock = threading.Lock()
+        self.__spawnLock = threading.Lock()
+        self.__commands = []
+        self.__thread = None
+        self.__wakeup = None
+        self.__stop = False
+
+    def __start(self):
+        if self.pid != os.getpid():
+            self.__reset()
+        with self.__lock:
+            if self.__thread is None:
+                self.__wakeup = os.pipe()
+                for fd in self.__wakeup:
+                    fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+                self.__thread = threading.Thread(target=self.__loop, name="CommandExecutor")
+                self.__thread.daemon = True
+                self.__thread.start()
+
+    def __wake(self):
+        try:
+            os.write(self.__wakeup[1], "x")
+        except OSError:
+            pass
+
+    def needsShell(self, cmd):
+        """ Does the command line need a shell? """
+
+        if self.shellSyntax.search(cmd):
+            return True
+        words = cmd.split()
+        return not words or words[0] in self.shellBuiltins
+
+    def start(self, cmd, timeout=None, shell=None, mergeStderr=True):
+        """ Start a command (a string or an argument list), return the Command object """
+
+        command = Command(cmd, timeout=timeout, shell=shell, mergeStderr=mergeStderr)
+        if isinstance(cmd, basestring):
+            if command.shell is None:
+                command.shell = self.needsShell(cmd)
+            args = cmd if command.shell else shlex.split(cmd)
+        else:
+            command.shell = False
+            args = list(cmd)
+        if command.shell:
+            command.name = (cmd.split() or ["sh"])[0]
+        else:
+            command.name = os.path.basename(args[0])
+
+        self.__start()
+        command.startTime = time.time()
+        stderr = subprocess.STDOUT if mergeStderr else subprocess.PIPE
+        devnull = open(os.devnull)
+        try:
+            # commands are started one at a time, so no child inherits the pipes of another command
+            with self.__spawnLock:
+                command.process = subprocess.Popen(args, shell=command.shell, stdin=devnull, stdout=subprocess.PIPE,
+                                                   stderr=stderr, preexec_fn=os.setpgrp)
+                command.addPipe(command.process.stdout, 'stdout')
+                if not mergeStderr:
+                    command.addPipe(command.process.stderr, 'stderr')
+        except OSError, e:
+            # e.g. the executable does not exist
+            command.process = None
+            command.exitcode = 127
+            command.finish()
+            command.stdout = "%s: %s" % (command.name, e.strerror)
+            self.__record(command)
+            return command
+        finally:
+            devnull.close()
+
+        with self.__lock:
+            self.__commands.append(command)
+        self.__wake()
+        return command
+
+    def run(self, cmd, timeout=None, shell=None, mergeStderr=True):
+        """ Run a command, return the done Command object """
+
+        command = self.start(cmd, timeout=timeout, shell=shell, mergeStderr=mergeStderr)
+        command.wait()
+        return command
+
+    def __loop(self):
+        """ Executor thread: collect the output, reap and time out the commands """
+
+        wakeup = self.__wakeup[0]
+        exitChecks = 0
+        while not self.__stop:
+            with self.__lock:
+                commands = list(self.__commands)
+
+            now = time.time()
+            nextCheck = None
+            fds = {wakeup: None}
+            exiting = False
+            for command in commands:
+                t = command.check(now)
+                if t is not None and (nextCheck is None or t < nextCheck):
+                    nextCheck = t
+                for fd in command.fds():
+                    fds[fd] = command
+                if not command.fds():
+                    # output closed, the process exits
+                    exiting = True
+
+            timeout = None
+            if not exiting:
+                exitChecks = 0
+            if exiting:
+                # the process exits right after closing its output, check again soon (and less often if it does not)
+                exitChecks += 1
+                timeout = 0 if exitChecks < 50 else 0.05
+            elif nextCheck is not None:
+                timeout = max(0, nextCheck - now)
+
+            poller = select.poll()
+            for fd in fds:
+                poller.register(fd, select.POLLIN | select.POLLPRI)
+            try:
+                events = poller.poll(None if timeout is None else int(timeout * 1000))
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            if not events and timeout == 0:
+                # poll() has a millisecond resolution
+                time.sleep(0.0002)
+
+            for fd, event in events:
+                if fd == wakeup:
+                    os.read(wakeup, 4096)
+                else:
+                    fds[fd].read(fd)
+
+            for command in commands:
+                if command.finish():
+                    with self.__lock:
+                        self.__commands.remove(command)
+                    self.__record(command)
+
+    def __record(self, command):
+        """ Add the command to the statistics """
+
+        with self.__lock:
+            stat = self.statistics.setdefault(command.name, {'count': 0, 'wallTime': 0.0, 'maxWallTime': 0.0, 'failed': 0,
+                                                             'timedOut': 0, 'outputSize': 0})
+            stat['count'] += 1
+            stat['wallTime'] += command.wallTime
+            stat['maxWallTime'] = max(stat['maxWallTime'], command.wallTime)
+            stat['outputSize'] += len(command.stdout) + len(command.stderr)
+            if command.exitcode != 0:
+                stat['failed'] += 1
+            if command.timedOut:
+                stat['timedOut'] += 1
+        if Instrumentation.enabled:
+            Instrumentation.add("command.%s" % command.name, command.wallTime)
+
+    def getStatistics(self):
+        """ Return the command statistics, the executables taking the most time first """
+
+        with self.__lock:
+            return sorted([dict(name=name, **self.statistics[name]) for name in self.statistics], key=lambda s: -s['wallTime'])
+
+    def shutdown(self):
+        """ Kill the running commands and stop the executor thread (at exit) """
+
+        if self.pid != os.getpid() or self.__thread is None:
+            return
+        with self.__lock:
+            commands = list(self.__commands)
+        for command in commands:
+            command.kill(signal.SIGKILL)
+        self.__stop = True
+        self.__wake()
+        self.__thread.join(5)
+
+# the executor shared by the pilot
+executor = CommandExecutor()
+atexit.register(executor.shutdown)
+
+def getstatusoutput(cmd, timeout=None):
+    """ Replacement of commands.getstatusoutput(): return the wait status and output (without the trailing newline) """
+
+    command = executor.run(cmd, timeout=timeout)
+    output = command.stdout
+    if output.endswith('\n'):
+        output = output[:-1]
+    return command.getStatus(), output
+
+def getoutput(cmd, timeout=None):
+    """ Replacement of commands.getoutput() """
+
+    return getstatusoutput(cmd, timeout=timeout)[1]
+
+def logStatistics(tolog, n=10):
+    """ Log the statistics of the n executables taking the most time """
+
+    statistics = executor.getStatistics()
+    if not statistics:
+        return
+    tolog("Commands run by the pilot (total wall time by executable):")
+    for stat in statistics[:n]:
+        tolog("%-20s count=%d wall=%.1f s (max %.1f s) failed=%d timed out=%d output=%d B" %\
+              (stat['name'], stat['count'], stat['wallTime'], stat['maxWallTime'], stat['failed'], stat['timedOut'], stat['outputSize']))
@@ -13,7 +13,11 @@ from glob import glob
 import os, sys
 import pUtil
 import time
+import multiprocessing
 from JobState import JobState
+from FileState import FileState
+from FileStateClient import updateFileStates
+from DeferredStageoutQueue import DeferredStageoutQueue
 from JobLog import JobLog
 from Configuration import Configuration
 from PilotErrors import PilotErrors
@@ -102,6 +106,12 @@ class LockFileWrapper(object):
         return True
 
     def __exit__(self, *args):
+        self.release()
+
+    def acquire(self):
+        return self.__enter__()
+
+    def release(self):
         try:
             os.close(self.__fd)
             os.unlink(self.__name)
@@ -114,6 +124,18 @@ class LockFileWrapper(object):
             log("Released lock file: %s" % (self.__name))
 
 
+class HeldLockWrapper(object):
+    """
+    Stands in for LockFileWrapper when the caller already holds the lock.
+    """
+
+    def __enter__(self):
+        return True
+
+    def __exit__(self, *args):
+        pass
+
+
 class ReturnCode:
     OK = 0
     SkipJob = 1
@@ -202,7 +224,7 @@ def DeferredStageoutDir(deferred_stageout_dir, max_stageout_jobs=0, remove_empty
     :param remove_empty_dir:  (bool)    Remove the directory or not
                             defaults to False
 
-    Other parameters are passed into DeferredStageoutJob
+    Other parameters are passed into DrainDeferredStageoutQueue and DeferredStageoutJob
 
     :return: (integer) number of staged out jobs
     """
@@ -227,17 +249,11 @@ def DeferredStageoutDir(deferred_stageout_dir, max_stageout_jobs=0, remove_empty
         if stageout_jobs >= max_stageout_jobs > 0:
             return stageout_jobs
 
-    for job_state_file in job_state_files:
-        # increment in two steps, because maybe I'll return some other params
-        d.update({'job_state_file': job_state_file})
-        was_stageout = DeferredStageoutJob(os.path.dirname(job_state_file),
-                                           **kwargs)
-
-        if was_stageout:
-            stageout_jobs += 1
+    d.update({'max_stageout_jobs': max_stageout_jobs-stageout_jobs if max_stageout_jobs > 0 else 0})
+    stageout_jobs += DrainDeferredStageoutQueue(deferred_stageout_dir, job_state_files, **d)
 
-        if stageout_jobs >= max_stageout_jobs > 0:
-            return stageout_jobs
+    if stageout_jobs >= max_stageout_jobs > 0:
+        return stageout_jobs
 
     # if not all dirs were processed, don't remove
     # remove only if there is no dir unprocessed
@@ -261,6 +277,151 @@ def DeferredStageoutDir(deferred_stageout_dir, max_stageout_jobs=0, remove_empty
     return stageout_jobs
 
 
+def DrainDeferredStageoutQueue(deferred_stageout_dir, job_state_files, max_stageout_jobs=0, max_parallel_jobs=4,
+                               max_jobs_per_endpoint=2, **kwargs):
+    """
+    Stages out the jobs of a directory, several jobs at a time.
+    The directory is locked for the whole drain with the lock file DeferredStageoutJob takes for a single job (in the
+    parent directory of the job directory, as older pilots do), so the jobs are not staged out by two pilots at once,
+    and the stageout processes of the drain take no lock of their own.
+    The jobs are taken from the persistent queue index of the directory (see DeferredStageoutQueue), so only the
+    job state files which are new or were modified since the last pass are read. Jobs of another site or of another
+    type than the pilot are skipped without reading their job state files again. Each job is staged out by
+    DeferredStageoutJob in its own process (it changes the working directory and the pilot log file).
+
+    :param deferred_stageout_dir:   (string) directory of the jobs
+                                    mandatory parameter
+    :param job_state_files:     (list of strings) job state files of the jobs
+                                mandatory parameter
+    :param max_stageout_jobs:   (integer)   maximum stageout jobs to be finished, if zero, every job will be processed
+                                defaults to zero
+    :param max_parallel_jobs:   (integer)   number of jobs staged out at the same time, if 1 or less, the jobs are
+                                            staged out one after the other in this process
+                                defaults to 4
+    :param max_jobs_per_endpoint:   (integer)   number of jobs staged out at the same time to the same endpoint
+                                                (the first output endpoint of the job)
+                                    defaults to 2
+
+    Other parameters are passed into DeferredStageoutJob
+
+    :return: (integer) number of staged out jobs
+    """
+    dir_lock = LockFileWrapper(os.path.join(deferred_stageout_dir, jobState_file_wildcart))
+    try:
+        dir_lock.acquire()
+    except OSError, e:
+        log("Could not drain deferred stageout directory \"%s\" (locked by another pilot?): %s" %
+            (deferred_stageout_dir, e))
+        return 0
+
+    try:
+        return _DrainDeferredStageoutQueue(deferred_stageout_dir, job_state_files, max_stageout_jobs, max_parallel_jobs,
+                                           max_jobs_per_endpoint, **kwargs)
+    finally:
+        dir_lock.release()
+
+
+def _DrainDeferredStageoutQueue(deferred_stageout_dir, job_state_files, max_stageout_jobs, max_parallel_jobs,
+                                max_jobs_per_endpoint, **kwargs):
+    """
+    Does the work of DrainDeferredStageoutQueue while it holds the lock of the directory.
+    """
+    queue = DeferredStageoutQueue(deferred_stageout_dir)
+    queue.refresh(job_state_files)
+    log("Deferred stageout queue of \"%s\" has %d jobs (%d job state files read)" %
+        (deferred_stageout_dir, len(queue.entries), queue.nread))
+
+    pending = []
+    for job_state_file in queue.jobs():
+        entry = queue.entries[job_state_file]
+        if entry['sitename'] != DorE(kwargs, 'thisSite').sitename:
+            log("Job %s is not running on the same site, skipping" % entry['job_id'])
+        elif not pUtil.isSameType(entry['trf'], DorE(kwargs, 'uflag')):
+            log("Job %s is not the same type as current pilot, skipping" % entry['job_id'])
+        else:
+            pending.append(job_state_file)
+
+    t0 = time.time()
+    stageout_jobs = 0
+    finished_jobs = 0
+    running = {}        # job state file -> (process, endpoint)
+    endpoint_jobs = {}  # endpoint -> number of running jobs
+    while pending or running:
+        for job_state_file in list(pending):
+            if len(running) >= max(1, max_parallel_jobs) or stageout_jobs + len(running) >= max_stageout_jobs > 0:
+                break
+            endpoint = queue.entries[job_state_file]['endpoint']
+            if endpoint_jobs.get(endpoint, 0) >= max_jobs_per_endpoint:
+                continue
+            pending.remove(job_state_file)
+
+            if max_parallel_jobs <= 1:
+                was_stageout = StageoutQueuedJob(job_state_file, **kwargs)
+                queue.done(job_state_file, was_stageout)
+                finished_jobs += 1
+                if was_stageout:
+                    stageout_jobs += 1
+                continue
+
+            log("Starting deferred stageout of job %s (endpoint %s)" % (queue.entries[job_state_file]['job_id'], endpoint))
+            process = multiprocessing.Process(target=StageoutQueuedJobProcess, args=(job_state_file, kwargs))
+            process.start()
+            running[job_state_file] = (process, endpoint)
+            endpoint_jobs[endpoint] = endpoint_jobs.get(endpoint, 0) + 1
+
+        if not running:
+            # nothing more can be started
+            break
+
+        time.sleep(1)
+        for job_state_file, (process, endpoint) in running.items():
+            if process.is_alive():
+                continue
+            process.join()
+            del running[job_state_file]
+            endpoint_jobs[endpoint] -= 1
+            was_stageout = process.exitcode == 0
+            log("Deferred stageout process of job %s finished (exit code %s)" %
+                (queue.entries[job_state_file]['job_id'], process.exitcode))
+            queue.done(job_state_file, was_stageout)
+            queue.save()
+            finished_jobs += 1
+            if was_stageout:
+                stageout_jobs += 1
+
+    queue.save()
+    t = time.time() - t0
+    log("Deferred stageout of \"%s\": %d jobs processed, %d staged out in %d s (%.2f jobs/min)" %
+        (deferred_stageout_dir, finished_jobs, stageout_jobs, t, finished_jobs * 60. / t if t > 0 else 0))
+
+    return stageout_jobs
+
+
+def StageoutQueuedJob(job_state_file, **kwargs):
+    """
+    Stages out a job of the deferred stageout queue, catching any exception.
+
+    :return: (bool) the fact of stageout being performed
+    """
+    try:
+        return DeferredStageoutJob(os.path.dirname(job_state_file), job_state_file=job_state_file, dir_locked=True,
+                                   **kwargs)
+    except OSError, e:
+        log("Could not stage out %s (job directory locked?): %s" % (job_state_file, e))
+    except:
+        log("Failed deferred stageout of %s: %s" % (job_state_file, traceback.format_exc()))
+    return False
+
+
+def StageoutQueuedJobProcess(job_state_file, kwargs):
+    """
+    Process target of DrainDeferredStageoutQueue, exits with 0 if the job was staged out.
+    """
+    was_stageout = StageoutQueuedJob(job_state_file, **kwargs)
+    pUtil.flushLog()
+    sys.exit(0 if was_stageout else 1)
+
+
 def DeferredStageoutHPCJob(job_dir, deferred_stageout_logfile=False, **kwargs):
     """
     Performs stageing out preparation for the HPC job in specified directory.
@@ -342,7 +503,7 @@ def DeferredStageoutHPCJob(job_dir, deferred_stageout_logfile=False, **kwargs):
         return False
 
 
-def DeferredStageoutJob(job_dir, job_state_file="", deferred_stageout_logfile=False,
+def DeferredStageoutJob(job_dir, job_state_file="", deferred_stageout_logfile=False, dir_locked=False,
                         **kwargs):
     """
     Performs stageing out preparation and stages out the job in specified directory.
@@ -358,6 +519,9 @@ def DeferredStageoutJob(job_dir, job_state_file="", deferred_stageout_logfile=Fa
                                                         "log-{job_id}.txt" -> "log-124124.txt"
                                         Default False
 
+    :param dir_locked:  (bool)  the caller holds the lock of the job directory (DrainDeferredStageoutQueue)
+                        Default False
+
     Other parameters are passed into other functions
 
     :return: (bool) the fact of stageout being performed
@@ -377,7 +541,7 @@ def DeferredStageoutJob(job_dir, job_state_file="", deferred_stageout_logfile=Fa
 
     # lockfd, lockfn = createAtomicLockFile(job_dir)
 
-    with LockFileWrapper(job_dir):
+    with HeldLockWrapper() if dir_locked else LockFileWrapper(job_dir):
         if not TestJobDirForDeferredStageoutNecessity(job_dir, job_state_file, **kwargs):
             log("Job \"%s\" does not need deferred stageout procedure (yet)" % job_dir)
             # releaseAtomicLockFile(lockfd, lockfn)
@@ -775,11 +939,27 @@ def CreateTransferFileList(job_state, **kwargs):
             remaining_files = []
         filesDir = os.path.abspath(job_state.job.datadir)
 
+        # resume an interrupted stageout: the files transferred by an earlier attempt are not transferred again
+        transferred_files = getTransferredFiles(job_state.site.workdir, job_state.job.jobId, remaining_files)
+        if transferred_files:
+            log("Files already transferred: %s" % ", ".join(transferred_files))
+            remaining_files = [f for f in remaining_files if f not in transferred_files]
+            if not remaining_files:
+                pUtil.createLockFile(True, job_state.site.workdir, lockfile="ALLFILESTRANSFERRED")
+
     pUtil.chdir(currentDir)
 
     return ReturnCode.OK, logfile, filesDir, remaining_files
 
 
+def getTransferredFiles(workdir, job_id, files):
+    """
+    Returns the files which are in transferred state in the output file state dictionary of the job in workdir
+    """
+    file_state = FileState(workDir=workdir, jobId=job_id, ftype="output")
+    return [f for f in files if file_state.getFileState(f)[0] == "transferred"]
+
+
 def setGuids(job_state, files, **kwargs):
     job = job_state.job
     try:
@@ -915,6 +1095,14 @@ def TransferFiles(job_state, datadir, files, **kwargs):
     tin_1 = os.times()
     job.timeStageOut = int(round(tin_1[4] - tin_0[4]))
 
+    # the mover keeps the file states in the work dir of this pilot, copy the transferred states to the job work dir
+    # so that a later attempt does not transfer these files again
+    if os.path.abspath(thisSite.workdir) != os.path.abspath(job_state.site.workdir):
+        transferred_files = getTransferredFiles(thisSite.workdir, job.jobId, files)
+        if transferred_files:
+            updateFileStates(transferred_files, job_state.site.workdir, job.jobId, mode="file_state",
+                             state="transferred")
+
     # set the error codes in case of failure
     job.pilotErrorDiag = pilotErrorDiag
     if ec != 0:
@@ -0,0 +1,133 @@
+import os
+import json
+import time
+
+from JobState import JobState
+from pUtil import tolog
+
+class DeferredStageoutQueue(object):
+    """
+    Persistent index of the job state files found in a deferred stageout directory.
+
+    The index is a json file in the directory, keyed by job state file. An entry keeps what the scheduling
+    of the stageout needs (job id, site, job type, endpoint, job state) together with the size and modification
+    time of the job state file, so a job state file is only read again when it has changed. It also keeps
+    the number of stageout attempts and the last result. The index is only a cache: a missing or unreadable
+    index is rebuilt from the job state files.
+    """
+
+    index_name = "deferred_stageout_index.json"
+
+    def __init__(self, deferred_stageout_dir):
+        self.dir = deferred_stageout_dir
+        self.filename = os.path.join(deferred_stageout_dir, self.index_name)
+        self.entries = {}
+        self.nread = 0      # job state files read by the last refresh
+        self.load()
+
+    def load(self):
+        """ Read the index file """
+
+        try:
+            with open(self.filename) as f:
+                entries = json.load(f)
+            if type(entries) is dict:
+                self.entries = entries
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        """ Write the index file (atomically) """
+
+        tmp = "%s.%s" % (self.filename, os.getpid())
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError), e:
+            tolog("!!WARNING!!1999!! Could not write deferred stageout index %s: %s" % (self.filename, e))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return False
+        return True
+
+    def refresh(self, job_state_files):
+        """ Update the index for the given job state files, read only the new or modified ones """
+
+        self.nread = 0
+        entries = {}
+        for job_state_file in job_state_files:
+            try:
+                st = os.stat(job_state_file)
+            except OSError:
+                continue
+            entry = self.entries.get(job_state_file)
+            if entry and entry['mtime'] == st.st_mtime and entry['size'] == st.st_size:
+                entries[job_state_file] = entry
+                continue
+
+            entry = self.describe(job_state_file)
+            self.nread += 1
+            if entry is None:
+                continue
+            if job_state_file in self.entries:
+                entry['attempts'] = self.entries[job_state_file].get('attempts', 0)
+                entry['last_result'] = self.entries[job_state_file].get('last_result')
+            entry['mtime'] = st.st_mtime
+            entry['size'] = st.st_size
+            entries[job_state_file] = entry
+        self.entries = entries
+
+    def describe(self, job_state_file):
+        """ Return the index entry of the job, from the job state header if there is one """
+
+        job_state = JobState()
+        header = job_state.getHeader(job_state_file)
+        if header:
+            return {'job_id': header['jobId'],
+                    'sitename': header['sitename'],
+                    'trf': header['trf'],
+                    'endpoint': header['endpoint'] or header['sitename'],
+                    'state': header['state'],
+                    'recovery_attempt': header['recoveryAttempt'],
+                    'attempts': 0,
+                    'last_result': None}
+
+        if not job_state.get(job_state_file):
+            return None
+        job, site, node, recoveryAttempt = job_state.decode()
+        if not (job and site):
+            return None
+
+        endpoint = ""
+        for endpoints in [job.ddmEndPointOut, job.ddmEndPointLog]:
+            endpoints = filter(None, endpoints or [])
+            if endpoints:
+                endpoint = endpoints[0]
+                break
+
+        return {'job_id': str(job.jobId),
+                'sitename': site.sitename,
+                'trf': job.trf.split(",")[0],
+                'endpoint': endpoint or site.sitename,
+                'state': job.result[0],
+                'recovery_attempt': recoveryAttempt,
+                'attempts': 0,
+                'last_result': None}
+
+    def jobs(self):
+        """ Return the indexed job state files, the least tried and the oldest ones first """
+
+        return sorted(self.entries.keys(), key=lambda f: (self.entries[f]['attempts'], self.entries[f]['mtime']))
+
+    def done(self, job_state_file, result):
+        """ Record the result of a stageout attempt """
+
+        entry = self.entries.get(job_state_file)
+        if entry is None:
+            return
+        entry['attempts'] = entry.get('attempts', 0) + 1
+        entry['last_result'] = result
+        entry['last_attempt'] = int(time.time())
@@ -0,0 +1,137 @@
+import os
+import stat
+import time
+
+class DirSizeTracker(object):
+    """ Incremental disk usage of a directory tree
+
+    The first update() walks the whole tree. Later updates only list the directories whose mtime
+    changed (i.e. entries were added, removed or renamed) and re-stat the files that were recently
+    modified, which are the ones that may still be growing. Every fullScanInterval updates the
+    whole tree is walked again to catch anything else. The total is computed like 'du -sk': allocated
+    blocks of all entries including the directories, hard links counted once, rounded up to kB.
+    """
+
+    def __init__(self, path, hotWindow=3600, fullScanInterval=6):
+        self.path = path
+        self.hotWindow = hotWindow                # files modified less than this many seconds ago are re-stat'ed
+        self.fullScanInterval = fullScanInterval  # walk the whole tree every n-th update
+        self.__dirs = {}                          # dir path -> (mtime, {name: (st_dev, st_ino, blocks, size, mtime, isdir)})
+        self.__nUpdates = 0
+        self.nListed = 0                          # directories listed during the last update
+        self.nStats = 0                           # entries stat'ed during the last update
+
+    def update(self):
+        """ Refresh the tracked state and return the total size in B """
+
+        full = self.__nUpdates % self.fullScanInterval == 0
+        self.__nUpdates += 1
+        self.nListed = 0
+        self.nStats = 0
+
+        now = time.time()
+        dirs = {}
+        try:
+            self.__updateDir(self.path, os.lstat(self.path).st_mtime, dirs, full, now)
+        except OSError:
+            self.__dirs = {}
+            return 0
+        self.__dirs = dirs
+
+        return self.getSize()
+
+    def __updateDir(self, path, mtime, dirs, full, now):
+        """ Refresh the entries of directory path (with current mtime) and recurse into its subdirectories """
+
+        old = self.__dirs.get(path)
+        if full or not old or old[0] != mtime:
+            # (re)list the directory
+            self.nListed += 1
+            entries = {}
+            try:
+                names = os.listdir(path)
+            except OSError:
+                names = []
+            for name in names:
+                entry = self.__stat(os.path.join(path, name))
+                if entry:
+                    entries[name] = entry
+        else:
+            # same set of names, only the recently modified files can have changed
+            # (subdirectories are always stat'ed since their mtime tells whether to list them)
+            entries = {}
+            for name, entry in old[1].items():
+                if entry[5] or now - entry[4] < self.hotWindow:
+                    entry = self.__stat(os.path.join(path, name))
+                    if not entry:
+                        continue
+                entries[name] = entry
+        dirs[path] = (mtime, entries)
+
+        for name, entry in entries.items():
+            if entry[5]:
+                self.__updateDir(os.path.join(path, name), entry[4], dirs, full, now)
+
+    def __stat(self, path):
+        """ Return the tracked attributes of path or None if it has gone """
+
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return None
+        self.nStats += 1
+        return (st.st_dev, st.st_ino, st.st_blocks, st.st_size, st.st_mtime, stat.S_ISDIR(st.st_mode))
+
+    def getSize(self):
+        """ Return the total size in B from the last update (as du -sk, in units of kB) """
+
+        blocks = 0
+        seen = set()
+        try:
+            st = os.lstat(self.path)
+            blocks += st.st_blocks
+        except OSError:
+            pass
+        for mtime, entries in self.__dirs.values():
+            for entry in entries.values():
+                inode = (entry[0], entry[1])
+                if inode in seen:
+                    continue
+                seen.add(inode)
+                blocks += entry[2]
+
+        # 512 B blocks, rounded up to whole kB
+        return ((blocks * 512 + 1023) / 1024) * 1024
+
+    def getLargestFiles(self, n=20):
+        """ Return a list of (size, path) of the n largest files, largest first """
+
+        files = []
+        for path, (mtime, entries) in self.__dirs.items():
+            for name, entry in entries.items():
+                if not entry[5]:
+                    files.append((entry[3], os.path.join(path, name)))
+        files.sort(reverse=True)
+
+        return files[:n]
+
+    def getNumberOfFiles(self):
+        """ Return the number of tracked non-directory entries """
+
+        n = 0
+        for mtime, entries in self.__dirs.values():
+            for entry in entries.values():
+                if not entry[5]:
+                    n += 1
+        return n
+
+# one tracker per directory
+trackers = {}
+
+def getDirSizeTracker(path):
+    """ Return the tracker for path """
+
+    path = os.path.abspath(path)
+    if path not in trackers:
+        trackers[path] = DirSizeTracker(path)
+    return trackers[path]
@@ -143,11 +143,14 @@ def updateEventRangesPandaProxy(event_ranges, pandaProxySecretKey, jobId):
     """
     tolog("Updating event ranges..")
 
+    # the panda proxy has no bulk update, so the ranges are sent one by one. Stop at the first failure or
+    # kill instruction (the returned message is empty or None when the update succeeded)
+    retStatus, message = "0", ""
     for range in event_ranges:
         eventRangeId = range['eventRangeID']
         eventRangeStatus = range['eventStatus']
-        retStatus, message =  updateEventRangePandaProxy_normalized(eventRangeId, jobId, pandaProxySecretKey, eventRangeStatus)
-        if message != "":
+        retStatus, message =  updateEventRangePandaProxy_normalized(eventRangeId, jobId, pandaProxySecretKey, eventRangeStatus, range.get('objstoreID', -1))
+        if message:
             return retStatus, message
     return retStatus, message		
    
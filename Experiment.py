@@ -156,6 +156,15 @@ class Experiment(object):
 
         return False
 
+    # Optional
+    def scanPayloadOutput(self, job, number_of_jobs=1):
+        """ Scan the payload output while the payload is running """
+
+        # The monitor calls this method every ten minutes, so that the final error diagnosis (e.g. isOutOfMemory())
+        # only needs to process the output written since (see the ATLASExperiment implementation)
+
+        pass
+
     def getNumberOfEvents(self, **kwargs):
         """ Return the number of events """
 
@@ -3,6 +3,8 @@
 import os
 
 from pUtil import tolog, convert, readpar
+from DirSizeTracker import getDirSizeTracker
+from Instrumentation import timed
 
 def openFile(filename, mode):
     """ Open and return a file pointer for the given mode """
@@ -680,13 +682,25 @@ def filterSpilloverFilename(filename):
 
     return filename
 
+@timed("getDirSize")
 def getDirSize(d):
-    """ Return the size of directory d using du -sk """
+    """ Return the size of directory d (same value as du -sk, in B) """
 
     tolog("Checking size of work dir: %s" % (d))
+    size = 0
+
+    # the tracker only rescans the parts of the tree that changed since the previous call
+    try:
+        tracker = getDirSizeTracker(d)
+        size = tracker.update()
+    except Exception, e:
+        tolog("!!WARNING!!4343!! Failed to measure directory size in-process (will use du): %s" % (e))
+    else:
+        tolog("Size of directory %s: %d B (%d files, listed %d dirs, %d stats)" % (d, size, tracker.getNumberOfFiles(), tracker.nListed, tracker.nStats))
+        return size
+
     from commands import getoutput
     size_str = getoutput("du -sk %s" % (d))
-    size = 0
 
     # E.g., size_str = "900\t/scratch-local/nilsson/pilot3z"
     try:
@@ -699,6 +713,11 @@ def getDirSize(d):
 
     return size
 
+def getLargestFiles(d, n=20):
+    """ Return a list of (size, path) for the n largest files in d, as seen by the last getDirSize(d) """
+
+    return getDirSizeTracker(d).getLargestFiles(n)
+
 def addToTotalSize(path, total_size):
     """ Add the size of file with 'path' to the total size of all in/output files """
 
@@ -1,6 +1,8 @@
 import os
 import commands
 from pUtil import tolog
+from StateSnapshot import RecordLog, writeAtomic
+from Instrumentation import timed
 
 class FileState:
     """
@@ -38,6 +40,11 @@ class FileState:
 
     E.g. a file with state = "created", "not_registered" should first be transferred and then registered in the LFC.
     The file state dictionary should be created with "not_created" states as soon as the output files are known (pilot).
+
+    The dictionary is stored in the pickle file, a state update is appended to the journal <pickle file>.journal (a
+    StateSnapshot.RecordLog) instead of rewriting the pickle file. The journal is compacted into the pickle file once it
+    has more records than max(maxJournalRecords, number of files). The dictionaries read in a process are cached, the
+    next FileState object of the same file only reads the new journal records.
     The "created" states should be set after the payload has run and if the file in question were actually created.
     "transferred" should be set by the mover once the file in question has been transferred.
     "registered" should be added to the file state once the file has been registered.
@@ -47,6 +54,9 @@ class FileState:
     transfer mode).
     """
 
+    maxJournalRecords = 100
+    __cache = {}    # file name -> [pickle file id, journal, dictionary]
+
     def __init__(self, workDir, jobId="0", mode="", ftype="output", fileName=""):
         """ Default init """
 
@@ -63,8 +73,10 @@ class FileState:
         if self.mode != "":
             self.filename = self.filename.replace(".pickle", "-%s.pickle" % (self.mode))
 
+        self.journal = RecordLog(self.filename + ".journal")
+
         # load the dictionary from file if it exists
-        if os.path.exists(self.filename):
+        if os.path.exists(self.filename) or os.path.exists(self.journal.filename):
             tolog("Using file state dictionary: %s" % (self.filename))
             status = self.get()
         else:
@@ -73,6 +85,49 @@ class FileState:
     def get(self):
         """ Read job state dictionary from file """
 
+        # only read the new journal records if the dictionary is cached
+        fileId = self.getFileId()
+        cached = FileState.__cache.get(self.filename)
+        if cached and cached[0] == fileId:
+            self.journal = cached[1]
+            self.fileStateDictionary = cached[2]
+            try:
+                records = self.journal.read()
+            except ValueError, e:
+                tolog("FILESTATE FAILURE: could not read journal: %s" % str(e))
+                return False
+            if not self.journal.reset:
+                self.applyRecords(records)
+                return True
+
+        # read the pickle file and the whole journal, appends are blocked meanwhile
+        self.journal = RecordLog(self.journal.filename)
+        try:
+            status = self.journal.load(self.mergeSnapshot)
+        except (IOError, OSError, ValueError), e:
+            tolog("FILESTATE FAILURE: could not read journal: %s" % str(e))
+            status = self.readPickle()
+        self.register()
+
+        return status
+
+    def getFileId(self):
+        """ Return the inode, modification time and size of the pickle file (None if it does not exist) """
+
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime, st.st_size)
+
+    def register(self):
+        """ Cache the dictionary for the next FileState objects of the file """
+
+        FileState.__cache[self.filename] = [self.getFileId(), self.journal, self.fileStateDictionary]
+
+    def readPickle(self):
+        """ Read the file state dictionary from the pickle file """
+
         status = False
 
         # De-serialize the file state file
@@ -80,6 +135,7 @@ class FileState:
             fp = open(self.filename, "r")
         except:
             tolog("FILESTATE FAILURE: get function could not open file: %s" % self.filename)
+            self.fileStateDictionary = {}
             pass
         else:
             from pickle import load
@@ -94,7 +150,27 @@ class FileState:
             fp.close()
 
         return status
-    
+
+    def applyRecords(self, records):
+        """ Apply the journal records ([file name, state list]) to the dictionary """
+
+        for record in records:
+            try:
+                filename, state_list = record
+                self.fileStateDictionary[str(filename)] = [str(state) for state in state_list]
+            except (TypeError, ValueError):
+                tolog("FILESTATE FAILURE: bad journal record: %s" % str(record))
+
+    def mergeSnapshot(self, records):
+        """ Read the pickle file and apply the journal records (called by RecordLog.load) """
+
+        status = self.readPickle()
+        if records:
+            self.applyRecords(records)
+            status = True
+        return status
+
+    @timed("FileState.put")
     def put(self):
         """
         Create/Update the file state file
@@ -102,28 +178,44 @@ class FileState:
 
         status = False
 
-        # write pickle file
-        from pickle import dump
+        # write the dictionary to the pickle file and empty the journal
         try:
-            fp = open(self.filename, "w")
+            self.journal.compact(self.writeSnapshot)
         except Exception, e:
-            tolog("FILESTATE FAILURE: Could not open file state file: %s, %s" % (self.filename, str(e)))
+            tolog("FILESTATE FAILURE: Could not write file state file: %s, %s" % (self.filename, str(e)))
             _cmd = "whoami; ls -lF %s" % (self.filename)
             tolog("Executing command: %s" % (_cmd))
             ec, rs = commands.getstatusoutput(_cmd)
             tolog("%d, %s" % (ec, rs))
         else:
-            try:
-                # write the dictionary to file
-                dump(self.fileStateDictionary, fp)
-            except Exception, e:
-                tolog("FILESTATE FAILURE: Could not pickle data to file state file: %s, %s" % (self.filename, str(e)))
-            else:
-                status = True
-            fp.close()
-                                                                                                        
+            status = True
+        self.register()
+
         return status
 
+    def writeSnapshot(self, records, reset):
+        """ Write the dictionary to the pickle file (called by RecordLog.compact, the journal records are dropped) """
+
+        from pickle import dump
+        writeAtomic(self.filename, self.fileStateDictionary, dump=dump)
+
+    def compact(self):
+        """ Move the journal records to the pickle file """
+
+        def writeSnapshot(records, reset):
+            if reset:
+                self.readPickle()
+            self.applyRecords(records)
+            self.writeSnapshot(records, reset)
+
+        try:
+            self.journal.compact(writeSnapshot)
+        except Exception, e:
+            tolog("FILESTATE FAILURE: Could not compact file state journal: %s, %s" % (self.journal.filename, str(e)))
+            return False
+        self.register()
+        return True
+
     def getNumberOfFiles(self):
         """ Get the number of files from the file state dictionary """
 
@@ -163,11 +255,9 @@ class FileState:
 
         status = False
 
-        tolog("updateState: filename=%s" % (filename))
-        tolog("updateState: mode=%s" % (mode))
-        tolog("updateState: state=%s" % (state))
+        tolog("updateState: filename=%s, mode=%s, state=%s" % (filename, mode, state))
         # get current state list
-        state_list = self.getStateList(filename)
+        state_list = list(self.getStateList(filename))
 
         # update file state
         try:
@@ -183,9 +273,17 @@ class FileState:
             # update state list
             status = self.updateStateList(filename, state_list)
 
-        # update the file state file for every update (necessary since a failed put operation can abort everything)
+        # journal every update (necessary since a failed put operation can abort everything)
         if status:
-            status = self.put()
+            try:
+                self.journal.append([[filename, state_list]])
+            except (IOError, OSError), e:
+                tolog("FILESTATE FAILURE: Could not update file state journal: %s, %s" % (self.journal.filename, str(e)))
+                status = False
+            else:
+                self.register()
+                if self.journal.count > max(self.maxJournalRecords, len(self.fileStateDictionary)):
+                    status = self.compact()
 
         return status
 
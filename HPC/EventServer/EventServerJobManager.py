@@ -21,6 +21,7 @@ except:
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from pandayoda.yodacore import Logger
 from FileHandling import getCPUTimes
+from ProcessTree import ProcessTree
 
 from signal_block.signal_block import block_sig, unblock_sig
 
@@ -202,15 +203,15 @@ class EventServerJobManager():
     def getCPUConsumptionTimeFromProc(self):
         cpuConsumptionTime = 0L
         try:
-            CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
             if self.__child_pid:
-                self.__childProcs = []
-                self.getChildren(self.__child_pid)
+                # the process list and the CPU times come from the same /proc snapshot
+                tree = ProcessTree()
+                self.__childProcs = tree.getDescendants(self.__child_pid)
                 for process in self.__childProcs:
                     if process not in self.__child_cpuTime.keys():
                         self.__child_cpuTime[process] = 0
                 for process in self.__child_cpuTime.keys():
-                    cpuTime = self.getCPUConsumptionTimeFromProcPid(process) / CLOCK_TICKS
+                    cpuTime = tree.getCPUTime(process)
                     if cpuTime > self.__child_cpuTime[process]:
                         self.__child_cpuTime[process] = cpuTime
                     cpuConsumptionTime += self.__child_cpuTime[process]
@@ -641,37 +642,14 @@ class EventServerJobManager():
             return True
 
     def findChildProcesses(self,pid):
-        command = "/bin/ps -e --no-headers -o pid -o ppid -o fname"
-        status,output = commands.getstatusoutput(command)
-        #print "ps output: %s" % output
-
-        pieces = []
-        result = []
-        for line in output.split("\n"):
-            pieces= line.split()
-            try:
-                value=int(pieces[1])
-            except Exception,e:
-                #print "trouble interpreting ps output %s: \n %s" % (e,pieces)
-                continue
-            if value==pid:
-                try:
-                    job=int(pieces[0])
-                except ValueError,e:
-                    #print "trouble interpreting ps output %s: \n %s" % (e,pieces[0])
-                    continue
-                result.append(job)
-        return result
+        return ProcessTree().getChildren(pid)
 
     def getChildren(self, pid):
         #self.__childProcs = []
-        if pid not in self.__childProcs:
-            self.__childProcs.append(pid)
-        childProcs = self.findChildProcesses(pid)
-        for child in childProcs:
-            #print "Child Process found: %s" % child
-            #self.__childProcs.append(child)
-            self.getChildren(child)
+        # one /proc snapshot for the whole tree
+        for child in ProcessTree().getDescendants(pid):
+            if child not in self.__childProcs:
+                self.__childProcs.append(child)
 
     def killProcess(self, pid):
         self.__isKilled = True
@@ -1,309 +1,200 @@
 import os
 import json
+import time
 import sqlite3
 import datetime
 
 
+# columns of the event table
+eventColumns = ['eventRangeID', 'startEvent', 'lastEvent', 'LFN', 'GUID', 'scope', 'status', 'todump', 'output']
+
+# columns set when inserting event ranges
+insertColumns = ['eventRangeID', 'startEvent', 'lastEvent', 'LFN', 'GUID', 'scope', 'status', 'todump']
+
+
 # database class
 class Backend:
-  
+    """ SQLite backend of the Yoda event table
+
+    The connection is opened once and kept. The table is indexed on eventRangeID, status and todump,
+    event ranges are inserted and updated with executemany, and in WAL mode single updates are
+    committed in batches (every commitBatchSize changes or commitInterval seconds, and always before
+    the updates are dumped). The backup database is a periodic snapshot of the main one instead of
+    a second copy of every write.
+    """
+
     # constructor
-    def __init__(self, workingDir):
+    def __init__(self, workingDir, commitBatchSize=1000, commitInterval=10, backupInterval=600):
         self.workingDir = workingDir
         # database file name
         self.dsFileName = os.path.join(self.workingDir, './events_sqlite.db')
         self.dsFileName_backup = os.path.join(self.workingDir, './events_sqlite_backup.db')
-        # timestamp when dumping updates 
+        # timestamp when dumping updates
         self.dumpedTime = None
         self.conn = None
         self.conn_backup = None
         self.cur = None
         self.cur_backup = None
-
-    def createEventTable(self):
-        # delete file just in case
+        # batched commits
+        self.commitBatchSize = commitBatchSize
+        self.commitInterval = commitInterval
+        self.nUncommitted = 0
+        self.committedTime = time.time()
+        # backup snapshots
+        self.backupInterval = backupInterval
+        self.backupTime = None
+        self.journalMode = None
+
+    # open the connection (once)
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.dsFileName)
+            self.cur = self.conn.cursor()
+            # WAL is not available with old SQLite versions, then the default journal is used
+            self.cur.execute('''PRAGMA journal_mode = WAL''')
+            self.journalMode = str(self.cur.fetchone()[0]).lower()
+            if self.journalMode == 'wal':
+                self.cur.execute('''PRAGMA synchronous = NORMAL''')
+        return self.conn
+
+    # close the connection (pending changes are committed)
+    def close(self):
+        if self.conn is not None:
+            self.commit()
+            self.conn.close()
+            self.conn = None
+            self.cur = None
+
+    # remove the database files
+    def removeFiles(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            self.cur = None
+        for fileName in [self.dsFileName, self.dsFileName_backup]:
+            for suffix in ['', '-wal', '-shm', '-journal']:
+                try:
+                    os.remove(fileName + suffix)
+                except:
+                    pass
+
+    # commit now
+    def commit(self):
+        if self.conn is not None:
+            self.conn.commit()
+        self.nUncommitted = 0
+        self.committedTime = time.time()
+        self.backupIfNeeded()
+
+    # commit when enough changes were made or enough time has passed
+    def commitBatched(self, nChanges=1):
+        self.nUncommitted += nChanges
+        if self.journalMode != 'wal' or self.nUncommitted >= self.commitBatchSize or \
+                time.time() - self.committedTime > self.commitInterval:
+            self.commit()
+
+    # write a snapshot of the event table to the backup database
+    def backup(self):
+        if self.conn is None:
+            return
+        # the snapshot is written to a temporary file which then replaces the backup database
+        tmpFileName = self.dsFileName_backup + '.tmp'
         try:
-            os.remove(self.dsFileName)
-            os.remove(self.dsFileName_backup)
+            os.remove(tmpFileName)
         except:
             pass
-        # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        self.conn_backup = sqlite3.connect(self.dsFileName_backup)
-        # make cursor
-        self.cur = self.conn.cursor()
-        self.cur_backup = self.conn_backup.cursor()
-        #self.cur.execute('''PRAGMA journal_mode = OFF''')
-        #self.cur_backup.execute('''PRAGMA journal_mode = OFF''')
-
-        # make event table
-        sqlM  = "CREATE TABLE JEDI_Events("
-        sqlM += "eventRangeID text,"
-        sqlM += "startEvent integer,"
-        sqlM += "lastEvent integer,"
-        sqlM += "LFN text,"
-        sqlM += "GUID text,"
-        sqlM += "scope text,"
-        sqlM += "status text,"
-        sqlM += "todump integer,"
-        sqlM += "output text,"
-        sqlM  = sqlM[:-1]
-        sqlM += ")"
-        self.cur.execute(sqlM)
         self.conn.commit()
-        self.cur_backup.execute(sqlM)
-        self.conn_backup.commit()
+        self.cur.execute("ATTACH DATABASE :fileName AS snapshot", {'fileName': tmpFileName})
+        try:
+            self.cur.execute(makeCreateSQL('snapshot.JEDI_Events'))
+            self.cur.execute("INSERT INTO snapshot.JEDI_Events SELECT {0} FROM main.JEDI_Events".format(','.join(eventColumns)))
+            self.conn.commit()
+        finally:
+            self.cur.execute("DETACH DATABASE snapshot")
+        os.rename(tmpFileName, self.dsFileName_backup)
+        self.backupTime = time.time()
+
+    # take a snapshot every backupInterval seconds
+    def backupIfNeeded(self):
+        if self.backupTime is None or time.time() - self.backupTime > self.backupInterval:
+            self.backup()
+
+    # make the event table and its indexes
+    def makeTable(self):
+        self.cur.execute(makeCreateSQL('JEDI_Events'))
+        self.cur.execute("CREATE INDEX JEDI_Events_eventRangeID ON JEDI_Events(eventRangeID)")
+        self.cur.execute("CREATE INDEX JEDI_Events_status ON JEDI_Events(status)")
+        self.cur.execute("CREATE INDEX JEDI_Events_todump ON JEDI_Events(todump)")
 
-    # setup table
-    def setupEventTable(self,job,eventRangeList):
+    def createEventTable(self):
         # delete file just in case
-        try:
-            os.remove(self.dsFileName)
-            os.remove(self.dsFileName_backup)
-        except:
-            pass
+        self.removeFiles()
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
-        self.cur.execute('''PRAGMA journal_mode = OFF''')
-
-        self.conn_backup = sqlite3.connect(self.dsFileName_backup)
-        self.cur_backup = self.conn_backup.cursor()
-        self.cur_backup.execute('''PRAGMA journal_mode = OFF''')
-
+        self.connect()
         # make event table
-        sqlM  = "CREATE TABLE JEDI_Events("
-        sqlM += "eventRangeID text,"
-        sqlM += "startEvent integer,"
-        sqlM += "lastEvent integer,"
-        sqlM += "LFN text,"
-        sqlM += "GUID text,"
-        sqlM += "scope text,"
-        sqlM += "status text,"
-        sqlM += "todump integer,"
-        sqlM += "output text,"
-        sqlM  = sqlM[:-1]
-        sqlM += ")"
-        self.cur.execute(sqlM)
-        self.cur_backup.execute(sqlM)
+        self.makeTable()
+        self.commit()
 
-        # insert event ranges
-        sqlI  = "INSERT INTO JEDI_Events ("
-        sqlI += "eventRangeID,"
-        sqlI += "startEvent,"
-        sqlI += "lastEvent,"
-        sqlI += "LFN,"
-        sqlI += "GUID,"
-        sqlI += "scope,"
-        sqlI += "status,"
-        sqlI += "todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ") "
-        sqlI += "VALUES("
-        sqlI += ":eventRangeID,"
-        sqlI += ":startEvent,"
-        sqlI += ":lastEvent,"
-        sqlI += ":LFN,"
-        sqlI += ":GUID,"
-        sqlI += ":scope,"
-        sqlI += ":status,"
-        sqlI += ":todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ")"
-        for tmpDict in eventRangeList:
+    # insert event ranges with a single executemany
+    def insertRanges(self, eventRanges):
+        sqlI  = "INSERT INTO JEDI_Events ({0}) VALUES({1})".format(','.join(insertColumns), ','.join([':' + c for c in insertColumns]))
+        for tmpDict in eventRanges:
             tmpDict['status'] = 'ready'
             tmpDict['todump'] = 0
-            self.cur.execute(sqlI,tmpDict)
-            self.cur_backup.execute(sqlI,tmpDict)
-        self.conn.commit()
-        self.conn_backup.commit()
+        self.cur.executemany(sqlI, eventRanges)
+
+    # setup table
+    def setupEventTable(self,job,eventRangeList):
+        self.createEventTable()
+        # insert event ranges
+        self.insertRanges(eventRangeList)
+        self.commit()
+        self.backup()
         # return
         return
 
-
     # setup table
     def setupJobsEventTable(self,jobs, eventRangeList):
-        # delete file just in case
-        try:
-            os.remove(self.dsFileName)
-            os.remove(self.dsFileName_backup)
-        except:
-            pass
-        # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
-        self.cur.execute('''PRAGMA journal_mode = OFF''')
-
-        self.conn_backup = sqlite3.connect(self.dsFileName_backup)
-        self.cur_backup = self.conn_backup.cursor()
-        self.cur_backup.execute('''PRAGMA journal_mode = OFF''')
-
-        # make event table
-        sqlM  = "CREATE TABLE JEDI_Events("
-        sqlM += "eventRangeID text,"
-        sqlM += "startEvent integer,"
-        sqlM += "lastEvent integer,"
-        sqlM += "LFN text,"
-        sqlM += "GUID text,"
-        sqlM += "scope text,"
-        sqlM += "status text,"
-        sqlM += "todump integer,"
-        sqlM += "output text,"
-        sqlM  = sqlM[:-1]
-        sqlM += ")"
-        self.cur.execute(sqlM)
-        self.cur_backup.execute(sqlM)
-
+        self.createEventTable()
         # insert event ranges
-        sqlI  = "INSERT INTO JEDI_Events ("
-        sqlI += "eventRangeID,"
-        sqlI += "startEvent,"
-        sqlI += "lastEvent,"
-        sqlI += "LFN,"
-        sqlI += "GUID,"
-        sqlI += "scope,"
-        sqlI += "status,"
-        sqlI += "todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ") "
-        sqlI += "VALUES("
-        sqlI += ":eventRangeID,"
-        sqlI += ":startEvent,"
-        sqlI += ":lastEvent,"
-        sqlI += ":LFN,"
-        sqlI += ":GUID,"
-        sqlI += ":scope,"
-        sqlI += ":status,"
-        sqlI += ":todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ")"
         for jobid in eventRangeList:
-            for tmpDict in eventRangeList[jobid]:
-                tmpDict['status'] = 'ready'
-                tmpDict['todump'] = 0
-                self.cur.execute(sqlI,tmpDict)
-                self.cur_backup.execute(sqlI,tmpDict)
-        self.conn.commit()
-        self.conn_backup.commit()
+            self.insertRanges(eventRangeList[jobid])
+        self.commit()
+        self.backup()
         # return
         return
 
-
     def insertEventRanges(self, eventRanges):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
-
-        self.conn_backup = sqlite3.connect(self.dsFileName_backup)
-        self.cur_backup = self.conn_backup.cursor()
-
+        self.connect()
         # insert event ranges
-        sqlI  = "INSERT INTO JEDI_Events ("
-        sqlI += "eventRangeID,"
-        sqlI += "startEvent,"
-        sqlI += "lastEvent,"
-        sqlI += "LFN,"
-        sqlI += "GUID,"
-        sqlI += "scope,"
-        sqlI += "status,"
-        sqlI += "todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ") "
-        sqlI += "VALUES("
-        sqlI += ":eventRangeID,"
-        sqlI += ":startEvent,"
-        sqlI += ":lastEvent,"
-        sqlI += ":LFN,"
-        sqlI += ":GUID,"
-        sqlI += ":scope,"
-        sqlI += ":status,"
-        sqlI += ":todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ")"
-        for tmpDict in eventRanges:
-            tmpDict['status'] = 'ready'
-            tmpDict['todump'] = 0
-            self.cur.execute(sqlI,tmpDict)
-            self.cur_backup.execute(sqlI,tmpDict)
-        self.conn.commit()
-        self.conn_backup.commit()
-
+        self.insertRanges(eventRanges)
+        self.commit()
 
     def insertJobsEventRanges(self, eventRanges):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
-
-        self.conn_backup = sqlite3.connect(self.dsFileName_backup)
-        self.cur_backup = self.conn_backup.cursor()
-
+        self.connect()
         # insert event ranges
-        sqlI  = "INSERT INTO JEDI_Events ("
-        sqlI += "eventRangeID,"
-        sqlI += "startEvent,"
-        sqlI += "lastEvent,"
-        sqlI += "LFN,"
-        sqlI += "GUID,"
-        sqlI += "scope,"
-        sqlI += "status,"
-        sqlI += "todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ") "
-        sqlI += "VALUES("
-        sqlI += ":eventRangeID,"
-        sqlI += ":startEvent,"
-        sqlI += ":lastEvent,"
-        sqlI += ":LFN,"
-        sqlI += ":GUID,"
-        sqlI += ":scope,"
-        sqlI += ":status,"
-        sqlI += ":todump,"
-        sqlI  = sqlI[:-1]
-        sqlI += ")"
         for jobId in eventRanges:
-            for tmpDict in eventRanges[jobId]:
-                tmpDict['status'] = 'ready'
-                tmpDict['todump'] = 0
-                self.cur.execute(sqlI,tmpDict)
-                self.cur_backup.execute(sqlI,tmpDict)
-        self.conn.commit()
-        self.conn_backup.commit()
-
+            self.insertRanges(eventRanges[jobId])
+        self.commit()
 
     # get event ranges
     def getEventRanges(self,nRanges):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
+        self.connect()
 
         # sql to get event range
-        sqlI  = "SELECT "
-        sqlI += "eventRangeID,"
-        sqlI += "startEvent,"
-        sqlI += "lastEvent,"
-        sqlI += "LFN,"
-        sqlI += "GUID,"
-        sqlI += "scope,"
-        sqlI  = sqlI[:-1]
-        sqlI += " FROM JEDI_Events WHERE status=:status ORDER BY rowid "
+        sqlI  = "SELECT eventRangeID,startEvent,lastEvent,LFN,GUID,scope FROM JEDI_Events WHERE status=:status ORDER BY rowid LIMIT :nRanges"
         # sql to update event range
         sqlU  = "UPDATE JEDI_Events SET status=:status WHERE eventRangeID=:eventRangeID "
         # get event ranges
         varMap = {}
         varMap['status'] = 'ready'
+        varMap['nRanges'] = nRanges
         self.cur.execute(sqlI,varMap)
         retRanges = []
-        for i in range(nRanges):
-            # get one row
-            tmpRet = self.cur.fetchone()
-            if tmpRet == None:
-                break
-            eventRangeID,startEvent,lastEvent,LFN,GUID,scope = tmpRet
+        for eventRangeID,startEvent,lastEvent,LFN,GUID,scope in self.cur.fetchall():
             tmpDict = {}
             tmpDict['eventRangeID'] = eventRangeID
             tmpDict['startEvent']   = startEvent
@@ -311,32 +202,20 @@ class Backend:
             tmpDict['LFN']          = LFN
             tmpDict['GUID']         = GUID
             tmpDict['scope']        = scope
-            ## update status
-            #varMap = {}
-            #varMap['eventRangeID'] = eventRangeID
-            #varMap['status'] = 'running'
-            #self.cur.execute(sqlU,varMap)
-            #should not update cursor here. otherwise next fetchone will return None
             # append
             retRanges.append(tmpDict)
-        for retRange in retRanges:
-            varMap = {}
-            varMap['eventRangeID'] = retRange['eventRangeID']
-            varMap['status'] = 'running'
-            self.cur.execute(sqlU,varMap)
-        self.conn.commit()
+        # update status
+        self.cur.executemany(sqlU, [{'eventRangeID': r['eventRangeID'], 'status': 'running'} for r in retRanges])
+        # the ranges are handed out now, do not risk handing them out again after a restart
+        self.commit()
         # return list
         #return json.dumps(retRanges)
         return retRanges
 
-
-
     # update event range
     def updateEventRange(self,eventRangeID,eventStatus, output):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
+        self.connect()
 
         sql = "UPDATE JEDI_Events SET status=:status,todump=:todump, output=:output WHERE eventRangeID=:eventRangeID "
         varMap = {}
@@ -345,19 +224,16 @@ class Backend:
         varMap['todump']       = 1
         varMap['output']       = output
         self.cur.execute(sql,varMap)
-        self.conn.commit()
+        self.commitBatched()
         return
 
-
-
     # update event range
     def updateEventRanges(self, eventRanges):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
+        self.connect()
 
         sql = "UPDATE JEDI_Events SET status=:status,todump=:todump, output=:output WHERE eventRangeID=:eventRangeID "
+        varMaps = []
         for eventRangeID,eventStatus,output in eventRanges:
             varMap = {}
             varMap['eventRangeID'] = eventRangeID
@@ -368,27 +244,24 @@ class Backend:
             else:
                 varMap['todump']       = 0
                 varMap['output']       = ''
-            self.cur.execute(sql,varMap)
-        self.conn.commit()
+            varMaps.append(varMap)
+        self.cur.executemany(sql,varMaps)
+        self.commitBatched(len(varMaps))
         return
 
-
-
     # dump updated records
     def dumpUpdates(self,forceDump=False):
         # make connection
-        self.conn = sqlite3.connect(self.dsFileName)
-        # make cursor
-        self.cur = self.conn.cursor()
+        self.connect()
 
         timeNow = datetime.datetime.utcnow()
         # forced or first dump or enough interval
         if forceDump or self.dumpedTime == None or \
                 timeNow-self.dumpedTime > datetime.timedelta(seconds=60):
             # sql to get event ranges to be dumped
-            sqlG = "SELECT eventRangeID,status,output FROM JEDI_Events WHERE todump=:todump "
-            # sql to reset flag
-            sqlR = "UPDATE JEDI_Events SET todump=:todump WHERE eventRangeID=:eventRangeID AND status=:status"
+            sqlG = "SELECT rowid,eventRangeID,status,output FROM JEDI_Events WHERE todump=:todump "
+            # sql to reset flag (by rowid, the status index would be picked for eventRangeID and status)
+            sqlR = "UPDATE JEDI_Events SET todump=:todump WHERE rowid=:rowid AND status=:status"
             # get event ranges to be dumped
             varMap = {}
             varMap['todump'] = 1
@@ -399,18 +272,30 @@ class Backend:
                 outFileName = timeNow.strftime("%Y-%m-%d-%H-%M-%S") + '.dump'
                 outFileName = os.path.join(self.workingDir, outFileName)
                 outFile = open(outFileName,'w')
-                for eventRangeID,status,output in res:
+                for rowid,eventRangeID,status,output in res:
                     outFile.write('{0} {1} {2}\n'.format(eventRangeID,status,output))
-                    # reset flag
-                    varMap = {}
-                    varMap['todump'] = 0
-                    varMap['status'] = status
-                    varMap['eventRangeID'] = eventRangeID
-                    self.cur.execute(sqlR,varMap)
                 outFile.close()
-            self.conn.commit()
+                # reset flag
+                self.cur.executemany(sqlR, [{'todump': 0, 'status': status, 'rowid': rowid} for rowid,eventRangeID,status,output in res])
+            self.commit()
             # update timestamp
             self.dumpedTime = timeNow
         # return
         return
- 
+
+
+# sql to make the event table
+def makeCreateSQL(tableName):
+    sqlM  = "CREATE TABLE {0}(".format(tableName)
+    sqlM += "eventRangeID text,"
+    sqlM += "startEvent integer,"
+    sqlM += "lastEvent integer,"
+    sqlM += "LFN text,"
+    sqlM += "GUID text,"
+    sqlM += "scope text,"
+    sqlM += "status text,"
+    sqlM += "todump integer,"
+    sqlM += "output text,"
+    sqlM  = sqlM[:-1]
+    sqlM += ")"
+    return sqlM
@@ -1,18 +1,69 @@
-import cgi
 import os
 import sys
-import json
 import time
-import urllib
 import Queue
+import atexit
+import cPickle
+import threading
 import traceback
+import collections
 
+# requests to rank 0: from the local requesters and, when the MPI listener thread runs, from all ranks
+# items are (rank, reply queue or None for MPI, data)
 recvQueue = Queue.Queue()
-sendQueue = Queue.Queue()
+# reply queues of the local requesters
+localQueues = []
+
+# MPI tags
+TAG_MESSAGE = 0
+TAG_STOP = 1
+
+# quit when no message was received for that long
+maxIdleTime = 40 * 60
+
+
+# compact binary encoding of messages
+def encode(data):
+    return cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL)
+
+
+def decode(data):
+    return cPickle.loads(str(data))
+
+
+# send encoded data to a rank
+def sendData(comm, data, dest, tag=TAG_MESSAGE):
+    from mpi4py import MPI
+    comm.Send([data, MPI.BYTE], dest=dest, tag=tag)
+
+
+# wait for a message and receive its encoded data
+def recvData(comm, source, tag, status):
+    from mpi4py import MPI
+    comm.Probe(source=source, tag=tag, status=status)
+    buf = bytearray(status.Get_count(MPI.BYTE))
+    comm.Recv([buf, MPI.BYTE], source=status.Get_source(), tag=status.Get_tag())
+    return buf
+
+
+# responses to the requests sent together in one message
+class RequestBatch:
+
+    def __init__(self, nRequests):
+        self.responses = [None] * nRequests
+        self.nAnswered = 0
 
 
 # class to receive requests
 class Receiver:
+    """ Receive the requests of the Droids in rank 0
+
+    When MPI supports concurrent calls from several threads, a listener thread does blocking receives
+    and passes the messages to recvQueue, where the local requesters put theirs too, so that
+    receiveRequest blocks on a single queue instead of polling. Otherwise all pending MPI messages are
+    received in one pass and the polling interval grows while idle. A message may carry several
+    requests (see Requester.sendRequests): they are handed out one by one and answered together.
+    """
 
     # constructor
     def __init__(self, rank=None, nonMPIMode=False, logger=None):
@@ -35,7 +86,23 @@ class Receiver:
         # for message in rank 0
         self.hasMessage = False
         self.recvQueue = recvQueue
-        self.sendQueue = sendQueue
+        # received requests not handled yet: (rank, reply queue, method, params, batch, index in batch)
+        self.pending = collections.deque()
+        self.current = None
+        self.answered = True
+        self.lastMessageTime = time.time()
+
+        self.listener = None
+        if self.comm and self.totalRanks > 1 and MPI.Query_thread() == MPI.THREAD_MULTIPLE:
+            self.listener = threading.Thread(target=self.listen, name='YodaListener')
+            self.listener.daemon = True
+            self.listener.start()
+            # a thread blocked in a receive would hang MPI finalization
+            atexit.register(self.stopListener)
+        if self.comm is None or self.listener:
+            watchdog = threading.Thread(target=self.watch, name='YodaWatchdog')
+            watchdog.daemon = True
+            watchdog.start()
 
 
     # get rank of itself
@@ -43,88 +110,135 @@ class Receiver:
         return self.comm.Get_rank() if self.comm else self.nRank
 
 
+    # receive MPI messages in a thread
+    def listen(self):
+        from mpi4py import MPI
+        status = MPI.Status()
+        while True:
+            try:
+                data = recvData(self.comm, MPI.ANY_SOURCE, MPI.ANY_TAG, status)
+            except:
+                if self.logger:
+                    self.logger.error('failed to receive message: %s' % traceback.format_exc())
+                time.sleep(1)
+                continue
+            if status.Get_tag() == TAG_STOP:
+                break
+            self.recvQueue.put((status.Get_source(), None, data))
+
+
+    # stop the listener thread
+    def stopListener(self):
+        if self.listener and self.listener.isAlive():
+            from mpi4py import MPI
+            self.comm.Isend([bytearray(0), MPI.BYTE], dest=self.nRank, tag=TAG_STOP).Wait()
+            self.listener.join(10)
+
+
+    # wake up receiveRequest to check the idle time
+    def watch(self):
+        while True:
+            time.sleep(60)
+            if time.time() - self.lastMessageTime > maxIdleTime:
+                self.recvQueue.put(None)
+
+
+    # wait for messages, return the list of (rank, reply queue, data)
+    def fetchMessages(self):
+        messages = []
+        if self.comm is None or self.listener:
+            item = self.recvQueue.get()
+            while True:
+                if item is not None:
+                    messages.append(item)
+                try:
+                    item = self.recvQueue.get_nowait()
+                except Queue.Empty:
+                    break
+        else:
+            interval = 0.0001
+            while True:
+                while self.comm.Iprobe(source=self.selectSource, status=self.stat):
+                    data = recvData(self.comm, self.stat.Get_source(), self.stat.Get_tag(), self.stat)
+                    messages.append((self.stat.Get_source(), None, data))
+                while not self.recvQueue.empty():
+                    messages.append(self.recvQueue.get())
+                if messages or time.time() - self.lastMessageTime > maxIdleTime:
+                    break
+                time.sleep(interval)
+                interval = min(interval * 2, 0.01)
+        return messages
+
+
     # receive request
     def receiveRequest(self):
+        # a request of a batch must get a response or the whole batch is never answered
+        if not self.answered and self.current[4] is not None:
+            self.returnResponse({'StatusCode': -1, 'ErrorDiag': 'no response'})
+
         # wait for a request from any ranks
-        t1 = time.time()
-        self.hasMessage = False
-        if self.comm:
-            while not self.comm.Iprobe(source=self.selectSource,
-                                       status=self.stat):
-                if not self.recvQueue.empty():
-                    self.hasMessage = True
-                    break
-                time.sleep(0.0001)
-                if (time.time() - t1) > 40 * 60:
+        while not self.pending:
+            messages = self.fetchMessages()
+            if not messages:
+                if time.time() - self.lastMessageTime > maxIdleTime:
                     # waiting too log, should quit.
                     errMsg = 'No messages received for 40 minutes. quit'
                     return False,errMsg,None
-        else:
-            while self.recvQueue.empty():
-                time.sleep(0.0001)
-                if (time.time() - t1) > 40 * 60:
-                    # waiting too log, should quit.
-                    errMsg = 'No messages received for 40 minutes. quit'
+                continue
+            self.lastMessageTime = time.time()
+            for rank, replyQueue, reqData in messages:
+                try:
+                    # decode
+                    data = decode(reqData)
+                    if 'requests' in data:
+                        batch = RequestBatch(len(data['requests']))
+                        for index, (method, params) in enumerate(data['requests']):
+                            self.pending.append((rank, replyQueue, method, params, batch, index))
+                    else:
+                        self.pending.append((rank, replyQueue, data['method'], data['params'], None, 0))
+                except:
+                    errtype,errvalue = sys.exc_info()[:2]
+                    errMsg = 'failed to got proper request with: %s' % traceback.format_exc()
                     return False,errMsg,None
-            self.hasMessage = True
 
-        if self.hasMessage:
-            try:
-                reqData = self.recvQueue.get()
-                # self.stat.Set_source(0)
-                data = json.loads(reqData)
-                return True,data['method'],data['params']
-            except:
-                errtype,errvalue = sys.exc_info()[:2]
-                errMsg = 'failed to got proper request with: %s' % traceback.format_exc()
-                return False,errMsg,None
-        else:
-            try:
-                # get the request
-                # reqData = self.comm.recv(source=self.selectSource, status=self.stat)
-                reqData = self.comm.recv(source=self.stat.Get_source())
-                # decode
-                data = json.loads(reqData)
-                return True,data['method'],data['params']
-            except:
-                errtype,errvalue = sys.exc_info()[:2]
-                errMsg = 'failed to got proper request with: %s' % traceback.format_exc()
-                return False,errMsg,None
+        self.current = self.pending.popleft()
+        self.answered = False
+        self.hasMessage = self.current[1] is not None
+        return True,self.current[2],self.current[3]
 
 
-    # return response 
+    # return response
     def returnResponse(self,rData):
-        if self.hasMessage:
-            try:
-                #data = urllib.urlencode(rData)
-                data = json.dumps(rData)
-                self.sendQueue.put(data)
-                return True,None
-            except:
-                errtype,errvalue = sys.exc_info()[:2]
-                errMsg = 'failed to retrun response with: %s' % traceback.format_exc()
-                return False,errMsg,None
-        else:
-            try:
-                #data = urllib.urlencode(rData)
-                data = json.dumps(rData)
-                self.comm.send(data,dest=self.stat.Get_source())
+        rank, replyQueue, method, params, batch, index = self.current
+        self.answered = True
+        if batch is not None:
+            batch.responses[index] = rData
+            batch.nAnswered += 1
+            if batch.nAnswered < len(batch.responses):
                 return True,None
-            except:
-                errtype,errvalue = sys.exc_info()[:2]
-                errMsg = 'failed to retrun response with: %s' % traceback.format_exc()
-                return False,errMsg,None
+            rData = batch.responses
+        try:
+            data = encode(rData)
+            if replyQueue is not None:
+                replyQueue.put(data)
+            else:
+                sendData(self.comm, data, dest=rank)
+            return True,None
+        except:
+            errtype,errvalue = sys.exc_info()[:2]
+            errMsg = 'failed to retrun response with: %s' % traceback.format_exc()
+            return False,errMsg,None
 
 
     # get rank of the requester
     def getRequesterRank(self):
-        return self.stat.Get_source() if self.stat else self.nRank
+        return self.current[0] if self.current else self.nRank
+
 
-        
     # decrement nRank
     def decrementNumRank(self):
         self.totalRanks -= 1
-        
+
 
     # check if there is active worker rank
     def activeRanks(self):
@@ -137,11 +251,13 @@ class Receiver:
 
     def sendMessage(self, rData):
         try:
-            #data = urllib.urlencode(rData)
-            data = json.dumps(rData)
-            for i in range(1, self.totalRanks):
-                self.comm.send(data,dest=i)
-            self.sendQueue.put(data)
+            data = encode(rData)
+            if self.comm:
+                from mpi4py import MPI
+                requests = [self.comm.Isend([data, MPI.BYTE], dest=i, tag=TAG_MESSAGE) for i in range(1, self.totalRanks)]
+                MPI.Request.Waitall(requests)
+            for localQueue in localQueues:
+                localQueue.put(data)
             return True,None
         except:
             errtype,errvalue = sys.exc_info()[:2]
@@ -151,6 +267,7 @@ class Receiver:
 
     def disconnect(self):
         try:
+            self.stopListener()
             self.comm.Disconnect()
             return True,None
         except:
@@ -161,23 +278,30 @@ class Receiver:
 
 # class to send requests
 class Requester:
-    
+
     # constructor
     def __init__(self, rank=None, nonMPIMode=False, logger=None):
         self.nonMPIMode = nonMPIMode
         if not self.nonMPIMode:
             from mpi4py import MPI
             self.comm = MPI.COMM_WORLD
+            self.stat = MPI.Status()
             self.rank = 0
         else:
             self.comm = None
+            self.stat = None
 
         self.logger = logger
 
         # for message in rank 0
         self.hasMessage = False
-        self.recvQueue = sendQueue
+        self.recvQueue = Queue.Queue()
         self.sendQueue = recvQueue
+        if self.getRank() == 0:
+            localQueues.append(self.recvQueue)
+
+        # one request (or batch of requests) in flight at a time
+        self.lock = threading.Lock()
 
     # get rank of itself
     def getRank(self):
@@ -186,36 +310,29 @@ class Requester:
         return self.comm.Get_rank()
 
 
-    # send request
-    def sendRequest(self,method,params):
-        try:
-            # encode
-            data = {'method':method,
-                    'params':params}
-            reqData = json.dumps(data)
+    # send a message and wait for the answer
+    def exchange(self, data):
+        reqData = encode(data)
+        with self.lock:
             if self.getRank() == 0:
-                self.sendQueue.put(reqData)
+                self.sendQueue.put((0, self.recvQueue, reqData))
             else:
                 # send a request ro rank0
-                self.comm.send(reqData,dest=0)
+                sendData(self.comm, reqData, dest=0)
 
             while True:
                 if self.getRank() == 0:
-                    ansData = self.recvQueue.get(True, timeout=1000)
+                    ansData = self.recvQueue.get()
                 else:
                     # wait for the answer from Rank 0
-                    # while not self.comm.Iprobe(source=0):
-                    #    time.sleep(0.001)
-                    # get the answer
-                    ansData = self.comm.recv(source=0)
+                    ansData = recvData(self.comm, 0, TAG_MESSAGE, self.stat)
                 # decode
-                #answer = cgi.parse_qs(ansData)
-                answer = json.loads(ansData)
+                answer = decode(ansData)
 
                 # special handler for signal
                 # {'StatusCode':0, 'State': 'signal', 'signum': signum}
                 try:
-                    if 'StatusCode' in answer and answer['StatusCode'] == 0 and 'State' in answer and  answer['State'] == 'signal':
+                    if isinstance(answer, dict) and answer.get('StatusCode') == 0 and answer.get('State') == 'signal':
                         if self.logger:
                             self.logger.debug("Received signal messages: %s" % answer)
                         os.kill(os.getpid(), answer['signum'])
@@ -226,26 +343,46 @@ class Requester:
                     if self.logger:
                         self.logger.debug("Failed to handle signal message: %s" % traceback.format_exc())
                     break
+        return answer
+
+
+    # send request
+    def sendRequest(self,method,params):
+        try:
+            # encode
+            data = {'method':method,
+                    'params':params}
+            answer = self.exchange(data)
             return True,answer
         except:
             errtype,errvalue = sys.exc_info()[:2]
             errMsg = 'failed to send the request with mode %s: %s' % (self.nonMPIMode, traceback.format_exc())
             return False,errMsg
-            
-        
+
+
+    # send several requests in one message, the answer is the list of responses
+    def sendRequests(self,requests):
+        try:
+            data = {'requests': [(method, params) for method, params in requests]}
+            answer = self.exchange(data)
+            return True,answer
+        except:
+            errtype,errvalue = sys.exc_info()[:2]
+            errMsg = 'failed to send the requests with mode %s: %s' % (self.nonMPIMode, traceback.format_exc())
+            return False,errMsg
+
+
     def waitMessage(self):
         try:
             if self.getRank() == 0:
                 ansData = self.recvQueue.get(True, timeout=0.0001)
             else:
-                # wait for message from Rank 0
-                # if self.comm.Iprobe(source=0):
-                #    time.sleep(0.0001)
-                # get the answer
-                ansData = self.comm.Irecv(source=0)
+                # poll for message from Rank 0
+                if not self.comm.Iprobe(source=0, tag=TAG_MESSAGE):
+                    return False,'no message'
+                ansData = recvData(self.comm, 0, TAG_MESSAGE, self.stat)
             # decode
-            #answer = cgi.parse_qs(ansData)
-            answer = json.loads(ansData)
+            answer = decode(ansData)
             return True,answer
         except:
             errtype,errvalue = sys.exc_info()[:2]
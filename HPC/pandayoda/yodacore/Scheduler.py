@@ -0,0 +1,115 @@
+import collections
+
+
+# class to assign jobs to ranks
+class JobScheduler:
+    """ Job queues of Yoda
+
+    A job needing n full ranks has n slots in the full rank queue (the jobs needing most ranks first),
+    the jobs with less than a rank of events are in the small piece queue. Both are deques: ranks up to
+    lastRankForBigJobFirst take from the front (big jobs first) and fall back to the small pieces, the
+    other ranks take small pieces from the back (smallest first) and fall back to the full rank slots.
+    A job already run by a rank is skipped for that rank but stays queued for the others. When no job
+    is left, the jobs with enough ready events for more ranks are queued again as small pieces, the
+    ones with most events first.
+    """
+
+    # constructor
+    def __init__(self, lastRankForBigJobFirst, cores=10, logger=None):
+        self.lastRankForBigJobFirst = lastRankForBigJobFirst
+        self.cores = cores
+        self.logger = logger
+        # jobId -> ready event ranges
+        self.readyEventRanges = {}
+        # jobs which needs more than one rank
+        self.jobRanks = collections.deque()
+        self.totalJobRanks = 0
+        # jobs which needs less than one rank
+        self.jobRanksSmallPiece = collections.deque()
+        self.totalJobRanksSmallPiece = 0
+        # rank -> set of jobIds already scheduled to it
+        self.rankJobsTries = {}
+
+
+    def debug(self, msg):
+        if self.logger:
+            self.logger.debug(msg)
+
+
+    # queue jobs by their needed ranks
+    def addJobs(self, jobs):
+        neededRanks = {}
+        for jobId in jobs:
+            neededRanks.setdefault(jobs[jobId]['neededRanks'], []).append(jobId)
+        for key in sorted(neededRanks.keys(), reverse=True):
+            self.debug("Needed ranks %s" % key)
+            if key < 1:
+                for jobId in neededRanks[key]:
+                    self.debug("Adding %s to small piece queue" % jobId)
+                    self.totalJobRanksSmallPiece += key
+                    self.jobRanksSmallPiece.append(jobId)
+            else:
+                for jobId in neededRanks[key]:
+                    self.debug("Adding %s to full rank queue %s times" % (jobId, int(key)))
+                    self.jobRanks.extend([jobId] * int(key))
+        self.totalJobRanks = len(self.jobRanks)
+
+
+    def hasReadyEvents(self, jobId):
+        return len(self.readyEventRanges.get(jobId, [])) > 0
+
+
+    # take the first job not tried by the rank and with ready events from one end of the queue
+    def takeJob(self, queue, fromFront, tried):
+        jobId = None
+        skipped = []
+        while queue:
+            candidate = queue.popleft() if fromFront else queue.pop()
+            if candidate in tried:
+                skipped.append(candidate)
+                continue
+            if self.hasReadyEvents(candidate):
+                jobId = candidate
+                break
+        # the skipped slots are kept for the other ranks, in the same order
+        if skipped:
+            self.debug("Jobs %s already tried on the rank, will not scheduled to it again." % sorted(set(skipped)))
+            if fromFront:
+                queue.extendleft(reversed(skipped))
+            else:
+                queue.extend(reversed(skipped))
+        return jobId
+
+
+    # get a job for a rank, None if there is no job for it
+    def getJob(self, rank):
+        tried = self.rankJobsTries.setdefault(rank, set())
+        if int(rank) <= self.lastRankForBigJobFirst:
+            self.debug("Big jobs first for rank %s(<=%s the last rank for big job first)" % (rank, self.lastRankForBigJobFirst))
+            order = [(self.jobRanks, True), (self.jobRanksSmallPiece, True)]
+        else:
+            self.debug("Small jobs first for rank %s(>%s the last rank for big job first)" % (rank, self.lastRankForBigJobFirst))
+            order = [(self.jobRanksSmallPiece, False), (self.jobRanks, False)]
+        for queue, fromFront in order:
+            jobId = self.takeJob(queue, fromFront, tried)
+            if jobId is not None:
+                tried.add(jobId)
+                return jobId
+        return None
+
+
+    # queue the jobs with ready events for at least two more ranks as small pieces
+    def reschedule(self):
+        queued = set(self.jobRanksSmallPiece)
+        numEvents = {}
+        for jobId in self.readyEventRanges:
+            no = len(self.readyEventRanges[jobId])
+            self.debug("Job %s ready events %s" % (jobId, no))
+            if jobId not in queued:
+                numEvents.setdefault(no, []).append(jobId)
+        for key in sorted(numEvents.keys(), reverse=True):
+            if key < self.cores * 2:
+                break
+            for jobId in numEvents[key]:
+                self.debug("Adding job %s to small piece queue" % jobId)
+                self.jobRanksSmallPiece.append(jobId)
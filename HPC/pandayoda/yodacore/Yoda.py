@@ -1,3 +1,4 @@
+import collections
 import commands
 import datetime
 import json
@@ -15,7 +16,7 @@ from os.path import abspath as _abspath, join as _join
 
 # logging.basicConfig(filename='Yoda.log', level=logging.DEBUG)
 
-import Interaction,Database,Logger
+import Interaction,Database,Logger,Scheduler
 from signal_block.signal_block import block_sig, unblock_sig
 #from HPC import EventServer
 
@@ -76,17 +77,18 @@ class Yoda(threading.Thread):
         self.cores = 10
         self.jobs = []
 
+        # scheduler policy:
+        self.bigJobFirst = True
+        self.lastRankForBigJobFirst = int(self.getTotalRanks() * 0.9)
+        self.scheduler = Scheduler.JobScheduler(self.lastRankForBigJobFirst, logger=self.tmpLog)
+
         # jobs which needs more than one rank
-        self.jobRanks = []
+        self.jobRanks = self.scheduler.jobRanks
         self.totalJobRanks = 0
         # jobs which needs less than one rank
-        self.jobRanksSmallPiece = []
+        self.jobRanksSmallPiece = self.scheduler.jobRanksSmallPiece
         self.totalJobRanksSmallPiece = 0
-        self.rankJobsTries = {}
-
-        # scheduler policy:
-        self.bigJobFirst = True
-        self.lastRankForBigJobFirst = int(self.getTotalRanks() * 0.9)
+        self.rankJobsTries = self.scheduler.rankJobsTries
 
         self.readyEventRanges = []
         self.runningEventRanges = {}
@@ -181,8 +183,6 @@ class Yoda(threading.Thread):
     # init job ranks
     def initJobRanks(self):
         try:
-            # sort by needed ranks
-            neededRanks = {}
             for jobId in self.jobs:
                 job = self.jobs[jobId]
                 try:
@@ -190,27 +190,12 @@ class Yoda(threading.Thread):
                     if self.cores < 1:
                         self.cores = 10
                 except:
-                     self.tmpLog.debug("Rank %s: failed to get core count" % (self.rank, traceback.format_exc()))
-                if job['neededRanks'] not in neededRanks:
-                    neededRanks[job['neededRanks']] = []
-                neededRanks[job['neededRanks']].append(jobId)
-            keys = neededRanks.keys()
-            keys.sort(reverse=True)
-            for key in keys:
-                self.tmpLog.debug("Rank %s: Needed ranks %s" % (self.rank, key))
-
-                if key < 1:
-                    for jobId in neededRanks[key]:
-                        self.tmpLog.debug("Rank %s: Adding %s to small piece queue" % (self.rank, jobId))
-                        self.totalJobRanksSmallPiece += key
-                        self.jobRanksSmallPiece.append(jobId)
-                else:
-                    for jobId in neededRanks[key]:            
-                        # for i in range(int(math.ceil(key))):
-                        for i in range(int(key)):
-                            self.tmpLog.debug("Rank %s: Adding %s to full rank queue" % (self.rank, jobId))
-                            self.jobRanks.append(jobId)
-            self.totalJobRanks = len(self.jobRanks)
+                     self.tmpLog.debug("Rank %s: failed to get core count: %s" % (self.rank, traceback.format_exc()))
+            # queue by needed ranks
+            self.scheduler.cores = self.cores
+            self.scheduler.addJobs(self.jobs)
+            self.totalJobRanks = self.scheduler.totalJobRanks
+            self.totalJobRanksSmallPiece = self.scheduler.totalJobRanksSmallPiece
             self.tmpLog.debug("Rank %s: Jobs in small piece queue(one job is not enough to take the full rank) %s, total needed ranks %s" % (self.rank, self.jobRanksSmallPiece, self.totalJobRanksSmallPiece))
             self.tmpLog.debug("Rank %s: Jobs in full rank queue(one job is long enough to take the full rank) %s, total needed ranks %s" % (self.rank, self.jobRanks, self.totalJobRanks))
             return True,self.jobRanks
@@ -273,7 +258,8 @@ class Yoda(threading.Thread):
             tmpFile.close()
             # setup database
             # self.db.setupJobsEventTable(self.jobs,eventRangeList)
-            self.readyJobsEventRanges = eventRangeList
+            self.readyJobsEventRanges = dict((jobId, collections.deque(eventRangeList[jobId])) for jobId in eventRangeList)
+            self.scheduler.readyEventRanges = self.readyJobsEventRanges
             for jobId in self.readyJobsEventRanges:
                 self.runningJobsEventRanges[jobId] = {}
                 self.finishedJobsEventRanges[jobId] = []
@@ -344,27 +330,13 @@ class Yoda(threading.Thread):
     def rescheduleJobRanks(self):
         try:
             self.tmpLog.debug("Rank %s: rescheduleJobRanks" % (self.rank))
-            numEvents = {}
-            for jobId in self.readyJobsEventRanges:
-                no = len(self.readyJobsEventRanges[jobId])
-                self.tmpLog.debug("Rank %s: Job %s ready events %s"  % (self.rank, jobId, no))
-                if no not in numEvents:
-                    numEvents[len] = []
-                numEvents.append(jobId)
-            keys = numEvents.keys()
-            keys.sort(reverse=True)
-            for key in keys:
-                if key < self.cores * 2:
-                    continue
-                for jobId in numEvents[key]:
-                    #for i in range(key/self.cores):
-                    self.tmpLog.debug("Rank %s: Adding job %s to small piece queue"  % (self.rank, jobId))
-                    self.jobRanksSmallPiece.append(jobId)
+            self.scheduler.reschedule()
 
             self.tmpLog.debug("Rank %s: Jobs in small piece queue(one job is not enough to take the full rank) %s" % (self.rank, self.jobRanksSmallPiece))
             self.tmpLog.debug("Rank %s: Jobs in full rank queue(one job is long enough to take the full rank, should be empty if reaching here) %s" % (self.rank, self.jobRanks))
 
             self.printEventStatus()
+            return True,None
         except:
             errtype,errvalue = sys.exc_info()[:2]
             errMsg = 'failed to reschedule job ranks with {0}:{1}'.format(errtype.__name__,errvalue)
@@ -374,47 +346,9 @@ class Yoda(threading.Thread):
     def getJobScheduler(self,params):
         rank = params['rank']
         job = None
-        jobId = None
-        if int(rank) <= self.lastRankForBigJobFirst:
-            self.tmpLog.debug("Rank %s: Big jobs first for rank %s(<=%s the last rank for big job first)"  % (self.rank, rank, self.lastRankForBigJobFirst))
-            while len(self.jobRanks):
-                jobId = self.jobRanks.pop(0)
-                if rank in self.rankJobsTries and jobId in self.rankJobsTries[rank]:
-                    self.tmpLog.debug("Rank %s: Job %s already tried on rank %s, will not scheduled to it again."  % (self.rank, jobId, rank))
-                    continue
-                if len(self.readyJobsEventRanges[jobId]) > 0:
-                    job = self.jobs[jobId]
-                    break
-            if job is None:
-                self.tmpLog.debug("Rank %s: no available jobs in full rank queue, try to get job from small piece queue"  % (self.rank))
-                while len(self.jobRanksSmallPiece):
-                    jobId = self.jobRanksSmallPiece.pop(0)
-                    if rank in self.rankJobsTries and jobId in self.rankJobsTries[rank]:
-                        self.tmpLog.debug("Rank %s: Job %s already tried on rank %s, will not scheduled to it again."  % (self.rank, jobId, rank))
-                        continue
-                    if len(self.readyJobsEventRanges[jobId]) > 0:
-                        job = self.jobs[jobId]
-                        break
-        else:
-            self.tmpLog.debug("Rank %s: Small jobs first for rank %s(>%s the last rank for big job first)"  % (self.rank, rank, self.lastRankForBigJobFirst))
-            while len(self.jobRanksSmallPiece):
-                jobId = self.jobRanksSmallPiece.pop()
-                if rank in self.rankJobsTries and jobId in self.rankJobsTries[rank]:
-                    self.tmpLog.debug("Rank %s: Job %s already tried on rank %s, will not scheduled to it again."  % (self.rank, jobId, rank))
-                    continue
-                if len(self.readyJobsEventRanges[jobId]) > 0:
-                    job = self.jobs[jobId]
-                    break
-            if job is None:
-                while len(self.jobRanks):
-                    jobId = self.jobRanks.pop()
-                    if rank in self.rankJobsTries and jobId in self.rankJobsTries[rank]:
-                        self.tmpLog.debug("Rank %s: Job %s already tried on rank %s, will not scheduled to it again."  % (self.rank, jobId, rank))
-                        continue
-                    if len(self.readyJobsEventRanges[jobId]) > 0:
-                        job = self.jobs[jobId]
-                        break
-
+        jobId = self.scheduler.getJob(rank)
+        if jobId is not None:
+            job = self.jobs[jobId]
         return jobId, job
 
     # get job
@@ -437,9 +371,6 @@ class Yoda(threading.Thread):
             self.jobsRuningRanks[jobId].append(rank)
             if jobId not in self.jobsTimestamp:
                 self.jobsTimestamp[jobId] = {'startTime': time.time(), 'endTime': None}
-            if rank not in self.rankJobsTries:
-                self.rankJobsTries[rank] = []
-            self.rankJobsTries[rank].append(jobId)
 
         self.comm.returnResponse(res)
         self.tmpLog.debug('return response')
@@ -534,7 +465,7 @@ class Yoda(threading.Thread):
         try:
             for i in range(nRanges):
                 if len(self.readyJobsEventRanges[jobId]) > 0:
-                    eventRange = self.readyJobsEventRanges[jobId].pop(0)
+                    eventRange = self.readyJobsEventRanges[jobId].popleft()
                     eventRanges.append(eventRange)
                     self.runningJobsEventRanges[jobId][eventRange['eventRangeID']] = eventRange
                 else:
@@ -745,6 +676,12 @@ class Yoda(threading.Thread):
             #if not final:
             #    self.updateRunningEventRangesToDB()
             self.updateFinishedEventRangesToDB()
+            if final:
+                # single updates are committed in batches, flush what is pending
+                try:
+                    self.db.commit()
+                except Exception as e:
+                    self.tmpLog.debug('db.commit failed: %s' % str(e))
             self.tmpLog.debug('finished to updateEventRangesToDB')
 
 
@@ -201,9 +201,18 @@ class Droid(threading.Thread):
         #else:
         #    request = {'nRanges': nRanges}
         request = {'jobId': self.__jobId, 'nRanges': nRanges}
-        self.__tmpLog.debug("Rank %s: getEventRanges(request: %s)" % (self.__rank, request))
-        status, output = self.__comm.sendRequest('getEventRanges',request)
-        self.__tmpLog.debug("Rank %s: (status: %s, output: %s)" % (self.__rank, status, output))
+        # pipeline the pending output updates with the request
+        outputs = self.collectOutputs()
+        if outputs:
+            self.__tmpLog.debug("Rank %s: updateEventRanges(request: %s), getEventRanges(request: %s)" % (self.__rank, outputs, request))
+            status, output = self.__comm.sendRequests([('updateEventRanges', outputs), ('getEventRanges', request)])
+            self.__tmpLog.debug("Rank %s: (status: %s, output: %s)" % (self.__rank, status, output))
+            if status:
+                output = output[1]
+        else:
+            self.__tmpLog.debug("Rank %s: getEventRanges(request: %s)" % (self.__rank, request))
+            status, output = self.__comm.sendRequest('getEventRanges',request)
+            self.__tmpLog.debug("Rank %s: (status: %s, output: %s)" % (self.__rank, status, output))
         if status:
             statusCode = output["StatusCode"]
             eventRanges = output['eventRanges']
@@ -274,7 +283,8 @@ class Droid(threading.Thread):
 
         return status, message
 
-    def updateOutputs(self, signal=False, final=False):
+    def collectOutputs(self):
+        """ Take the queued outputs, report the staged out ones to PanDA and return the outputs to update in Yoda """
         outputs = []
         stagedOutpus = []
         while not self.__outputs.empty():
@@ -289,6 +299,10 @@ class Droid(threading.Thread):
             retStatus, retOutput = self.updatePandaEventRanges(stagedOutpus)
             if retStatus == 0:
                 self.__tmpLog.debug("Rank %s: updatePandaEventRanges(status: %s, output: %s)" % (self.__rank, retStatus, retOutput))
+        return outputs
+
+    def updateOutputs(self, signal=False, final=False):
+        outputs = self.collectOutputs()
         if outputs:
             self.__tmpLog.debug("Rank %s: updateEventRanges(request: %s)" % (self.__rank, outputs))
             retStatus, retOutput = self.__comm.sendRequest('updateEventRanges',outputs)
@@ -1,4 +1,3 @@
-import commands
 import datetime
 import json
 import logging
@@ -21,6 +20,7 @@ import pUtil
 from objectstoreSiteMover import objectstoreSiteMover
 from Mover import getInitialTracingReport
 from ThreadPool import ThreadPool
+from TarAppender import TarAppender
 
 class DroidStager(threading.Thread):
     def __init__(self, globalWorkingDir, localWorkingDir, outputs=None, job=None, esJobManager=None, outputDir=None, rank=None, logger=None):
@@ -51,6 +51,7 @@ class DroidStager(threading.Thread):
 
         self.__outputs = outputs
         self.__threadpool = None
+        self.__tarAppender = None
         self.setup(job)
 
     def setup(self, job):
@@ -65,6 +66,8 @@ class DroidStager(threading.Thread):
             if self.__zipFileName is None or self.__zipEventRangesName is None:
                 self.__tmpLog.debug("Rank %s: either zipFileName(%s) is None or zipEventRanagesName(%s) is None, will not use zip output" % (self.__rank, self.__zipFileName, self.__zipEventRangesName))
                 self.__yodaToZip = False
+            if self.__yodaToZip:
+                self.__tarAppender = TarAppender(self.__zipFileName, index=self.__zipEventRangesName)
             self.__copyOutputToGlobal =  job.get('copyOutputToGlobal', False)
 
             if self.__yodaToOS:
@@ -178,23 +181,15 @@ class DroidStager(threading.Thread):
             self.__tmpLog.warning("Released lock file: %s" % (lockfile_name))
 
     def zipOutputs(self, eventRangeID, eventStatus, outputs):
+        # the archive is committed by bulkZipOutputs
         try:
+            self.__tmpLog.debug("Tar/zip: adding %s to %s" % (outputs, self.__zipFileName))
+            self.__tarAppender.add(outputs, record="%s %s %s" % (eventRangeID, eventStatus, outputs))
             for filename in outputs:
-                command = "tar -rf " + self.__zipFileName + " --directory=%s %s" %(os.path.dirname(filename), os.path.basename(filename))
-                self.__tmpLog.debug("Tar/zip: %s" % (command))
-                status, ret = commands.getstatusoutput(command)
-                if status:
-                    self.__tmpLog.debug("Failed to zip %s: %s, %s" % (filename, status, ret))
-                    return status, ret
-                else:
-                    os.remove(filename)
+                os.remove(filename)
         except:
             self.__tmpLog.warning("Rank %s: Droid throws exception when zipping out: %s" % (self.__rank, traceback.format_exc()))
             return -1, "Failed to zip outputs"
-        else:
-            handler = open(self.__zipEventRangesName, "a")
-            handler.write("%s %s %s\n" % (eventRangeID, eventStatus, outputs))
-            handler.close()
         return 0, outputs
 
     def stageOut(self, eventRangeID, eventStatus, output, retries=0):
@@ -243,12 +238,17 @@ class DroidStager(threading.Thread):
                 if fd:
                     break
                 time.sleep(0.1)
-            for outputMsg in outputs:
-                try:
-                    eventRangeID, eventStatus, output = outputMsg
-                    self.stageOut(eventRangeID, eventStatus, output, retries=0)
-                except:
-                    self.__tmpLog.warning("Rank %s: error message: %s" % (self.__rank, traceback.format_exc()))
+            # other ranks may have appended to the archive since this rank held the lock
+            self.__tarAppender.begin()
+            try:
+                for outputMsg in outputs:
+                    try:
+                        eventRangeID, eventStatus, output = outputMsg
+                        self.stageOut(eventRangeID, eventStatus, output, retries=0)
+                    except:
+                        self.__tmpLog.warning("Rank %s: error message: %s" % (self.__rank, traceback.format_exc()))
+            finally:
+                self.__tarAppender.commit()
         except:
             self.__tmpLog.warning("Rank %s: error message: %s" % (self.__rank, traceback.format_exc()))
         finally:
@@ -287,6 +287,11 @@ class DroidStager(threading.Thread):
                     self.__tmpLog.warning("Rank %s: wait threadpool to finish" % (self.__rank))
                     self.__threadpool.wait_completion()
                     self.__tmpLog.warning("Rank %s: threadpool finished" % (self.__rank))
+                if self.__tarAppender:
+                    try:
+                        self.__tarAppender.close()
+                    except:
+                        self.__tmpLog.warning("Rank %s: failed to close the zip file: %s" % (self.__rank, traceback.format_exc()))
                 break
             time.sleep(1)
         self.__isFinished = True
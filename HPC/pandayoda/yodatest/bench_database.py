@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+from pandayoda.yodacore import Database
+
+# replay synthetic event range traffic against the Yoda event table:
+# insert the ranges, hand them out in chunks, report them one by one and in bulk, dump the updates
+nRanges = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+nPerRequest = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+eventRangeList = []
+for i in range(nRanges):
+    eventRangeList.append({'eventRangeID': '4000000-2880000000-%s-%s-1' % (i / 1000 + 1, i),
+                           'startEvent': i * 10,
+                           'lastEvent': i * 10 + 9,
+                           'LFN': 'EVNT.01461041._000001.pool.root.1',
+                           'GUID': 'c58cc417-f369-44d8-81b4-72a76c1f2b79',
+                           'scope': 'mc15_13TeV'})
+
+workDir = tempfile.mkdtemp()
+try:
+    db = Database.Backend(workDir)
+
+    t0 = time.time()
+    db.setupEventTable(None, eventRangeList)
+    t1 = time.time()
+    print "insert: %s ranges in %.3f s (journal_mode=%s)" % (nRanges, t1 - t0, db.journalMode)
+
+    handedOut = []
+    while True:
+        tmpList = db.getEventRanges(nPerRequest)
+        if tmpList == []:
+            break
+        handedOut += [tmpItem['eventRangeID'] for tmpItem in tmpList]
+    t2 = time.time()
+    print "getEventRanges: %s ranges in %.3f s, %s requests" % (len(handedOut), t2 - t1, (len(handedOut) + nPerRequest - 1) / nPerRequest)
+
+    random.shuffle(handedOut)
+    half = len(handedOut) / 2
+    for eventRangeID in handedOut[:half]:
+        db.updateEventRange(eventRangeID, 'finished', 'output_%s.pool.root' % eventRangeID)
+    t3 = time.time()
+    print "updateEventRange: %s ranges in %.3f s" % (half, t3 - t2)
+
+    updates = [(eventRangeID, 'finished', 'output_%s.pool.root' % eventRangeID) for eventRangeID in handedOut[half:]]
+    for i in range(0, len(updates), 100):
+        db.updateEventRanges(updates[i:i + 100])
+    t4 = time.time()
+    print "updateEventRanges: %s ranges in %.3f s" % (len(updates), t4 - t3)
+
+    db.dumpUpdates(True)
+    t5 = time.time()
+    print "dumpUpdates: %.3f s" % (t5 - t4)
+
+    db.backup()
+    t6 = time.time()
+    print "backup: %.3f s, %s B" % (t6 - t5, os.path.getsize(db.dsFileName_backup))
+    print "total: %.3f s" % (t6 - t0)
+    db.close()
+finally:
+    shutil.rmtree(workDir)
@@ -0,0 +1,102 @@
+import sys
+import time
+import threading
+from pandayoda.yodacore import Interaction
+
+# Yoda with N simulated Droids: every Droid reports the outputs of its last event ranges and asks for
+# new ones in one message, the benchmark reports the requests per second and the round trip latencies
+# usage: mpirun -n <N+1> python bench_interaction.py [rounds]
+#        python bench_interaction.py [rounds] [N]   (without MPI, the Droids are threads)
+nRounds = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+nRangesPerRequest = 4
+
+try:
+    from mpi4py import MPI
+    comm = MPI.COMM_WORLD
+    if comm.Get_size() < 2:
+        raise ImportError
+    nonMPIMode = False
+    mpirank = comm.Get_rank()
+    nDroids = comm.Get_size() - 1
+except ImportError:
+    nonMPIMode = True
+    mpirank = 0
+    nDroids = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+
+def runYoda():
+    rsv = Interaction.Receiver(nonMPIMode=nonMPIMode)
+    rsv.totalRanks = nDroids
+    nRequests = 0
+    nextRangeID = 0
+    while rsv.activeRanks():
+        tmpStat,method,params = rsv.receiveRequest()
+        if not tmpStat:
+            raise Exception(method)
+        nRequests += 1
+        if method == 'getEventRanges':
+            eventRanges = []
+            for i in range(params['nRanges']):
+                eventRanges.append({'eventRangeID': '4000000-2880000000-1-%s-1' % nextRangeID,
+                                    'startEvent': nextRangeID,
+                                    'lastEvent': nextRangeID,
+                                    'LFN': 'EVNT.01461041._000001.pool.root.1',
+                                    'GUID': 'c58cc417-f369-44d8-81b4-72a76c1f2b79',
+                                    'scope': 'mc15_13TeV'})
+                nextRangeID += 1
+            rsv.returnResponse({'StatusCode': 0, 'eventRanges': eventRanges})
+        elif method == 'finishDroid':
+            rsv.decrementNumRank()
+            rsv.returnResponse({'StatusCode': 0})
+        else:
+            rsv.returnResponse({'StatusCode': 0})
+    rsv.stopListener()
+    return nRequests
+
+
+def runDroid(latencies):
+    snd = Interaction.Requester(nonMPIMode=nonMPIMode)
+    eventRanges = []
+    for i in range(nRounds):
+        outputs = [{'eventRangeID': eventRange['eventRangeID'], 'eventStatus': 'finished',
+                    'output': '/tmp/HITS.%s.pool.root' % eventRange['eventRangeID']} for eventRange in eventRanges]
+        t0 = time.time()
+        if outputs:
+            tmpStat,res = snd.sendRequests([('updateEventRanges', outputs), ('getEventRanges', {'jobId': '1', 'nRanges': nRangesPerRequest})])
+            res = res[1]
+        else:
+            tmpStat,res = snd.sendRequest('getEventRanges', {'jobId': '1', 'nRanges': nRangesPerRequest})
+        latencies.append(time.time() - t0)
+        eventRanges = res['eventRanges']
+    snd.sendRequest('finishDroid', {'state': 'finished'})
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100.))]
+
+
+t0 = time.time()
+if nonMPIMode:
+    latencies = []
+    threads = [threading.Thread(target=runDroid, args=(latencies,)) for i in range(nDroids)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    nRequests = runYoda()
+    for thread in threads:
+        thread.join()
+elif mpirank == 0:
+    nRequests = runYoda()
+    latencies = sum(comm.gather([], root=0), [])
+else:
+    latencies = []
+    runDroid(latencies)
+    comm.gather(latencies, root=0)
+t1 = time.time()
+
+if mpirank == 0:
+    latencies.sort()
+    print "%s droids (%s), %s rounds: %s requests in %.3f s, %.1f requests/s" % (nDroids, 'threads' if nonMPIMode else 'MPI ranks', nRounds,
+                                                                             nRequests, t1 - t0, nRequests / (t1 - t0))
+    print "round trip latency [ms]: p50 %.3f, p90 %.3f, p99 %.3f, max %.3f" % (percentile(latencies, 50) * 1000, percentile(latencies, 90) * 1000,
+                                                                              percentile(latencies, 99) * 1000, latencies[-1] * 1000)
@@ -0,0 +1,61 @@
+import sys
+import time
+import random
+import collections
+from pandayoda.yodacore import Scheduler
+
+# synthetic load: nJobs jobs with up to nEvents ready event ranges each, nRanks ranks asking for jobs
+# and then for event ranges until everything is handed out
+nJobs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+nEvents = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+nRanks = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+cores = 16
+nRangesPerRequest = cores
+
+random.seed(1)
+jobs = {}
+readyEventRanges = {}
+for i in range(nJobs):
+    jobId = str(1000 + i)
+    n = random.randint(1, nEvents)
+    jobs[jobId] = {'neededRanks': n / (cores * 100.)}
+    readyEventRanges[jobId] = collections.deque({'eventRangeID': '%s-%s' % (jobId, j)} for j in xrange(n))
+totalEvents = sum(len(ranges) for ranges in readyEventRanges.values())
+
+t0 = time.time()
+scheduler = Scheduler.JobScheduler(lastRankForBigJobFirst=int(nRanks * 0.9), cores=cores)
+scheduler.readyEventRanges = readyEventRanges
+scheduler.addJobs(jobs)
+t1 = time.time()
+print "%s jobs, %s events, %s ranks: queued %s full rank slots and %s small pieces in %.3f s" % (nJobs, totalEvents, nRanks,
+                                                                                          len(scheduler.jobRanks), len(scheduler.jobRanksSmallPiece), t1 - t0)
+
+rankJobs = {}
+nGetJob = 0
+nGetEventRanges = 0
+nEventsHandedOut = 0
+active = range(nRanks)
+while active:
+    stillActive = []
+    for rank in active:
+        jobId = rankJobs.get(rank)
+        if jobId is None or not readyEventRanges[jobId]:
+            nGetJob += 1
+            jobId = scheduler.getJob(rank)
+            if jobId is None:
+                scheduler.reschedule()
+                jobId = scheduler.getJob(rank)
+            if jobId is None:
+                continue
+            rankJobs[rank] = jobId
+        nGetEventRanges += 1
+        ranges = readyEventRanges[jobId]
+        for i in range(min(nRangesPerRequest, len(ranges))):
+            ranges.popleft()
+            nEventsHandedOut += 1
+        stillActive.append(rank)
+    active = stillActive
+t2 = time.time()
+
+print "handed out %s events: %s getJob and %s getEventRanges requests in %.3f s, %.1f us per request" % (nEventsHandedOut, nGetJob, nGetEventRanges,
+                                                                                                    t2 - t1, (t2 - t1) * 1e6 / (nGetJob + nGetEventRanges))
@@ -0,0 +1,66 @@
+import collections
+from pandayoda.yodacore import Scheduler
+
+jobs = {'big':    {'neededRanks': 3},
+        'medium': {'neededRanks': 1},
+        'small':  {'neededRanks': 0.5},
+        'tiny':   {'neededRanks': 0.2}}
+readyEventRanges = {'big':    collections.deque(range(300)),
+                    'medium': collections.deque(range(100)),
+                    'small':  collections.deque(range(50)),
+                    'tiny':   collections.deque(range(19))}
+
+
+def makeScheduler():
+    scheduler = Scheduler.JobScheduler(lastRankForBigJobFirst=2, cores=10)
+    scheduler.readyEventRanges = readyEventRanges
+    scheduler.addJobs(jobs)
+    return scheduler
+
+# queues
+scheduler = makeScheduler()
+assert list(scheduler.jobRanks) == ['big', 'big', 'big', 'medium'], scheduler.jobRanks
+assert list(scheduler.jobRanksSmallPiece) == ['small', 'tiny'], scheduler.jobRanksSmallPiece
+assert scheduler.totalJobRanks == 4
+print "queues ok"
+
+# big jobs first for the low ranks, small pieces first for the others
+scheduler = makeScheduler()
+assert scheduler.getJob(1) == 'big'
+assert scheduler.getJob(5) == 'tiny'
+assert scheduler.getJob(6) == 'small'
+assert scheduler.getJob(7) == 'medium'
+assert scheduler.getJob(2) == 'big'
+print "policy ok"
+
+# a rank does not get a job it already ran, the skipped slots stay for the other ranks
+scheduler = makeScheduler()
+assert scheduler.getJob(1) == 'big'
+assert scheduler.getJob(1) == 'medium'
+assert list(scheduler.jobRanks) == ['big', 'big'], scheduler.jobRanks
+assert scheduler.getJob(2) == 'big'
+assert scheduler.rankJobsTries[1] == set(['big', 'medium'])
+print "tries ok"
+
+# jobs without ready events are not scheduled
+scheduler = makeScheduler()
+scheduler.readyEventRanges = dict(readyEventRanges)
+scheduler.readyEventRanges['big'] = collections.deque()
+assert scheduler.getJob(1) == 'medium'
+assert scheduler.getJob(2) == 'small'
+assert scheduler.getJob(3) == 'tiny'
+assert scheduler.getJob(4) is None
+print "empty jobs ok"
+
+# rescheduling queues the jobs with events for at least two more ranks, most events first
+scheduler = makeScheduler()
+scheduler.jobRanks.clear()
+scheduler.jobRanksSmallPiece.clear()
+assert scheduler.getJob(1) is None
+scheduler.reschedule()
+assert list(scheduler.jobRanksSmallPiece) == ['big', 'medium', 'small'], scheduler.jobRanksSmallPiece
+scheduler.reschedule()
+assert list(scheduler.jobRanksSmallPiece) == ['big', 'medium', 'small'], scheduler.jobRanksSmallPiece
+assert scheduler.getJob(1) == 'big'
+assert scheduler.getJob(9) == 'small'
+print "reschedule ok"
@@ -0,0 +1,245 @@
+import os
+import ssl
+import zlib
+import socket
+import select
+import urllib
+import httplib
+import urlparse
+import mimetools
+import threading
+
+# curl exit codes used to report connection level failures, so that callers of _Curl
+# see the same status values whichever implementation served the request
+CURLE_COULDNT_CONNECT = 7
+CURLE_OPERATION_TIMEDOUT = 28
+CURLE_SSL_CONNECT_ERROR = 35
+CURLE_RECV_ERROR = 56
+CURLE_SSL_CERTPROBLEM = 58
+
+# requests which are resent when the connection is lost after they were sent
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+class HttpClientError(Exception):
+    """ Raised when a request could not be sent or its response not read """
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+class HttpClient(object):
+    """ In-process HTTP(S) client with persistent connections
+
+    Idle connections are kept per (scheme, host, port, SSL settings) and reused by later
+    requests, so a series of dispatcher updates pays for a single TLS handshake.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__contexts = {}
+        self.__pid = os.getpid()
+        self.nRequests = 0
+        self.nConnections = 0
+
+    def isAvailable(self):
+        """ Can this python build verify and present certificates in-process? """
+
+        return hasattr(ssl, 'SSLContext')
+
+    def __checkFork(self):
+        """ Do not share sockets with the parent after a fork """
+
+        if self.__pid != os.getpid():
+            self.__lock = threading.Lock()
+            self.__idle = {}
+            self.__pid = os.getpid()
+
+    def __getContext(self, sslCert, sslKey, sslCertDir, verifyHost, tlsv1):
+        """ Return a (cached) SSL context for the given settings """
+
+        key = (sslCert, sslKey, sslCertDir, verifyHost, tlsv1)
+        context = self.__contexts.get(key)
+        if context is None:
+            if tlsv1:
+                context = ssl.SSLContext(ssl.PROTOCOL_TLSv1)
+            else:
+                context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+                context.options |= ssl.OP_NO_SSLv2
+                context.options |= ssl.OP_NO_SSLv3
+            if verifyHost:
+                context.verify_mode = ssl.CERT_REQUIRED
+                context.check_hostname = True
+                # same as curl --capath <dir> --cacert <proxy>
+                if sslCertDir != '':
+                    context.load_verify_locations(capath=sslCertDir)
+                if sslCert != '':
+                    context.load_verify_locations(cafile=sslCert)
+                if sslCertDir == '' and sslCert == '':
+                    context.load_default_certs()
+            else:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            if sslCert != '':
+                context.load_cert_chain(sslCert, keyfile=sslKey or None)
+            self.__contexts[key] = context
+        return context
+
+    def __acquire(self, key):
+        """ Return an idle connection for key, or None """
+
+        self.__lock.acquire()
+        try:
+            self.__checkFork()
+            connections = self.__idle.get(key)
+            while connections:
+                connection = connections.pop()
+                # an idle connection is readable when the server has closed it
+                try:
+                    closed = connection.sock is None or select.select([connection.sock], [], [], 0)[0]
+                except (select.error, socket.error, ValueError):
+                    closed = True
+                if not closed:
+                    return connection
+                connection.close()
+        finally:
+            self.__lock.release()
+        return None
+
+    def __release(self, key, connection):
+        """ Keep connection for reuse """
+
+        self.__lock.acquire()
+        try:
+            self.__checkFork()
+            self.__idle.setdefault(key, []).append(connection)
+        finally:
+            self.__lock.release()
+
+    def closeAll(self):
+        """ Close all idle connections """
+
+        self.__lock.acquire()
+        try:
+            for connections in self.__idle.values():
+                for connection in connections:
+                    try:
+                        connection.close()
+                    except:
+                        pass
+            self.__idle = {}
+        finally:
+            self.__lock.release()
+
+    def request(self, method, url, body=None, headers=None, timeout=None, sslCert='', sslKey='', sslCertDir='', verifyHost=True, tlsv1=False, compress=True):
+        """ Send a request and return (HTTP status, response body) """
+
+        parsed = urlparse.urlsplit(url)
+        scheme = parsed.scheme.lower()
+        host = parsed.hostname
+        port = parsed.port
+        if scheme == 'https':
+            port = port or httplib.HTTPS_PORT
+            key = (scheme, host, port, sslCert, sslKey, sslCertDir, verifyHost, tlsv1)
+        else:
+            port = port or httplib.HTTP_PORT
+            key = (scheme, host, port)
+        selector = parsed.path or '/'
+        if parsed.query:
+            selector += '?' + parsed.query
+
+        _headers = {'User-Agent': 'PanDA Pilot', 'Connection': 'keep-alive'}
+        if compress:
+            _headers['Accept-Encoding'] = 'gzip, deflate'
+        if headers:
+            _headers.update(headers)
+
+        # a reused connection may have been closed by the server in the meantime, in which case the request is
+        # retried on a fresh connection if it could not be sent; once sent, only requests which can safely be
+        # repeated are, since the server may have processed it (e.g. a POST of a job update)
+        connection = self.__acquire(key)
+        while True:
+            reused = connection is not None
+            sent = False
+            if connection is None:
+                if scheme == 'https':
+                    try:
+                        context = self.__getContext(sslCert, sslKey, sslCertDir, verifyHost, tlsv1)
+                    except (ssl.SSLError, IOError), e:
+                        raise HttpClientError(CURLE_SSL_CERTPROBLEM, "Could not set up SSL context: %s" % (e))
+                try:
+                    if scheme == 'https':
+                        connection = httplib.HTTPSConnection(host, port, timeout=timeout, context=context)
+                    else:
+                        connection = httplib.HTTPConnection(host, port, timeout=timeout)
+                    connection.connect()
+                except socket.timeout, e:
+                    raise HttpClientError(CURLE_OPERATION_TIMEDOUT, "Connection to %s:%s timed out: %s" % (host, port, e))
+                except ssl.SSLError, e:
+                    raise HttpClientError(CURLE_SSL_CONNECT_ERROR, "SSL connect error for %s:%s: %s" % (host, port, e))
+                except (socket.error, IOError), e:
+                    raise HttpClientError(CURLE_COULDNT_CONNECT, "Could not connect to %s:%s: %s" % (host, port, e))
+                self.nConnections += 1
+            else:
+                connection.sock.settimeout(timeout)
+
+            try:
+                connection.request(method, selector, body, _headers)
+                sent = True
+                response = connection.getresponse()
+                data = response.read()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, httplib.ResponseNotReady, socket.error), e:
+                connection.close()
+                connection = None
+                if reused and not isinstance(e, socket.timeout) and (not sent or method in IDEMPOTENT_METHODS):
+                    continue
+                if isinstance(e, socket.timeout):
+                    raise HttpClientError(CURLE_OPERATION_TIMEDOUT, "Request to %s timed out" % (url))
+                raise HttpClientError(CURLE_RECV_ERROR, "Request to %s failed: %s" % (url, e))
+            break
+
+        self.nRequests += 1
+        if response.will_close:
+            connection.close()
+        else:
+            self.__release(key, connection)
+
+        encoding = (response.getheader('content-encoding') or '').lower()
+        if encoding == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                data = zlib.decompress(data, -zlib.MAX_WBITS)
+
+        return response.status, data
+
+def encodeFormData(data):
+    """ Encode a dictionary as application/x-www-form-urlencoded, one field per key (as curl --data) """
+
+    return '&'.join([urllib.urlencode({key: data[key]}) for key in data.keys()])
+
+def encodeMultipartFiles(files):
+    """ Encode {field: filename} as multipart/form-data with the file contents (as curl -F field=@file) """
+
+    boundary = mimetools.choose_boundary()
+    parts = []
+    for field in files.keys():
+        filename = files[field]
+        f = open(filename, 'rb')
+        try:
+            content = f.read()
+        finally:
+            f.close()
+        parts.append('--%s' % boundary)
+        parts.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (field, os.path.basename(filename)))
+        parts.append('Content-Type: application/octet-stream')
+        parts.append('')
+        parts.append(content)
+    parts.append('--%s--' % boundary)
+    parts.append('')
+    return 'multipart/form-data; boundary=%s' % boundary, '\r\n'.join(parts)
+
+# Process wide client used by pUtil._Curl
+httpClient = HttpClient()
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import functools
+import threading
+
+from StateSnapshot import writeAtomic
+
+# timers and counters of the pilot overhead, aggregated by name
+#
+#   with Instrumentation.timer("stagein"):        time a block
+#   @Instrumentation.timed("readpar")               time every call of a function
+#   Instrumentation.count("curl.bytes", len(data))  count something
+#
+# Profiling is switched on with the PILOT_PROFILE environment variable (inherited by runJob) or the schedconfig
+# catchall pilot_profile (see configure()). When it is off, timer() returns a shared no-op context manager and a
+# timed function only tests a module flag before calling the function.
+
+PROFILE_NAME = "pilot_profile.json"
+PROFILE_VERSION = 1
+
+enabled = os.environ.get("PILOT_PROFILE", "").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_timers = {}       # name -> [count, total time, max time]
+_counters = {}     # name -> value
+
+def add(name, seconds):
+    """ Add a measured time to the timer name """
+
+    with _lock:
+        t = _timers.get(name)
+        if t is None:
+            _timers[name] = [1, seconds, seconds]
+        else:
+            t[0] += 1
+            t[1] += seconds
+            if seconds > t[2]:
+                t[2] = seconds
+
+def count(name, value=1):
+    """ Add value to the counter name """
+
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_nullTimer = _NullTimer()
+
+class _Timer(object):
+    __slots__ = ('name', 't0')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        add(self.name, time.time() - self.t0)
+        return False
+
+def timer(name):
+    """ Return a context manager adding the time spent in the block to the timer name """
+
+    if not enabled:
+        return _nullTimer
+    return _Timer(name)
+
+def timed(name=None):
+    """ Decorator adding the time spent in each call to the timer name (the function name by default) """
+
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            t0 = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(label, time.time() - t0)
+        return wrapper
+    return decorator
+
+def configure(catchall=""):
+    """ Switch profiling on if the catchall contains pilot_profile (also for the runJob processes started later) """
+
+    global enabled
+    if "pilot_profile" in catchall.split(","):
+        enabled = True
+        os.environ["PILOT_PROFILE"] = "1"
+    return enabled
+
+def getProfile():
+    """ Return the timers and counters as a profile dictionary """
+
+    with _lock:
+        timers = dict([(name, {'count': t[0], 'time': t[1], 'max': t[2]}) for name, t in _timers.items()])
+        counters = dict(_counters)
+    return {'version': PROFILE_VERSION, 'timers': timers, 'counters': counters}
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+def merge(profile, other):
+    """ Add the timers and counters of the profile other to profile """
+
+    for name, t in other.get('timers', {}).items():
+        s = profile['timers'].setdefault(name, {'count': 0, 'time': 0.0, 'max': 0.0})
+        s['count'] += t['count']
+        s['time'] += t['time']
+        s['max'] = max(s['max'], t['max'])
+    for name, value in other.get('counters', {}).items():
+        profile['counters'][name] = profile['counters'].get(name, 0) + value
+    profile['processes'] = profile.get('processes', []) + other.get('processes', [])
+    return profile
+
+def readProfile(workdir):
+    """ Return the profile saved in workdir (None if there is none) """
+
+    try:
+        with open(os.path.join(workdir, PROFILE_NAME)) as f:
+            profile = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if type(profile) is not dict or profile.get('version') != PROFILE_VERSION:
+        return None
+    return profile
+
+def dump(workdir):
+    """ Add the timers and counters of this process to the profile of workdir, then reset them; return the profile """
+
+    if not enabled:
+        return None
+
+    profile = getProfile()
+    profile['processes'] = [{'pid': os.getpid(), 'name': os.path.basename(sys.argv[0]), 'time': int(time.time())}]
+    filename = os.path.join(workdir, PROFILE_NAME)
+    try:
+        # the pilot and runJob both add their timers (serialized with a lock on the directory)
+        fd = os.open(workdir, os.O_RDONLY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            saved = readProfile(workdir)
+            if saved:
+                profile = merge(saved, profile)
+            writeAtomic(filename, profile, dump=lambda data, f: json.dump(data, f, indent=1, sort_keys=True))
+        finally:
+            os.close(fd)
+    except (IOError, OSError), e:
+        from pUtil import tolog
+        tolog("!!WARNING!!1999!! Could not write the pilot profile %s: %s" % (filename, e))
+        return None
+
+    reset()
+    return profile
+
+def getSummary(profile, n=3):
+    """ Return the n timers taking the most time as name:seconds,... (for the job metrics) """
+
+    if not profile or not profile.get('timers'):
+        return ""
+    timers = sorted(profile['timers'].items(), key=lambda item: -item[1]['time'])[:n]
+    return ",".join(["%s:%d" % (name, round(t['time'])) for name, t in timers])
+
+def log(profile, tolog, n=20):
+    """ Log the n timers taking the most time """
+
+    if not profile:
+        return
+    tolog("Pilot profile (time by timer):")
+    for name, t in sorted(profile['timers'].items(), key=lambda item: -item[1]['time'])[:n]:
+        tolog("%-40s count=%d time=%.2f s (max %.2f s)" % (name, t['count'], t['time'], t['max']))
+    for name in sorted(profile['counters']):
+        tolog("%-40s %s" % (name, profile['counters'][name]))
@@ -164,6 +164,9 @@ class Job:
         self.timeExe = 0
         self.timeStageOut = 0
         self.timeCleanUp = 0
+        self.timeLogTar = 0
+        self.timeLogZip = 0
+        self.profileSummary = ""           # timers of the pilot taking the most time (when profiling)
 
         self.inData = []  # validated structured data of input files ( aggregated inFiles, ddmEndPointIn, scopeIn, filesizeIn and others...)
         self.outData = [] # structured data of output files (similar to inData)
@@ -20,6 +20,7 @@ from FileState import FileState
 from FileStateClient import updateFileState, dumpFileStates
 from JobRecovery import JobRecovery
 from Configuration import Configuration
+from LogArchiver import LogArchiver
 
 class JobLog:
     """
@@ -1245,7 +1246,6 @@ class JobLog:
             status = storeWorkDirSize(size, self.__env['pilot_initdir'], job)
 
         # input and output files should already be removed from the workdir in child process
-        tarballNM = "%s.tar" % (job.newDirNM)
         try:
             cmd = "mv %s %s" % (job.workdir, job.newDirNM)
             tolog("Executing command: %s" % (cmd))
@@ -1254,30 +1254,75 @@ class JobLog:
             tolog("!!WARNING!!1400!! Could not move job workdir %s to %s" % (job.workdir, job.newDirNM))
         else:
             timeout = 55*60
-            # add an echo $? to mask any tar error code - for now - otherwise it can cause the time-out of the tar
-            # to return an error code when we don't want it to, e.g. in evgen jobs that have broken soft links
-            # the pilot should remove the broken links before though. later, the pilot should fail if the log file
-            # is too big
-            cmd = "pwd;tar cvf %s %s --dereference; echo $?" % (tarballNM, job.newDirNM)
+            maxFileSize, nThreads = self.getLogArchiverOptions()
+            archiver = LogArchiver(maxFileSize=maxFileSize, nThreads=nThreads, timeout=timeout)
+            try:
+                metrics = archiver.create(job.newDirNM, job.logFile)
+            except Exception, e:
+                tolog("!!WARNING!!4343!! Log file creation failed: %s (will try with tar and gzip)" % (e))
+                status = self.createLogFileWithTar(job, timeout)
+            else:
+                tolog("Tarball created: %s (%d files, %d bytes, %d bytes compressed, tar %.1f s, compression %.1f s with %d threads)" %\
+                      (job.logFile, metrics['nFiles'], metrics['size'], metrics['compressedSize'], metrics['tarTime'], metrics['zipTime'], archiver.nThreads))
+                if archiver.skipped:
+                    tolog("!!WARNING!!1400!! Files not added to the log tarball: %s" % ", ".join(["%s (%d bytes, %s)" % tuple(skipped) for skipped in archiver.skipped]))
+                job.timeLogTar = int(round(metrics['tarTime']))
+                job.timeLogZip = int(round(metrics['zipTime']))
+                status = True
+
+        return status
+
+    def getLogArchiverOptions(self):
+        """ Return the log tarball file size limit (bytes) and number of compression threads from the schedconfig catchall """
+        # log_max_file_size=<MB>: files larger than this are left out of the log tarball
+        # log_compression_threads=<n>: number of threads compressing the log tarball (default: cores, max 4)
+
+        maxFileSize = None
+        nThreads = None
+        catchalls = readpar('catchall')
+        for catchall in catchalls.split(","):
+            try:
+                if 'log_max_file_size=' in catchall:
+                    name, value = catchall.split('=')
+                    maxFileSize = int(value) * 1024 * 1024
+                elif 'log_compression_threads=' in catchall:
+                    name, value = catchall.split('=')
+                    nThreads = int(value)
+            except ValueError:
+                tolog("!!WARNING!!1400!! Could not parse catchall %s" % (catchall))
+
+        return maxFileSize, nThreads
+
+    def createLogFileWithTar(self, job, timeout):
+        """ Create the log file of the renamed workdir with tar and gzip """
+
+        status = False
+        tarballNM = "%s.tar" % (job.newDirNM)
+
+        # add an echo $? to mask any tar error code - for now - otherwise it can cause the time-out of the tar
+        # to return an error code when we don't want it to, e.g. in evgen jobs that have broken soft links
+        # the pilot should remove the broken links before though. later, the pilot should fail if the log file
+        # is too big
+        cmd = "pwd;tar cvf %s %s --dereference; echo $?" % (tarballNM, job.newDirNM)
+        exitcode, output = timedCommand(cmd, timeout=timeout)
+        if exitcode != 0:
+            tolog("!!WARNING!!4343!! Log file creation failed: %d, %s" % (exitcode, output))
+        else:
+            tolog("Tarball created: %s" % (tarballNM))
+            cmd = "gzip -f %s" % (tarballNM)
             exitcode, output = timedCommand(cmd, timeout=timeout)
             if exitcode != 0:
-                tolog("!!WARNING!!4343!! Log file creation failed: %d, %s" % (exitcode, output))
+                tolog("!!WARNING!!4343!! Log file zip failed: %d, %s" % (exitcode, output))
             else:
-                tolog("Tarball created: %s" % (tarballNM))
-                cmd = "gzip -f %s" % (tarballNM)
-                exitcode, output = timedCommand(cmd, timeout=timeout)
-                if exitcode != 0:
-                    tolog("!!WARNING!!4343!! Log file zip failed: %d, %s" % (exitcode, output))
+                try:
+                    os.rename("%s.gz" % (tarballNM), job.logFile)
+                    #command = "cp %s ../" % job.logFile
+                    #os.system(command)
+                except OSError:
+                    tolog("!!WARNING!!1400!! Could not rename gzipped tarball %s" % job.logFile)
                 else:
-                    try:
-                        os.rename("%s.gz" % (tarballNM), job.logFile)
-                        #command = "cp %s ../" % job.logFile
-                        #os.system(command)
-                    except OSError:
-                        tolog("!!WARNING!!1400!! Could not rename gzipped tarball %s" % job.logFile)
-                    else:
-                        tolog("Tarball renamed to %s" % (job.logFile))
-                        status = True
+                    tolog("Tarball renamed to %s" % (job.logFile))
+                    status = True
 
         return status
 
@@ -1,11 +1,11 @@
 import os
 import time
 import commands
-from glob import glob
 
 from PilotErrors import PilotErrors
 from pUtil import tolog, isAnalysisJob, setPilotlogFilename, readpar
 from JobState import JobState
+from JobStateIndex import JobStateIndex
 from FileState import FileState
 
 class JobRecovery:
@@ -276,14 +276,13 @@ class JobRecovery:
         status = False
         tolog("Running job recovery in: %s" % (_dir))
 
-        # grab all job state files in all work directories
-        job_state_files_pickle = glob(os.path.join(_dir, "/Panda_Pilot_*/jobState-*.pickle"))
-        job_state_files_json = glob(os.path.join(_dir, "/Panda_Pilot_*/jobState-*.json"))
-        tolog("Number of found job state pickle files: %d" % (len(job_state_files_pickle)))
-        tolog("Number of found job state json files: %d" % (len(job_state_files_json)))
+        # grab the job state files not updated for longer than two heartbeats from the job state index of all work
+        # directories, the oldest first (the modification times are checked again below)
+        index = JobStateIndex(_dir)
+        job_state_files = [entry['job_state_file'] for entry in index.getStaleJobs(2*self.__heartbeatPeriod)]
+        tolog("Number of found job state files: %d" % (len(job_state_files)))
 
         _rec_nr = 0
-        job_state_files = job_state_files_json + job_state_files_pickle
         if not job_state_files:
             return True
 
@@ -349,6 +348,14 @@ class JobRecovery:
                     tolog("File was last modified %d seconds ago (limit=%d, t=%d, tmod=%d)" %\
                           (current_time - file_modification_time, 2*self.__heartbeatPeriod, current_time, file_modification_time))
 
+                    # a job of another type is skipped without reading its job state file
+                    header = JS.getHeader(job_state_file)
+                    if header and not self.isSameType(header['trf'], self.__uflag):
+                        # release the atomic lockfile and go to the next directory
+                        self.releaseAtomicLockFile(fd, lockfile_name)
+                        status = True
+                        continue
+
                     # open the job state file
                     if JS.get(job_state_file):
                         # decode the job state info
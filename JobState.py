@@ -1,7 +1,12 @@
 import os
+import json
+import time
 import commands
 from pUtil import tolog
 from FileHandling import getExtension
+from StateSnapshot import SNAPSHOT_VERSION, writeAtomic
+from JobStateIndex import JobStateIndex
+from Instrumentation import timed
 
 class JobState:
     """
@@ -9,6 +14,10 @@ class JobState:
     When the job is running, the file jobState-<JobID>.[pickle|json]
     is created which contains the state of the Site, Job and Node
     objects. The job state file is updated at every heartbeat.
+    Next to it, jobStateHeader-<JobID>.json holds the few fields needed to decide
+    whether a job state file is of interest (job state, site, work dir, ..) with
+    the size and modification time of the job state file it describes, see getHeader().
+    The jobs are also listed in the job state index of the work area (see JobStateIndex).
     """
     def __init__(self):
         """ Default init """
@@ -103,6 +112,7 @@ class JobState:
         return "%s/jobState-%s.%s" % (workdir, jobId, extension)
         # return "%s/jobState-%s.%s" % (workdir, jobId, getExtension())
 
+    @timed("JobState.put")
     def put(self, job, site, node, recoveryAttempt=0, mode=""):
         """
         Create/Update the job state file
@@ -133,32 +143,96 @@ class JobState:
             objectDictionary['node'] = self.node
             objectDictionary['recoveryAttempt'] = self.recoveryAttempt
 
-            # write the dictionary
+            # write the dictionary (through a temporary file, a reader never sees a partly written file)
             if "json" in self.filename:
                 from json import dump
             else:
                 from pickle import dump
             try:
-                fp = open(self.filename, "w")
-            except Exception, e:
+                writeAtomic(self.filename, objectDictionary, dump=dump)
+            except (IOError, OSError), e:
                 tolog("JOBSTATE FAILURE: Could not open job state file: %s, %s" % (self.filename, str(e)))
                 _cmd = "whoami; ls -lF %s" % (self.filename)
                 tolog("Executing command: %s" % (_cmd))
                 ec, rs = commands.getstatusoutput(_cmd)
                 tolog("%d, %s" % (ec, rs))
                 status = False
+            except Exception, e:
+                tolog("JOBSTATE FAILURE: Could not encode data to job state file: %s, %s" % (self.filename, str(e)))
+                status = False
             else:
-                try:
-                    # write the dictionary to file
-                    dump(objectDictionary, fp)
-                except Exception, e:
-                    tolog("JOBSTATE FAILURE: Could not encode data to job state file: %s, %s" % (self.filename, str(e)))
-                    status = False
+                header = self.putHeader()
+                if header and mode == "":
+                    JobStateIndex(os.path.dirname(self.site.workdir)).update(self.filename, header)
 
-                fp.close()
-                                                                                                        
         return status
 
+    def getHeaderFilename(self, filename):
+        """ get the name of the header file of a job state file """
+
+        name = os.path.basename(filename).replace("jobState-", "jobStateHeader-", 1)
+        name = name.replace(".pickle", ".json").replace(".json.json", ".json")
+        return os.path.join(os.path.dirname(filename), name)
+
+    def putHeader(self):
+        """ Write the header of the current job state file, return the header (None if it could not be written) """
+
+        try:
+            st = os.stat(self.filename)
+            endpoint = ""
+            for endpoints in [self.job.ddmEndPointOut, self.job.ddmEndPointLog]:
+                endpoints = filter(None, endpoints or [])
+                if endpoints:
+                    endpoint = endpoints[0]
+                    break
+            header = {'version': SNAPSHOT_VERSION,
+                      'time': int(time.time()),
+                      'file_size': st.st_size,
+                      'file_mtime': st.st_mtime,
+                      'jobId': str(self.job.jobId),
+                      'state': self.job.result[0],
+                      'attemptNr': self.job.attemptNr,
+                      'recoveryAttempt': self.recoveryAttempt,
+                      'trf': self.job.trf.split(",")[0],
+                      'prodSourceLabel': getattr(self.job, 'prodSourceLabel', ''),
+                      'endpoint': endpoint,
+                      'sitename': self.site.sitename,
+                      'workdir': self.site.workdir}
+            writeAtomic(self.getHeaderFilename(self.filename), json.dumps(header))
+        except Exception, e:
+            tolog("JOBSTATE WARNING: Could not write job state header: %s" % str(e))
+            return None
+        return header
+
+    def getHeader(self, filename):
+        """
+        Return the header dictionary of a job state file without reading the job state file,
+        None if there is no header, it has another version or it does not describe the current job state file
+        """
+
+        try:
+            fp = open(self.getHeaderFilename(filename))
+            try:
+                header = json.load(fp)
+            finally:
+                fp.close()
+            st = os.stat(filename)
+        except (IOError, OSError, ValueError):
+            return None
+        if type(header) is not dict or header.get('version') != SNAPSHOT_VERSION:
+            return None
+        if header.get('file_size') != st.st_size or header.get('file_mtime') != st.st_mtime:
+            return None
+        return header
+
+    def removeHeader(self, filename):
+        """ Remove the header of a job state file """
+
+        try:
+            os.remove(self.getHeaderFilename(filename))
+        except OSError:
+            pass
+
     def rename(self, site, job):
         """
         Rename the job state file. Should only be called for
@@ -184,6 +258,8 @@ class JobState:
                 status = False
             else:
                 tolog("Job state file renamed to: %s" % (fileNameNew))
+                self.removeHeader(fileNameOld)
+                JobStateIndex(os.path.dirname(site.workdir)).remove(site.workdir, job.jobId)
         else:
             tolog("JOBSTATE FAILURE: Job state file does not exist: %s" % (fileNameOld))
             status = False
@@ -207,6 +283,8 @@ class JobState:
 
         if os.path.isfile(fileName):
             # remove the job state file
+            self.removeHeader(fileName)
+            JobStateIndex(os.path.dirname(site.workdir)).remove(site.workdir, job.jobId)
             try:
                 os.system("rm -f %s" % fileName)
             except OSError:
@@ -224,6 +302,9 @@ class JobState:
 
         # remove the job state file
         ec = -1
+        self.removeHeader(self.filename)
+        if self.site and self.job:
+            JobStateIndex(os.path.dirname(self.site.workdir)).remove(self.site.workdir, self.job.jobId)
         try:
             cmd = "rm -f %s" % (self.filename)
             tolog("Executing command: %s" % (cmd))
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import fcntl
+from glob import glob
+
+from pUtil import tolog
+from StateSnapshot import writeAtomic
+
+class JobStateIndex(object):
+    """
+    Index of the job state files of all pilots sharing a work area (the directory holding the Panda_Pilot_* dirs).
+
+    The index is the directory pilot_job_index/ of the work area with one manifest per pilot work dir,
+    <Panda_Pilot_* dir name>.json, listing the jobs of the pilot (job state file, job state, site, work dir, trf and
+    the time of the last update). A pilot only writes its own manifest (JobState.put and remove update it, serialized
+    between the processes of the pilot with flock, and written with a rename), so no lock is shared between pilots.
+    Reading the index takes one directory listing and one small read per pilot. A manifest is trusted while it is
+    newer than its pilot dir, otherwise it is checked against the job state files of the dir (job state files created
+    or removed without the manifest, e.g. by an older pilot or a pilot killed in between). The pilot dirs without a
+    manifest or with a manifest which does not match are indexed from their job state files, and the manifests of
+    removed pilot dirs are dropped.
+    """
+
+    index_dir = "pilot_job_index"
+
+    def __init__(self, path):
+        self.path = path
+        self.dir = os.path.join(path, self.index_dir)
+
+    def getManifestFilename(self, workdir):
+        """ Return the manifest file of a pilot work dir """
+
+        return os.path.join(self.dir, os.path.basename(os.path.normpath(workdir)) + ".json")
+
+    def readManifest(self, filename):
+        """ Return the job dictionary of a manifest file ({} if there is none) """
+
+        try:
+            with open(filename) as f:
+                jobs = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return jobs if type(jobs) is dict else {}
+
+    def modify(self, workdir, function):
+        """ Apply function to the job dictionary of the manifest of workdir and write it back """
+
+        filename = self.getManifestFilename(workdir)
+        try:
+            if not os.path.isdir(self.dir):
+                os.makedirs(self.dir)
+            lock = open(filename + ".lock", "a")
+        except (IOError, OSError), e:
+            tolog("!!WARNING!!1999!! Could not update job state index %s: %s" % (filename, e))
+            return False
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            jobs = self.readManifest(filename)
+            function(jobs)
+            writeAtomic(filename, json.dumps(jobs))
+        except (IOError, OSError), e:
+            tolog("!!WARNING!!1999!! Could not update job state index %s: %s" % (filename, e))
+            return False
+        finally:
+            lock.close()
+        return True
+
+    def update(self, job_state_file, header):
+        """ Add or update the entry of a job (header is the JobState header dictionary) """
+
+        entry = {'job_state_file': job_state_file,
+                 'state': header['state'],
+                 'sitename': header['sitename'],
+                 'workdir': header['workdir'],
+                 'trf': header['trf'],
+                 'time': header['time']}
+        def add(jobs):
+            jobs[header['jobId']] = entry
+        return self.modify(header['workdir'], add)
+
+    def remove(self, workdir, jobId):
+        """ Remove the entry of a job """
+
+        def remove(jobs):
+            jobs.pop(str(jobId), None)
+        return self.modify(workdir, remove)
+
+    def getJobStateFiles(self, workdir):
+        """ Return the job state files of a pilot work dir """
+
+        return glob(os.path.join(workdir, "jobState-*.pickle")) + glob(os.path.join(workdir, "jobState-*.json"))
+
+    def isCurrent(self, workdir, filename, jobs):
+        """ Does the manifest file of a pilot work dir (with the job dictionary jobs) list the job state files of the dir? """
+
+        try:
+            if os.path.getmtime(workdir) < os.path.getmtime(filename):
+                # no file was created in or removed from the work dir since the manifest was written
+                return True
+        except OSError:
+            return False
+        listed = set([os.path.basename(jobs[jobId]['job_state_file']) for jobId in jobs])
+        return listed == set(map(os.path.basename, self.getJobStateFiles(workdir)))
+
+    def indexWorkdir(self, workdir):
+        """ Index the job state files of a pilot work dir which has no manifest, or a manifest which does not match """
+
+        from JobState import JobState
+
+        jobs = {}
+        for job_state_file in self.getJobStateFiles(workdir):
+            JS = JobState()
+            try:
+                mtime = int(os.path.getmtime(job_state_file))
+            except OSError:
+                continue
+            header = JS.getHeader(job_state_file)
+            if header:
+                jobs[header['jobId']] = {'job_state_file': job_state_file, 'state': header['state'], 'sitename': header['sitename'],
+                                         'workdir': header['workdir'], 'trf': header['trf'], 'time': mtime}
+            elif JS.get(job_state_file):
+                _job, _site, _node, _recoveryAttempt = JS.decode()
+                if _job and _site:
+                    jobs[str(_job.jobId)] = {'job_state_file': job_state_file, 'state': _job.result[0], 'sitename': _site.sitename,
+                                             'workdir': _site.workdir, 'trf': _job.trf.split(",")[0], 'time': mtime}
+
+        def replace(manifest):
+            manifest.clear()
+            manifest.update(jobs)
+        self.modify(workdir, replace)
+        return jobs
+
+    def read(self):
+        """ Return the entries of all jobs (with the job id as 'jobId'), index the pilot dirs without a valid manifest """
+
+        try:
+            manifests = set(os.listdir(self.dir))
+        except OSError:
+            manifests = set()
+        try:
+            workdirs = [d for d in os.listdir(self.path) if d.startswith("Panda_Pilot_")]
+        except OSError, e:
+            tolog("!!WARNING!!1999!! Could not list %s: %s" % (self.path, e))
+            return []
+
+        entries = []
+        for d in workdirs:
+            workdir = os.path.join(self.path, d)
+            manifest = d + ".json"
+            jobs = None
+            if manifest in manifests:
+                manifests.discard(manifest)
+                filename = os.path.join(self.dir, manifest)
+                jobs = self.readManifest(filename)
+                if not self.isCurrent(workdir, filename, jobs):
+                    tolog("Job state index manifest %s does not match the job state files of %s, indexing it again" % (filename, workdir))
+                    jobs = None
+            if jobs is None:
+                jobs = self.indexWorkdir(workdir)
+            for jobId in jobs:
+                entry = dict(jobs[jobId])
+                entry['jobId'] = jobId
+                entries.append(entry)
+
+        # manifests of removed pilot dirs
+        for manifest in manifests:
+            if manifest.endswith(".json"):
+                for filename in [manifest, manifest + ".lock"]:
+                    try:
+                        os.remove(os.path.join(self.dir, filename))
+                    except OSError:
+                        pass
+
+        return entries
+
+    def getStaleJobs(self, age, states=None):
+        """ Return the entries of the jobs not updated for age seconds (in one of states if given), the oldest first """
+
+        limit = time.time() - age
+        entries = [e for e in self.read() if e['time'] < limit and (states is None or e['state'] in states)]
+        return sorted(entries, key=lambda e: e['time'])
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import zlib
+import Queue
+import struct
+import tarfile
+import threading
+import collections
+from StringIO import StringIO
+
+MANIFEST = "logarchive_manifest.json"
+
+class ParallelGzipFile(object):
+    """ Write-only gzip file compressed by several threads (like pigz)
+
+    The data is cut in blocks which are deflated independently by the worker threads (zlib releases
+    the GIL while compressing). Each block but the last ends with a sync flush, i.e. on a byte
+    boundary without the final bit, so the blocks written in order form a single deflate stream and
+    the file is one regular gzip member that gzip, zcat and tar z read. The crc and the size are
+    computed on the calling thread as the data comes in.
+    """
+
+    def __init__(self, filename, level=6, nThreads=4, blockSize=1024*1024):
+        self.filename = filename
+        self.level = level
+        self.nThreads = max(1, nThreads)
+        self.blockSize = blockSize
+        self.crc = zlib.crc32("") & 0xffffffffL
+        self.size = 0
+        self.compressedSize = 0
+        self.compressTime = 0.0      # summed over the worker threads
+        self.waitTime = 0.0          # time the writer waited for the workers
+        self.__buffer = []
+        self.__bufferSize = 0
+        self.__pending = collections.deque()
+        self.__lock = threading.Lock()
+        self.__queue = Queue.Queue()
+        self.__threads = []
+        self.__file = open(filename, "wb")
+        for i in range(self.nThreads):
+            thread = threading.Thread(target=self.__compress)
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+        # header: magic, deflate, no flags, mtime, no extra flags, unix
+        self.__write("\037\213\010\000" + struct.pack("<L", long(time.time())) + "\000\003")
+
+    def __write(self, data):
+        self.__file.write(data)
+        self.compressedSize += len(data)
+
+    def __compress(self):
+        """ Worker thread: deflate the queued blocks """
+
+        while True:
+            block = self.__queue.get()
+            if block is None:
+                break
+            t0 = time.time()
+            try:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+                if block['last']:
+                    block['output'] = compressor.compress(block['data']) + compressor.flush(zlib.Z_FINISH)
+                else:
+                    block['output'] = compressor.compress(block['data']) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            except Exception, e:
+                block['error'] = e
+            block['data'] = None
+            with self.__lock:
+                self.compressTime += time.time() - t0
+            block['done'].set()
+
+    def __submit(self, data, last=False):
+        block = {'data': data, 'last': last, 'output': None, 'error': None, 'done': threading.Event()}
+        self.__pending.append(block)
+        self.__queue.put(block)
+
+        # write the finished blocks in order, keep at most two blocks per thread in flight
+        while self.__pending and (last or self.__pending[0]['done'].isSet() or len(self.__pending) > 2 * self.nThreads):
+            block = self.__pending.popleft()
+            if not block['done'].isSet():
+                t0 = time.time()
+                block['done'].wait()
+                self.waitTime += time.time() - t0
+            if block['error']:
+                raise IOError("Block compression failed: %s" % block['error'])
+            self.__write(block['output'])
+
+    def write(self, data):
+        if not data:
+            return
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffffL
+        self.size += len(data)
+        self.__buffer.append(data)
+        self.__bufferSize += len(data)
+        if self.__bufferSize >= self.blockSize:
+            data = "".join(self.__buffer)
+            n = len(data) - len(data) % self.blockSize
+            for offset in range(0, n, self.blockSize):
+                self.__submit(data[offset:offset + self.blockSize])
+            self.__buffer = [data[n:]]
+            self.__bufferSize = len(data) - n
+
+    def close(self):
+        """ Compress the rest, write the trailer and stop the workers """
+
+        if not self.__file:
+            return
+        try:
+            self.__submit("".join(self.__buffer), last=True)
+            self.__buffer = []
+            self.__write(struct.pack("<LL", self.crc, self.size & 0xffffffffL))
+        finally:
+            for thread in self.__threads:
+                self.__queue.put(None)
+            self.__file.close()
+            self.__file = None
+
+class LogArchiver(object):
+    """ Create the gzipped log tarball of a directory in one pass
+
+    The tar stream is written directly to a ParallelGzipFile instead of tar followed by gzip, so the
+    directory is read once and no intermediate tarball is written. Symbolic links are followed (like
+    tar --dereference), files larger than maxFileSize bytes or which cannot be read are skipped, and
+    when the timeout is reached the remaining files are skipped. The name and size of every member
+    and the skipped files are listed in a manifest added as the last member of the tarball.
+    """
+
+    def __init__(self, maxFileSize=None, nThreads=None, level=6, blockSize=1024*1024, timeout=None):
+        if not nThreads:
+            try:
+                import multiprocessing
+                nThreads = min(4, multiprocessing.cpu_count())
+            except (ImportError, NotImplementedError):
+                nThreads = 1
+        self.maxFileSize = maxFileSize
+        self.nThreads = nThreads
+        self.level = level
+        self.blockSize = blockSize
+        self.timeout = timeout
+        self.members = []            # [name, size]
+        self.skipped = []            # [name, size, reason]
+        self.metrics = {}
+
+    def __walk(self, path):
+        """ Yield the paths below path, following symbolic links to directories once """
+
+        seen = set()
+        for root, dirs, files in os.walk(path, followlinks=True):
+            try:
+                st = os.stat(root)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in seen:
+                # symbolic link loop
+                del dirs[:]
+                continue
+            seen.add((st.st_dev, st.st_ino))
+            yield root
+            dirs.sort()
+            for name in sorted(files):
+                yield os.path.join(root, name)
+
+    def create(self, path, logFile, arcname=None):
+        """ Create the gzipped tarball logFile of the directory path, return the metrics dictionary """
+
+        if arcname is None:
+            arcname = os.path.basename(os.path.normpath(path))
+        self.members = []
+        self.skipped = []
+        inodes = {}
+        t0 = time.time()
+        gz = ParallelGzipFile(logFile, level=self.level, nThreads=self.nThreads, blockSize=self.blockSize)
+        try:
+            tar = tarfile.open(fileobj=gz, mode="w|", dereference=True)
+            for name in self.__walk(path):
+                relativeName = os.path.relpath(name, path)
+                if relativeName == ".":
+                    memberName = arcname
+                else:
+                    memberName = os.path.join(arcname, relativeName)
+                try:
+                    tarinfo = tar.gettarinfo(name, memberName)
+                except (OSError, IOError), e:
+                    # e.g. a broken link
+                    self.skipped.append([memberName, 0, str(e)])
+                    continue
+                if tarinfo.isreg():
+                    if self.maxFileSize is not None and tarinfo.size > self.maxFileSize:
+                        self.skipped.append([memberName, tarinfo.size, "size limit"])
+                        continue
+                    if self.timeout is not None and time.time() - t0 > self.timeout:
+                        self.skipped.append([memberName, tarinfo.size, "timeout"])
+                        continue
+                    # the same file reached through several links is stored once (as tar --dereference does)
+                    st = os.stat(name)
+                    if (st.st_dev, st.st_ino) in inodes:
+                        tarinfo.type = tarfile.LNKTYPE
+                        tarinfo.linkname = inodes[(st.st_dev, st.st_ino)]
+                        tarinfo.size = 0
+                        tar.addfile(tarinfo)
+                        self.members.append([memberName, 0])
+                        continue
+                    inodes[(st.st_dev, st.st_ino)] = memberName
+                    try:
+                        f = open(name, "rb")
+                    except IOError, e:
+                        self.skipped.append([memberName, tarinfo.size, str(e)])
+                        continue
+                    try:
+                        tar.addfile(tarinfo, f)
+                    finally:
+                        f.close()
+                else:
+                    tar.addfile(tarinfo)
+                self.members.append([memberName, tarinfo.size])
+
+            manifest = json.dumps({'members': self.members, 'skipped': self.skipped}, indent=1)
+            tarinfo = tarfile.TarInfo(os.path.join(arcname, MANIFEST))
+            tarinfo.size = len(manifest)
+            tarinfo.mtime = int(time.time())
+            tarinfo.mode = 0644
+            tar.addfile(tarinfo, StringIO(manifest))
+            tar.close()
+            gz.close()
+        except:
+            try:
+                gz.close()
+            except Exception:
+                pass
+            if os.path.exists(logFile):
+                os.remove(logFile)
+            raise
+
+        totalTime = time.time() - t0
+        self.metrics = {'nFiles': len(self.members),
+                        'nSkipped': len(self.skipped),
+                        'size': gz.size,
+                        'compressedSize': gz.compressedSize,
+                        'totalTime': totalTime,
+                        'tarTime': totalTime - gz.waitTime,
+                        'zipTime': gz.compressTime}
+        return self.metrics
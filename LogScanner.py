@@ -0,0 +1,287 @@
+import os
+import re
+import copy
+import json
+import hashlib
+
+from pUtil import tolog
+from StateSnapshot import writeAtomic
+
+# patterns looked for in the payload output, as (name, regular expression, keep)
+# keep is KEEP_ALL (the first MAX_MATCHES matching lines) or KEEP_LAST (only the last matching line)
+KEEP_ALL = "all"
+KEEP_LAST = "last"
+MAX_MATCHES = 1000
+MAX_LINE_LENGTH = 4096
+
+SCAN_VERSION = 2
+CHUNK_SIZE = 4*1024*1024
+TAIL_LINES = 50
+
+patterns = []
+
+def registerPattern(name, pattern, keep=KEEP_ALL):
+    """ Add a pattern to the ones looked for by the log scanners (the patterns should not contain numbered back references) """
+
+    for i, (_name, _pattern, _keep) in enumerate(patterns):
+        if _name == name:
+            patterns[i] = (name, pattern, keep)
+            return
+    patterns.append((name, pattern, keep))
+
+# out of memory errors (stdout, stderr)
+registerPattern("bad_alloc", r"St9bad_alloc|std::bad_alloc")
+registerPattern("memory_rescue", r"MemoryRescueSvc")
+registerPattern("fatal_out_of_memory", r"FATAL out of memory: taking the application down")
+# event count of athena (stdout), e.g. "event #4, run #0 3 events processed so far"
+registerPattern("events_processed", r"events processed so far", keep=KEEP_LAST)
+# start of the job report of the trf (stdout)
+registerPattern("job_report", r"Job Report produced by")
+
+def toBytes(line):
+    """ Return the line read back from a state file as the original bytes """
+
+    if isinstance(line, unicode):
+        return line.encode('latin-1')
+    return line
+
+def compileMatcher(expressions):
+    """ Return a regular expression matching any of the expressions, with ^ and $ matching at the line boundaries """
+
+    return re.compile("|".join(["(?:%s)" % (expression) for expression in expressions]), re.M)
+
+def iterMatchingLines(data, matcher):
+    """
+    Yield (offset, line) for the lines of data (complete lines) containing a match of matcher
+
+    A match is only a candidate for the line it starts in (e.g. \s can match the newline and the match continue on the
+    next line), the caller checks the line against the expressions on their own.
+    """
+
+    pos = 0
+    search = matcher.search
+    while True:
+        m = search(data, pos)
+        if not m:
+            break
+        start = data.rfind('\n', 0, m.start()) + 1
+        end = data.find('\n', m.start())
+        if end == -1:
+            end = len(data) - 1
+        yield start, data[start:end+1]
+        pos = end + 1
+
+def iterChunks(f, size=CHUNK_SIZE):
+    """ Yield (offset from the first byte read, data) for the complete lines read from f, then for the partial last line """
+
+    offset = 0
+    rest = ""
+    while True:
+        data = f.read(size)
+        if not data:
+            break
+        end = data.rfind('\n')
+        if end == -1:
+            rest += data
+            continue
+        chunk = rest + data[:end+1]
+        rest = data[end+1:]
+        yield offset, chunk
+        offset += len(chunk)
+    if rest:
+        yield offset, rest
+
+def grepFile(expressions, filename):
+    """ Return the lines of filename matching the expressions, once per matching expression (in a single pass) """
+
+    compiled = [re.compile(expression) for expression in expressions]
+    matcher = compileMatcher(expressions)
+    matched_lines = []
+    f = open(filename, "r")
+    try:
+        for offset, chunk in iterChunks(f):
+            for start, line in iterMatchingLines(chunk, matcher):
+                for cp in compiled:
+                    if cp.search(line):
+                        matched_lines.append(line)
+    finally:
+        f.close()
+
+    return matched_lines
+
+def readLastLines(filename, number_of_lines):
+    """ Return the last lines of filename (reading it from the end) """
+
+    f = open(filename, "r")
+    try:
+        f.seek(0, 2)
+        size = f.tell()
+        data = ""
+        offset = size
+        while offset > 0 and data.count('\n') <= number_of_lines:
+            n = min(offset, 64*1024)
+            offset -= n
+            f.seek(offset)
+            data = f.read(n) + data
+    finally:
+        f.close()
+
+    lines = data.splitlines(True)
+    if offset > 0:
+        # the first line is incomplete
+        lines = lines[1:]
+    return lines[-number_of_lines:]
+
+class LogScanner(object):
+    """
+    Single pass scanner of a payload output file for the registered patterns.
+
+    All patterns are combined into one regular expression which is run over large chunks of the file; only the lines
+    it matches are checked against the separate patterns. The matching lines (with their offsets), the number of
+    matches and the tail of the file are saved with the offset reached in a state file next to the output, so that
+    the next scan, e.g. by runJob after the Monitor of the pilot scanned the file while the payload was running,
+    only reads the bytes added since. The partial last line is matched on each scan but not saved.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.stateFile = os.path.join(os.path.dirname(filename), ".%s.scan" % (os.path.basename(filename)))
+        self.__signature = None
+        self.__state = None
+        self.__view = None
+
+    def __compile(self):
+        self.__patterns = [(name, re.compile(pattern), keep) for name, pattern, keep in patterns]
+        self.__matcher = compileMatcher([pattern for name, pattern, keep in patterns]) if patterns else None
+        self.__signature = hashlib.md5(json.dumps(patterns)).hexdigest()
+
+    def __newState(self, inode):
+        return {'version': SCAN_VERSION, 'signature': self.__signature, 'inode': inode, 'offset': 0,
+                'matches': dict([(name, []) for name, pattern, keep in patterns]),
+                'counts': dict([(name, 0) for name, pattern, keep in patterns]),
+                'tail': []}
+
+    def __loadState(self, st):
+        """ Return the saved state if it is valid for the current file and patterns """
+
+        try:
+            f = open(self.stateFile)
+            try:
+                state = json.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError):
+            return None
+        if type(state) is not dict or state.get('version') != SCAN_VERSION or state.get('signature') != self.__signature or \
+               state.get('inode') != st.st_ino or state.get('offset', 0) > st.st_size:
+            return None
+        return state
+
+    def __saveState(self):
+        # the output is not necessarily utf-8, its bytes are saved as latin-1 characters
+        try:
+            writeAtomic(self.stateFile, self.__state, dump=lambda data, f: json.dump(data, f, encoding='latin-1'))
+        except (IOError, OSError), e:
+            tolog("!!WARNING!!1999!! Could not save the scan state of %s: %s" % (self.filename, e))
+
+    def __add(self, state, offset, data):
+        """ Add the matches and tail of data (read at offset) to state """
+
+        if self.__matcher:
+            for start, line in iterMatchingLines(data, self.__matcher):
+                names = [name for name, cp, keep in self.__patterns if cp.search(line)]
+                if len(line) > MAX_LINE_LENGTH:
+                    line = line[:MAX_LINE_LENGTH] + "[..]\n"
+                for name, cp, keep in self.__patterns:
+                    if name in names:
+                        state['counts'][name] += 1
+                        if keep == KEEP_LAST:
+                            state['matches'][name] = [[offset + start, line]]
+                        elif len(state['matches'][name]) < MAX_MATCHES:
+                            state['matches'][name].append([offset + start, line])
+
+        lines = data.rsplit('\n', TAIL_LINES + 1)
+        if lines[-1] == "":
+            lines = lines[:-1]
+        state['tail'] = (state['tail'] + [line[:MAX_LINE_LENGTH] for line in lines[-TAIL_LINES:]])[-TAIL_LINES:]
+
+    def scan(self):
+        """ Scan the bytes added to the file since the last scan, return False if the file cannot be read """
+
+        if self.__signature is None or self.__signature != hashlib.md5(json.dumps(patterns)).hexdigest():
+            self.__compile()
+            self.__state = None
+
+        try:
+            f = open(self.filename, "r")
+        except IOError, e:
+            tolog("!!WARNING!!2999!! %s" % e)
+            return False
+
+        try:
+            st = os.fstat(f.fileno())
+            state = self.__loadState(st)
+            if not state or (self.__state and self.__state['inode'] == st.st_ino and self.__state['offset'] > state['offset']):
+                # no saved state, or the one of this process is more recent
+                state = self.__state
+            if not state or state['inode'] != st.st_ino or state['offset'] > st.st_size:
+                state = self.__newState(st.st_ino)
+            self.__state = state
+
+            f.seek(state['offset'])
+            nbytes = 0
+            rest = ""
+            for offset, chunk in iterChunks(f):
+                if not chunk.endswith('\n'):
+                    rest = chunk
+                    break
+                self.__add(state, state['offset'], chunk)
+                state['offset'] += len(chunk)
+                nbytes += len(chunk)
+        finally:
+            f.close()
+
+        if nbytes:
+            self.__saveState()
+
+        # the partial last line only counts for this scan
+        if rest:
+            self.__view = copy.deepcopy(state)
+            self.__add(self.__view, state['offset'], rest + '\n')
+        else:
+            self.__view = state
+
+        return True
+
+    def getMatches(self, name):
+        """ Return the lines matching the pattern name """
+
+        return [toBytes(line) for offset, line in self.__view['matches'].get(name, [])]
+
+    def getOffsets(self, name):
+        """ Return the offsets of the lines matching the pattern name """
+
+        return [offset for offset, line in self.__view['matches'].get(name, [])]
+
+    def getCount(self, name):
+        """ Return the number of lines matching the pattern name """
+
+        return self.__view['counts'].get(name, 0)
+
+    def getTail(self, number_of_lines=20):
+        """ Return the last lines of the file """
+
+        return [toBytes(line) for line in self.__view['tail'][-number_of_lines:]]
+
+# one scanner per file and process
+scanners = {}
+
+def scanFile(filename):
+    """ Scan the bytes added to filename since the last scan, return its scanner (None if it cannot be read) """
+
+    if filename not in scanners:
+        scanners[filename] = LogScanner(filename)
+    scanner = scanners[filename]
+    if not scanner.scan():
+        return None
+    return scanner
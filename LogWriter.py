@@ -0,0 +1,163 @@
+import os
+import atexit
+import threading
+import multiprocessing.util
+
+class LogWriter(object):
+    """ Background writer for the pilot log files
+
+    Records are queued by tolog() and appended to their log files by a single daemon thread,
+    one open/write/close per file and batch instead of one per message. The queue is drained
+    synchronously by flush(), which must be called before the process exits or exec's.
+    """
+
+    def __init__(self):
+        self.__pid = None
+        self.__pending = []
+        self.__cond = None
+        self.__writeLock = None
+        self.__thread = None
+        self.__enabled = True
+        self.__stopped = False
+
+    def __setup(self):
+        """ (Re)create the queue and writer thread for the current process """
+
+        # after a fork the locks may have been held by the parent's writer thread and the thread
+        # itself does not exist in the child, so start from scratch. Records still pending at fork
+        # time belong to the parent and are written by it
+        self.__pid = os.getpid()
+        self.__pending = []
+        self.__cond = threading.Condition(threading.Lock())
+        self.__writeLock = threading.Lock()
+        self.__stopped = False
+        try:
+            self.__thread = threading.Thread(target=self.__run, name='LogWriter')
+            self.__thread.setDaemon(True)
+            self.__thread.start()
+        except Exception, e:
+            # fall back to synchronous writes
+            print "WARNING: Could not start log writer thread: %s" % (e)
+            self.__thread = None
+
+        # multiprocessing children leave through os._exit() without running the atexit hooks, but
+        # run the finalizers registered in the child (the ones inherited from the parent are cleared)
+        multiprocessing.util.Finalize(None, self.stop, exitpriority=100)
+
+    def __run(self):
+        """ Writer thread main loop """
+
+        while True:
+            cond = self.__cond
+            cond.acquire()
+            try:
+                while not self.__pending and not self.__stopped:
+                    cond.wait()
+            finally:
+                cond.release()
+            self.__drain()
+            if self.__stopped:
+                break
+
+    def __drain(self):
+        """ Write all pending records, grouped per file and in order """
+
+        writeLock = self.__writeLock
+        writeLock.acquire()
+        try:
+            cond = self.__cond
+            cond.acquire()
+            try:
+                records = self.__pending
+                self.__pending = []
+            finally:
+                cond.release()
+            if records:
+                self.__write(records)
+        finally:
+            writeLock.release()
+
+    def __write(self, records):
+        """ Append the records to their files, one open per consecutive run of the same file """
+
+        i = 0
+        n = len(records)
+        while i < n:
+            filename = records[i][0]
+            j = i
+            while j < n and records[j][0] == filename:
+                j += 1
+            writeToFile(filename, "".join([txt for _f, txt in records[i:j]]))
+            i = j
+
+    def put(self, filename, txt):
+        """ Queue txt for appending to filename """
+
+        # the pilot changes directory, a relative filename refers to the current directory at queue time
+        filename = os.path.abspath(filename)
+
+        if not self.__enabled:
+            writeToFile(filename, txt)
+            return
+
+        if self.__pid != os.getpid():
+            self.__setup()
+        if self.__thread is None:
+            writeToFile(filename, txt)
+            return
+
+        cond = self.__cond
+        cond.acquire()
+        try:
+            self.__pending.append((filename, txt))
+            cond.notify()
+        finally:
+            cond.release()
+
+    def flush(self):
+        """ Write all pending records now (from the calling thread) """
+
+        if self.__pid == os.getpid():
+            self.__drain()
+
+    def setEnabled(self, enabled):
+        """ Switch between queued (default) and synchronous writes """
+
+        if not enabled:
+            self.flush()
+        self.__enabled = enabled
+
+    def stop(self):
+        """ Write the pending records and stop the writer thread, later records are written synchronously """
+
+        self.__enabled = False
+        self.__stopped = True
+        if self.__pid != os.getpid() or self.__thread is None:
+            return
+        cond = self.__cond
+        cond.acquire()
+        try:
+            cond.notify()
+        finally:
+            cond.release()
+        self.__thread.join(5)
+        self.flush()
+
+def writeToFile(filename, txt):
+    """ Append txt to filename """
+
+    try:
+        f = open(filename, 'a')
+        f.write(txt)
+        f.close()
+    except Exception, e:
+        if "No such file" in str(e):
+            pass
+        else:
+            print "WARNING: Exception caught: %s" % e
+
+# Process wide writer used by pUtil.tolog()
+logWriter = LogWriter()
+
+# the writer thread must have finished before the interpreter starts tearing down the modules
+atexit.register(logWriter.stop)
@@ -0,0 +1,181 @@
+import os
+import copy
+from array import array
+
+from pUtil import tolog
+
+class MemoryMonitorStats(object):
+    """ Running max/total accumulators and PSS time series of the memory monitor lines added so far """
+
+    fields = ['VMEM', 'PSS', 'RSS', 'Swap']
+
+    def __init__(self):
+        self.max = dict([(field, -1) for field in self.fields])
+        self.total = dict([(field, 0) for field in self.fields])
+        self.N = 0
+        self.other = {}                 # rchar, wchar, rbytes, wbytes of the last line
+        self.times = array('l')         # time series of the PSS
+        self.pss = array('l')
+        self.sums = [0.0, 0.0, 0.0, 0.0]    # sums of t, pss, t*t, t*pss (t from the first time) for the PSS slope
+
+    def addLine(self, line, warn=True):
+        if line.strip() == "":
+            return
+        try:
+            # Remove empty entries from list (caused by multiple \t)
+            l = filter(None, line.split('\t'))
+            values = [int(value) for value in l[1:5]]
+            if len(values) != 4:
+                raise ValueError("too few columns")
+            # note: the last rchar etc values will be reported
+            if len(l) == 9:
+                other = dict(zip(['rchar', 'wchar', 'rbytes', 'wbytes'], [int(value) for value in l[5:9]]))
+            else:
+                other = {}
+        except Exception, e:
+            if warn:
+                tolog("!!WARNING!!4542!! Unexpected format of utility output: %s (expected format: Time, VMEM, PSS, RSS, Swap [, RCHAR, WCHAR, RBYTES, WBYTES])" % (line))
+            return
+
+        for field, value in zip(self.fields, values):
+            self.total[field] += value
+            if value > self.max[field]:
+                self.max[field] = value
+        self.other = other
+        self.N += 1
+
+        try:
+            t = int(l[0])
+        except ValueError:
+            t = self.times[-1] + 60 if self.times else 0
+        self.times.append(t)
+        self.pss.append(values[1])
+        x = float(t - self.times[0])
+        y = float(values[1])
+        self.sums[0] += x
+        self.sums[1] += y
+        self.sums[2] += x*x
+        self.sums[3] += x*y
+
+class MemoryMonitorReader(object):
+    """
+    Incremental reader of the memory monitor text output (Time, VMEM, PSS, RSS, Swap [, RCHAR, WCHAR, RBYTES, WBYTES])
+
+    Each update() only reads the lines added since the previous one and adds them to running max/total accumulators,
+    so the cost no longer grows with the length of the job. A partial last line (e.g. the last sample of a memory
+    monitor which exited without a newline) is counted in the values, but read again by the next update. The output
+    is read again from the start when the memory monitor replaced it (new inode, smaller file or different header
+    line). The PSS values are also kept as a time series, in arrays of longs.
+    """
+
+    fields = MemoryMonitorStats.fields
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        self.__inode = None
+        self.__offset = 0
+        self.__header = None
+        self.__stats = MemoryMonitorStats()     # the complete lines
+        self.__view = self.__stats              # the complete lines and the partial last line, if any
+
+    # the values of the lines read by the last update
+    max = property(lambda self: self.__view.max)
+    total = property(lambda self: self.__view.total)
+    N = property(lambda self: self.__view.N)
+    other = property(lambda self: self.__view.other)
+    times = property(lambda self: self.__view.times)
+    pss = property(lambda self: self.__view.pss)
+
+    def __isReplaced(self, f, st):
+        """ Has the file been replaced since the last update? """
+
+        if st.st_ino != self.__inode or st.st_size < self.__offset:
+            return True
+        if self.__header is not None:
+            f.seek(0)
+            return f.read(len(self.__header)) != self.__header
+        return False
+
+    def update(self):
+        """ Read the lines added since the last update, return False if the file cannot be read """
+
+        try:
+            f = open(self.path)
+        except IOError, e:
+            tolog("!!WARNING!!4541!! Could not open the utility output: %s" % (e))
+            return False
+
+        try:
+            st = os.fstat(f.fileno())
+            if self.__isReplaced(f, st):
+                if self.__inode is not None:
+                    tolog("Utility output %s was replaced, reading it from the start" % (self.path))
+                self.reset()
+                self.__inode = st.st_ino
+            if st.st_size == self.__offset:
+                self.__view = self.__stats
+                return True
+            f.seek(self.__offset)
+            data = f.read(st.st_size - self.__offset)
+        finally:
+            f.close()
+
+        # only complete lines are consumed
+        end = data.rfind('\n')
+        lines = data[:end].split('\n') if end != -1 else []
+        rest = data[end + 1:]
+        self.__offset += end + 1
+        if lines and self.__header is None:
+            # skip the first line
+            self.__header = lines.pop(0) + '\n'
+        for line in lines:
+            self.__stats.addLine(line)
+
+        # the partial last line only counts for this update
+        if rest and self.__header is not None:
+            self.__view = copy.deepcopy(self.__stats)
+            self.__view.addLine(rest, warn=False)
+        else:
+            self.__view = self.__stats
+
+        return True
+
+    def getSummary(self):
+        """ Return the maximum and average values in the format of the memory monitor JSON summary """
+
+        summary_dictionary = { "Max": {}, "Avg": {}, "Other": {} }
+        summary_dictionary["Max"] = dict([("max%s" % field, self.max[field]) for field in self.fields])
+        for name, value in self.other.items():
+            if value:
+                summary_dictionary["Other"][name] = value
+        summary_dictionary["Avg"] = dict([("avg%s" % field, int(float(self.total[field])/float(self.N)) if self.N > 0 else 0) for field in self.fields])
+
+        return summary_dictionary
+
+    def getTimeSeries(self):
+        """ Return the lists of times and PSS values """
+
+        return self.times.tolist(), self.pss.tolist()
+
+    def getPSSSlope(self):
+        """ Return the growth of the PSS in kB/s (least squares fit of the time series), None if it cannot be fitted """
+
+        n = len(self.pss)
+        sx, sy, sxx, sxy = self.__view.sums
+        d = n*sxx - sx*sx
+        if n < 2 or d <= 0:
+            return None
+        return (n*sxy - sx*sy)/d
+
+# one reader per memory monitor output file
+readers = {}
+
+def getMemoryMonitorReader(path):
+    """ Return the reader of the memory monitor output path """
+
+    if path not in readers:
+        readers[path] = MemoryMonitorReader(path)
+    return readers[path]
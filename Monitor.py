@@ -1,7 +1,6 @@
 import atexit
 import time
 import os
-import commands
 import json
 import re
 import sys
@@ -20,10 +19,14 @@ from processes import killProcesses, checkProcesses, killOrphans, getMaxMemoryUs
 from PilotErrors import PilotErrors
 from FileStateClient import createFileStates, dumpFileStates, getFileState
 from WatchDog import WatchDog
+from CommandExecutor import getstatusoutput, getoutput, logStatistics
+import Instrumentation
+from Instrumentation import timed
 from PilotTCPServer import PilotTCPServer
-from UpdateHandler import UpdateHandler
+from UpdateHandler import UpdateHandler, setUpdatingPandaServer
 from RunJobFactory import RunJobFactory
-from FileHandling import updatePilotErrorReport, getDirSize, storeWorkDirSize
+from WorkDirActivity import WorkDirActivityScanner
+from FileHandling import updatePilotErrorReport, getDirSize, storeWorkDirSize, getLargestFiles
 
 import inspect
 
@@ -49,6 +52,7 @@ class Monitor:
         self.__env['curtime_sp'] = int(time.time())
         self.__env['curtime_pr'] = int(time.time())
         self.__env['lastTimeFilesWereModified'] = {}
+        self.__workDirActivityScanners = {}
         self.__wdog = WatchDog()
         self.__runJob = None # Remember the RunJob instance
 
@@ -102,6 +106,7 @@ class Monitor:
 
         return allow
 
+    @timed("Monitor.checkPayloadStdout")
     def __checkPayloadStdout(self):
         """ Check the size of the payload stdout """
 
@@ -182,6 +187,7 @@ class Monitor:
 
         return maxwdirsize
 
+    @timed("Monitor.checkWorkDir")
     def __checkWorkDir(self):
         """
         Check the size of the work directory
@@ -203,8 +209,10 @@ class Monitor:
                                          (workDir, size, maxwdirsize)
                         pUtil.tolog("!!FAILED!!1999!! %s" % (pilotErrorDiag))
 
-                        cmd = 'ls -altrR %s' % workDir
-                        pUtil.tolog("%s: %s" % (cmd + '\n', commands.getoutput(cmd)))
+                        # dump the largest files (as seen by the size check above)
+                        pUtil.tolog("Largest files in %s:" % (workDir))
+                        for fsize, path in getLargestFiles(workDir):
+                            pUtil.tolog("%12d B  %s" % (fsize, path))
 
                         # kill the job
                         pUtil.createLockFile(True, self.__env['jobDic'][k][1].workdir, lockfile="JOBWILLBEKILLED")
@@ -234,6 +242,7 @@ class Monitor:
             else:
                 pUtil.tolog("(Skipping size check of workDir since it has not been created yet)")
 
+    @timed("Monitor.checkLocalSpace")
     def __checkLocalSpace(self, disk):
         """ Check the remaining local disk space during running """
 
@@ -268,6 +277,7 @@ class Monitor:
         else:
             pUtil.tolog("Remaining local disk space: %d B" % (spaceleft))
 
+    @timed("Monitor.check_remaining_proxy")
     def __check_remaining_proxy(self):
         """
         Every five minutes, check the remaining proxy life time
@@ -302,6 +312,7 @@ class Monitor:
             # update the time for checking the proxy
             self.__env['curtime_pr'] = int(time.time())
 
+    @timed("Monitor.check_memory_usage")
     def __check_memory_usage(self):
         """
         Every minute check the memory usage of the payload
@@ -366,6 +377,7 @@ class Monitor:
             # update the time for checking memory
             self.__env['curtime_mem'] = int(time.time())
 
+    @timed("Monitor.check_remaining_space")
     def __check_remaining_space(self):
         """
         Every ten minutes, check the remaining disk space, the size of the workdir
@@ -375,6 +387,12 @@ class Monitor:
             # check the size of the payload stdout
             self.__skip = self.__checkPayloadStdout()
 
+            # scan the new payload output (the final error diagnosis will continue from there)
+            thisExperiment = pUtil.getExperiment(self.__env['experiment'])
+            for k in self.__env['jobDic'].keys():
+                job = self.__env['jobDic'][k][1]
+                thisExperiment.scanPayloadOutput(job, number_of_jobs=job.jobPars.count("\n") + 1)
+
             # update the worker node info (i.e. get the remaining disk space)
             self.__env['workerNode'].collectWNInfo(self.__env['thisSite'].workdir)
             self.__skip = self.__checkLocalSpace(self.__env['workerNode'].disk)
@@ -405,7 +423,7 @@ class Monitor:
                     if not os.path.exists(lnfilename):
                         # ..and only if the size of stdout is > 0
                         if os.path.getsize(filename) > 0:
-                            ec, rs = commands.getstatusoutput("ln -s %s %s" % (filename, lnfilename))
+                            ec, rs = getstatusoutput("ln -s %s %s" % (filename, lnfilename), timeout=60)
                             if ec == 0:
                                 pUtil.tolog("Created soft link to %s in sitedir: %s" % (_stdout, lnfilename))
                             else:
@@ -489,7 +507,7 @@ class Monitor:
                 for file_name in self.__env['jobDic'][k][1].outFiles:
                     findFlag = False
                     # locate the file first
-                    out = commands.getoutput("find %s -name %s" % (self.__env['jobDic'][k][1].workdir, file_name))
+                    out = getoutput("find %s -name %s" % (self.__env['jobDic'][k][1].workdir, file_name), timeout=600)
                     if out != "":
                         for line in out.split('\n'):
                             try:
@@ -509,6 +527,7 @@ class Monitor:
 
         return rc, pilotErrorDiag, job_index
 
+    @timed("Monitor.checkOutputFileSizes")
     def __checkOutputFileSizes(self):
         """ check that the output file sizes are within the limit """
         # return True for too large files, to skip looping test and normal server update
@@ -558,12 +577,13 @@ class Monitor:
                          (job.jobId, pUtil.timeStamp())
         pUtil.tolog("!!FAILED!!1999!! %s" % (pilotErrorDiag))
 
-        cmd = 'ps -fwu %s' % (commands.getoutput("whoami"))
-        pUtil.tolog("%s: %s" % (cmd + '\n', commands.getoutput(cmd)))
+        whoami = getoutput("whoami", timeout=60)
+        cmd = 'ps -fwu %s' % (whoami)
+        pUtil.tolog("%s: %s" % (cmd + '\n', getoutput(cmd, timeout=60)))
         cmd = 'ls -ltr %s' % (job.workdir)
-        pUtil.tolog("%s: %s" % (cmd + '\n', commands.getoutput(cmd)))
-        cmd = 'ps -o pid,ppid,sid,pgid,tpgid,stat,comm -u %s' % (commands.getoutput("whoami"))
-        pUtil.tolog("%s: %s" % (cmd + '\n', commands.getoutput(cmd)))
+        pUtil.tolog("%s: %s" % (cmd + '\n', getoutput(cmd, timeout=60)))
+        cmd = 'ps -o pid,ppid,sid,pgid,tpgid,stat,comm -u %s' % (whoami)
+        pUtil.tolog("%s: %s" % (cmd + '\n', getoutput(cmd, timeout=60)))
 
         pUtil.createLockFile(True, job.workdir, lockfile="JOBWILLBEKILLED")
         killProcesses(pid, job.pgrp)
@@ -624,11 +644,11 @@ class Monitor:
 
                 # update the panda server
                 try:
-                    self.__env['jobDic'][k][1].updatingPandaServer = True
+                    setUpdatingPandaServer(self.__env['jobDic'][k][1], True)
                     ret, retNode = pUtil.updatePandaServer(self.__env['jobDic'][k][1], stdout_tail = self.__env['stdout_tail'], stdout_path = self.__env['stdout_path'])
-                    self.__env['jobDic'][k][1].updatingPandaServer = False
+                    setUpdatingPandaServer(self.__env['jobDic'][k][1], False)
                 except  Exception, e:
-                    self.__env['jobDic'][k][1].updatingPandaServer = False
+                    setUpdatingPandaServer(self.__env['jobDic'][k][1], False)
                     raise e
 
                 if ret == 0:
@@ -712,39 +732,16 @@ class Monitor:
                 # loop over all job output files and find the one with the latest modification time
                 # note that some files might not have been created at this point (e.g. RDO built from HITS)
 
-                # locate all files that were modified the last N minutes
-                cmd = "find %s -mmin -%d" % (self.__env['jobDic'][k][1].workdir, int(self.__env['loopingLimit']/60))
-                pUtil.tolog("Executing command: %s" % (cmd))
-                out = commands.getoutput(cmd)
-                if out != "":
-                    files = out.split("\n")
-                    if len(files) > 0:
-                        # remove unwanted list items (*.py, *.pyc, workdir, ...)
-                        _files = []
-                        for _file in files:
-                            if not (self.__env['jobDic'][k][1].workdir == _file or
-                                    ".lib.tgz" in _file or
-                                    ".py" in _file or
-                                    "PoolFileCatalog" in _file or
-                                    "setup.sh" in _file or
-                                    "jobState" in _file or
-                                    "pandaJob" in _file or
-                                    "runjob" in _file or
-                                    "matched_replicas" in _file or
-                                    "memory_" in _file or
-                                    "mem." in _file or
-                                    "DBRelease-" in _file):
-                                _files.append(_file)
-                        if _files != []:
-                            pUtil.tolog("Found %d files that were recently updated (e.g. file %s)" % (len(_files), _files[0]))
-                            # get the current system time
-                            self.__env['lastTimeFilesWereModified'][k] = int(time.time())
-                        else:
-                            pUtil.tolog("WARNING: found no recently updated files!")
-                    else:
-                        pUtil.tolog("WARNING: found no recently updated files")
+                # locate a file that was modified within the looping limit (skipping *.py, *.pyc, workdir, ...)
+                scanner = self.__getWorkDirActivityScanner(k)
+                found = scanner.findRecentlyModified(int(time.time()) - self.__env['loopingLimit'])
+                if found:
+                    pUtil.tolog("Found recently updated file %s (modified at %s, %d stat calls)" %\
+                                (found[0], time.strftime("%H:%M:%S", time.gmtime(found[1])), scanner.nStats))
+                    # get the current system time
+                    self.__env['lastTimeFilesWereModified'][k] = int(time.time())
                 else:
-                    pUtil.tolog("WARNING: Found no recently updated files")
+                    pUtil.tolog("WARNING: Found no recently updated files (%d stat calls)" % (scanner.nStats))
 
                 # check if the last modification time happened long ago
                 # (process is considered to be looping if it's files have not been modified within loopingLimit time)
@@ -754,17 +751,31 @@ class Monitor:
                 if (int(time.time()) - self.__env['lastTimeFilesWereModified'][k]) > self.__env['loopingLimit']:
                     self.__env['jobDic'][k][1] = self.__killLoopingJob(self.__env['jobDic'][k][1], self.__env['jobDic'][k][0])
 
+    def __getWorkDirActivityScanner(self, k):
+        """ Return the work dir activity scanner for job k """
+
+        workdir = self.__env['jobDic'][k][1].workdir
+        scanner = self.__workDirActivityScanners.get(k)
+        if not scanner or scanner.workdir != workdir:
+            scanner = WorkDirActivityScanner(workdir, exclusions=self.__env['loopingExclusions'])
+            self.__workDirActivityScanners[k] = scanner
+        return scanner
+
+    @timed("Monitor.check_looping_jobs")
     def __check_looping_jobs(self):
-        # every 30 minutes, look for looping jobs
-        if (int(time.time()) - self.__env['curtime']) > self.__env['update_freq_server'] and not self.__skip: # 30 minutes
+        # every 5 minutes, look for looping jobs
+        if (int(time.time()) - self.__env['curtime_looping']) > self.__env['update_freq_looping'] and not self.__skip:
             # check when the workdir files were last updated or that the stageout command is not hanging
             if self.__allowLoopingJobKiller():
                 self.__loopingJobKiller()
+            self.__env['curtime_looping'] = int(time.time())
 
+        # every 30 minutes, update the server
+        if (int(time.time()) - self.__env['curtime']) > self.__env['update_freq_server'] and not self.__skip: # 30 minutes
             # make final server update for all ended jobs
             self.__updateJobs()
 
-            # update the time for checking looping jobs
+            # update the time for the server update
             self.__env['curtime'] = int(time.time())
 
         self.__updateJobs(onlyUpdateStateChangedJobs=True)
@@ -781,7 +792,7 @@ class Monitor:
         # verify permissions
         cmd = "stat %s" % (self.__env['thisSite'].workdir)
         pUtil.tolog("(1b) Executing command: %s" % (cmd))
-        rc, rs = commands.getstatusoutput(cmd)
+        rc, rs = getstatusoutput(cmd, timeout=60)
         pUtil.tolog("\n%s" % (rs))
 
     def __getsetWNMem(self):
@@ -827,13 +838,14 @@ class Monitor:
 
             cmd = "ulimit -a"
             pUtil.tolog("Executing command: %s" % (cmd))
-            out = commands.getoutput(cmd)
+            out = getoutput(cmd, timeout=60)
             pUtil.tolog("\n%s" % (out))
         else:
             pUtil.tolog("Max memory will not be set")
 
         return maxrss
 
+    @timed("Monitor.checkLocalDiskSpace")
     def __checkLocalDiskSpace(self, disk):
         """ Do we have enough local disk space left to run the job? """
 
@@ -1208,6 +1220,7 @@ class Monitor:
 
             self.__set_outputs()
             self.__verify_permissions()
+            Instrumentation.configure(pUtil.readpar('catchall'))
 
 
             # PN
@@ -1480,6 +1493,7 @@ class Monitor:
                     # start the RunJob* subprocess
                     pUtil.chdir(self.__env['jobDic']["prod"][1].workdir)
                     sys.path.insert(1,".")
+                    pUtil.flushLog()
                     os.execvpe(self.__env['pyexe'], jobargs, os.environ)
 
             # Control variables for looping jobs
@@ -1495,6 +1509,7 @@ class Monitor:
             self.__env['curtime_of'] = self.__env['curtime']
             self.__env['curtime_proc'] = self.__env['curtime']
             self.__env['curtime_mem'] = self.__env['curtime']
+            self.__env['curtime_looping'] = self.__env['curtime']
             self.__env['create_softlink'] = True
             while True:
 
@@ -1695,6 +1710,7 @@ class Monitor:
 
         # end of the pilot
         else:
+            logStatistics(pUtil.tolog)
             self.__env['return'] = 0
             return
 
@@ -1724,6 +1740,7 @@ class Monitor:
 
             self.__set_outputs()
             self.__verify_permissions()
+            Instrumentation.configure(pUtil.readpar('catchall'))
 
 
             # start the monitor and watchdog process
@@ -1841,6 +1858,7 @@ class Monitor:
                         break
                 jobargs[i+1] = '%s' % monthread.port
                 pUtil.tolog("jobargs=%s" % (jobargs))
+                pUtil.flushLog()
                 os.execvpe(self.__env['pyexe'], jobargs, os.environ)
 
             # Control variables for looping jobs
@@ -1856,6 +1874,7 @@ class Monitor:
             self.__env['curtime_of'] = self.__env['curtime']
             self.__env['curtime_proc'] = self.__env['curtime']
             self.__env['curtime_mem'] = self.__env['curtime']
+            self.__env['curtime_looping'] = self.__env['curtime']
             self.__env['create_softlink'] = True
             while True:
 
@@ -174,6 +174,15 @@ class PandaServerClient:
             if filenames != "":
                 jobMetrics += self.jobMetric(key="altTransferred", value=filenames)
 
+        # time spent creating the log tarball (archiving, and compression summed over the threads)
+        if job.timeLogTar or job.timeLogZip:
+            jobMetrics += self.jobMetric(key="logTarTime", value=job.timeLogTar)
+            jobMetrics += self.jobMetric(key="logZipTime", value=job.timeLogZip)
+
+        # where the pilot overhead went (when profiling, see Instrumentation)
+        if job.profileSummary:
+            jobMetrics += self.jobMetric(key="pilotProfile", value=job.profileSummary)
+
         # report on which OS bucket the log was written to, if any
         if job.logBucketID != -1:
             jobMetrics += self.jobMetric(key="logBucketID", value=job.logBucketID)
@@ -726,6 +735,20 @@ class PandaServerClient:
 
         return filenamePayloadMetadata
 
+    def getFAXRecoveryParams(self, job):
+        """ Return the PandaLogger parameters reporting the FAX usage of a job """
+
+        params = {}
+        params['pid'] = job.jobId
+        params['line'] = 0 # this is mandatory part of API, has to be present
+        params['type'] = 'FAXrecovery'
+        params['message'] = '"WithFAX":' + str(job.filesWithFAX) +\
+                            ',"WithoutFAX":' + str(job.filesWithoutFAX) +\
+                            ',"bytesWithFAX":' + str(job.bytesWithFAX) +\
+                            ',"bytesWithoutFAX":' + str(job.bytesWithoutFAX) +\
+                            ',"timeToCopy":' + str(job.timeStageIn)
+        return params
+
     def updatePandaServer(self, job, site, workerNode, port, xmlstr=None, spaceReport=False, log=None, ra=0, jr=False, useCoPilot=False, stdout_tail="", stdout_path="", additionalMetadata=None):
         """
         Update the job status with the jobdispatcher web server.
@@ -972,16 +995,7 @@ class PandaServerClient:
             # do not send FAX info for overflow jobs (transferType=fax), only for failover jobs
             if job.filesWithFAX > 0 and job.transferType.lower() != "fax":
                 tolog("Sending PandaLogger update")
-                params = {}
-                params['pid'] = job.jobId
-                params['line'] = 0 # this is mandatory part of API, has to be present
-                params['type'] = 'FAXrecovery'
-                params['message'] = '"WithFAX":' + str(job.filesWithFAX) +\
-                                    ',"WithoutFAX":' + str(job.filesWithoutFAX) +\
-                                    ',"bytesWithFAX":' + str(job.bytesWithFAX) +\
-                                    ',"bytesWithoutFAX":' + str(job.bytesWithoutFAX) +\
-                                    ',"timeToCopy":' + job.timeStageIn
-                toPandaLogger(params)
+                toPandaLogger(self.getFAXRecoveryParams(job))
 
         # make the actual update, repeatedly if necessary (for the final update)
         #ret = makeHTTPUpdate(job.result[0], node, port, url=self.__pshttpurl, path=self.__pilot_initdir)
@@ -1,9 +1,50 @@
-from SocketServer import TCPServer
+from SocketServer import TCPServer, ThreadingMixIn
 import threading
 import random
 import socket
+import struct
+import json
 from pUtil import tolog
 
+# messages between runJob and the pilot are json documents, each preceded by its length (4 bytes, network order)
+HEADER = struct.Struct("!I")
+
+def sendMessage(sock, message):
+    """ Send a message (a json serializable object) """
+
+    data = json.dumps(message)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def recvExactly(sock, size, data=""):
+    """ Receive size bytes (after data), None if the connection was closed first """
+
+    chunks = [data]
+    received = len(data)
+    while received < size:
+        chunk = sock.recv(min(size - received, 1024*1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        received += len(chunk)
+    return "".join(chunks)
+
+def recvMessage(sock):
+    """ Receive a message, None if the connection was closed """
+
+    header = recvExactly(sock, HEADER.size)
+    if header is None:
+        return None
+    data = recvExactly(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return json.loads(data)
+
+class ThreadingPilotTCPServer(ThreadingMixIn, TCPServer):
+    """ TCP server handling each connection in its own thread """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
 class PilotTCPServer(threading.Thread):
     """ TCP server used to send TCP messages from runJob to pilot """
 
@@ -16,7 +57,7 @@ class PilotTCPServer(threading.Thread):
             n += 1
             self.port = random.randrange(1, 800, 1) + 8888
             try:
-                self.srv = TCPServer(('localhost',self.port), handler)
+                self.srv = ThreadingPilotTCPServer(('localhost',self.port), handler)
             except socket.error, e:
                 tolog("WARNING: Can not create TCP server on port %d, re-try... : %s" % (self.port, str(e)))
             else:
@@ -26,20 +67,19 @@ class PilotTCPServer(threading.Thread):
         if n >= 20: # raise some exception later ??
             self.srv = None
             self.port = None
-            
-        self._stopevent = threading.Event() 
+
         threading.Thread.__init__(self, name=name)
 
     def run(self):
         """ main control loop """
         tolog("%s starts" % str((self.getName( ),)))
 
-        while not self._stopevent.isSet():
-            self.srv.handle_request()
-                
+        # the connections are served by their own threads
+        self.srv.serve_forever(poll_interval=1)
+
     def join(self, timeout=None):
         """ Stop the thread and wait for it to end. """
         tolog("join called on thread %s" % self.getName())
-        self._stopevent.set() # signal thread to stop
-        self.srv.socket.shutdown(2) # shutdown the connection in two-ways
+        self.srv.shutdown() # stop serve_forever
+        self.srv.server_close()
         threading.Thread.join(self, timeout) # wait until the thread terminates or timeout occurs
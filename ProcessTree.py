@@ -0,0 +1,192 @@
+import os
+
+class ProcessTree(object):
+    """ Snapshot of the process table read from /proc
+
+    All /proc/<pid>/stat files are read once and indexed by pid and parent pid, so that descendant
+    lists, zombie states, CPU times and RSS of a whole process tree are answered without running
+    ps. Command lines and owners are read on demand (and cached) for the pids that are asked for.
+    """
+
+    def __init__(self, proc="/proc"):
+        self.__proc = proc
+        self.__stats = {}      # pid -> (comm, state, ppid, pgrp, utime+stime [ticks], rss [pages])
+        self.__children = {}   # ppid -> [pid, ..]
+        self.__cmdlines = {}
+        self.__uids = {}
+        self.refresh()
+
+    @staticmethod
+    def isAvailable(proc="/proc"):
+        """ Is there a readable /proc file system? """
+
+        return os.path.exists(os.path.join(proc, "self", "stat"))
+
+    def refresh(self):
+        """ Read the process table """
+
+        stats = {}
+        children = {}
+        try:
+            entries = os.listdir(self.__proc)
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.isdigit():
+                continue
+            stat = self.__readStat(entry)
+            if stat:
+                pid = int(entry)
+                stats[pid] = stat
+                children.setdefault(stat[2], []).append(pid)
+        for pids in children.values():
+            pids.sort()
+        self.__stats = stats
+        self.__children = children
+        self.__cmdlines = {}
+        self.__uids = {}
+
+    def __readStat(self, pid):
+        """ Parse /proc/<pid>/stat, return None if the process has gone """
+
+        try:
+            f = open(os.path.join(self.__proc, str(pid), "stat"), "r")
+            try:
+                line = f.read()
+            finally:
+                f.close()
+        except IOError:
+            return None
+
+        # the command name is in parentheses and may itself contain spaces and parentheses
+        start = line.find("(")
+        end = line.rfind(")")
+        if start == -1 or end == -1:
+            return None
+        comm = line[start+1:end]
+        fields = line[end+2:].split()
+        try:
+            # fields[0] is field 3 of proc(5): state, ppid, pgrp, .., utime (14), stime (15), .., rss (24)
+            return (comm, fields[0], int(fields[1]), int(fields[2]), int(fields[11]) + int(fields[12]), int(fields[21]))
+        except (IndexError, ValueError):
+            return None
+
+    def getPids(self):
+        """ Return all pids in the snapshot """
+
+        return sorted(self.__stats.keys())
+
+    def exists(self, pid):
+        """ Was pid running when the snapshot was taken? """
+
+        return int(pid) in self.__stats
+
+    def getParent(self, pid):
+        """ Return the parent pid of pid (or None) """
+
+        stat = self.__stats.get(int(pid))
+        if stat:
+            return stat[2]
+        return None
+
+    def getChildren(self, pid):
+        """ Return the pids of the direct children of pid """
+
+        return list(self.__children.get(int(pid), []))
+
+    def getDescendants(self, pid, includeSelf=True):
+        """ Return pid (if includeSelf) followed by all its descendants, depth first """
+
+        pid = int(pid)
+        descendants = []
+        if includeSelf:
+            descendants.append(pid)
+        stack = list(reversed(self.__children.get(pid, [])))
+        seen = set([pid])
+        while stack:
+            child = stack.pop()
+            if child in seen:
+                continue
+            seen.add(child)
+            descendants.append(child)
+            stack.extend(reversed(self.__children.get(child, [])))
+        return descendants
+
+    def getState(self, pid):
+        """ Return the one letter process state (R, S, D, Z, ..) or None """
+
+        stat = self.__stats.get(int(pid))
+        if stat:
+            return stat[1]
+        return None
+
+    def isZombie(self, pid):
+        """ Return True if pid is a zombie process """
+
+        return self.getState(pid) == "Z"
+
+    def getName(self, pid):
+        """ Return the command name (comm) of pid """
+
+        stat = self.__stats.get(int(pid))
+        if stat:
+            return stat[0]
+        return ""
+
+    def getCommand(self, pid):
+        """ Return the full command line of pid (as ps args) """
+
+        pid = int(pid)
+        if pid not in self.__cmdlines:
+            cmdline = ""
+            try:
+                f = open(os.path.join(self.__proc, str(pid), "cmdline"), "r")
+                try:
+                    cmdline = f.read()
+                finally:
+                    f.close()
+            except IOError:
+                pass
+            cmdline = " ".join(cmdline.split("\0")).strip()
+            if cmdline == "" and pid in self.__stats:
+                # kernel threads and zombies have no command line
+                cmdline = "[%s]" % (self.__stats[pid][0])
+            self.__cmdlines[pid] = cmdline
+        return self.__cmdlines[pid]
+
+    def getUid(self, pid):
+        """ Return the (effective) uid owning pid, or None """
+
+        pid = int(pid)
+        if pid not in self.__uids:
+            try:
+                self.__uids[pid] = os.stat(os.path.join(self.__proc, str(pid))).st_uid
+            except OSError:
+                self.__uids[pid] = None
+        return self.__uids[pid]
+
+    def getCPUTime(self, pid):
+        """ Return the user+system CPU time of pid in seconds """
+
+        stat = self.__stats.get(int(pid))
+        if stat:
+            return float(stat[4]) / os.sysconf("SC_CLK_TCK")
+        return 0.0
+
+    def getRSS(self, pid):
+        """ Return the resident set size of pid in kB """
+
+        stat = self.__stats.get(int(pid))
+        if stat:
+            return stat[5] * (os.sysconf("SC_PAGE_SIZE") / 1024)
+        return 0
+
+    def getTreeCPUTime(self, pid):
+        """ Return the summed CPU time in seconds of pid and its descendants """
+
+        return sum([self.getCPUTime(_pid) for _pid in self.getDescendants(pid)])
+
+    def getTreeRSS(self, pid):
+        """ Return the summed RSS in kB of pid and its descendants """
+
+        return sum([self.getRSS(_pid) for _pid in self.getDescendants(pid)])
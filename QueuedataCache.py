@@ -0,0 +1,193 @@
+import os
+import re
+import json
+import marshal
+
+from StateSnapshot import writeAtomic
+
+class QueuedataCache(object):
+    """ Process wide cache of parsed queuedata files
+
+    Each file is parsed once into a dictionary, keyed by path and validated against the file's
+    mtime and size, so readpar() becomes a dictionary lookup. Writers of the queuedata file must
+    call invalidate() since a rewrite can keep both mtime and size.
+    """
+
+    def __init__(self):
+        self.__entries = {}   # path -> (mtime, size, dictionary)
+        self.nParses = 0      # number of times a queuedata file was read and parsed
+        self.nHits = 0        # number of parses avoided
+
+    def get(self, path, containsJson=False):
+        """ Return the parsed queuedata dictionary for path (raises OSError/IOError if it cannot be read) """
+
+        st = os.stat(path)
+        entry = self.__entries.get(path)
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            self.nHits += 1
+            return entry[2]
+
+        f = open(path)
+        try:
+            s = f.read()
+        finally:
+            f.close()
+        if s == "":
+            dictionary = {}
+        elif containsJson:
+            dictionary = json.loads(s)
+        else:
+            dictionary = parseQueuedataString(s)
+        self.__entries[path] = (st.st_mtime, st.st_size, dictionary)
+        self.nParses += 1
+
+        return dictionary
+
+    def invalidate(self, path=None):
+        """ Forget the cached content of path (or of all files) """
+
+        if path:
+            self.__entries.pop(path, None)
+            self.__entries.pop(os.path.basename(path), None)
+        else:
+            self.__entries = {}
+
+    def getStatistics(self):
+        """ Return a summary string of the cache usage """
+
+        return "queuedata parsed %d time(s), %d parse(s) avoided" % (self.nParses, self.nHits)
+
+def parseQueuedataString(s):
+    """ Convert a string on the form par1=value1|par2=value2|... to a dictionary """
+
+    # a value ends where the next |par= begins, so values may themselves contain |-signs
+    # (first occurrence of a parameter wins, as in the old per-parameter lookup)
+    dictionary = {}
+    matches = list(re.finditer("(^|\|)([^\|=]+)=", s))
+    for i, match in enumerate(matches):
+        par = match.group(2)
+        if par in dictionary:
+            continue
+        if i + 1 == len(matches):
+            value = s[match.end():]
+            if value.endswith("\n"):
+                value = value[:-1]
+        else:
+            value = s[match.end():matches[i+1].start()]
+        dictionary[par] = value
+
+    return dictionary
+
+class AGISConfigCache(object):
+    """ Process wide cache of the AGIS schedconf/ddmconf json files, indexed by panda queue or ddm endpoint
+
+    A source file (tens of MB for the full CVMFS dump) is parsed at most once per mtime and size, and only the
+    entries that were asked for are kept, marshalled, so that each caller gets its own copy to modify. The entries
+    are also saved in an index file next to the source, which the next pilot or runJob process reads instead of
+    parsing the source again while it has not changed.
+    """
+
+    def __init__(self):
+        self.__entries = {}   # path -> (mtime, size, {name: marshalled entry or None if missing}, marshalled document or None)
+        self.nParses = 0      # number of times a source was parsed
+        self.nIndexReads = 0  # number of times entries were found in an index file
+        self.nHits = 0        # number of requests served from memory
+
+    def getIndexFileName(self, path):
+        return "%s.index" % path
+
+    def get(self, path, names=None):
+        """ Return {name: entry} for the names found in the source path (the whole document if no names are given)
+
+        Raises OSError/IOError if the source cannot be read and ValueError if it is not a valid document.
+        """
+
+        st = os.stat(path)
+        entry = self.__entries.get(path)
+        if not entry or entry[0] != st.st_mtime or entry[1] != st.st_size:
+            entry = (st.st_mtime, st.st_size, {}, None)
+            self.__entries[path] = entry
+        mtime, size, entries, document = entry
+
+        if not names:
+            if document is None:
+                document = marshal.dumps(self.__parse(path))
+                self.__entries[path] = (mtime, size, entries, document)
+            else:
+                self.nHits += 1
+            return marshal.loads(document)
+
+        missing = [name for name in set(names) if name not in entries]
+        if missing:
+            self.__readIndex(path, mtime, size, entries)
+            missing = [name for name in missing if name not in entries]
+        else:
+            self.nHits += 1
+        if missing:
+            data = self.__parse(path)
+            for name in missing:
+                entries[name] = marshal.dumps(data[name]) if name in data else None
+            del data
+            self.__writeIndex(path, mtime, size, entries)
+
+        return dict([(name, marshal.loads(entries[name])) for name in set(names) if entries[name] is not None])
+
+    def __parse(self, path):
+        """ Read and parse the source path """
+
+        f = open(path)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+        self.nParses += 1
+
+        # AGIS reports a failed query as {'error': ...}
+        if not data or not isinstance(data, dict) or 'error' in data:
+            raise ValueError("not a valid AGIS document: %s" % str(data)[:256])
+        return data
+
+    def __readIndex(self, path, mtime, size, entries):
+        """ Add the entries of the index file of path to entries, if it was made from the current source """
+
+        try:
+            f = open(self.getIndexFileName(path))
+            try:
+                index = json.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError):
+            return
+        if type(index) is not dict or index.get('mtime') != mtime or index.get('size') != size:
+            return
+        for name, value in index.get('entries', {}).items():
+            if name not in entries:
+                entries[str(name)] = marshal.dumps(value) if value is not None else None
+        self.nIndexReads += 1
+
+    def __writeIndex(self, path, mtime, size, entries):
+        """ Save the entries of path in its index file (in the pilot home directory, next to the source) """
+
+        index = {'mtime': mtime, 'size': size,
+                 'entries': dict([(name, marshal.loads(value) if value is not None else None) for name, value in entries.items()])}
+        try:
+            writeAtomic(self.getIndexFileName(path), index, dump=json.dump)
+        except (IOError, OSError):
+            # the index only saves time
+            pass
+
+    def invalidate(self, path=None):
+        """ Forget the cached entries of path (or of all files), e.g. after the source was downloaded again """
+
+        if path:
+            self.__entries.pop(path, None)
+        else:
+            self.__entries = {}
+
+    def getStatistics(self):
+        """ Return a summary string of the cache usage """
+
+        return "AGIS config parsed %d time(s), %d index read(s), %d request(s) served from memory" % (self.nParses, self.nIndexReads, self.nHits)
+
+queuedataCache = QueuedataCache()
+agisConfigCache = AGISConfigCache()
@@ -19,9 +19,10 @@ from json import loads
 
 # Pilot modules
 import Site, pUtil, Job, Node, RunJobUtilities
+import Instrumentation
 import Mover as mover
 from pUtil import tolog, readpar, createLockFile, getDatasetDict, getSiteInformation,\
-     tailPilotErrorDiag, getCmtconfig, getExperiment, getGUID
+     tailPilotErrorDiag, getCmtconfig, getExperiment, getGUID, flushLog
 from JobRecovery import JobRecovery
 from FileStateClient import updateFileStates, dumpFileStates
 from ErrorDiagnosis import ErrorDiagnosis # import here to avoid issues seen at BU with missing module
@@ -517,9 +518,12 @@ class RunJob(object):
         rs is the return string from Mover::put containing a list of files that were not transferred
         '''
 
+        # the pilot adds its own timers to the profile when the job has ended
+        Instrumentation.dump(job.workdir)
         self.cleanup(job, rf=rf)
         sys.stderr.close()
         tolog("RunJob (payload wrapper) has finished")
+        flushLog()
         # change to sys.exit?
         os._exit(job.result[2]) # pilotExitCode, don't confuse this with the overall pilot exit code,
                                 # which doesn't get reported back to panda server anyway
@@ -1757,6 +1761,7 @@ if __name__ == "__main__":
             runJob.setFailureCode(runJob.getGlobalErrorCode())
             # print to stderr
             print >> sys.stderr, runJob.getGlobalPilotErrorDiag()
+            flushLog()
             raise SystemError(sig)
 
         signal.signal(signal.SIGTERM, sig2exc)
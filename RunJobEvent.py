@@ -19,6 +19,8 @@ import signal
 import commands
 import traceback
 import uuid
+import Queue
+import threading
 from optparse import OptionParser
 from json import loads, dump
 from shutil import copy2
@@ -30,12 +32,15 @@ import Node
 import Site
 import pUtil
 import RunJobUtilities
+import Instrumentation
 import Mover as mover
 from JobRecovery import JobRecovery
 from FileStateClient import getFilesOfState
 from ErrorDiagnosis import ErrorDiagnosis # import here to avoid issues seen at BU with missing module
 from PilotErrors import PilotErrors
 from StoppableThread import StoppableThread
+from ProcessTree import ProcessTree
+from TarAppender import TarAppender
 from pUtil import tolog, isAnalysisJob, readpar, createLockFile, getDatasetDict,\
      tailPilotErrorDiag, getExperiment, getEventService,\
      getSiteInformation, getGUID
@@ -79,6 +84,8 @@ class RunJobEvent(RunJob):
     __eventRange_dictionary = {}                 # eventRange_dictionary[event_range_id] = [path, cpu, wall]
     __eventRangeID_dictionary = {}               # eventRangeID_dictionary[event_range_id] = True (corr. output file has been transferred)
     __stageout_queue = []                        # Queue for files to be staged-out; files are added as they arrive and removed after they have been staged-out
+    __stageout_queue_info = {}                   # stageout_queue_info[tuple(paths)] = (event_range_id, time added to the stage-out queue)
+    __tarAppenders = {}                          # open zip (tar) files of the event range outputs: name -> TarAppender
     __pfc_path = ""                              # The path to the pool file catalog
     __message_server_payload = None              # Message server for the payload
     __message_server_prefetcher = None           # Message server for Prefetcher
@@ -114,6 +121,14 @@ class RunJobEvent(RunJob):
     __multipleBuckets = None
     __numBuckets = 1
     __stageoutStorages = None
+    __stageoutStoragesLock = threading.Lock()    # Stage-out storages resolve and counters (concurrent stage-outs)
+    __esStageOutWorkers = 4                      # Number of concurrent event range stage-outs (non-zip mode)
+    __esUpdateBatchSize = 100                    # Max number of event ranges per updateEventRanges call
+    __stageoutQueueMaxDepth = 0
+    __stageoutQueueMaxAge = 0
+    __stageoutEnvCondition = threading.Condition()
+    __stageoutEnvKeys = None                     # S3 access key in the environment for the ongoing stage-outs
+    __stageoutEnvUsers = 0                       # Number of ongoing stage-outs using the environment
     __max_wait_for_one_event = 360	# 6 hours, 360 minutes
     __min_events = 1
     __allowPrefetchEvents = True
@@ -1200,9 +1215,12 @@ class RunJobEvent(RunJob):
         rs is the return string from Mover::put_data() containing a list of files that were not transferred
         '''
 
+        # the pilot adds its own timers to the profile when the job has ended
+        Instrumentation.dump(self.__job.workdir)
         self.cleanup(rf=rf)
         sys.stderr.close()
         tolog("RunJobEvent (payload wrapper) has finished")
+        pUtil.flushLog()
 
         # change to sys.exit?
         os._exit(self.__job.result[2]) # pilotExitCode, don't confuse this with the overall pilot exit code,
@@ -1400,6 +1418,13 @@ class RunJobEvent(RunJob):
                         name, value = catchall.split('=')
                         self.__min_events = int(value)
             tolog("Minimal events requirement: %s events" % self.__min_events)
+
+            if "es_stageout_workers=" in catchalls:
+                for catchall in catchalls.split(","):
+                    if 'es_stageout_workers=' in catchall:
+                        name, value = catchall.split('=')
+                        self.__esStageOutWorkers = max(int(value), 1)
+            tolog("Number of concurrent event range stage-outs: %s" % self.__esStageOutWorkers)
         except:
             tolog("Failed to init zip cofnig: %s" % traceback.format_exc())
 
@@ -1844,71 +1869,110 @@ class RunJobEvent(RunJob):
         """
         tolog("To stage out event %s: %s" % (event_range_id, file_paths))
 
-        if self.__stageoutStorages is None or\
-            self.__stageoutStorages['primary'] and self.is_blacklisted(self.__stageoutStorages['primary']['endpoint']) or\
-            self.__stageoutStorages['failover'] and self.is_blacklisted(self.__stageoutStorages['failover']['endpoint']):
-            ret, storages = self.reolve_stageout_endpoints()
-            if ret:
-                 tolog("[stage_out_es] Failed to resolve stageout endpoints: %s, %s" % (ret, storages))
-                 return PilotErrors.ERR_NOSTORAGE, "[stage_out_es] Failed to resolve stageout endpoints: %s, %s" % (ret, storages), None
-            else:
-                self.__stageoutStorages = storages
+        # stage_out_es() is called by the concurrent stage-out workers: the storages are resolved once,
+        # and their counters are updated under the lock (the transfers are not)
+        with self.__stageoutStoragesLock:
+            if self.__stageoutStorages is None or\
+                self.__stageoutStorages['primary'] and self.is_blacklisted(self.__stageoutStorages['primary']['endpoint']) or\
+                self.__stageoutStorages['failover'] and self.is_blacklisted(self.__stageoutStorages['failover']['endpoint']):
+                ret, storages = self.reolve_stageout_endpoints()
+                if ret:
+                     tolog("[stage_out_es] Failed to resolve stageout endpoints: %s, %s" % (ret, storages))
+                     return PilotErrors.ERR_NOSTORAGE, "[stage_out_es] Failed to resolve stageout endpoints: %s, %s" % (ret, storages), None
+                else:
+                    self.__stageoutStorages = storages
+            primary, failover = self.__stageoutStorages['primary'], self.__stageoutStorages['failover']
+            usePrimary = primary and (primary['continousErrors'] < 3 or random.randint(1, primary['continousErrors']) <2)
 
         ret_code, ret_str, os_bucket_id = PilotErrors.ERR_STAGEOUTFAILED, "Stageout failed", -1
-        if self.__stageoutStorages['primary'] and (self.__stageoutStorages['primary']['continousErrors'] < 3 or random.randint(1, self.__stageoutStorages['primary']['continousErrors']) <2):
-            tolog("[stage_out_es] Trying to stageout with primary storage: %s" % (self.__stageoutStorages['primary']['endpoint']))
+        if usePrimary:
+            tolog("[stage_out_es] Trying to stageout with primary storage: %s" % (primary['endpoint']))
             try:
-                ret_code, ret_str, os_bucket_id = self.stage_out_es_real(job, event_range_id, file_paths, pathConvention=pathConvention, storage=self.__stageoutStorages['primary'])
+                ret_code, ret_str, os_bucket_id = self.stage_out_es_real(job, event_range_id, file_paths, pathConvention=pathConvention, storage=primary)
             except Exception, e:
                 tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+            self.countStageOut(primary, ret_code == 0)
             if ret_code == 0:
-                tolog("[stage_out_es] Successful to stageout to primary storage: %s" % (self.__stageoutStorages['primary']['endpoint']))
-                self.__stageoutStorages['primary']['continousErrors'] = 0
-                self.__stageoutStorages['primary']['success'] += 1
+                tolog("[stage_out_es] Successful to stageout to primary storage: %s" % (primary['endpoint']))
                 return ret_code, ret_str, os_bucket_id
             else:
-                tolog("[stage_out_es] Failed to stageout to primary storage(%s): %s, %s" % (self.__stageoutStorages['primary']['endpoint'], ret_code, ret_str))
-                self.__stageoutStorages['primary']['continousErrors'] += 1
-                self.__stageoutStorages['primary']['failed'] += 1
+                tolog("[stage_out_es] Failed to stageout to primary storage(%s): %s, %s" % (primary['endpoint'], ret_code, ret_str))
         else:
             tolog("[stage_out_es] Primary storage(%s) is not available or reached 3 times countinous errors(continousErrors:%s)" %
-                  (self.__stageoutStorages['primary'], self.__stageoutStorages['primary']['continousErrors']))
+                  (primary, primary['continousErrors']))
 
         ret_code, ret_str, os_bucket_id = PilotErrors.ERR_STAGEOUTFAILED, "Stageout failed", -1
-        if self.__stageoutStorages['failover']:
-            tolog("[stage_out_es] Failover storage is defined. Trying to stageout with failover storage: %s" % (self.__stageoutStorages['failover']['endpoint']))
+        if failover:
+            tolog("[stage_out_es] Failover storage is defined. Trying to stageout with failover storage: %s" % (failover['endpoint']))
             try:
-                ret_code, ret_str, os_bucket_id = self.stage_out_es_real(job, event_range_id, file_paths, pathConvention=pathConvention, storage=self.__stageoutStorages['failover'])
+                ret_code, ret_str, os_bucket_id = self.stage_out_es_real(job, event_range_id, file_paths, pathConvention=pathConvention, storage=failover)
             except Exception, e:
                 tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+            self.countStageOut(failover, ret_code == 0)
             if ret_code == 0:
-                tolog("[stage_out_es] Successful to stageout to failover storage: %s" % (self.__stageoutStorages['failover']['endpoint']))
-                self.__stageoutStorages['failover']['continousErrors'] = 0
-                self.__stageoutStorages['failover']['success'] += 1
+                tolog("[stage_out_es] Successful to stageout to failover storage: %s" % (failover['endpoint']))
                 return ret_code, ret_str, os_bucket_id
             else:
-                tolog("[stage_out_es] Failed to stageout to failover storage(%s): %s, %s" % (self.__stageoutStorages['failover']['endpoint'], ret_code, ret_str))
-                self.__stageoutStorages['failover']['continousErrors'] += 1
-                self.__stageoutStorages['failover']['failed'] += 1
+                tolog("[stage_out_es] Failed to stageout to failover storage(%s): %s, %s" % (failover['endpoint'], ret_code, ret_str))
         else:
-            tolog("[stage_out_es] Failover storage(%s) is not available" % (self.__stageoutStorages['failover']))
+            tolog("[stage_out_es] Failover storage(%s) is not available" % (failover))
 
         return ret_code, ret_str, os_bucket_id
 
+    def countStageOut(self, storage, success):
+        """ Update the success/failure counters of a stage-out storage """
+
+        with self.__stageoutStoragesLock:
+            if success:
+                storage['continousErrors'] = 0
+                storage['success'] += 1
+            else:
+                storage['continousErrors'] += 1
+                storage['failed'] += 1
+
+    def acquireStageOutEnvironment(self, storage):
+        """ Set the objectstore keys of storage in the environment, waiting for ongoing stage-outs that use other keys """
+
+        # the keys are passed to the site movers via the (process wide) environment, so concurrent
+        # stage-outs are only possible to storages sharing the same keys
+        keys = None
+        if 'access_keys' in storage:
+            keys = storage['access_keys']["publicKey"]
+        self.__stageoutEnvCondition.acquire()
+        try:
+            while self.__stageoutEnvUsers > 0 and self.__stageoutEnvKeys != keys:
+                self.__stageoutEnvCondition.wait()
+            if self.__stageoutEnvUsers == 0:
+                if keys is not None:
+                    os.environ['S3_ACCESS_KEY'] = storage['access_keys']["publicKey"]
+                    os.environ['S3_SECRET_KEY'] = storage['access_keys']["privateKey"]
+                    os.environ['S3_IS_SECURE'] = storage['access_keys']['is_secure']
+                else:
+                    if 'S3_ACCESS_KEY' in os.environ:
+                        del os.environ['S3_ACCESS_KEY']
+                    if 'S3_SECRET_KEY' in os.environ:
+                        del os.environ['S3_SECRET_KEY']
+                    if 'S3_IS_SECURE' in os.environ:
+                        del os.environ['S3_IS_SECURE']
+                self.__stageoutEnvKeys = keys
+            self.__stageoutEnvUsers += 1
+        finally:
+            self.__stageoutEnvCondition.release()
+        if keys is not None:
+            tolog("[stage-out] [%s] resolved ddmendpoint=%s for es transfer with access key %s" % (storage['activity'], storage['endpoint'], keys))
+
+    def releaseStageOutEnvironment(self):
+        """ Allow stage-outs with other objectstore keys once no stage-out uses the current ones """
+
+        self.__stageoutEnvCondition.acquire()
+        try:
+            self.__stageoutEnvUsers -= 1
+            self.__stageoutEnvCondition.notifyAll()
+        finally:
+            self.__stageoutEnvCondition.release()
+
     def stage_out_es_real(self, job, event_range_id, file_paths, pathConvention=None, storage=None):
         tolog("[stage-out-os] ddmendpoints %s,  storageId %s with activity %s" % (storage['endpoint'], storage['storageId'], storage['activity']))
-        if 'access_keys' in storage:
-            os.environ['S3_ACCESS_KEY'] = storage['access_keys']["publicKey"]
-            os.environ['S3_SECRET_KEY'] = storage['access_keys']["privateKey"]
-            os.environ['S3_IS_SECURE'] = storage['access_keys']['is_secure']
-            tolog("[stage-out] [%s] resolved ddmendpoint=%s for es transfer with access key %s" % (storage['activity'], storage['endpoint'], os.environ.get('S3_ACCESS_KEY', None)))
-        else:
-            if 'S3_ACCESS_KEY' in os.environ:
-                del os.environ['S3_ACCESS_KEY']
-            if 'S3_SECRET_KEY' in os.environ:
-                del os.environ['S3_SECRET_KEY']
-            if 'S3_IS_SECURE' in os.environ:
-                del os.environ['S3_IS_SECURE']
 
         try:
             osPublicKey = self.__siteInfo.getObjectstoresField("os_access_key", os_bucket_name="eventservice")
@@ -1941,7 +2005,11 @@ class RunJobEvent(RunJob):
             files.append(finfo)
             job.addStageOutESFiles(finfo)
 
-        ret_code, ret_str, os_bucket_id = mover.put_data_es(job, jobSite=self.getJobSite(), stageoutTries=2, files=files, workDir=None, activity=storage['activity'])
+        self.acquireStageOutEnvironment(storage)
+        try:
+            ret_code, ret_str, os_bucket_id = mover.put_data_es(job, jobSite=self.getJobSite(), stageoutTries=2, files=files, workDir=None, activity=storage['activity'])
+        finally:
+            self.releaseStageOutEnvironment()
         if os_bucket_id is None or os_bucket_id == 0:
             os_bucket_id = -1
         return ret_code, ret_str, os_bucket_id
@@ -1956,26 +2024,30 @@ class RunJobEvent(RunJob):
         ec = 0
         pilotErrorDiag = ""
 
-        # Extract all information from the dictionary
-        for path in paths:
-            if output_name:
-                command = "tar -rf " + output_name + " --directory=%s %s" %(os.path.dirname(path), os.path.basename(path))
-            else:
-                command = "tar -rf " + self.__job.outputZipName + " --directory=%s %s" %(os.path.dirname(path), os.path.basename(path))
-            tolog("Adding file to zip: %s" % command)
-            ec, pilotErrorDiag = commands.getstatusoutput(command)
-            tolog("status: %s, output: %s\n" % (ec, pilotErrorDiag))
-            if ec:
-                tolog("Failed to zip %s: %s, %s" % (path, ec, pilotErrorDiag))
-                return ec, pilotErrorDiag
-
-        # tolog("Adding event range to zip event range file: %s %s" % (event_range_id, paths))
-        handler = open(self.__job.outputZipEventRangesName, "a")
-        handler.write("%s %s\n" % (event_range_id, paths))
-        handler.close()
+        if not output_name:
+            output_name = self.__job.outputZipName
+        if output_name not in self.__tarAppenders:
+            self.__tarAppenders[output_name] = TarAppender(output_name, index=self.__job.outputZipEventRangesName)
+        appender = self.__tarAppenders[output_name]
+
+        tolog("Adding files to zip %s: %s" % (output_name, paths))
+        try:
+            appender.add(paths, record="%s %s" % (event_range_id, paths))
+            appender.commit()
+        except Exception, e:
+            ec = 1
+            pilotErrorDiag = "Failed to zip %s: %s" % (paths, e)
+            tolog(pilotErrorDiag)
 
         return ec, pilotErrorDiag
 
+    def closeZipOutput(self, output_name):
+        """ Close the zip file before staging it out """
+
+        appender = self.__tarAppenders.pop(output_name, None)
+        if appender:
+            appender.close(final=True)
+
     def getPathConvention(self, taskId, jobId):
         # __multipleBuckets:
         # 1: final path will be atlaseventservice_<pathConvention>
@@ -2249,6 +2321,143 @@ class RunJobEvent(RunJob):
 
         self.__asyncOutputStager_thread.join()
 
+    def handleEventRangeUpdateMessage(self, msg):
+        """ Act on an instruction from the updateEventRange(s) back channel """
+
+        if not msg:
+            return
+        if "tobekilled" in msg:
+            tolog("The PanDA server has issued a hard kill command for this job - AthenaMP will be killed (current event range will be aborted)")
+            self.setAbort()
+            self.setToBeKilled()
+            job = self.getJob()
+            if job:
+                job.subStatus = 'pilot_killed'
+        if "softkill" in msg:
+            tolog("The PanDA server has issued a soft kill command for this job - current event range will be allowed to finish")
+            self.sendMessage("No more events")
+            self.setAbort()
+            job = self.getJob()
+            if job:
+                job.subStatus = 'pilot_killed'
+
+    def updateEventRangeBatch(self, eventRanges):
+        """ Send the status of the given event ranges to the server with a single updateEventRanges call """
+
+        tolog("Updating %d event range(s)" % len(eventRanges))
+        try:
+            status, message = updateEventRanges(eventRanges, jobId=self.__job.jobId, url=self.getPanDAServer(), pandaProxySecretKey=self.__job.pandaProxySecretKey)
+            tolog("Update event ranges status: %s, output: %s" % (status, message))
+            if message:
+                self.handleEventRangeUpdateMessage(str(message))
+        except:
+            tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+
+    def logStageOutQueueMetrics(self):
+        """ Report the depth of the stage-out queue and the age of its entries """
+
+        now = time.time()
+        queue = list(self.__stageout_queue)
+        ages = []
+        for paths in queue:
+            info = self.__stageout_queue_info.get(tuple(paths))
+            if info:
+                ages.append(now - info[1])
+        maxAge, meanAge = 0, 0
+        if ages:
+            maxAge, meanAge = max(ages), sum(ages) / len(ages)
+        self.__stageoutQueueMaxDepth = max(self.__stageoutQueueMaxDepth, len(queue))
+        self.__stageoutQueueMaxAge = max(self.__stageoutQueueMaxAge, maxAge)
+        tolog("Stage-out queue: depth=%d, oldest entry=%d s, mean age=%d s" % (len(queue), maxAge, meanAge))
+
+    def stageOutEventRanges(self):
+        """ Stage-out the queued event range outputs with a pool of workers and report them to the server in batches """
+
+        queue = list(self.__stageout_queue)
+        tasks = Queue.Queue()
+        nTasks = 0
+        for paths in queue:
+            # Create the output file metadata (will be sent to server)
+            tolog("Preparing to stage-out file %s" % (paths))
+            info = self.__stageout_queue_info.get(tuple(paths))
+            if info:
+                event_range_id = info[0]
+            else:
+                event_range_id = self.getEventRangeID(paths)
+            if event_range_id == "":
+                tolog("!!WARNING!!1111!! Did not find the event range for file %s in the event range dictionary" % (paths))
+            else:
+                tasks.put((event_range_id, paths))
+                nTasks += 1
+        if nTasks == 0:
+            return
+
+        results = Queue.Queue()
+
+        def worker():
+            while True:
+                try:
+                    event_range_id, paths = tasks.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    ec, pilotErrorDiag, os_bucket_id = self.stage_out_es(self.__job, event_range_id, paths)
+                except Exception, e:
+                    tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+                    results.put((event_range_id, paths, None))
+                else:
+                    results.put((event_range_id, paths, (ec, os_bucket_id)))
+
+        t0 = time.time()
+        nWorkers = min(self.__esStageOutWorkers, nTasks)
+        workers = []
+        for i in range(nWorkers):
+            thread = threading.Thread(target=worker, name='esStageOut-%d' % i)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+
+        # the server is updated while the remaining transfers are still ongoing
+        eventRanges = []
+        for i in range(nTasks):
+            event_range_id, paths, result = results.get()
+            self.__stageout_queue.remove(paths)
+            self.__stageout_queue_info.pop(tuple(paths), None)
+            if result is None:
+                tolog("Removed %s from stage-out queue to prevent endless loop" % (paths))
+                continue
+            tolog("Removed %s from stage-out queue" % (paths))
+            tolog("Adding %s to output file list" % (paths))
+            for fpath in paths:
+                self.__output_files.append(fpath)
+
+            ec, os_bucket_id = result
+            eventRange = {'eventRangeID': event_range_id}
+            if ec == 0:
+                eventRange['eventStatus'] = 'finished'
+                self.__nEventsW += 1
+            else:
+                eventRange['eventStatus'] = 'failed'
+                eventRange['errorCode'] = self.__error.ERR_STAGEOUTFAILED
+                self.__nEventsFailed += 1
+                self.__nEventsFailedStagedOut += 1
+
+                # Update the global status field in case of failure
+                self.setStatus(False)
+            if os_bucket_id != -1:
+                eventRange['objstoreID'] = os_bucket_id
+            eventRanges.append(eventRange)
+
+            if len(eventRanges) >= self.__esUpdateBatchSize:
+                self.updateEventRangeBatch(eventRanges)
+                eventRanges = []
+        if eventRanges:
+            self.updateEventRangeBatch(eventRanges)
+
+        for thread in workers:
+            thread.join()
+        tolog("Staged out %d event range(s) in %d s using %d worker(s)" % (nTasks, time.time() - t0, nWorkers))
+
     def asynchronousOutputStager_new(self):
         """ Transfer output files to stage-out area asynchronously """
 
@@ -2278,67 +2487,16 @@ class RunJobEvent(RunJob):
                     time.sleep(60)
                 tolog("Asynchronous output stager thread working")
                 run_time = time.time()
+                self.logStageOutQueueMetrics()
                 if not self.__esToZip:
-                    for paths in self.__stageout_queue:
-                        # Create the output file metadata (will be sent to server)
-                        tolog("Preparing to stage-out file %s" % (paths))
-                        event_range_id = self.getEventRangeID(paths)
-                        if event_range_id == "":
-                            tolog("!!WARNING!!1111!! Did not find the event range for file %s in the event range dictionary" % (paths))
-                        else:
-                            try:
-                                ec, pilotErrorDiag, os_bucket_id = self.stage_out_es(self.__job, event_range_id, paths)
-                            except Exception, e:
-                                tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
-                                tolog("Removing %s from stage-out queue to prevent endless loop" % (paths))
-                                self.__stageout_queue.remove(paths)
-                            else:
-                                tolog("Removing %s from stage-out queue" % (paths))
-                                self.__stageout_queue.remove(paths)
-                                tolog("Adding %s to output file list" % (paths))
-                                for fpath in paths:
-                                    self.__output_files.append(fpath)
-                                # tolog("output_files = %s" % (self.__output_files))
-                                errorCode = None
-                                if ec == 0:
-                                    status = 'finished'
-                                    self.__nEventsW += 1
-                                else:
-                                    status = 'failed'
-                                    self.__nEventsFailed += 1
-                                    self.__nEventsFailedStagedOut += 1
-                                    errorCode = self.__error.ERR_STAGEOUTFAILED
-
-                                    # Update the global status field in case of failure
-                                    self.setStatus(False)
-
-                                try:
-                                    # Time to update the server
-                                    msg = updateEventRange(event_range_id, self.__eventRange_dictionary[event_range_id], self.__job.jobId, status=status, os_bucket_id=os_bucket_id, errorCode=errorCode, pandaProxySecretKey=self.__job.pandaProxySecretKey)
-
-                                    # Did the updateEventRange back channel contain an instruction?
-                                    if msg == "tobekilled":
-                                        tolog("The PanDA server has issued a hard kill command for this job - AthenaMP will be killed (current event range will be aborted)")
-                                        self.setAbort()
-                                        self.setToBeKilled()
-                                        job = self.getJob()
-                                        if job:
-                                            job.subStatus = 'pilot_killed'
-                                    if msg == "softkill":
-                                        tolog("The PanDA server has issued a soft kill command for this job - current event range will be allowed to finish")
-                                        self.sendMessage("No more events")
-                                        self.setAbort()
-                                        job = self.getJob()
-                                        if job:
-                                            job.subStatus = 'pilot_killed'
-                                except:
-                                    tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+                    self.stageOutEventRanges()
                 else:
                     output_name = None
                     output_eventRange_id = None
                     output_eventRanges = {}
                     while len(self.__stageout_queue) > 0:
                         paths = self.__stageout_queue.pop()
+                        self.__stageout_queue_info.pop(tuple(paths), None)
                         #tolog("Pop %s from stage-out queue" % (paths))
 
                         # Create the output file metadata (will be sent to server)
@@ -2361,12 +2519,14 @@ class RunJobEvent(RunJob):
                                     self.__output_files.append(fpath)
                                 # tolog("output_files = %s" % (self.__output_files))
                     tolog("Files %s are zipped to %s" % (output_eventRanges, output_name))
+                    self.closeZipOutput(output_name)
                     self.stageOutZipFiles_new(output_name, output_eventRanges, output_eventRange_id)
                     finished_first_upload = True
                 self.syncStagedOutESFileStatus()
             time.sleep(1)
           except:
                tolog("!!WARNING!!2222!! Caught exception: %s" % (traceback.format_exc()))
+        tolog("Stage-out queue: max depth=%d, max age=%d s" % (self.__stageoutQueueMaxDepth, self.__stageoutQueueMaxAge))
         tolog("Asynchronous output stager thread has been stopped")
 
     @mover.use_newmover(asynchronousOutputStager_new)
@@ -2478,6 +2638,7 @@ class RunJobEvent(RunJob):
                                     self.__output_files.append(fpath)
                                 # tolog("output_files = %s" % (self.__output_files))
                     tolog("Files %s are zipped to %s" % (output_eventRanges, output_name))
+                    self.closeZipOutput(output_name)
                     self.stageOutZipFiles(output_name, output_eventRanges, output_eventRange_id)
 
             time.sleep(1)
@@ -2547,6 +2708,7 @@ class RunJobEvent(RunJob):
                         self.__eventRange_dictionary[event_range_id] = [paths, cpu, wall]
 
                         # Add the file to the stage-out queue
+                        self.__stageout_queue_info[tuple(paths)] = (event_range_id, time.time())
                         self.__stageout_queue.append(paths)
                         # tolog("File %s has been added to the stage-out queue (length = %d)" % (paths, len(self.__stageout_queue)))
 
@@ -3232,35 +3394,14 @@ class RunJobEvent(RunJob):
         return filename
 
     def findChildProcesses(self,pid):
-        command = "/bin/ps -e --no-headers -o pid -o ppid -o fname"
-        status,output = commands.getstatusoutput(command)
-        #print "ps output: %s" % output
-
-        pieces = []
-        result = []
-        for line in output.split("\n"):
-            pieces= line.split()
-            try:
-                value=int(pieces[1])
-            except Exception,e:
-                #print "trouble interpreting ps output %s: \n %s" % (e,pieces)
-                continue
-            if value==pid:
-                try:
-                    job=int(pieces[0])
-                except ValueError,e:
-                    #print "trouble interpreting ps output %s: \n %s" % (e,pieces[0])
-                    continue
-                result.append(job)
-        return result
+        return ProcessTree().getChildren(pid)
 
     def getChildren(self, pid):
         #self.__childProcs = []
-        if pid not in self.__childProcs:
-            self.__childProcs.append(pid)
-        childProcs = self.findChildProcesses(pid)
-        for child in childProcs:
-            self.getChildren(child)
+        # one /proc snapshot for the whole tree
+        for child in ProcessTree().getDescendants(pid):
+            if child not in self.__childProcs:
+                self.__childProcs.append(child)
 
     def getCPUConsumptionTimeFromProcPid(self, pid):
         try:
@@ -3282,16 +3423,16 @@ class RunJobEvent(RunJob):
     def getCPUConsumptionTimeFromProc(self, processId):
         cpuConsumptionTime = 0L
         try:
-            CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
             if processId:
-                self.__childProcs = []
+                # the process list and the CPU times come from the same /proc snapshot
+                tree = ProcessTree()
+                self.__childProcs = tree.getDescendants(processId)
                 self.__child_cpuTime = {}
-                self.getChildren(processId)
                 for process in self.__childProcs:
                     if process not in self.__child_cpuTime.keys():
                         self.__child_cpuTime[process] = 0
                 for process in self.__child_cpuTime.keys():
-                    cpuTime = self.getCPUConsumptionTimeFromProcPid(process) / CLOCK_TICKS
+                    cpuTime = tree.getCPUTime(process)
                     # if cpuTime > self.__child_cpuTime[process]:
                     # process can return a small value if it's killed
                     self.__child_cpuTime[process] = cpuTime
@@ -3537,6 +3678,7 @@ if __name__ == "__main__":
 
             # print to stderr
             print >> sys.stderr, runJob.getGlobalPilotErrorDiag()
+            pUtil.flushLog()
             raise SystemError(sig)
 
         signal.signal(signal.SIGTERM, sig2exc)
@@ -718,6 +718,7 @@ class RunJobHpcEvent(RunJob):
             self.failOneJob(transExitCode, pilotExitCode, job, ins=job.inFiles, pilotErrorDiag=pilotErrorDiag, updatePanda=updatePanda)
         if firstJob:
             self.failOneJob(transExitCode, pilotExitCode, firstJob, ins=firstJob.inFiles, pilotErrorDiag=pilotErrorDiag, updatePanda=updatePanda)
+        pUtil.flushLog()
         os._exit(pilotExitCode)
 
     def stageInHPCJobs(self):
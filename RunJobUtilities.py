@@ -1,5 +1,4 @@
 import commands
-import json
 import os
 import socket
 import time
@@ -8,16 +7,18 @@ import sys
 
 from pUtil import timeStamp, debugInfo, tolog, readpar, verifyReleaseString,\
      isAnalysisJob, dumpOrderedItems, grep, getExperiment, getGUID,\
-     getCmtconfig, timedCommand, getProperTimeout, removePattern, encode_string
+     getCmtconfig, timedCommand, getProperTimeout, removePattern
 from PilotErrors import PilotErrors
+from PilotTCPServer import sendMessage, recvMessage
 from FileStateClient import dumpFileStates, hasOnlyCopyToScratch
 from SiteInformation import SiteInformation
 
 # global variables
 #siteroot = ""
+pilotServerConnections = {} # open connections to the local pilot TCP server, by (server, port)
 
 def filterTCPString(TCPMessage):
-    """ Remove any unwanted characters from the TCP message string and truncate if necessary """
+    """ Remove any unwanted characters from the TCP message string """
 
     # sometimes a failed command will return html which end up in (e.g.) pilotErrorDiag, remove it
     if TCPMessage.upper().find("<HTML>") >= 0:
@@ -36,26 +37,59 @@ def filterTCPString(TCPMessage):
     # also remove any "-signs
     TCPMessage = TCPMessage.replace('"','')
 
-    # truncate if necessary
-    if len(TCPMessage) > 250:
-        tolog("TCP message string will be truncated to size 250")
-        tolog("Original TCP message string: %s" % (TCPMessage))
-        TCPMessage = TCPMessage[:250]
-
     return TCPMessage
 
-def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
-    """ send job status updates to local pilot TCP server, in the format
-    of status=running;pid=2343; logfile is the file that contains
-    some debug information, usually used in failure case """
+def getPilotServerConnection(server, port):
+    """ Return the open connection to the local pilot TCP server, connect if there is none """
 
-    try:
+    if (server, port) not in pilotServerConnections:
         s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         s.settimeout(120)
         s.connect((server, port))
-    except Exception, e:
-        tolog("!!WARNING!!2999!! updateJobInfo caught a socket/connect exception: %s" % str(e))
-        return "NOTOK"
+        pilotServerConnections[(server, port)] = s
+    return pilotServerConnections[(server, port)]
+
+def closePilotServerConnection(server, port):
+    """ Close the connection to the local pilot TCP server """
+
+    s = pilotServerConnections.pop((server, port), None)
+    if s:
+        try:
+            s.close()
+        except socket.error:
+            pass
+
+def sendPilotServerMessage(msgdic, server, port):
+    """ Send a message to the local pilot TCP server on the open connection (reconnect once if it was closed), return the reply status """
+
+    for attempt in range(2):
+        reused = (server, port) in pilotServerConnections
+        try:
+            s = getPilotServerConnection(server, port)
+        except Exception, e:
+            tolog("!!WARNING!!2999!! updateJobInfo caught a socket/connect exception: %s" % str(e))
+            return "NOTOK"
+        try:
+            sendMessage(s, msgdic)
+            tolog("(Sent)")
+            reply = recvMessage(s)
+            if reply is None:
+                raise socket.error("connection closed by the pilot TCP server")
+            tolog("(Received)")
+        except Exception, e:
+            closePilotServerConnection(server, port)
+            if reused and attempt == 0:
+                tolog("Connection to the local pilot TCP server lost (%s), reconnecting" % str(e))
+                continue
+            tolog("!!WARNING!!2999!! updateJobInfo caught a send/receive exception: %s" % str(e))
+            return "NOTOK"
+        return reply.get('status', "NOTOK")
+    return "NOTOK"
+
+def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
+    """ send job status updates to local pilot TCP server, as a json dictionary
+    on a connection kept open between the updates; logfile is the file that contains
+    some debug information, usually used in failure case """
 
     msgdic = {}
     msgdic["pid"] = os.getpid()
@@ -95,7 +129,7 @@ def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
     if job.hpcStatus:
         msgdic['hpcStatus'] = job.hpcStatus
     if job.yodaJobMetrics:
-        msgdic["yodaJobMetrics"] = json.dumps(job.yodaJobMetrics)
+        msgdic["yodaJobMetrics"] = job.yodaJobMetrics
     if job.HPCJobId:
         msgdic['HPCJobId'] = job.HPCJobId
 
@@ -130,16 +164,11 @@ def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
     else:
         tolog("filesNormalStageOut not set")
 
-    # truncate already now if necesary so not too much junk is sent back to the local pilot TCP server
-    if job.pilotErrorDiag != None and job.pilotErrorDiag != "None" and len(job.pilotErrorDiag.strip()) != 0:
-        # remove any unwanted characters from the string
-        job.pilotErrorDiag = encode_string(job.pilotErrorDiag)
     msgdic["pilotErrorDiag"] = job.pilotErrorDiag
 
     # report trf error message if set
     if job.exeErrorDiag != "":
-        # remove any unwanted characters from the string
-        msgdic["exeErrorDiag"] = encode_string(job.exeErrorDiag)
+        msgdic["exeErrorDiag"] = job.exeErrorDiag
         msgdic["exeErrorCode"] = job.exeErrorCode
 
     if logfile:
@@ -147,8 +176,7 @@ def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
 
     # send the special setup string for the log transfer (on xrdcp systems)
     if job.spsetup:
-        # temporarily remove = and ;-signs not to disrupt the TCP message (see ;-handling below)
-        msgdic["spsetup"] = job.spsetup.replace(";", "^").replace("=", "!")
+        msgdic["spsetup"] = job.spsetup
         tolog("Updated spsetup: %s" % (msgdic["spsetup"]))
 
     # set final job state (will be propagated to the job state file)
@@ -172,24 +200,9 @@ def updateJobInfo(job, server, port, logfile=None, final=False, latereg=False):
             latereg_str = "False"
         msgdic["output_latereg"] = latereg_str
 
-    msg = ''
-    for k in msgdic.keys():
-        msg += "%s=%s;" % (k, msgdic[k])
-
-    tolog("About to send TCP message to main pilot thread of length = %d" % len(msg))
-    if len(msg) > 4096:
-        tolog("!!WARNING!!1234!! TCP message too long (cannot truncate easily without harming encoded message)")
-    try:
-        s.send(msg)
-        tolog("(Sent)")
-        tm = s.recv(1024)
-        tolog("(Received)")
-    except Exception, e:
-        tolog("!!WARNING!!2999!! updateJobInfo caught a send/receive exception: %s" % str(e))
-        return "NOTOK"
-    else:
-        s.settimeout(None)
-        s.close()
+    tolog("About to send TCP message to main pilot thread (%d fields)" % len(msgdic))
+    tm = sendPilotServerMessage(msgdic, server, port)
+    if tm == "OK":
         tolog("Successfully sent and received TCP message")
 
     return tm  # =OK or NOTOK
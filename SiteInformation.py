@@ -5,6 +5,7 @@
 
 import os
 import re
+import copy
 import commands
 import random
 import time
@@ -15,6 +16,7 @@ from pUtil import tolog, replace, getDirectAccessDic
 from pUtil import getExperiment as getExperimentObject
 from FileHandling import getExtension, readJSON, writeJSON, getJSONDictionary, getDirectAccess
 from PilotErrors import PilotErrors
+from QueuedataCache import queuedataCache, agisConfigCache
 
 try:
     import json
@@ -68,21 +70,18 @@ class SiteInformation(object):
 
         # Use olf queuedata version
         fileName = self.getQueuedataFileName(alt=alt)
+        containsJson = fileName.endswith("json")
         try:
-            fh = open(fileName)
+            queuedata = queuedataCache.get(fileName, containsJson=containsJson)
         except:
             try:
                 # Try without the path
-                fh = open(os.path.basename(fileName))
+                queuedata = queuedataCache.get(os.path.basename(fileName), containsJson=containsJson)
             except Exception, e:
                 tolog("!!WARNING!!2999!! Could not read queuedata file: %s" % str(e))
-                fh = None
-        if fh:
-            #
-            queuedata = fh.read()
-            fh.close()
-            if queuedata != "":
-                value = self.getpar(par, queuedata, containsJson=fileName.endswith("json"))
+                queuedata = None
+        if queuedata:
+            value = self.getparFromDictionary(par, queuedata, containsJson=containsJson)
 
         # repair JSON issue
         if value == None:
@@ -90,6 +89,22 @@ class SiteInformation(object):
 
         return value
 
+    def getparFromDictionary(self, par, queuedata, containsJson=False):
+        """ Extract par from the parsed queuedata dictionary """
+
+        parameter_value = ""
+        if par in queuedata:
+            parameter_value = queuedata[par]
+            if type(parameter_value) == unicode: # avoid problem with unicode for strings
+                parameter_value = parameter_value.encode('ascii')
+            elif type(parameter_value) == dict or type(parameter_value) == list:
+                # do not hand out the cached object
+                parameter_value = copy.deepcopy(parameter_value)
+        elif containsJson:
+            tolog("WARNING: Could not find parameter %s in queuedata" % (par))
+
+        return parameter_value
+
     def getpar(self, par, s, containsJson=False):
         """ Extract par from s """
 
@@ -186,6 +201,7 @@ class SiteInformation(object):
         else:
             stext = field + "=" + self.readpar(field)
             rtext = field + "=" + value
+            queuedataCache.invalidate(queuedata_filename)
             if replace(queuedata_filename, stext, rtext):
                 if verbose:
                     tolog("Successfully changed %s to: %s" % (field, value))
@@ -199,6 +215,7 @@ class SiteInformation(object):
         """ Replace/update queuedata field in JSON file """
 
         status = False
+        queuedataCache.invalidate(queuedata_filename)
         from json import load, dump
         try:
             fp = open(queuedata_filename, "r")
@@ -1762,6 +1779,7 @@ class SiteInformation(object):
 
                         # Store it
                         if writeJSON(filename, trimmed_dictionary):
+                            queuedataCache.invalidate(filename)
                             tolog("Stored trimmed AGIS dictionary from CVMFS in: %s" % (filename))
                             status = True
                         else:
@@ -1780,6 +1798,7 @@ class SiteInformation(object):
                 cmd = 'curl --connect-timeout 20 --max-time 120 -sS "http://atlas-agis-api.cern.ch/request/pandaqueue/query/list/?json&preset=schedconf.all&panda_queue=%s" >%s' % (queuename, filename)
                 tolog("Executing command: %s" % (cmd))
                 ret, output = commands.getstatusoutput(cmd)
+                queuedataCache.invalidate(filename)
 
                 # Verify queuedata
                 value = self.getField('objectstores', queuename=queuename)
@@ -1798,8 +1817,12 @@ class SiteInformation(object):
         tolog("queuedata file: %s" % filename)
         if os.path.exists(filename):
 
-            # Load the dictionary
-            dictionary = readJSON(filename)
+            # Load the dictionary (parsed once per file version)
+            try:
+                dictionary = queuedataCache.get(filename, containsJson=True)
+            except Exception, e:
+                tolog("!!WARNING!!2120!! Failed to parse %s: %s" % (filename, e))
+                dictionary = {}
             if dictionary != {}:
                 # Get the entry for queuename
                 try:
@@ -1887,6 +1910,48 @@ class SiteInformation(object):
 
         return content
 
+    @classmethod
+    def loadURLFile(self, url, fname, cache_time=0, nretry=3, sleeptime=60):
+        """
+        Download data from url/file resource into the cachefile fname unless the cache is younger than "cache_time" seconds
+        :return: fname, or None if there is no cache file
+        """
+
+        if url and self.isFileExpired(fname, cache_time):
+            self.loadURLData(url, fname=fname, cache_time=cache_time, nretry=nretry, sleeptime=sleeptime)
+            agisConfigCache.invalidate(fname)
+
+        if not os.path.isfile(fname):
+            return None
+
+        return fname
+
+    def loadAGISConfData(self, name, sources, sources_order, keys, cache_time):
+        """
+        Load the entries for keys (panda queues or ddm endpoints) from the first valid source
+        Each source is parsed only once per file version (see QueuedataCache.AGISConfigCache)
+        :return: dict of the entries (of all entries if no keys are given) or None
+        """
+
+        for key in sources_order:
+            tolog("Loading %s from source %s" % (name, key))
+            dat = sources.get(key)
+            if not dat:
+                continue
+
+            fname = self.loadURLFile(cache_time=cache_time, **dat)
+            if not fname:
+                continue
+            try:
+                data = agisConfigCache.get(fname, keys)
+            except Exception, e:
+                tolog("!!WARNING: load%s(): Failed to parse JSON content from source=%s .. skipped, error=%s" % (name, dat.get('url'), e))
+                continue
+
+            return data
+
+        return None
+
     def loadDDMConfData(self, ddmendpoints=[], cache_time=60):
 
         # try to get data from CVMFS first
@@ -1910,25 +1975,7 @@ class SiteInformation(object):
 
         ddmconf_sources_order = ['LOCAL', 'CVMFS', 'AGIS'] # can be moved into the schedconfig in order to configure workflow in AGIS on fly: TODO
 
-        for key in ddmconf_sources_order:
-            tolog("Loading DDMConfData from source %s" % key)
-            dat = ddmconf_sources.get(key)
-            if not dat:
-                continue
-
-            content = self.loadURLData(cache_time=cache_time, **dat)
-            if not content:
-                continue
-            try:
-                data = json.loads(content)
-            except Exception, e:
-                tolog("!!WARNING: loadDDMConfData(): Failed to parse JSON content from source=%s .. skipped, error=%s" % (dat.get('url'), e))
-                data = None
-
-            if data and isinstance(data, dict):
-                return data
-
-        return None
+        return self.loadAGISConfData('DDMConfData', ddmconf_sources, ddmconf_sources_order, ddmendpoints, cache_time)
 
     def resolveDDMConf(self, ddmendpoints):
 
@@ -2036,27 +2083,8 @@ class SiteInformation(object):
 
         schedcond_sources_order = ['CVMFS', 'AGIS'] # can be moved into the schedconfig in order to configure workflow in AGIS on fly: TODO
 
-        for key in schedcond_sources_order:
-            dat = schedcond_sources.get(key)
-            if not dat:
-                continue
-
-            content = self.loadURLData(cache_time=cache_time, **dat)
-            if not content:
-                continue
-            try:
-                data = json.loads(content)
-            except Exception, e:
-                tolog("!!WARNING: loadSchedConfData(): Failed to parse JSON content from source=%s .. skipped, error=%s" % (dat.get('url'), e))
-                data = None
-
-            if data and isinstance(data, dict):
-                if 'error' in data:
-                    tolog("!!WARNING: loadSchedConfData(): skipped source=%s since response contains error: data=%s" % (dat.get('url'), data))
-                else: # valid response
-                    return data
-
-        return None
+        # the whole CVMFS dump is parsed at most once, only the requested queues are kept (and indexed in a file)
+        return self.loadAGISConfData('SchedConfData', schedcond_sources, schedcond_sources_order, pandaqueues, cache_time)
 
 
     def resolvePandaProtocols(self, pandaqueues, activity):
@@ -14,6 +14,7 @@ from PilotErrors import PilotErrors
 from timed_command import timed_command
 from configSiteMover import config_sm
 from FileHandling import getExtension, getTracingReportFilename, writeJSON
+from Instrumentation import timed
 
 PERMISSIONS_DIR = config_sm.PERMISSIONS_DIR
 PERMISSIONS_FILE = config_sm.PERMISSIONS_FILE
@@ -1191,6 +1192,17 @@ class SiteMover(object):
                 return error.ERR_FAILEDADLOCAL, pilotErrorDiag, fsize, 0
             else:
                 tolog("Got adler32 checksum: %s" % (fchecksum))
+        elif CMD_CHECKSUM == "md5sum":
+            # same as md5sum, but in-process (and cached for the later stage-out verification)
+            tolog("Calculating md5 checksum for file: %s" % (fname))
+            from movers import base
+            try:
+                fchecksum = base.BaseSiteMover.calc_md5_checksum(fname)
+            except Exception, e:
+                pilotErrorDiag = "Error calculating md5 checksum: %s" % (e)
+                tolog("!!WARNING!!2999!! %s" % (pilotErrorDiag))
+                return error.ERR_FAILEDMD5LOCAL, pilotErrorDiag, fsize, 0
+            tolog("Got checksum: %s" % (fchecksum))
         else:
             _cmd = '%s %s' % (CMD_CHECKSUM, fname)
             tolog("Executing command: %s" % (_cmd))
@@ -1327,6 +1339,7 @@ class SiteMover(object):
             return '%s/%s/%s/%s/%s/%s' % (bpath, project, dataset_type, tag, stripped_dsn, lfn)
     to_native_lfn = staticmethod(to_native_lfn)
 
+    @timed("calc_adler32")
     def calc_adler32(file_name):
         """ calculate the checksum for a file with the zlib.adler32 algorithm """
 
@@ -1347,29 +1360,16 @@ class SiteMover(object):
         """ calculate the checksum for a file with the zlib.adler32 algorithm """
         # note: a failed file open will return '1'
 
-        import zlib
-        # default adler32 starting value
-        sum1 = 1L
+        from movers import base
 
         try:
-            f = open(filename, 'rb')
-        except Exception, e:
+            sum2 = base.BaseSiteMover.calc_adler32_checksum(filename)
+        except (IOError, OSError), e:
             tolog("!!WARNING!!2999!! Could not open file: %s" % (filename))
-        else:
-            try:
-                for line in f:
-                    sum1 = zlib.adler32(line, sum1)
-            except Exception, e:
-                tolog("!!WARNING!!2777!! Exception caught in zlib.adler32: %s" % (e))
-
-            f.close()
-
-        # correct for bug 32 bit zlib
-        if sum1 < 0:
-            sum1 = sum1 + 2**32
-
-        # convert to hex
-        sum2 = "%08x" % sum1
+            sum2 = "%08x" % 1 # default adler32 starting value
+        except Exception, e:
+            tolog("!!WARNING!!2777!! Exception caught in zlib.adler32: %s" % (e))
+            sum2 = "%08x" % 1
 
         return str(sum2)
 
@@ -0,0 +1,149 @@
+import os
+import json
+import fcntl
+
+SNAPSHOT_VERSION = 1    # version of the record log and of the job state header
+
+def writeAtomic(filename, data, dump=None):
+    """ Write data (or call dump(data, file)) to a temporary file and rename it to filename
+
+    The temporary file is hidden (.<basename>.tmp.<pid> in the same dir), so that one left behind by a killed pilot
+    does not match the job state file globs (jobState-*) of job recovery, deferred stage-out and the site dir cleanup.
+    """
+
+    tmpFile = os.path.join(os.path.dirname(filename), ".%s.tmp.%d" % (os.path.basename(filename), os.getpid()))
+    f = open(tmpFile, "w")
+    try:
+        if dump:
+            dump(data, f)
+        else:
+            f.write(data)
+    except:
+        f.close()
+        os.remove(tmpFile)
+        raise
+    f.close()
+    os.rename(tmpFile, filename)
+
+class RecordLog(object):
+    """
+    Append-only log of json records, one per line, following a header line with the format version.
+
+    Appends are serialized between processes with flock() and a record is only read once its line is complete,
+    so a log cut by a crash loses at most its last record. compact() has the compacted state written (through the
+    given function) and replaces the log by an empty one; a reader notices it from the new inode and starts over.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.count = 0          # records in the log when last read or appended
+        self.reset = False      # did the last read start over?
+        self.__inode = None
+        self.__offset = 0
+
+    def header(self):
+        return json.dumps({'format': 'records', 'version': SNAPSHOT_VERSION}) + "\n"
+
+    def __lock(self):
+        """ Open and lock the current log file, return the file descriptor """
+
+        while True:
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_ino == os.stat(self.filename).st_ino:
+                    return fd
+            except OSError:
+                pass
+            # the log was replaced meanwhile
+            os.close(fd)
+
+    def append(self, records):
+        """ Append the records to the log """
+
+        fd = self.__lock()
+        try:
+            data = "".join([json.dumps(record) + "\n" for record in records])
+            if os.fstat(fd).st_size == 0:
+                data = self.header() + data
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self.count += len(records)
+
+    def read(self):
+        """ Return the records appended since the last read, all records if the log was replaced (then reset is True) """
+
+        self.reset = False
+        try:
+            f = open(self.filename)
+        except IOError:
+            if self.__inode is not None:
+                self.reset = True
+            self.__inode = None
+            self.__offset = 0
+            self.count = 0
+            return []
+        try:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self.__inode or st.st_size < self.__offset:
+                self.reset = self.__inode is not None
+                self.__inode = st.st_ino
+                self.__offset = 0
+                self.count = 0
+            f.seek(self.__offset)
+            data = f.read()
+        finally:
+            f.close()
+
+        # only complete lines
+        data = data[:data.rfind("\n") + 1]
+        records = []
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a record cut by a crash (the next append continued the line)
+                continue
+            if type(record) is dict and record.get('format') == 'records':
+                if record.get('version') != SNAPSHOT_VERSION:
+                    raise ValueError("Unsupported record log version %s in %s" % (record.get('version'), self.filename))
+                continue
+            records.append(record)
+        self.__offset += len(data)
+        self.count += len(records)
+        return records
+
+    def load(self, readSnapshot):
+        """ Read the whole log, return readSnapshot(records) which reads the compacted state and applies the records
+
+        Appends and compactions are blocked meanwhile, so the records are the ones following the compacted state.
+        """
+
+        fd = self.__lock()
+        try:
+            self.__inode = None
+            self.__offset = 0
+            self.count = 0
+            records = self.read()
+            return readSnapshot(records)
+        finally:
+            os.close(fd)
+
+    def compact(self, writeSnapshot):
+        """ Replace the log by an empty one after writeSnapshot(records, reset) saved the state, appends are blocked meanwhile
+
+        writeSnapshot gets the records not read yet, and reset is True if the log was replaced since the last read (the
+        caller has to start over from its last snapshot)
+        """
+
+        fd = self.__lock()
+        try:
+            records = self.read()
+            writeSnapshot(records, self.reset)
+            writeAtomic(self.filename, self.header())
+        finally:
+            os.close(fd)
+        self.count = 0
+        self.__inode = os.stat(self.filename).st_ino
+        self.__offset = len(self.header())
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import tarfile
+
+BLOCKSIZE = tarfile.BLOCKSIZE
+EOA = tarfile.NUL * BLOCKSIZE * 2  # end of archive marker
+
+class TarAppender(object):
+    """ Append files to a tar archive without rescanning it (what tar -r does on every call)
+
+    The archive stays open and the end offset of the last member is tracked, so each member is
+    written where the previous one ended, followed by the end of archive marker, i.e. the archive is
+    valid after every commit(). When several processes append to the same archive (serialized by
+    the caller, e.g. with a lock file), begin() finds the members the others added by reading only
+    their headers. Every checkpointInterval seconds the archive and the index file (one line per
+    committed record) are fsync'ed and the end offset is saved in <archive>.checkpoint: an archive
+    left by an interrupted job is cut back to its last complete member, scanning from that point.
+    """
+
+    def __init__(self, archive, index=None, checkpointInterval=60):
+        self.archive = archive
+        self.index = index
+        self.checkpointFile = archive + ".checkpoint"
+        self.checkpointInterval = checkpointInterval
+        self.__file = None
+        self.__indexFile = None
+        self.__tar = None
+        self.__records = []
+        self.offset = None           # end of the last member
+        self.nMembers = 0            # members added by this appender
+        self.checkpointTime = time.time()
+
+    def __open(self):
+        """ (Re)open the archive and the index file """
+
+        self.__closeFiles()
+        fd = os.open(self.archive, os.O_RDWR | os.O_CREAT, 0644)
+        self.__file = os.fdopen(fd, "r+b")
+        if self.index:
+            self.__indexFile = open(self.index, "a")
+        self.offset = None
+
+    def __closeFiles(self):
+        for f in [self.__file, self.__indexFile]:
+            if f:
+                f.close()
+        self.__file = None
+        self.__indexFile = None
+
+    def __isOpen(self):
+        """ Is the open archive still the one at the archive path? """
+
+        if not self.__file:
+            return False
+        try:
+            return os.stat(self.archive).st_ino == os.fstat(self.__file.fileno()).st_ino
+        except OSError:
+            return False
+
+    def readCheckpoint(self):
+        """ Return the end offset saved by the last checkpoint (0 if none) """
+
+        try:
+            f = open(self.checkpointFile)
+            try:
+                return int(json.load(f)['offset'])
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return 0
+
+    def findEnd(self, offset):
+        """ Return the end of the last complete member, reading the headers from offset (a member boundary) """
+
+        size = os.fstat(self.__file.fileno()).st_size
+        if offset > size:
+            offset = 0
+        while offset + BLOCKSIZE <= size:
+            self.__file.seek(offset)
+            buf = self.__file.read(BLOCKSIZE)
+            if buf.count(tarfile.NUL) == BLOCKSIZE:
+                break
+            try:
+                tarinfo = tarfile.TarInfo.frombuf(buf)
+            except tarfile.HeaderError:
+                break
+            end = offset + BLOCKSIZE + ((tarinfo.size + BLOCKSIZE - 1) // BLOCKSIZE) * BLOCKSIZE
+            if end > size:
+                # truncated member
+                break
+            offset = end
+        return offset
+
+    def begin(self):
+        """ Locate the end of the archive before adding members, return its offset """
+
+        if not self.__isOpen():
+            self.__open()
+        if self.offset is None or self.offset > os.fstat(self.__file.fileno()).st_size:
+            start = self.readCheckpoint()
+        else:
+            start = self.offset
+        self.offset = self.findEnd(start)
+
+        # drop whatever follows the last member (end marker, or a member cut by an interrupted job)
+        self.__file.seek(self.offset)
+        self.__file.truncate()
+        self.__tar = tarfile.TarFile(fileobj=self.__file, mode="w")
+        return self.offset
+
+    def add(self, paths, record=None):
+        """ Add the files (under their base names) and queue the index record for the next commit """
+
+        if not self.__tar:
+            self.begin()
+        try:
+            for path in paths:
+                self.__tar.add(path, arcname=os.path.basename(path), recursive=False)
+                self.nMembers += 1
+        except:
+            # the next begin() keeps the complete members and drops a partly written one
+            self.__tar = None
+            raise
+        if record is not None:
+            self.__records.append(record)
+
+    def commit(self):
+        """ Terminate the archive, write the index records and checkpoint if due """
+
+        if self.__tar:
+            self.offset = self.__tar.offset
+            self.__tar = None
+            self.__file.seek(self.offset)
+            self.__file.write(EOA)
+            self.__file.flush()
+        if self.__records and self.__indexFile:
+            self.__indexFile.write("".join(["%s\n" % record for record in self.__records]))
+            self.__indexFile.flush()
+        self.__records = []
+        if time.time() - self.checkpointTime > self.checkpointInterval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """ Make the archive and the index durable and save the end offset """
+
+        if not self.__file or self.offset is None:
+            return
+        os.fsync(self.__file.fileno())
+        if self.__indexFile:
+            os.fsync(self.__indexFile.fileno())
+        tmpFile = "%s.%s" % (self.checkpointFile, os.getpid())
+        f = open(tmpFile, "w")
+        try:
+            json.dump({'offset': self.offset, 'time': int(time.time())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmpFile, self.checkpointFile)
+        self.checkpointTime = time.time()
+
+    def close(self, final=False):
+        """ Commit, checkpoint and close the archive (a final archive is not resumed, its checkpoint is removed) """
+
+        if self.__file:
+            self.commit()
+            if final:
+                self.__file.flush()
+                if os.path.exists(self.checkpointFile):
+                    os.remove(self.checkpointFile)
+            else:
+                self.checkpoint()
+        self.__closeFiles()
@@ -10,15 +10,14 @@
 # Authors:
 # - Wen Guan, <wguan@cern.ch>, 2014-2018
 
-import os
 import signal
-import time
 import traceback
 
-from Queue import Empty, Full
-import subprocess, threading
+from Queue import Empty
 import multiprocessing
 
+from CommandExecutor import executor
+
 class TimerCommand(object):
     def __init__(self, cmd=None):
         self.cmd = cmd
@@ -28,52 +27,17 @@ class TimerCommand(object):
         self.is_timeout = False
 
     def run(self, timeout=3600):
-        def target():
-            # print 'Thread started'
-            self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, shell=True)
-            self.stdout, self.stderr = self.process.communicate()
-            # print 'Thread finished'
-
-        thread = threading.Thread(target=target)
-        thread.start()
+        command = executor.run(self.cmd, timeout=timeout)
+        self.process = command.process
+        self.stdout = command.stdout
+        self.stderr = command.stderr
 
-        thread.join(timeout)
-        if thread.is_alive():
+        if command.timedOut:
             self.is_timeout = True
-            try:
-                # print 'TimeOut. Terminating process'
-                self.process.terminate()
-                thread.join(2)
-                if thread.is_alive():
-                    os.kill(int(self.process.pid), signal.SIGKILL)
-                    thread.join(2)
-            except:
-                if thread.is_alive():
-                    try:
-                        os.kill(int(self.process.pid), signal.SIGKILL)
-                    except:
-                        pass
-                    thread.join(2)
-
-            if not self.stdout:
-                self.stdout = ''
             self.stdout += "Command time-out: %s s" % timeout
+            return 1, self.stdout
 
-        if not self.stderr:
-            self.stderr = ''
-        if not self.stdout:
-            self.stdout = ''
-        if self.stderr and self.stderr != '':
-            self.stdout += " Error: " + self.stderr
-
-        if self.process:
-            returncode = self.process.returncode
-        else:
-            returncode = 1
-
-        if returncode != 1 and 'Command time-out' in self.stdout:
-            returncode = 1
-
+        returncode = command.exitcode
         if returncode == None:
             returncode = 0
 
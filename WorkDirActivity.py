@@ -0,0 +1,95 @@
+import os
+import re
+import stat
+
+class WorkDirActivityScanner(object):
+    """ Find recently modified files in a job work directory without running find
+
+    The exclusions are compiled into a single pattern which is matched against the path relative to
+    the work directory, before the entry is stat'ed. Directory listings are kept between scans and
+    only renewed when the directory mtime changes, and the directories where activity was last seen
+    are scanned first, so that for a running payload a scan usually stops after a few stat calls.
+    """
+
+    def __init__(self, workdir, exclusions=None):
+        self.workdir = workdir
+        self.setExclusions(exclusions)
+        self.__listings = {}     # dir path -> (mtime, [names])
+        self.__hotDirs = []      # dirs where recent activity was found, most recent first
+        self.nStats = 0          # number of stat calls during the last scan
+
+    def setExclusions(self, exclusions):
+        """ Set the list of substrings that exclude a path from the activity check """
+
+        if exclusions:
+            self.__excluded = re.compile("|".join([re.escape(e) for e in exclusions]))
+        else:
+            self.__excluded = None
+
+    def isExcluded(self, relpath):
+        """ Is the path (relative to the work dir) excluded? """
+
+        return self.__excluded is not None and self.__excluded.search(relpath) is not None
+
+    def __list(self, path, mtime):
+        """ Return the names in directory path, reusing the previous listing if its mtime is unchanged """
+
+        listing = self.__listings.get(path)
+        if listing and listing[0] == mtime:
+            return listing[1]
+        try:
+            names = os.listdir(path)
+        except OSError:
+            names = []
+        self.__listings[path] = (mtime, names)
+        return names
+
+    def __walk(self, start, since, visited):
+        """ Look below directory start for an entry modified after since, return (path, mtime) or None """
+
+        stack = [start]
+        while stack:
+            path = stack.pop()
+            if path in visited:
+                continue
+            visited.add(path)
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            self.nStats += 1
+            if path != self.workdir and st.st_mtime > since:
+                return path, st.st_mtime
+            for name in self.__list(path, st.st_mtime):
+                _path = os.path.join(path, name)
+                if self.isExcluded(os.path.relpath(_path, self.workdir)):
+                    continue
+                try:
+                    _st = os.lstat(_path)
+                except OSError:
+                    continue
+                self.nStats += 1
+                if stat.S_ISDIR(_st.st_mode):
+                    stack.append(_path)
+                elif _st.st_mtime > since:
+                    return _path, _st.st_mtime
+        return None
+
+    def findRecentlyModified(self, since):
+        """ Return (path, mtime) of a file or directory modified after time since, or None """
+
+        self.nStats = 0
+        visited = set()
+
+        # start with the directories where the payload was last seen writing
+        for path in self.__hotDirs + [self.workdir]:
+            found = self.__walk(path, since, visited)
+            if found:
+                hot = found[0]
+                if not os.path.isdir(hot):
+                    hot = os.path.dirname(hot)
+                self.__hotDirs = [hot] + [d for d in self.__hotDirs if d != hot][:4]
+                return found
+        self.__hotDirs = []
+
+        return None
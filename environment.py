@@ -82,6 +82,9 @@ def set_environment():
     env['timefloor_default'] = None            # Time limit for multi-jobs in minutes (turned off by default)
     env['useCoPilot'] = False                  # CERNVM Co-Pilot framework (on: let Co-Pilot finish job, off: let pilot finish job (default))
     env['update_freq_server'] = 30*60          # Server update frequency, 30 minutes
+    env['update_freq_looping'] = 5*60          # Looping job check frequency, 5 minutes
+    env['loopingExclusions'] = [".lib.tgz", ".py", "PoolFileCatalog", "setup.sh", "jobState", "pandaJob", "runjob",
+                                "matched_replicas", "memory_", "mem.", "DBRelease-"] # Work dir paths ignored by the looping job check
     env['experiment'] = "ATLAS"                # Current experiment (can be set with pilot option -F <experiment>)
     env['getjobmaxtime'] = 3*60                # Maximum time the pilot will attempt to download a single job (seconds)
     env['pandaJobDataFileName'] = "pandaJobData.out" # Job definition file name
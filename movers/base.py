@@ -7,12 +7,15 @@ import hashlib
 import os, re
 import time
 
-from subprocess import Popen, PIPE, STDOUT
+from CommandExecutor import executor
+from Instrumentation import timed
 
 from pUtil import tolog #
 from PilotErrors import PilotErrors, PilotException
 from Node import Node
 
+from .checksum import checksumService
+
 class BaseSiteMover(object):
     """
     File movers move files between a storage element (of different kinds) and a local directory
@@ -665,24 +668,39 @@ class BaseSiteMover(object):
             raise an exception if input filename is not exist/readable
         """
 
-        from zlib import adler32
+        return checksumService.calculate(filename, ['adler32'])['adler32']
+
+    @classmethod
+    def calc_md5_checksum(self, filename):
+        """
+            calculate the md5 checksum for a file (in-process, as md5sum)
+            raise an exception if input filename is not exist/readable
+        """
+
+        return checksumService.calculate(filename, ['md5'])['md5']
+
+    @classmethod
+    def calc_local_file_info(self, filename, checksum_types=('adler32',)):
+        """
+            get size and checksums of a local file reading it only once (cached for unchanged files)
+            :return: dict(filesize=.., <checksum_type>=<value>, ..)
+            raise an exception if input filename is not exist/readable
+        """
 
-        asum = 1 # default adler32 starting value
-        BLOCKSIZE = 64*1024*1024 # read buffer, 64 Mb
+        return checksumService.calculate(filename, checksum_types)
 
-        with open(filename, 'rb') as f:
-            while True:
-                data = f.read(BLOCKSIZE)
-                if not data:
-                   break
-                asum = adler32(data, asum)
-                if asum < 0:
-                  asum += 2**32
+    @classmethod
+    def calc_files_checksums(self, filenames, checksum_types=('adler32',), nworkers=4):
+        """
+            calculate size and checksums of several local files in parallel and keep them in the cache
+            :return: dict(filename: dict(filesize=.., <checksum_type>=<value>, ..)) for the files successfully processed
+        """
 
-        return "%08x" % asum # convert to hex
+        return checksumService.calculate_files(filenames, checksum_types, nworkers=nworkers)
 
 
     @classmethod
+    @timed("calc_checksum")
     def calc_checksum(self, filename, command='md5sum', setup=None, pattern=None, cmd=None):
         """
             :cmd: quick hack: fix me later
@@ -697,14 +715,19 @@ class BaseSiteMover(object):
 
         self.log("Execute command (%s) to calc checksum of file" % cmd)
 
-        c = Popen(cmd, stdout=PIPE, stderr=PIPE, shell=True)
-        output, error = c.communicate()
+        # same limit as getTimeOut() (not callable from a classmethod)
+        try:
+            timeout = min(self.timeout + int(os.path.getsize(filename)/0.5e6), 5 + 3*3600)
+        except OSError:
+            timeout = self.timeout
+        c = executor.run(cmd, timeout=timeout, mergeStderr=False)
+        output, error = c.stdout, c.stderr
 
         if error:
             self.log("INFO: calc_checksum: error=%s" % error)
 
-        if c.returncode:
-            self.log('FAILED to calc_checksum for file=%s, cmd=%s, rcode=%s, output=%s' % (filename, cmd, c.returncode, output))
+        if c.exitcode or c.timedOut:
+            self.log('FAILED to calc_checksum for file=%s, cmd=%s, rcode=%s, timed out=%s, output=%s' % (filename, cmd, c.exitcode, c.timedOut, output))
             raise Exception(output)
 
         self.log("calc_checksum: output=%s" % output)
@@ -0,0 +1,178 @@
+"""
+  Checksum service: size, adler32 and md5 of local files in a single read
+"""
+
+import io
+import os
+import zlib
+import Queue
+import hashlib
+import threading
+
+from Instrumentation import timed, count
+
+
+class ChecksumService(object):
+    """
+        Calculate checksums of local files reading every file only once
+
+        All requested checksums and the file size are computed in the same pass over the file
+        into a read buffer which is reused by the calling thread.
+        Results are cached by (path, inode, mtime, size): asking again for an unchanged file
+        (e.g. stage-out verification after the metadata preparation) does not read it again.
+    """
+
+    supported_types = ['adler32', 'md5']
+    blocksize = 16*1024*1024 # read buffer, 16 Mb
+    max_entries = 10000      # max number of cached files
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.cache = {} # path -> ((st_ino, st_mtime, st_size), {'filesize': .., checksum_type: value, ..})
+
+        self.nreads = 0      # number of files read
+        self.nhits = 0       # number of reads avoided thanks to the cache
+        self.bytes_read = 0
+
+    def get_buffer(self):
+        """ Return the read buffer of the calling thread """
+
+        buf = getattr(self.local, 'buf', None)
+        if buf is None:
+            buf = bytearray(self.blocksize)
+            self.local.buf = buf
+        return buf
+
+    def calculate(self, filename, checksum_types=('adler32',)):
+        """
+            Calculate the checksums of a local file
+            :return: dict(filesize=.., <checksum_type>=<hex value>, ..) for the requested checksum types
+            raise an exception if input filename is not exist/readable
+        """
+
+        for ctype in checksum_types:
+            if ctype not in self.supported_types:
+                raise ValueError("ChecksumService: unsupported checksum type=%s, accepted types=%s" % (ctype, self.supported_types))
+
+        st = os.stat(filename)
+        key = (st.st_ino, st.st_mtime, st.st_size)
+
+        with self.lock:
+            entry = self.cache.get(filename)
+            if entry and entry[0] == key and not [e for e in checksum_types if e not in entry[1]]:
+                self.nhits += 1
+                return dict([k, entry[1][k]] for k in ['filesize'] + list(checksum_types))
+
+        # compute the missing checksums together with whatever was cached for the same file version
+        ret = self.read_file(filename, checksum_types)
+
+        with self.lock:
+            if ret.pop('key') == key:
+                entry = self.cache.get(filename)
+                values = entry[1] if entry and entry[0] == key else {}
+                values.update(ret)
+                if len(self.cache) >= self.max_entries:
+                    self.cache.clear()
+                self.cache[filename] = (key, values)
+
+        return ret
+
+    @timed("checksum")
+    def read_file(self, filename, checksum_types):
+        """
+            Read the file once and compute its size and checksums
+            :return: dict(key=(st_ino, st_mtime, st_size), filesize=.., <checksum_type>=<value>, ..)
+        """
+
+        asum = 1 # default adler32 starting value
+        md5 = hashlib.md5() if 'md5' in checksum_types else None
+        do_adler32 = 'adler32' in checksum_types
+
+        buf = self.get_buffer()
+        filesize = 0
+
+        with io.open(filename, 'rb', buffering=0) as f:
+            st = os.fstat(f.fileno())
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                data = buffer(buf, 0, n)
+                if do_adler32:
+                    asum = zlib.adler32(data, asum)
+                if md5:
+                    md5.update(data)
+                filesize += n
+            st_end = os.fstat(f.fileno())
+
+        with self.lock:
+            self.nreads += 1
+            self.bytes_read += filesize
+        count("checksum.bytes", filesize)
+
+        ret = {'filesize': filesize}
+        if do_adler32:
+            ret['adler32'] = "%08x" % (asum & 0xffffffff) # convert to hex
+        if md5:
+            ret['md5'] = md5.hexdigest()
+
+        # do not cache results of a file modified while being read
+        key = (st.st_ino, st.st_mtime, st.st_size)
+        if key == (st_end.st_ino, st_end.st_mtime, st_end.st_size) and filesize == st.st_size:
+            ret['key'] = key
+        else:
+            ret['key'] = None
+
+        return ret
+
+    def calculate_files(self, filenames, checksum_types=('adler32',), nworkers=4):
+        """
+            Calculate the checksums of several files in parallel (the results are cached)
+            :return: dict(filename: dict(filesize=.., <checksum_type>=<value>, ..)) for the files successfully processed
+        """
+
+        queue = Queue.Queue()
+        for filename in filenames:
+            queue.put(filename)
+
+        ret = {}
+
+        def worker():
+            while True:
+                try:
+                    filename = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    ret[filename] = self.calculate(filename, checksum_types)
+                except Exception:
+                    pass # the caller will get the error when asking for this file
+
+        threads = [threading.Thread(target=worker, name='checksum-%s' % i) for i in range(min(nworkers, len(filenames)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        return ret
+
+    def invalidate(self, filename=None):
+        """ Forget the cached checksums of filename (or of all files) """
+
+        with self.lock:
+            if filename:
+                self.cache.pop(filename, None)
+            else:
+                self.cache.clear()
+
+    def get_statistics(self):
+        """ Return a summary string of the service usage """
+
+        return "checksums: %d file(s) read (%.3f MB), %d read(s) avoided" % (self.nreads, self.bytes_read/1024./1024., self.nhits)
+
+
+# process wide service used by the site movers
+checksumService = ChecksumService()
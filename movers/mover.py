@@ -19,9 +19,13 @@ from pUtil import tolog, readpar
 import sys
 import os
 import time
+import Queue
+import threading
 import traceback
+from copy import deepcopy
 from random import shuffle, uniform
-from subprocess import Popen, PIPE, STDOUT
+from CommandExecutor import executor
+from Instrumentation import timer
 
 try:
     import json # python2.6
@@ -49,6 +53,8 @@ class JobMover(object):
     _stageout_sleeptime_min = 1*60  # seconds, min allowed sleep time in case of stageout failure
     _stageout_sleeptime_max = 5*60    # seconds, max allowed sleep time in case of stageout failure
 
+    _filestate_lock = threading.Lock() # file state updates of all movers in the process (concurrent transfers)
+
     direct_remoteinput_allowed_schemas = ['root']
     remoteinput_allowed_schemas = ['root', 'gsiftp', 'dcap', 'davs', 'srm'] ## extend me later if need
 
@@ -570,7 +576,6 @@ class JobMover(object):
         remain_files = [e for e in files if e.status not in ['remote_io', 'transferred', 'no_transfer']]
 
         nfiles = len(remain_files)
-        nprotocols = len(protocols)
 
         # direct access settings
         allow_directaccess, directaccesstype = self.get_directaccess() ## resolve Site depended direct_access settings
@@ -593,164 +598,305 @@ class JobMover(object):
                     fdata.allowRemoteInputs = True
                 self.log("check direct access for lfn=%s: allow_directaccess=%s, fdata.is_directaccess()=%s => is_directaccess=%s, allowRemoteInputs=%s" % (fdata.lfn, allow_directaccess, fdata.is_directaccess(ensure_replica=False), is_directaccess, fdata.allowRemoteInputs))
 
-        sitemover_objects = {}
-        is_replicas_resolved = False
+        ctx = dict(files=files, remain_files=remain_files, protocols=protocols, maxinputsize=maxinputsize,
+                   allow_directaccess=allow_directaccess, skip_transfer_failure=skip_transfer_failure,
+                   transferred_files=transferred_files, failed_transfers=failed_transfers,
+                   replicas_lock=threading.Lock(), is_replicas_resolved=False, slots={})
+
+        ## concurrent transfers are limited per copytool by the 'stagein_workers' copytool setting (default is 1: serial stage-in)
+        workers = self.get_stagein_workers(protocols, copytools)
+        nworkers = min(nfiles, max(workers.values() or [1]))
+        if nworkers > 1 and [e for e in self.objectstorekeys.itervalues() if e.get('status')]:
+            self.log("stage-in: objectstore keys are passed via the environment, concurrent transfers are not possible .. will use serial stage-in")
+            nworkers = 1
+
+        t0 = time.time()
+        if nworkers > 1:
+            self.log("stage-in: will transfer N=%s files using %s concurrent workers, limits per copytool=%s" % (nfiles, nworkers, workers))
+            ctx['slots'] = dict([cp, threading.Semaphore(n)] for cp, n in workers.iteritems())
+            self._stagein_files_concurrently(remain_files, ctx, nworkers)
+        else:
+            sitemover_objects = {}
+            for fnum, fdata in enumerate(remain_files, 1):
+                self._stagein_file(fnum, fdata, ctx, sitemover_objects, self.trace_report)
+        t1 = time.time()
 
-        for fnum, fdata in enumerate(remain_files, 1):
+        self.log('INFO: all input files have been successfully processed')
 
-            self.log('INFO: prepare to transfer (stage-in) %s/%s file: lfn=%s' % (fnum, nfiles, fdata.lfn))
+        dumpFileStates(self.workDir, self.job.jobId, ftype="input")
 
-            is_directaccess = allow_directaccess and fdata.is_directaccess(ensure_replica=False) #fdata.turl is not defined at this point
-            #self.log("check direct access: allow_directaccess=%s, fdata.is_directaccess()=%s => is_directaccess=%s" % (allow_directaccess, fdata.is_directaccess(ensure_replica=False), is_directaccess))
+        #self.log('transferred_files= %s' % transferred_files)
+        self.log('Summary of transferred files:')
+        for e in transferred_files:
+            self.log(" -- %s" % e)
 
-            bad_copytools = True
+        if failed_transfers:
+            self.log('Summary of failed transfers:')
+            for e in failed_transfers:
+                self.log(" -- %s" % e)
 
-            for protnum, dat in enumerate(protocols, 1):
+        transferred_size = reduce(lambda x, y: x + (y.filesize or 0), [e for e in remain_files if e.status == 'transferred'], 0)
+        self.log("stage-in throughput: transferred %.3f MB in %.1f s: %.3f MB/s (workers=%s)" % (transferred_size/1024./1024., t1 - t0, transferred_size/1024./1024./max(t1 - t0, 1e-3), nworkers))
 
-                if fdata.status in ['remote_io', 'transferred', 'no_transfer']: ## success
-                    break
+        self.log("stagein finished")
 
-                copytool, copysetup = dat.get('copytool'), dat.get('copysetup')
+        if not self.job.usePrefetcher:
+            self.job.print_infiles()
 
-                try:
-                    sitemover = sitemover_objects.get(copytool)
-                    if not sitemover:
-                        sitemover = getSiteMover(copytool)(copysetup, workDir=self.job.workdir)
-                        sitemover_objects.setdefault(copytool, sitemover)
-
-                        sitemover.trace_report = self.trace_report
-                        sitemover.ddmconf = self.ddmconf # self.si.resolveDDMConf([]) # quick workaround  ###
-                        sitemover.setup()
-                    if dat.get('resolve_scheme'):
-                        dat['scheme'] = sitemover.schemes
-                        self.log("is_directaccess=%s" % is_directaccess)
-                        self.log("self.job.usePrefetcher=%s"%str(self.job.usePrefetcher))
-                        if is_directaccess or self.job.usePrefetcher:
-                            if dat['scheme'] and dat['scheme'][0] != self.remoteinput_allowed_schemas[0]:  ## ensure that root:// is coming first in allowed schemas required for further resolve_replica()
-                                dat['scheme'] = self.remoteinput_allowed_schemas + dat['scheme'] ## add supported schema for direct access
-                            self.log("INFO: prepare direct access mode: force to extend accepted protocol schemes to use direct access, schemes=%s" % dat['scheme'])
-
-                except Exception, e:
-                    self.log('WARNING: Failed to get SiteMover: %s .. skipped .. try to check next available protocol, current protocol details=%s' % (e, dat))
-                    self.trace_report.update(protocol=copytool, clientState='BAD_COPYTOOL', stateReason=str(e)[:500])
-                    self.sendTrace(self.trace_report)
-                    continue
+        return transferred_files, failed_transfers
 
-                bad_copytools = False
+    def get_stagein_workers(self, protocols, copytools):
+        """
+            Resolve the max number of concurrent stage-in transfers allowed per copytool
+            The limit is taken from the 'stagein_workers' entry of the copytool settings in queuedata (default is 1)
+            :return: dict(copytool: nworkers)
+        """
+
+        settings = dict(copytools)
+        workers = {}
+        for dat in protocols:
+            copytool = dat.get('copytool')
+            try:
+                n = int((settings.get(copytool) or {}).get('stagein_workers', 1))
+            except (TypeError, ValueError), e:
+                self.log("WARNING: bad stagein_workers value for copytool=%s: %s .. will use 1" % (copytool, e))
+                n = 1
+            workers[copytool] = max(n, 1)
+
+        return workers
 
-                if sitemover.require_replicas and not is_replicas_resolved:
-                    self.log("mover resolving replicas")
-                    self.resolve_replicas(files) ## do populate fspec.replicas for each entry in files
-                    is_replicas_resolved = True
+    def update_file_state(self, *args, **kwargs):
+        """
+            Thread safe wrapper of updateFileState(): the file states are kept in a single pickle file
+        """
 
-                self.log("Copy command [stage-in]: %s, sitemover=%s" % (copytool, sitemover))
-                self.log("Copy setup   [stage-in]: %s" % copysetup)
+        with self._filestate_lock:
+            updateFileState(*args, **kwargs)
 
-                self.trace_report.update(protocol=copytool, filesize=fdata.filesize)
+    def dump_file_states(self, *args, **kwargs):
+        """
+            Thread safe wrapper of dumpFileStates()
+        """
 
-                updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="not_transferred", ftype="input")
+        with self._filestate_lock:
+            dumpFileStates(*args, **kwargs)
 
-                self.log("[stage-in] Prepare to get_data: [%s/%s]-protocol=%s, fspec=%s" % (protnum, nprotocols, dat, fdata))
+    def _stagein_files_concurrently(self, remain_files, ctx, nworkers):
+        """
+            Stage-in files using nworkers threads
+            Each worker uses its own sitemover objects and trace report.
+            The first failure which should stop the stage-in prevents the workers from starting new transfers
+            and is raised (as for serial stage-in) once the transfers already started are finished.
+        """
 
-                try:
-                    r = sitemover.resolve_replica(fdata, dat, ddm=self.ddmconf.get(fdata.ddmendpoint))
-                except Exception, e:
-                    if sitemover.require_replicas:
-                        self.log("resolve_replica() failed for [%s/%s]-protocol.. skipped.. will check next available protocol, error=%s" % (protnum, nprotocols, e))
-                        self.trace_report.update(clientState='NO_REPLICA', stateReason=str(e))
-                        self.sendTrace(self.trace_report)
-                        continue
-                    r = {}
-
-                # quick stub: propagate changes to FileSpec
-                if r.get('surl'):
-                    fdata.surl = r['surl'] # TO BE CLARIFIED if it's still used and need
-                if r.get('pfn'):
-                    fdata.turl = r['pfn']
-                if r.get('ddmendpoint'):
-                    fdata.ddmendpoint = r['ddmendpoint']
-
-                self.log("[stage-in] found replica to be used: ddmendpoint=%s, pfn=%s" % (fdata.ddmendpoint, fdata.turl))
-
-                # check if protocol and found replica belong to same site
-                if dat.get('ddm'):
-                    protocol_site = self.ddmconf.get(dat.get('ddm'), {}).get('site')
-                    replica_site = self.ddmconf.get(fdata.ddmendpoint, {}).get('site')
-
-                    if protocol_site != replica_site:
-                        if fdata.allowRemoteInputs is None or not fdata.allowRemoteInputs:
-                            self.log('INFO: cross-sites checks: protocol_site=%s and replica_site=%s mismatched and remote inputs is not allowed.. skip file processing for copytool=%s' % (protocol_site, replica_site, copytool))
-                            continue
-                        else:
-                            self.log('INFO: cross-sites checks: protocol_site=%s and replica_site=%s mismatched but remote inputs is allowed.. keep processing for copytool=%s' % (protocol_site, replica_site, copytool))
-
-                # fill trace details
-                self.trace_report.update(localSite=fdata.ddmendpoint, remoteSite=fdata.ddmendpoint)
-                self.trace_report.update(filename=fdata.lfn, guid=fdata.guid.replace('-', ''))
-                self.trace_report.update(scope=fdata.scope, dataset=fdata.prodDBlock)
-
-                # check direct access
-                if fdata.is_directaccess() and is_directaccess: # direct access mode, no transfer required
-                    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="direct_access", ftype="input")
-                    fdata.status = 'remote_io'
-                    updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
-                    self.log("Direct access mode will be used for lfn=%s .. skip transfer for this file" % fdata.lfn)
-                    self.trace_report.update(url=fdata.turl, clientState='FOUND_ROOT', stateReason='direct_access')
-                    self.sendTrace(self.trace_report)
-                    continue
+        queue = Queue.Queue()
+        for fnum, fdata in enumerate(remain_files, 1):
+            queue.put((fnum, fdata))
 
-                # check prefetcher (the turl must be saved for prefetcher to use)
-                # note: for files to be prefetched, there's no entry for the file_state, so the updateFileState needs
-                # to be called twice (or update the updateFileState function to allow list arguments)
-                # also update the file_state for the existing entry (could also be removed?)
-                # note also that at least one file still needs to be staged in, or AthenaMP will not start
-                if self.job.usePrefetcher and self.job.eventService:
-                    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="prefetch", ftype="input")
-                    fdata.status = 'remote_io'
-                    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
-                    self.log("Added TURL to file state dictionary: %s" % fdata.turl)
-                    #updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state="no_transfer", ftype="input")
-                    self.trace_report.update(url=fdata.turl, clientState='FOUND_ROOT', stateReason='prefetch')
-                    self.sendTrace(self.trace_report)
-                    continue  # - if we continue here, the the file will not be staged in, but AthenaMP needs it so we still need to stage it in
+        abort = threading.Event()
+        errors = []
 
-                # apply site-mover custom job-specific checks for stage-in
+        def worker():
+            sitemover_objects = {}
+            trace_report = deepcopy(self.trace_report)
+            while not abort.is_set():
                 try:
-                    is_stagein_allowed = sitemover.is_stagein_allowed(fdata, self.job)
-                    if not is_stagein_allowed:
-                        reason = 'SiteMover does not allow stage-in operation for the job'
-                except PilotException, e:
-                    is_stagein_allowed = False
-                    reason = e
+                    fnum, fdata = queue.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    self._stagein_file(fnum, fdata, ctx, sitemover_objects, trace_report)
                 except Exception:
-                    raise
-                if not is_stagein_allowed:
-                    self.log("WARNING: sitemover=%s does not allow stage-in transfer for this job, lfn=%s with reason=%s.. skip transfer the file" % (sitemover.getID(), fdata.lfn, reason))
-                    failed_transfers.append(reason)
-                    self.trace_report.update(clientState='STAGEIN_NOTALLOWED', stateReason='skip stagein file')
-                    self.sendTrace(self.trace_report)
+                    errors.append((fnum, sys.exc_info()))
+                    abort.set()
+
+        threads = [threading.Thread(target=worker, name='stagein-%s' % i) for i in range(nworkers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            fnum, exc_info = sorted(errors, key=lambda x: x[0])[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _stagein_file(self, fnum, fdata, ctx, sitemover_objects, trace_report):
+        """
+            Stage-in single file: try the protocols in order with retries
+            :param ctx: stage-in settings and results shared by all files of stagein_real()
+            :raise: PilotException if the file failed and the stage-in should be stopped
+        """
+
+        files, remain_files, protocols = ctx['files'], ctx['remain_files'], ctx['protocols']
+        maxinputsize, allow_directaccess = ctx['maxinputsize'], ctx['allow_directaccess']
+        transferred_files, failed_transfers = ctx['transferred_files'], ctx['failed_transfers']
+
+        nfiles = len(remain_files)
+        nprotocols = len(protocols)
+
+        self.log('INFO: prepare to transfer (stage-in) %s/%s file: lfn=%s' % (fnum, nfiles, fdata.lfn))
+
+        is_directaccess = allow_directaccess and fdata.is_directaccess(ensure_replica=False) #fdata.turl is not defined at this point
+        #self.log("check direct access: allow_directaccess=%s, fdata.is_directaccess()=%s => is_directaccess=%s" % (allow_directaccess, fdata.is_directaccess(ensure_replica=False), is_directaccess))
+
+        bad_copytools = True
+
+        for protnum, dat in enumerate(protocols, 1):
+
+            if fdata.status in ['remote_io', 'transferred', 'no_transfer']: ## success
+                break
+
+            dat = dict(dat) # the protocols are shared by the stage-in workers: resolved schemes are kept per file
+
+            copytool, copysetup = dat.get('copytool'), dat.get('copysetup')
+
+            try:
+                sitemover = sitemover_objects.get(copytool)
+                if not sitemover:
+                    sitemover = getSiteMover(copytool)(copysetup, workDir=self.job.workdir)
+                    sitemover_objects.setdefault(copytool, sitemover)
+
+                    sitemover.trace_report = trace_report
+                    sitemover.ddmconf = self.ddmconf # self.si.resolveDDMConf([]) # quick workaround  ###
+                    sitemover.setup()
+                if dat.get('resolve_scheme'):
+                    dat['scheme'] = sitemover.schemes
+                    self.log("is_directaccess=%s" % is_directaccess)
+                    self.log("self.job.usePrefetcher=%s"%str(self.job.usePrefetcher))
+                    if is_directaccess or self.job.usePrefetcher:
+                        if dat['scheme'] and dat['scheme'][0] != self.remoteinput_allowed_schemas[0]:  ## ensure that root:// is coming first in allowed schemas required for further resolve_replica()
+                            dat['scheme'] = self.remoteinput_allowed_schemas + dat['scheme'] ## add supported schema for direct access
+                        self.log("INFO: prepare direct access mode: force to extend accepted protocol schemes to use direct access, schemes=%s" % dat['scheme'])
+
+            except Exception, e:
+                self.log('WARNING: Failed to get SiteMover: %s .. skipped .. try to check next available protocol, current protocol details=%s' % (e, dat))
+                trace_report.update(protocol=copytool, clientState='BAD_COPYTOOL', stateReason=str(e)[:500])
+                self.sendTrace(trace_report)
+                continue
+
+            bad_copytools = False
+
+            if sitemover.require_replicas and not ctx['is_replicas_resolved']:
+                with ctx['replicas_lock']:
+                    if not ctx['is_replicas_resolved']:
+                        self.log("mover resolving replicas")
+                        self.resolve_replicas(files) ## do populate fspec.replicas for each entry in files
+                        ctx['is_replicas_resolved'] = True
+
+            self.log("Copy command [stage-in]: %s, sitemover=%s" % (copytool, sitemover))
+            self.log("Copy setup   [stage-in]: %s" % copysetup)
+
+            trace_report.update(protocol=copytool, filesize=fdata.filesize)
+
+            self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="not_transferred", ftype="input")
+
+            self.log("[stage-in] Prepare to get_data: [%s/%s]-protocol=%s, fspec=%s" % (protnum, nprotocols, dat, fdata))
+
+            try:
+                r = sitemover.resolve_replica(fdata, dat, ddm=self.ddmconf.get(fdata.ddmendpoint))
+            except Exception, e:
+                if sitemover.require_replicas:
+                    self.log("resolve_replica() failed for [%s/%s]-protocol.. skipped.. will check next available protocol, error=%s" % (protnum, nprotocols, e))
+                    trace_report.update(clientState='NO_REPLICA', stateReason=str(e))
+                    self.sendTrace(trace_report)
                     continue
+                r = {}
+
+            # quick stub: propagate changes to FileSpec
+            if r.get('surl'):
+                fdata.surl = r['surl'] # TO BE CLARIFIED if it's still used and need
+            if r.get('pfn'):
+                fdata.turl = r['pfn']
+            if r.get('ddmendpoint'):
+                fdata.ddmendpoint = r['ddmendpoint']
+
+            self.log("[stage-in] found replica to be used: ddmendpoint=%s, pfn=%s" % (fdata.ddmendpoint, fdata.turl))
+
+            # check if protocol and found replica belong to same site
+            if dat.get('ddm'):
+                protocol_site = self.ddmconf.get(dat.get('ddm'), {}).get('site')
+                replica_site = self.ddmconf.get(fdata.ddmendpoint, {}).get('site')
+
+                if protocol_site != replica_site:
+                    if fdata.allowRemoteInputs is None or not fdata.allowRemoteInputs:
+                        self.log('INFO: cross-sites checks: protocol_site=%s and replica_site=%s mismatched and remote inputs is not allowed.. skip file processing for copytool=%s' % (protocol_site, replica_site, copytool))
+                        continue
+                    else:
+                        self.log('INFO: cross-sites checks: protocol_site=%s and replica_site=%s mismatched but remote inputs is allowed.. keep processing for copytool=%s' % (protocol_site, replica_site, copytool))
+
+            # fill trace details
+            trace_report.update(localSite=fdata.ddmendpoint, remoteSite=fdata.ddmendpoint)
+            trace_report.update(filename=fdata.lfn, guid=fdata.guid.replace('-', ''))
+            trace_report.update(scope=fdata.scope, dataset=fdata.prodDBlock)
+
+            # check direct access
+            if fdata.is_directaccess() and is_directaccess: # direct access mode, no transfer required
+                self.update_file_state(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="direct_access", ftype="input")
+                fdata.status = 'remote_io'
+                self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
+                self.log("Direct access mode will be used for lfn=%s .. skip transfer for this file" % fdata.lfn)
+                trace_report.update(url=fdata.turl, clientState='FOUND_ROOT', stateReason='direct_access')
+                self.sendTrace(trace_report)
+                continue
+
+            # check prefetcher (the turl must be saved for prefetcher to use)
+            # note: for files to be prefetched, there's no entry for the file_state, so the updateFileState needs
+            # to be called twice (or update the updateFileState function to allow list arguments)
+            # also update the file_state for the existing entry (could also be removed?)
+            # note also that at least one file still needs to be staged in, or AthenaMP will not start
+            if self.job.usePrefetcher and self.job.eventService:
+                self.update_file_state(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="prefetch", ftype="input")
+                fdata.status = 'remote_io'
+                self.update_file_state(fdata.turl, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
+                self.log("Added TURL to file state dictionary: %s" % fdata.turl)
+                #self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state="no_transfer", ftype="input")
+                trace_report.update(url=fdata.turl, clientState='FOUND_ROOT', stateReason='prefetch')
+                self.sendTrace(trace_report)
+                continue  # - if we continue here, the the file will not be staged in, but AthenaMP needs it so we still need to stage it in
+
+            # apply site-mover custom job-specific checks for stage-in
+            try:
+                is_stagein_allowed = sitemover.is_stagein_allowed(fdata, self.job)
+                if not is_stagein_allowed:
+                    reason = 'SiteMover does not allow stage-in operation for the job'
+            except PilotException, e:
+                is_stagein_allowed = False
+                reason = e
+            except Exception:
+                raise
+            if not is_stagein_allowed:
+                self.log("WARNING: sitemover=%s does not allow stage-in transfer for this job, lfn=%s with reason=%s.. skip transfer the file" % (sitemover.getID(), fdata.lfn, reason))
+                failed_transfers.append(reason)
+                trace_report.update(clientState='STAGEIN_NOTALLOWED', stateReason='skip stagein file')
+                self.sendTrace(trace_report)
+                continue
 
-                # verify file sizes and available space for stagein
-                sitemover.check_availablespace(maxinputsize, [e for e in remain_files if e.status not in ['remote_io', 'transferred']])
+            # verify file sizes and available space for stagein
+            sitemover.check_availablespace(maxinputsize, [e for e in remain_files if e.status not in ['remote_io', 'transferred']])
 
-                self.trace_report.update(catStart=time.time())  ## is this metric still needed? LFC catalog
+            trace_report.update(catStart=time.time())  ## is this metric still needed? LFC catalog
 
-                self.log("[stage-in] Preparing copy for lfn=%s using copytool=%s: mover=%s" % (fdata.lfn, copytool, sitemover))
+            self.log("[stage-in] Preparing copy for lfn=%s using copytool=%s: mover=%s" % (fdata.lfn, copytool, sitemover))
 
-                # set environment for objectstore
-                if fdata.ddmendpoint in self.objectstorekeys and self.objectstorekeys[fdata.ddmendpoint]['status']:
-                    os.environ['S3_ACCESS_KEY'] = self.objectstorekeys[fdata.ddmendpoint]['S3_ACCESS_KEY']
-                    os.environ['S3_SECRET_KEY'] = self.objectstorekeys[fdata.ddmendpoint]['S3_SECRET_KEY']
-                    os.environ['S3_IS_SECURE'] = str(self.objectstorekeys[fdata.ddmendpoint]['S3_IS_SECURE'])
-                else:
-                    if 'S3_ACCESS_KEY' in os.environ: del os.environ['S3_ACCESS_KEY']
-                    if 'S3_SECRET_KEY' in os.environ: del os.environ['S3_SECRET_KEY']
-                    if 'S3_IS_SECURE' in os.environ: del os.environ['S3_IS_SECURE']
-                self.log("Environment S3_ACCESS_KEY=%s" % os.environ.get('S3_ACCESS_KEY', None))
+            # set environment for objectstore
+            if fdata.ddmendpoint in self.objectstorekeys and self.objectstorekeys[fdata.ddmendpoint]['status']:
+                os.environ['S3_ACCESS_KEY'] = self.objectstorekeys[fdata.ddmendpoint]['S3_ACCESS_KEY']
+                os.environ['S3_SECRET_KEY'] = self.objectstorekeys[fdata.ddmendpoint]['S3_SECRET_KEY']
+                os.environ['S3_IS_SECURE'] = str(self.objectstorekeys[fdata.ddmendpoint]['S3_IS_SECURE'])
+            else:
+                os.environ.pop('S3_ACCESS_KEY', None)
+                os.environ.pop('S3_SECRET_KEY', None)
+                os.environ.pop('S3_IS_SECURE', None)
+            self.log("Environment S3_ACCESS_KEY=%s" % os.environ.get('S3_ACCESS_KEY', None))
 
-                #dumpFileStates(self.workDir, self.job.jobId, ftype="input")
+            #dumpFileStates(self.workDir, self.job.jobId, ftype="input")
 
+            # limit the number of concurrent transfers per copytool
+            slot = ctx['slots'].get(copytool)
+            if slot:
+                slot.acquire()
+            try:
                 # loop over multple stage-in attempts
                 for _attempt in xrange(1, self.stageinretry + 1):
                     if _attempt > 1: # if not first stage-in attempt, take a nap before next attempt
@@ -761,7 +907,8 @@ class JobMover(object):
                     self.log("Get attempt %s/%s for file (%s/%s) with lfn=%s .. sitemover=%s" % (_attempt, self.stageinretry, fnum, nfiles, fdata.lfn, sitemover))
 
                     try:
-                        result = sitemover.get_data(fdata)
+                        with timer("stagein.%s" % sitemover.getID()):
+                            result = sitemover.get_data(fdata)
                         fdata.status = 'transferred' # mark as successful
                         fdata.status_code = 0
                         if result.get('ddmendpoint'):
@@ -771,10 +918,10 @@ class JobMover(object):
                         if result.get('pfn'):
                             fdata.turl = result.get('pfn')
 
-                        #self.trace_report.update(url=fdata.surl) ###
-                        self.trace_report.update(url=fdata.turl) ###
+                        #trace_report.update(url=fdata.surl) ###
+                        trace_report.update(url=fdata.turl) ###
                         # for files without replication registered in rucio, the filesize need to be got from local file
-                        self.trace_report.update(filesize=fdata.filesize)
+                        trace_report.update(filesize=fdata.filesize)
 
                         break # transferred successfully
                     except PilotException, e:
@@ -792,77 +939,59 @@ class JobMover(object):
                     if isinstance(result, PilotException) and result.code in accepted_codes:
                         self.log("[stage-in] WARNING: BAD input file detected at storage side (code=%s).. will skip all remaining retry attempts (if any) .." % result.code)
                         break
+            finally:
+                if slot:
+                    slot.release()
 
-                if not isinstance(result, PilotException): # transferred successfully
+            if not isinstance(result, PilotException): # transferred successfully
 
-                    # finalize and send trace report
-                    self.trace_report.update(clientState='DONE', stateReason='OK', timeEnd=time.time())
-                    self.sendTrace(self.trace_report)
+                # finalize and send trace report
+                trace_report.update(clientState='DONE', stateReason='OK', timeEnd=time.time())
+                self.sendTrace(trace_report)
 
-                    updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="transferred", ftype="input")
-                    dumpFileStates(self.workDir, self.job.jobId, ftype="input")
+                self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="transferred", ftype="input")
+                self.dump_file_states(self.workDir, self.job.jobId, ftype="input")
 
-                    ## self.updateSURLDictionary(guid, surl, self.workDir, self.job.jobId) # FIX ME LATER
+                ## self.updateSURLDictionary(guid, surl, self.workDir, self.job.jobId) # FIX ME LATER
 
-                    fdat = result.copy()
-                    #fdat.update(lfn=lfn, pfn=pfn, guid=guid, surl=surl)
-                    transferred_files.append(fdat)
-                else:
-                    fdata.status = 'error'
-                    fdata.status_code = result.code
-                    fdata.status_message = result.message
-                    self.trace_report.update(clientState=result.state or 'STAGEIN_ATTEMPT_FAILED', stateReason=result.message, timeEnd=time.time())
-                    self.sendTrace(self.trace_report)
-                    failed_transfers.append(result)
-
-                    badfile_codes = [PilotErrors.ERR_GETADMISMATCH, PilotErrors.ERR_GETMD5MISMATCH, PilotErrors.ERR_GETWRONGSIZE, PilotErrors.ERR_NOSUCHFILE]
-                    if fdata.status_code in badfile_codes:
-                        break
-
-                # TEMPORARY: SHOULD BE REMOVED IF DIRECT I/O ACTUALLY WORKS WITH ATHENAMP, WHICH IT SEEMS IT DOESN'T
-                # AS OF NOW, THE INITIAL INPUT FILE IS STILL TRANSFERRED, OTHERWISE ATHENAMP FAILS IMMEDIATELY SINCE
-                # IT DOESN'T FIND THE INPUT FILE
-                # check prefetcher (no transfer is required, but the turl must be saved for prefetcher to use)
-                # note: for files to be prefetched, there's no entry for the file_state, so the updateFileState needs
-                # to be called twice (or update the updateFileState function to allow list arguments)
-                # also update the file_state for the existing entry (could also be removed?)
-                #if self.job.prefetcher:
-                #    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="prefetch", ftype="input")
-                #    fdata.status = 'remote_io'
-                #    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
-                #    self.log("Prefetcher will be used for turl=%s .. skip transfer for this file" % fdata.turl)
-                #    updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state="no_transfer", ftype="input")
-                #    continue
-
-            if fdata.status == 'error' and not skip_transfer_failure:
-                self.log('stage-in of file (%s/%s) with lfn=%s failed: code=%s .. skip transferring remaining files..' % (fnum, nfiles, fdata.lfn, fdata.status_code))
-                dumpFileStates(self.workDir, self.job.jobId, ftype="input")
-                status_code = fdata.status_code if fdata.status_code != PilotErrors.ERR_UNKNOWN else PilotErrors.ERR_STAGEINFAILED
-                raise PilotException("STAGEIN FAILED: %s: lfn=%s, error=%s" % (PilotErrors.getErrorStr(status_code), fdata.lfn, getattr(fdata, 'status_message', '')), code=status_code, state='STAGEIN_FILE_FAILED')
-
-            if bad_copytools:
-                raise PilotException("STAGEIN FAILED: bad copytools: no supported copytools", code=PilotErrors.ERR_NOSTORAGE, state='STAGEIN_BAD_COPYTOOLS')
-
-        self.log('INFO: all input files have been successfully processed')
-
-        dumpFileStates(self.workDir, self.job.jobId, ftype="input")
-
-        #self.log('transferred_files= %s' % transferred_files)
-        self.log('Summary of transferred files:')
-        for e in transferred_files:
-            self.log(" -- %s" % e)
-
-        if failed_transfers:
-            self.log('Summary of failed transfers:')
-            for e in failed_transfers:
-                self.log(" -- %s" % e)
-
-        self.log("stagein finished")
-
-        if not self.job.usePrefetcher:
-            self.job.print_infiles()
+                fdat = result.copy()
+                #fdat.update(lfn=lfn, pfn=pfn, guid=guid, surl=surl)
+                transferred_files.append(fdat)
+            else:
+                fdata.status = 'error'
+                fdata.status_code = result.code
+                fdata.status_message = result.message
+                trace_report.update(clientState=result.state or 'STAGEIN_ATTEMPT_FAILED', stateReason=result.message, timeEnd=time.time())
+                self.sendTrace(trace_report)
+                failed_transfers.append(result)
+
+                badfile_codes = [PilotErrors.ERR_GETADMISMATCH, PilotErrors.ERR_GETMD5MISMATCH, PilotErrors.ERR_GETWRONGSIZE, PilotErrors.ERR_NOSUCHFILE]
+                if fdata.status_code in badfile_codes:
+                    break
 
-        return transferred_files, failed_transfers
+            # TEMPORARY: SHOULD BE REMOVED IF DIRECT I/O ACTUALLY WORKS WITH ATHENAMP, WHICH IT SEEMS IT DOESN'T
+            # AS OF NOW, THE INITIAL INPUT FILE IS STILL TRANSFERRED, OTHERWISE ATHENAMP FAILS IMMEDIATELY SINCE
+            # IT DOESN'T FIND THE INPUT FILE
+            # check prefetcher (no transfer is required, but the turl must be saved for prefetcher to use)
+            # note: for files to be prefetched, there's no entry for the file_state, so the updateFileState needs
+            # to be called twice (or update the updateFileState function to allow list arguments)
+            # also update the file_state for the existing entry (could also be removed?)
+            #if self.job.prefetcher:
+            #    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="file_state", state="prefetch", ftype="input")
+            #    fdata.status = 'remote_io'
+            #    updateFileState(fdata.turl, self.workDir, self.job.jobId, mode="transfer_mode", state=fdata.status, ftype="input")
+            #    self.log("Prefetcher will be used for turl=%s .. skip transfer for this file" % fdata.turl)
+            #    updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="transfer_mode", state="no_transfer", ftype="input")
+            #    continue
+
+        if fdata.status == 'error' and not ctx['skip_transfer_failure']:
+            self.log('stage-in of file (%s/%s) with lfn=%s failed: code=%s .. skip transferring remaining files..' % (fnum, nfiles, fdata.lfn, fdata.status_code))
+            self.dump_file_states(self.workDir, self.job.jobId, ftype="input")
+            status_code = fdata.status_code if fdata.status_code != PilotErrors.ERR_UNKNOWN else PilotErrors.ERR_STAGEINFAILED
+            raise PilotException("STAGEIN FAILED: %s: lfn=%s, error=%s" % (PilotErrors.getErrorStr(status_code), fdata.lfn, getattr(fdata, 'status_message', '')), code=status_code, state='STAGEIN_FILE_FAILED')
+
+        if bad_copytools:
+            raise PilotException("STAGEIN FAILED: bad copytools: no supported copytools", code=PilotErrors.ERR_NOSTORAGE, state='STAGEIN_BAD_COPYTOOLS')
 
     def _prepare_destinations(self, files, activities):
         """
@@ -1191,7 +1320,7 @@ class JobMover(object):
                                                        pathConvention=fdata.pathConvention,
                                                        ddmEndpoint=fdata.ddmendpoint)
 
-                    updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="not_transferred", ftype="output")
+                    self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="not_transferred", ftype="output")
 
                     # job is passing here for possible JOB specific processing
                     fdata.turl = sitemover.getSURL(se, se_path, fdata.scope, fdata.lfn, self.job, pathConvention=fdata.pathConvention, ddmEndpoint=fdata.ddmendpoint)
@@ -1217,7 +1346,8 @@ class JobMover(object):
                         self.log("Put attempt %s/%s for file (%s/%s) with lfn=%s .. sitemover=%s" % (_attempt, self.stageoutretry, fnum, nfiles, fdata.lfn, sitemover))
 
                         try:
-                            result = sitemover.put_data(fdata)
+                            with timer("stageout.%s" % sitemover.getID()):
+                                result = sitemover.put_data(fdata)
                             fdata.status = 'transferred' # mark as successful
                             fdata.status_code = 0
                             if result.get('surl'):
@@ -1232,8 +1362,8 @@ class JobMover(object):
                             self.trace_report.update(clientState='DONE', stateReason='OK', timeEnd=time.time())
                             self.sendTrace(self.trace_report)
 
-                            updateFileState(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="transferred", ftype="output")
-                            dumpFileStates(self.workDir, self.job.jobId, ftype="output")
+                            self.update_file_state(fdata.lfn, self.workDir, self.job.jobId, mode="file_state", state="transferred", ftype="output")
+                            self.dump_file_states(self.workDir, self.job.jobId, ftype="output")
 
                             self.updateSURLDictionary(fdata.guid, fdata.surl, self.workDir, self.job.jobId) # FIXME LATER: isolate later
 
@@ -1269,7 +1399,7 @@ class JobMover(object):
 
             if fdata.status == 'error' and not skip_transfer_failure:
                 self.log('[stage-out] [%s] failed to transfer file (%s/%s) with lfn=%s: code=%s .. skip transferring of remaining data..' % (activity, fnum, nfiles, fdata.lfn, fdata.status_code))
-                dumpFileStates(self.workDir, self.job.jobId, ftype="output")
+                self.dump_file_states(self.workDir, self.job.jobId, ftype="output")
                 status_code = fdata.status_code if fdata.status_code != PilotErrors.ERR_UNKNOWN else PilotErrors.ERR_STAGEOUTFAILED
                 raise PilotException("STAGEOUT FAILED: %s: lfn=%s, error=%s" % (PilotErrors.getErrorStr(status_code), fdata.lfn, getattr(fdata, 'status_message', '')), code=status_code, state='STAGEOUT_FILE_FAILED')
 
@@ -1277,7 +1407,7 @@ class JobMover(object):
                 raise PilotException("STAGEOUT FAILED: bad copytools: no supported copytools", code=PilotErrors.ERR_NOSTORAGE, state='STAGEOUT_BAD_COPYTOOLS')
 
 
-        dumpFileStates(self.workDir, self.job.jobId, ftype="output")
+        self.dump_file_states(self.workDir, self.job.jobId, ftype="output")
 
         self.log('Summary of transferred files:')
         for e in transferred_files:
@@ -1486,7 +1616,8 @@ class JobMover(object):
                         # quick work around
                         from Job import FileSpec
                         stub_fspec = FileSpec(ddmendpoint=ddmendpoint, guid=guid, scope=scope, lfn=lfn, cmtconfig=self.job.cmtconfig)
-                        result = sitemover.stageOut(pfn, turl, stub_fspec)
+                        with timer("stageout.%s" % sitemover.getID()):
+                            result = sitemover.stageOut(pfn, turl, stub_fspec)
                         break # transferred successfully
                     except PilotException, e:
                         result = e
@@ -1577,9 +1708,9 @@ class JobMover(object):
             cmd = 'curl --connect-timeout 20 --max-time 120 --cacert %s -v -k -d "%s" %s' % (sslCertificate, data, url)
             self.log("Executing command: %s" % cmd)
 
-            c = Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=True)
-            output = c.communicate()[0]
-            if c.returncode:
+            c = executor.run(cmd, timeout=180)
+            output = c.stdout
+            if c.exitcode:
                 raise Exception(output)
         except Exception, e:
             self.log('WARNING: FAILED to send tracing report: %s' % e)
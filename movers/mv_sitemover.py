@@ -99,10 +99,10 @@ class mvSiteMover(BaseSiteMover):
                 cmd = 'rucio download %s:%s' % (fspec.scope, fspec.lfn)
                 self.log("Executing command: %s" % cmd)
 
-                from subprocess import Popen, PIPE, STDOUT
-                c = Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=True)
-                output = c.communicate()[0]
-                if c.returncode:
+                from CommandExecutor import executor
+                c = executor.run(cmd)
+                output = c.stdout
+                if c.exitcode:
                     raise Exception(output)
 
                 fileRucioLocation='%s/%s' % (fspec.scope, fspec.lfn)  # the place where Rucio downloads file
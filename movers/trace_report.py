@@ -7,10 +7,11 @@ import os
 import time
 
 import hashlib
-import commands
 
 import socket
 
+from CommandExecutor import getoutput
+
 class TraceReport(dict):
 
     def __init__(self, *args, **kwargs):
@@ -77,6 +78,6 @@ class TraceReport(dict):
             self['uuid'] = hashlib.md5('ppilot_%s' % job.jobDefinitionID).hexdigest() # hash_pilotid
             #tolog("Using job definition id: %s" % job.jobDefinitionID)
         else:
-            self['uuid'] = commands.getoutput('uuidgen -t 2> /dev/null').replace('-','') # all LFNs of one request have the same uuid
+            self['uuid'] = getoutput('uuidgen -t 2> /dev/null', timeout=60).replace('-','') # all LFNs of one request have the same uuid
 
         #tolog("Tracing report initialised with: %s" % self)
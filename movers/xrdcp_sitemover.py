@@ -8,7 +8,7 @@ from .base import BaseSiteMover
 from TimerCommand import TimerCommand
 from PilotErrors import PilotErrors, PilotException
 
-from subprocess import Popen, PIPE, STDOUT
+from CommandExecutor import executor
 
 from datetime import datetime
 
@@ -40,10 +40,10 @@ class xrdcpSiteMover(BaseSiteMover):
 
         self.log("Execute command (%s) to check xrdcp client version.." % cmd)
 
-        c = Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=True)
-        output = c.communicate()[0]
+        c = executor.run(cmd, timeout=120)
+        output = c.stdout
 
-        self.log("return code: %s" % c.returncode)
+        self.log("return code: %s" % c.exitcode)
         self.log("return output: %s" % output)
 
         cmd = "%s -h" % self.copy_command
@@ -52,14 +52,14 @@ class xrdcpSiteMover(BaseSiteMover):
 
         self.log("Execute command (%s) to decide which option should be used to calc file checksum.." % cmd)
 
-        c = Popen(cmd, stdout=PIPE, stderr=STDOUT, shell=True)
-        output = c.communicate()[0]
+        c = executor.run(cmd, timeout=120)
+        output = c.stdout
 
-        self.log("return code: %s" % c.returncode)
+        self.log("return code: %s" % c.exitcode)
 
         coption = ""
 
-        if c.returncode:
+        if c.exitcode:
             self.log('FAILED to execute command=%s: %s' % (cmd, output))
         else:
             if "--cksum" in output:
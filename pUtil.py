@@ -13,6 +13,8 @@ import environment
 env = environment.set_environment()
 
 from processes import killProcesses
+from Instrumentation import timed
+from LogWriter import logWriter
 
 # exit code
 EC_Failed = 255
@@ -100,15 +102,17 @@ def tolog_file(msg):
 def appendToLog(txt):
     """ append txt to file """
 
-    try:
-        f = open(pilotlogFilename, 'a')
-        f.write(txt)
-        f.close()
-    except Exception, e:
-        if "No such file" in e:
-            pass
-        else:
-            print "WARNING: Exception caught: %s" % e
+    logWriter.put(pilotlogFilename, txt)
+
+def appendToEssentialLog(txt):
+    """ append txt to the essential log file """
+
+    logWriter.put(essentialPilotlogFilename, txt)
+
+def flushLog():
+    """ Write any queued log records to the log files """
+
+    logWriter.flush()
 
 def tologNew(msg, tofile=True, label='INFO', essential=False):
     """ Write message to pilot log and to stdout """
@@ -147,25 +151,31 @@ def tologNew(msg, tofile=True, label='INFO', essential=False):
     if label == 'ERROR' or label == 'CRITICAL':
         print >> sys.stderr, msg # write any FAILED messages to stderr
 
+# cache of caller file name -> module label used by tolog()
+_tologModuleNames = {}
+
 def tolog(msg, tofile=True, label='INFO', essential=False):
     """ Write date+msg to pilot log and to stdout """
 
     try:
-        import inspect
-
         MAXLENGTH = 12
         # getting the name of the module that is invoking tolog() and adjust the length
         try:
-            module_name = os.path.basename(inspect.stack()[1][1])
+            filename = sys._getframe(1).f_code.co_filename
+            module_name_cut = _tologModuleNames.get(filename)
+            if module_name_cut is None:
+                module_name_cut = os.path.basename(filename)[0:MAXLENGTH].ljust(MAXLENGTH)
+                _tologModuleNames[filename] = module_name_cut
         except Exception, e:
-            module_name = "unknown"
+            module_name_cut = "unknown".ljust(MAXLENGTH)
             #print "Exception caught by tolog(): ", e,
-        module_name_cut = module_name[0:MAXLENGTH].ljust(MAXLENGTH)
         msg = "%i|%s| %s" % (os.getpid(),module_name_cut, msg)
 
         t = timeStampUTC(format='%Y-%m-%d %H:%M:%S')
         if tofile:
             appendToLog("%s|%s\n" % (t, msg))
+            if essential:
+                appendToEssentialLog("%s|%s\n" % (t, msg))
 
         # remove backquotes from the msg since they cause problems with batch submission of pilot
         # (might be present in error messages from the OS)
@@ -278,17 +288,10 @@ def returnLogMsg(logf=None, linenum=20):
             thisLog = "\n- No log file %s found -" % (logf)
         else:
             thisLog = "\n- Log from %s -" % (logf)
-            f = open(logf)
-            lines = f.readlines()
-            f.close()
 
-            if len(lines) <= linenum:
-                ln = len(lines)
-            else:
-                ln = linenum
-
-            for i in range(-ln,0):
-                thisLog += lines[i]
+            # only the end of the file is read
+            from LogScanner import readLastLines
+            thisLog += "".join(readLastLines(logf, linenum))
 
     return thisLog
 
@@ -980,6 +983,16 @@ def getOutputFileInfo(outputFiles, checksum_cmd, skiplog=False, logFile=""):
     if logFile != "":
         outputFiles.insert(0, logFile)
 
+    # read the files in parallel first, getLocalFileInfo() below will then use the cached checksums
+    # (only for the checksum types calculated in-process)
+    from SiteMover import CMD_CHECKSUM
+    if checksum_cmd == "adler32" or CMD_CHECKSUM == "md5sum":
+        from movers.base import BaseSiteMover
+        checksum_type = "adler32" if checksum_cmd == "adler32" else "md5"
+        _files = [f for f in outputFiles if not (f == logFile and skiplog) and os.path.isfile(f)]
+        if len(_files) > 1:
+            BaseSiteMover.calc_files_checksums(_files, [checksum_type])
+
     for filename in outputFiles:
         # add "" for the log metadata since it has not been created yet
         if filename == logFile and skiplog:
@@ -1009,6 +1022,9 @@ def getOutputFileInfo(outputFiles, checksum_cmd, skiplog=False, logFile=""):
     if logFile != "":
         outputFiles.remove(logFile)
 
+    from movers.checksum import checksumService
+    tolog("Checksum service: %s" % (checksumService.get_statistics()))
+
     #tolog("Going to return %d,%s,%s,%s" % (ec, pilotErrorDiag, fsize, checksum))
     return ec, pilotErrorDiag, fsize, checksum
 
@@ -1503,25 +1519,29 @@ def timedCommand(cmd, timeout=300):
     """ Protect cmd with timed_command """
 
     tolog("Executing command: %s (protected by timed_command, timeout: %d s)" % (cmd, timeout))
-    t0 = os.times()
+    timedOut = False
     try:
-        from TimerCommand import TimerCommand
-        timerCommand = TimerCommand(cmd)
-        exitcode, output = timerCommand.run(timeout=timeout)
+        from CommandExecutor import executor
+        command = executor.run(cmd, timeout=timeout)
     except Exception, e:
         pilotErrorDiag = 'TimedCommand() threw an exception: %s' % e
         tolog("!!WARNING!!2220!! %s" % pilotErrorDiag)
         exitcode = 1
         output = str(e)
+        telapsed = 0
     else:
+        exitcode = command.exitcode
+        output = command.stdout
+        timedOut = command.timedOut
+        telapsed = int(round(command.wallTime))
+        if timedOut:
+            exitcode = 1
         if exitcode != 0:
             tolog("!!WARNING!!2220!! Timed command returned: %s" % (output))
 
-    t1 = os.times()
-    telapsed = int(round(t1[4] - t0[4]))
     tolog("Elapsed time: %d" % (telapsed))
 
-    if telapsed >= timeout:
+    if timedOut:
         tolog("!!WARNING!!2220!! Command timed out")
         output += " (timed out)"
 
@@ -1543,11 +1563,18 @@ def stringToFields(jobFields):
 
     return fields
 
+# SiteInformation object used by readpar()
+_readparSiteInformation = None
+
+@timed("readpar")
 def readpar(parameter, alt=False, version=0, queuename=None):
     """ Read 'parameter' from queuedata via SiteInformation class """
 
-    from SiteInformation import SiteInformation
-    si = SiteInformation()
+    global _readparSiteInformation
+    if _readparSiteInformation is None:
+        from SiteInformation import SiteInformation
+        _readparSiteInformation = SiteInformation()
+    si = _readparSiteInformation
 
     return si.readpar(parameter, alt=alt, version=version, queuename=queuename)
 
@@ -1932,9 +1959,52 @@ class _Curl:
         self.sslKey = self.sslCert
         # CA cert dir
         self.sslCertDir = si.getSSLCertificatesDirectory()
+        # send the requests from within the pilot process using persistent connections
+        # (curl is used if the client is not available, or if requested in schedconfig.catchall)
+        from HttpClient import httpClient
+        self.useHttpClient = httpClient.isAvailable() and not 'use_curl' in readpar('catchall')
+
+    def __httpRequest(self, method, url, body=None, headers=None, timeout=None):
+        """ Send the request with the in-process client, return None if curl should be used instead """
+
+        from HttpClient import httpClient, HttpClientError, CURLE_SSL_CONNECT_ERROR, CURLE_SSL_CERTPROBLEM
+        tolog("Sending %s request to %s" % (method, url))
+        try:
+            status, response = httpClient.request(method, url, body=body, headers=headers, timeout=timeout,
+                                                  sslCert=self.sslCert, sslKey=self.sslKey, sslCertDir=self.sslCertDir,
+                                                  verifyHost=self._verifyHost, tlsv1="HPC_HPC" in readpar('catchall'),
+                                                  compress=self.compress)
+        except HttpClientError, e:
+            if e.status == CURLE_SSL_CONNECT_ERROR or e.status == CURLE_SSL_CERTPROBLEM:
+                tolog("!!WARNING!!1111!! In-process HTTP client failed (%s), will use curl" % (e))
+                self.useHttpClient = False
+                return None
+            tolog("!!WARNING!!1111!! Caught exception from HTTP request: %s" % (e))
+            return [e.status, str(e)]
+        except Exception, e:
+            tolog("!!WARNING!!1111!! Unexpected exception from in-process HTTP client (%s), will use curl" % (e))
+            self.useHttpClient = False
+            return None
+
+        # as curl --silent, a HTTP error is not a transfer error
+        if status != 200:
+            tolog("!!WARNING!!1111!! HTTP status %d from %s" % (status, url))
+        return [0, response]
 
     # GET method
     def get(self, url, data, path):
+        if self.useHttpClient:
+            from HttpClient import encodeFormData
+            headers = {}
+            if 'nJobs' in data:
+                headers['Accept'] = 'application/json'
+            query = encodeFormData(data)
+            if query:
+                url = url + ('&' if '?' in url else '?') + query
+            ret = self.__httpRequest('GET', url, headers=headers, timeout=120)
+            if ret:
+                return ret
+
         # make command
         com = '%s --silent --get' % self.path
         if "HPC_HPC" in readpar('catchall'):
@@ -1987,6 +2057,15 @@ class _Curl:
 
     # POST method
     def post(self, url, data, path):
+        if self.useHttpClient:
+            from HttpClient import encodeFormData
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+            if 'nJobs' in data:
+                headers['Accept'] = 'application/json'
+            ret = self.__httpRequest('POST', url, body=encodeFormData(data), headers=headers, timeout=120)
+            if ret:
+                return ret
+
         # make command
         com = '%s --silent --show-error' % self.path
         if "HPC_HPC" in readpar('catchall'):
@@ -2051,6 +2130,17 @@ class _Curl:
 
     # PUT method
     def put(self, url, data):
+        if self.useHttpClient:
+            from HttpClient import encodeMultipartFiles
+            try:
+                contentType, body = encodeMultipartFiles(data)
+            except IOError, e:
+                tolog("!!WARNING!!1111!! Could not read file to upload: %s" % (e))
+                return [-1, e]
+            ret = self.__httpRequest('POST', url, body=body, headers={'Content-Type': contentType})
+            if ret:
+                return ret
+
         # make command
         com = '%s --silent' % self.path
         if "HPC_HPC" in readpar('catchall'):
@@ -2156,6 +2246,7 @@ def verifyJobState(state):
     return state
 
 # send message to dispatcher
+@timed("toServer")
 def toServer(baseURL, cmd, data, path, experiment):
     """ sends 'data' using command 'cmd' to the dispatcher """
 
@@ -2224,15 +2315,16 @@ def toServer(baseURL, cmd, data, path, experiment):
                 tolog("!!WARNING!!2999!! Dispatcher response: %s" % data)
             else:
                 status = int(data['StatusCode'])
-            if status != 0:
+            if status != 0 and os.path.exists(curl_config):
                 # pilotErrorDiag = getDispatcherErrorDiag(status)
                 tolog("Dumping curl config file: %s" % (curl_config))
                 dumpFile(curl_config, topilotlog=True)
         else:
             tolog("!!WARNING!!2999!! Dispatcher message curl error: %d " % (curlstat))
             tolog("Response = %s" % (response))
-            tolog("Dumping curl.config file: %s" % curl_config)
-            dumpFile(curl_config, topilotlog=True)
+            if os.path.exists(curl_config):
+                tolog("Dumping curl.config file: %s" % curl_config)
+                dumpFile(curl_config, topilotlog=True)
             return curlstat, None, None
         if status == 0:
             return status, data, response
@@ -2511,27 +2603,15 @@ def grep(patterns, file_name):
     #   CaloTrkMuIdAlg2.sysExecute()             ERROR St9bad_alloc
     #   AthAlgSeq.sysExecute()                   FATAL  Standard std::exception is caught
 
-    matched_lines = []
-    p = []
-    for pattern in patterns:
-        p.append(re.compile(pattern))
+    # the patterns are combined into one, so the file is read once in large chunks
+    # and only the matching lines are checked against each pattern
+    from LogScanner import grepFile
 
+    matched_lines = []
     try:
-        f = open(file_name, "r")
+        matched_lines = grepFile(patterns, file_name)
     except IOError, e:
         tolog("!!WARNING!!2999!! %s" % e)
-    else:
-        while True:
-            # get the next line in the file
-            line = f.readline()
-            if not line:
-                break
-
-            # can the search pattern be found
-            for cp in p:
-                if re.search(cp, line):
-                    matched_lines.append(line)
-        f.close()
     return matched_lines
 
 def getJobReport(filename):
@@ -2539,35 +2619,25 @@ def getJobReport(filename):
 
     report = ""
     if os.path.exists(filename):
-        pattern = re.compile("Job Report produced by")
-        try:
-            f = open(filename, "r")
-        except IOError, e:
-            tolog("!!WARNING!!1299!! %s" % e)
-        else:
+        # the positions of the job report titles are found by the log scanner (only the bytes not scanned yet are read)
+        from LogScanner import scanFile
+        scanner = scanFile(filename)
+        if scanner:
             matched_lines = []
-            status = True
-            first_report = True
-            while status:
-                # get the next line in the file
-                line = f.readline()
-                if not line:
-                    break
-
-                # find the start position of the job report and grab all remaining lines
-                if re.search(pattern, line) and first_report:
-                    # the job report is repeated, only grab it the second time it appears
-                    first_report = False
-                elif re.search(pattern, line) and not first_report:
-                    # save the job report title line
-                    line = line.replace("=====", "-")
-                    matched_lines.append(line)
-                    while True:
-                        line = f.readline()
-                        if not line:
-                            status = False
-                            break
-                        matched_lines.append(line)
+            offsets = scanner.getOffsets("job_report")
+            # the job report is repeated, only grab it the second time it appears
+            if len(offsets) > 1:
+                try:
+                    f = open(filename, "r")
+                except IOError, e:
+                    tolog("!!WARNING!!1299!! %s" % e)
+                else:
+                    # grab the report title line and all remaining lines
+                    f.seek(offsets[1])
+                    matched_lines = f.readlines()
+                    f.close()
+                    if matched_lines:
+                        matched_lines[0] = matched_lines[0].replace("=====", "-")
 
             # grab the last couple of lines in case the trf failed before the job report was printed
             if len(matched_lines) == 0:
@@ -2577,7 +2647,6 @@ def getJobReport(filename):
                 report = report + tail(filename, N)
             else:
                 report = "".join(matched_lines)
-            f.close()
     else:
         tolog("!!WARNING!!1299!! File %s does not exist" % (filename))
 
@@ -3994,6 +4063,13 @@ def postJobTask(job, thisSite, thisNode, experiment, jr=False, ra=0, stdout_tail
     ra = recovery attempt
     """
 
+    # collect the pilot profile of the job (added to the job metrics and the log)
+    import Instrumentation
+    profile = Instrumentation.dump(job.workdir)
+    if profile:
+        Instrumentation.log(profile, tolog)
+        job.profileSummary = Instrumentation.getSummary(profile)
+
     # create and instantiate the job log object
     from JobLog import JobLog
     joblog = JobLog()
@@ -4186,6 +4262,9 @@ def cleanup(wd, initdir, wrflag, rmwkdir):
     """ cleanup function """
 
     tolog("Overall cleanup function is called")
+    from QueuedataCache import queuedataCache, agisConfigCache
+    tolog("Queuedata cache: %s" % (queuedataCache.getStatistics()))
+    tolog("AGIS config cache: %s" % (agisConfigCache.getStatistics()))
     # collect any zombie processes
     wd.collectZombieJob(tn=10)
     tolog("Collected zombie processes")
@@ -4291,12 +4370,14 @@ def cleanup(wd, initdir, wrflag, rmwkdir):
     if wrflag:
         tolog("Done, returning %d to wrapper" % (ec))
         # flush buffers
+        flushLog()
         sys.stdout.flush()
         sys.stderr.flush()
         return shellExitCode(ec)
     else:
         tolog("Done, using system exit to quit")
         # flush buffers
+        flushLog()
         sys.stdout.flush()
         sys.stderr.flush()
         os._exit(0) # need to call this to clean up the socket, thread etc resources
@@ -4366,6 +4447,7 @@ def sig2exc(sig, frm):
     ec = error.ERR_KILLSIGNAL
     # send to stderr
     print >> sys.stderr, errorText
+    flushLog()
 
     # here add the kill function to kill all the real jobs processes
     for k in env['jobDic'].keys():
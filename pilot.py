@@ -1959,6 +1959,7 @@ def setUpdateFrequencies():
     pUtil.tolog("...Processes: %d s" % (env['update_freq_proc']))
     pUtil.tolog(".......Space: %d s" % (env['update_freq_space']))
     pUtil.tolog("......Server: %d s" % (env['update_freq_server']))
+    pUtil.tolog(".....Looping: %d s" % (env['update_freq_looping']))
 
 def getProdSourceLabel():
     """ determine the job type """
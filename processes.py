@@ -1,44 +1,70 @@
-import commands
 import os
 import signal
 import time
 import re
 import pUtil
 from subprocess import Popen, PIPE
+from ProcessTree import ProcessTree
+from CommandExecutor import getstatusoutput, getoutput
 
-def findProcessesInGroup(cpids, pid):
-    """ recursively search for the children processes belonging to pid and return their pids
+def findProcessesInGroup(cpids, pid, tree=None):
+    """ search for the children processes belonging to pid and return their pids
     here pid is the parent pid for all the children to be found
     cpids is a list that has to be initialized before calling this function and it contains
     the pids of the children AND the parent as well """
 
+    if ProcessTree.isAvailable():
+        # one pass over /proc instead of one ps call per process in the tree
+        if not tree:
+            tree = ProcessTree()
+        cpids += tree.getDescendants(pid)
+    else:
+        findProcessesInGroupPs(cpids, pid)
+
+def findProcessesInGroupPs(cpids, pid):
+    """ recursively search for the children processes belonging to pid using ps (when /proc is not available) """
+
     cpids.append(pid)
-    psout = commands.getoutput("ps -eo pid,ppid -m | grep %d" % pid)
+    psout = getoutput("ps -eo pid,ppid -m | grep %d" % pid, timeout=60)
     lines = psout.split("\n")
     if lines != ['']:
         for i in range(0, len(lines)):
             thispid = int(lines[i].split()[0])
             thisppid = int(lines[i].split()[1])
             if thisppid == pid:
-                findProcessesInGroup(cpids, thispid)
+                findProcessesInGroupPs(cpids, thispid)
 
-def isZombie(pid):
+def isZombie(pid, tree=None):
     """ Return True if pid is a zombie process """
 
+    if ProcessTree.isAvailable():
+        if not tree:
+            tree = ProcessTree()
+        return tree.isZombie(pid)
+
     zombie = False
 
-    out = commands.getoutput("ps aux | grep %d" % (pid))
+    out = getoutput("ps aux | grep %d" % (pid), timeout=60)
     if "<defunct>" in out:
         zombie = True
 
     return zombie
 
-def getProcessCommands(euid, pids):
+def getProcessCommands(euid, pids, tree=None):
     """ return a list of process commands corresponding to a pid list for user euid """
 
+    if ProcessTree.isAvailable():
+        if not tree:
+            tree = ProcessTree()
+        processCommands = ["%8s %5s %9s %6s %s" % ("PID", "STAT", "TIME", "RSS", "COMMAND")]
+        for pid in pids:
+            if tree.exists(pid) and tree.getUid(pid) == euid:
+                processCommands.append("%8d %5s %9.2f %6d %s" % (pid, tree.getState(pid), tree.getCPUTime(pid), tree.getRSS(pid), tree.getCommand(pid)))
+        return processCommands
+
     _cmd = 'ps u -u %d' % (euid)
     processCommands = []
-    ec, rs = commands.getstatusoutput(_cmd)
+    ec, rs = getstatusoutput(_cmd, timeout=60)
     if ec != 0:
         pUtil.tolog("Command failed: %s" % (rs))
     else:
@@ -66,15 +92,13 @@ def getProcessCommands(euid, pids):
 
 
 def printProcessTree():
-    import subprocess
-    pl = subprocess.Popen(['ps', '--forest', '-ef'], stdout=subprocess.PIPE).communicate()[0]
-    pUtil.tolog(pl)
+    pUtil.tolog(getoutput(['ps', '--forest', '-ef'], timeout=60))
 
-def dumpStackTrace(pid):
+def dumpStackTrace(pid, tree=None):
     """ run the stack trace command """
 
     # make sure that the process is not in a zombie state
-    if not isZombie(pid):
+    if not isZombie(pid, tree=tree):
         pUtil.tolog("Running stack trace command on pid=%d:" % (pid))
         cmd = "pstack %d" % (pid)
         timeout = 60
@@ -118,8 +142,11 @@ def killProcesses(pid, pgrp):
 
     if not status:
         # firstly find all the children process IDs to be killed
+        tree = None
+        if ProcessTree.isAvailable():
+            tree = ProcessTree()
         children = []
-        findProcessesInGroup(children, pid)
+        findProcessesInGroup(children, pid, tree=tree)
 
         # reverse the process order so that the athena process is killed first (otherwise the stdout will be truncated)
         children.reverse()
@@ -127,7 +154,7 @@ def killProcesses(pid, pgrp):
 
         # find which commands are still running
         try:
-            cmds = getProcessCommands(os.geteuid(), children)
+            cmds = getProcessCommands(os.geteuid(), children, tree=tree)
         except Exception, e:
             pUtil.tolog("getProcessCommands() threw an exception: %s" % str(e))
         else:
@@ -141,7 +168,7 @@ def killProcesses(pid, pgrp):
                 # loop over all child processes
                 for i in children:
                     # dump the stack trace before killing it
-                    dumpStackTrace(i)
+                    dumpStackTrace(i, tree=tree)
 
                     # kill the process gracefully
                     try:
@@ -182,6 +209,27 @@ def checkProcesses(pid):
         pUtil.tolog("Number of running processes: %d" % (n))
     return n
 
+def getUserProcesses():
+    """ Return a list of (pid, ppid, args) for the processes of the current user, args being the command without arguments """
+
+    processes = []
+    if ProcessTree.isAvailable():
+        tree = ProcessTree()
+        euid = os.geteuid()
+        for pid in tree.getPids():
+            if tree.getUid(pid) == euid:
+                args = tree.getCommand(pid).split(" ")[0]
+                processes.append((pid, tree.getParent(pid), args))
+    else:
+        cmd = "ps -o pid,ppid,args -u %s" % (getoutput("whoami", timeout=60))
+        pattern = re.compile('(\d+)\s+(\d+)\s+(\S+)')
+        for line in getoutput(cmd, timeout=60).split('\n'):
+            ids = pattern.search(line)
+            if ids:
+                processes.append((int(ids.group(1)), int(ids.group(2)), ids.group(3)))
+
+    return processes
+
 def killOrphans():
     """ Find and kill all orphan processes belonging to current pilot user """
 
@@ -190,34 +238,24 @@ def killOrphans():
         return
 
     pUtil.tolog("Searching for orphan processes")
-    cmd = "ps -o pid,ppid,args -u %s" % (commands.getoutput("whoami"))
-
-    processes = commands.getoutput(cmd)
-    pattern = re.compile('(\d+)\s+(\d+)\s+(\S+)')
-
     count = 0
-    for line in processes.split('\n'):
-        ids = pattern.search(line)
-        if ids:
-            pid = ids.group(1)
-            ppid = ids.group(2)
-            args = ids.group(3)
-            if 'cvmfs2' in args:
-                pUtil.tolog("Ignoring possible orphan process running cvmfs2: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
-            elif 'pilots_starter.py' in args:
-                pUtil.tolog("Ignoring Pilot Launcher: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
-            elif ppid == '1':
-                count += 1
-                pUtil.tolog("Found orphan process: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
-                if args.endswith('bash'):
-                    pUtil.tolog("Will not kill bash process")
+    for pid, ppid, args in getUserProcesses():
+        if 'cvmfs2' in args:
+            pUtil.tolog("Ignoring possible orphan process running cvmfs2: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
+        elif 'pilots_starter.py' in args:
+            pUtil.tolog("Ignoring Pilot Launcher: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
+        elif ppid == 1:
+            count += 1
+            pUtil.tolog("Found orphan process: pid=%s, ppid=%s, args='%s'" % (pid, ppid, args))
+            if args.endswith('bash'):
+                pUtil.tolog("Will not kill bash process")
+            else:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError, e:
+                    pUtil.tolog("!!WARNING!!2999!! %s" % (e))
                 else:
-                    cmd = 'kill -9 %s' % (pid)
-                    ec, rs = commands.getstatusoutput(cmd)
-                    if ec != 0:
-                        pUtil.tolog("!!WARNING!!2999!! %s" % (rs))
-                    else:
-                        pUtil.tolog("Killed orphaned process %s (%s)" % (pid, args))
+                    pUtil.tolog("Killed orphaned process %s (%s)" % (pid, args))
 
     if count == 0:
         pUtil.tolog("Did not find any orphan processes")
@@ -235,7 +273,7 @@ def getMaxMemoryUsageFromCGroups():
     if os.path.exists(path):
         cmd = "grep memory %s" % (path)
         pUtil.tolog("Executing command: %s" % (cmd))
-        out = commands.getoutput(cmd)
+        out = getoutput(cmd, timeout=60)
         if out == "":
             pUtil.tolog("(Command did not return anything)")
         else:
@@ -270,7 +308,7 @@ def getMaxMemoryUsageFromCGroups():
 def getCGROUPSBasePath():
     """ Return the base path for CGROUPS """
 
-    return commands.getoutput("grep \'^cgroup\' /proc/mounts|grep memory| awk \'{print $2}\'")
+    return getoutput("grep \'^cgroup\' /proc/mounts|grep memory| awk \'{print $2}\'", timeout=60)
 
 def isCGROUPSSite():
     """ Return True if site is a CGROUPS site """
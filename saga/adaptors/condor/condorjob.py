@@ -15,6 +15,7 @@ import saga.adaptors.cpi.job
 
 from saga.job.constants import *
 from transferdirectives import TransferDirectives
+from saga.utils.job import JobStateCache
 
 import re
 import os
@@ -211,7 +212,18 @@ _PTY_TIMEOUT = 2.0
 #
 _ADAPTOR_NAME          = "saga.adaptor.condorjob"
 _ADAPTOR_SCHEMAS       = ["condor", "condor+ssh", "condor+gsissh"]
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.condorjob',
+    'name'             : 'state_poll_interval',
+    'type'             : float,
+    'default'          : 1.0,
+    'documentation'    : '''Number of seconds the job states listed by a single
+                          condor_q call for all jobs are reused, e.g. while waiting
+                          for many jobs. Set it to 0 to query each job separately.''',
+    'env_variable'     : None
+    },
+]
 
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -298,6 +310,8 @@ class Adaptor (saga.adaptors.base.Base):
         self.id_re = re.compile('^\[(.*)\]-\[(.*?)\]$')
         self.opts  = self.get_config (_ADAPTOR_NAME)
 
+        self.state_poll_interval = self.opts['state_poll_interval'].get_value()
+
     # ----------------------------------------------------------------
     #
     def sanity_check(self):
@@ -384,6 +398,11 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
       # self.shell.set_initialize_hook(self.initialize)
       # self.shell.set_finalize_hook(self.finalize)
 
+        # the condor_q states of all jobs, shared by the job objects
+        self._state_cache = JobStateCache(self._list_job_states,
+                                          self._adaptor.state_poll_interval,
+                                          self._logger)
+
         self.initialize()
 
         return self.get_api ()
@@ -527,6 +546,9 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
                 'stderr':       None
             }
 
+            # the new job is not in the cached listing yet
+            self._state_cache.invalidate()
+
             # remove submit file(s)
             # XXX: maybe leave them in case of debugging?
             if self.shell.url.scheme == 'ssh':
@@ -537,6 +559,28 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
 
             return job_id
 
+    # ----------------------------------------------------------------
+    #
+    def _list_job_states(self):
+        """ list the JobStatus of all jobs in the queue, by condor job id
+        """
+        ret, out, _ = self.shell.run_sync("%s -format '%%d.' ClusterId -format '%%d ' ProcId -format '%%d\\n' JobStatus" \
+            % self._commands['condor_q']['path'])
+
+        if ret != 0:
+            raise saga.NoSuccess("condor_q failed (%s): %s" % (ret, out))
+
+        # output looks like this:
+        # 112059.0 2
+        # 112061.0 1
+        states = dict()
+        for line in out.split('\n'):
+            fields = line.split()
+            if len(fields) == 2:
+                states[fields[0]] = fields[1]
+
+        return states
+
     # ----------------------------------------------------------------
     #
     def _retrieve_job(self, job_id):
@@ -673,6 +717,13 @@ class CondorJobService (saga.adaptors.cpi.job.Service):
 
         rm, pid = self._adaptor.parse_id(job_id)
 
+        # a job in the listing shared by all jobs of the service which has not
+        # completed (or been removed) doesn't need a query of its own
+        condor_state = self._state_cache.get(pid)
+        if condor_state is not None and condor_state not in ['3', '4']:
+            curr_info['state'] = _condor_to_saga_jobstate(condor_state)
+            return curr_info
+
         # run the Condor 'condor_q' command to get some infos about our job
         ret, out, _ = self.shell.run_sync("unset GREP_OPTIONS; %s -long %s | \
             grep -E '(JobStatus)|(ExitStatus)|(CompletionDate)'" \
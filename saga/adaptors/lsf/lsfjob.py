@@ -17,6 +17,7 @@ import saga.adaptors.base
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
+from saga.utils.job import JobStateCache
 
 import re
 import os 
@@ -29,7 +30,7 @@ SYNC_CALL = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
 SYNC_WAIT_UPDATE_INTERVAL = 1  # seconds
-MONITOR_UPDATE_INTERVAL = 3  # seconds
+MONITOR_UPDATE_INTERVAL = 3  # seconds, without the state cache
 
 
 # --------------------------------------------------------------------
@@ -56,8 +57,8 @@ class _job_state_monitor(threading.Thread):
     def run(self):
         while self.stopped() is False:
             try:
-                # do bulk updates here! we don't want to pull information
-                # job by job. that would be too inefficient!
+                # the jobs are updated from a single bjobs call listing
+                # all jobs, see _job_get_info()
                 jobs = self.js.jobs
                 job_keys = jobs.keys()
 
@@ -82,7 +83,10 @@ class _job_state_monitor(threading.Thread):
                             # update job info
                             self.js.jobs[job] = job_info
 
-                time.sleep(MONITOR_UPDATE_INTERVAL)
+                if self.js._adaptor.state_poll_interval > 0:
+                    time.sleep(self.js._adaptor.state_poll_interval)
+                else:
+                    time.sleep(MONITOR_UPDATE_INTERVAL)
             except Exception as e:
                 self.logger.warning("Exception caught in job monitoring thread: %s" % e)
 
@@ -229,7 +233,19 @@ _PTY_TIMEOUT = 2.0
 #
 _ADAPTOR_NAME          = "saga.adaptor.lsfjob"
 _ADAPTOR_SCHEMAS       = ["lsf", "lsf+ssh", "lsf+gsissh"]
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.lsfjob',
+    'name'             : 'state_poll_interval',
+    'type'             : float,
+    'default'          : 3.0,
+    'documentation'    : '''Number of seconds between two updates of the job states
+                          by the monitoring thread, which lists all jobs of the
+                          user with a single bjobs call. Set it to 0 to query
+                          each job separately, every 3 seconds.''',
+    'env_variable'     : None
+    },
+]
 
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -315,6 +331,8 @@ class Adaptor (saga.adaptors.base.Base):
         self.id_re = re.compile('^\[(.*)\]-\[(.*?)\]$')
         self.opts  = self.get_config (_ADAPTOR_NAME)
 
+        self.state_poll_interval = self.opts['state_poll_interval'].get_value()
+
     # ----------------------------------------------------------------
     #
     def sanity_check(self):
@@ -392,6 +410,11 @@ class LSFJobService (saga.adaptors.cpi.job.Service):
         self.shell   = None
         self.jobs    = dict()
 
+        # the bjobs lines of all jobs, used by the monitoring thread
+        self._state_cache = JobStateCache(self._list_job_states,
+                                          self._adaptor.state_poll_interval,
+                                          self._logger)
+
         # the monitoring thread - one per service instance
         self.mt = _job_state_monitor(job_service=self)
         self.mt.start()
@@ -564,6 +587,9 @@ class LSFJobService (saga.adaptors.cpi.job.Service):
             self.jobs[job_obj]['job_id'] = job_id
             self.jobs[job_obj]['submitted'] = job_id
 
+            # the new job is not in the cached listing yet
+            self._state_cache.invalidate()
+
             # set status to 'pending' and manually trigger callback
             #self.jobs[job_obj]['state'] = saga.job.PENDING
             #job_obj._api()._attributes_i_set('state', self.jobs[job_obj]['state'], job_obj._api()._UP, True)
@@ -571,6 +597,26 @@ class LSFJobService (saga.adaptors.cpi.job.Service):
             # return the job id
             return job_id
 
+    # ----------------------------------------------------------------
+    #
+    def _list_job_states(self):
+        """ list the bjobs lines of all jobs of the user (including the
+            recently finished ones), by LSF job id
+        """
+        ret, out, _ = self.shell.run_sync("%s -noheader -a" % self._commands['bjobs']['path'])
+
+        if ret != 0 and "job found" not in out:
+            # "No job found" is not an error
+            raise saga.NoSuccess("bjobs failed (%s): %s" % (ret, out))
+
+        states = dict()
+        for line in out.split('\n'):
+            fields = line.split()
+            if len(fields) > 5 and fields[0].isdigit():
+                states[fields[0]] = line
+
+        return states
+
     # ----------------------------------------------------------------
     #
     def _retrieve_job(self, job_id):
@@ -650,8 +696,14 @@ class LSFJobService (saga.adaptors.cpi.job.Service):
         # 901545  oweidne DONE  regular    yslogin5-ib ys3833-ib   *FILENAME  Nov 11 12:06 
         # 
         # If we add the -nodeader flag, the first row is ommited 
+        #
+        # the line is taken from the listing of all jobs when the job is in it
 
-        ret, out, _ = self.shell.run_sync("%s -noheader %s" % (self._commands['bjobs']['path'], pid))
+        out = self._state_cache.get(pid)
+        if out is not None:
+            ret = 0
+        else:
+            ret, out, _ = self.shell.run_sync("%s -noheader %s" % (self._commands['bjobs']['path'], pid))
 
         if ret != 0:
             if ("Illegal job ID" in out):
@@ -15,6 +15,7 @@ import saga.adaptors.base
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
+from saga.utils.job import JobStateCache
 
 import re
 import os 
@@ -27,7 +28,7 @@ SYNC_CALL  = saga.adaptors.cpi.decorators.SYNC_CALL
 ASYNC_CALL = saga.adaptors.cpi.decorators.ASYNC_CALL
 
 SYNC_WAIT_UPDATE_INTERVAL =  1  # seconds
-MONITOR_UPDATE_INTERVAL   = 60  # seconds
+MONITOR_UPDATE_INTERVAL   = 60  # seconds, without the state cache
 
 
 # --------------------------------------------------------------------
@@ -56,8 +57,9 @@ class _job_state_monitor(threading.Thread):
         while self.stopped() is False:
 
             try:
-                # FIXME: do bulk updates here! we don't want to pull information
-                # job by job. that would be too inefficient!
+                # one qstat call lists the states of all jobs, only the jobs
+                # whose state changed (or which are not listed anymore) are
+                # queried on their own for the details
                 jobs = self.js.jobs
 
                 for job_id in jobs.keys() :
@@ -69,6 +71,12 @@ class _job_state_monitor(threading.Thread):
                     # either done, failed or canceled
                     if  job_info['state'] not in [saga.job.DONE, saga.job.FAILED, saga.job.CANCELED] :
 
+                        rm, pid   = self.js._adaptor.parse_id(job_id)
+                        pbs_state = self.js._state_cache.get(pid)
+                        if  pbs_state is not None and \
+                            _pbs_to_saga_jobstate(pbs_state) == job_info['state'] :
+                            continue
+
                         new_job_info = self.js._job_get_info(job_id)
                         self.logger.info ("Job monitoring thread updating Job %s (state: %s)" \
                                        % (job_id, new_job_info['state']))
@@ -87,7 +95,10 @@ class _job_state_monitor(threading.Thread):
                 self.logger.warning("Exception caught in job monitoring thread: %s" % e)
 
             finally :
-                time.sleep (MONITOR_UPDATE_INTERVAL)
+                if  self.js._adaptor.state_poll_interval > 0 :
+                    time.sleep (self.js._adaptor.state_poll_interval)
+                else :
+                    time.sleep (MONITOR_UPDATE_INTERVAL)
 
 
 # --------------------------------------------------------------------
@@ -299,7 +310,19 @@ _PTY_TIMEOUT = 2.0
 #
 _ADAPTOR_NAME          = "saga.adaptor.pbsjob"
 _ADAPTOR_SCHEMAS       = ["pbs", "pbs+ssh", "pbs+gsissh"]
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.pbsjob',
+    'name'             : 'state_poll_interval',
+    'type'             : float,
+    'default'          : 60.0,
+    'documentation'    : '''Number of seconds between two updates of the job states
+                          by the monitoring thread, which lists the states of all
+                          jobs of the user with a single qstat call. Set it to 0
+                          to query each job separately, every 60 seconds.''',
+    'env_variable'     : None
+    },
+]
 
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -387,6 +410,8 @@ class Adaptor (saga.adaptors.base.Base):
         self.id_re = re.compile('^\[(.*)\]-\[(.*?)\]$')
         self.opts  = self.get_config (_ADAPTOR_NAME)
 
+        self.state_poll_interval = self.opts['state_poll_interval'].get_value()
+
     # ----------------------------------------------------------------
     #
     def sanity_check(self):
@@ -465,6 +490,11 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
         self.shell   = None
         self.jobs    = dict()
 
+        # the qstat states of all jobs, used by the monitoring thread
+        self._state_cache = JobStateCache(self._list_job_states,
+                                          self._adaptor.state_poll_interval,
+                                          self._logger)
+
         # the monitoring thread - one per service instance
         self.mt = _job_state_monitor(job_service=self)
         self.mt.start()
@@ -682,6 +712,9 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
             self._logger.info ("assign job id  %s / %s / %s to watch list (%s)" \
                             % (None, job_id, job_obj, self.jobs.keys()))
 
+            # the new job is not in the cached listing yet
+            self._state_cache.invalidate()
+
             # set status to 'pending' and manually trigger callback
             job_obj._attributes_i_set('state', state, job_obj._UP, True)
 
@@ -689,6 +722,31 @@ class PBSJobService (saga.adaptors.cpi.job.Service):
             return job_id
 
 
+    # ----------------------------------------------------------------
+    #
+    def _list_job_states(self):
+        """ list the one-letter pbs states of the jobs of the user, by pbs job
+            id
+        """
+        # only the jobs of the user, a plain qstat lists the jobs of all users
+        ret, out, _ = self.shell.run_sync("%s -u `whoami`" %
+                                          self._commands['qstat']['path'])
+
+        if ret != 0:
+            raise saga.NoSuccess("qstat failed (%s): %s" % (ret, out))
+
+        # output looks like this (after the server name and three header
+        # lines), the state is the next to last column:
+        # 112059.svc.uc.fu  oweidner batch testjob 1234 1 1 -- 00:10 Q --
+        # 112061.svc.uc.fu  oweidner batch testjob 1235 1 1 -- 00:10 R 00:01
+        states = dict()
+        for line in out.split("\n"):
+            fields = line.split()
+            if len(fields) >= 11 and fields[0][0].isdigit():
+                states[fields[0].split('.')[0]] = fields[-2]
+
+        return states
+
     # ----------------------------------------------------------------
     #
     def _retrieve_job(self, job_id):
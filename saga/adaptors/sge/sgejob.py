@@ -15,6 +15,7 @@ import saga.adaptors.base
 import saga.adaptors.cpi.job
 
 from saga.job.constants import *
+from saga.utils.job import JobStateCache
 
 import os
 import re
@@ -135,6 +136,16 @@ _ADAPTOR_OPTIONS       = [
                             of days to consider a temporary file older enough to be deleted.''',
     'env_variable'     : None
     },
+    {
+    'category'         : 'saga.adaptor.sgejob',
+    'name'             : 'state_poll_interval',
+    'type'             : float,
+    'default'          : 1.0,
+    'documentation'    : '''Number of seconds the job states listed by a single
+                          qstat call for all jobs are reused, e.g. while waiting
+                          for many jobs. Set it to 0 to query each job separately.''',
+    'env_variable'     : None
+    },
 ]
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -222,6 +233,7 @@ class Adaptor (saga.adaptors.base.Base):
 
         self.purge_on_start = self.opts['purge_on_start'].get_value()
         self.purge_older_than = self.opts['purge_older_than'].get_value()
+        self.state_poll_interval = self.opts['state_poll_interval'].get_value()
 
     # ----------------------------------------------------------------
     #
@@ -318,6 +330,11 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
       # self.shell.set_initialize_hook(self.initialize)
       # self.shell.set_finalize_hook(self.finalize)
 
+        # the qstat lines of all jobs, shared by the job objects
+        self._state_cache = JobStateCache(self._list_job_states,
+                                          self._adaptor.state_poll_interval,
+                                          self._logger)
+
         self.initialize()
 
         return self.get_api ()
@@ -834,8 +851,33 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
             'gone':         False
         }
 
+        # the new job is not in the cached listing yet
+        self._state_cache.invalidate()
+
         return job_id
 
+    # ----------------------------------------------------------------
+    #
+    def _list_job_states(self):
+        """ list the state, start time and queue columns of the qstat output
+            for the jobs of the user, by SGE job id
+        """
+
+        ret, out, _ = self.shell.run_sync(
+                        "%s -u `whoami` | tail -n+3 | awk '{{print $1,$5,$6,$7,$8}}'" % (
+                            self._commands['qstat']['path']))
+        if ret != 0:
+            raise saga.NoSuccess("qstat failed (%s): %s" % (ret, out))
+
+        states = dict()
+        for line in out.strip().split('\n'):
+            fields = line.split(' ', 1)
+            if len(fields) == 2:
+                # the first line of an array job
+                states.setdefault(fields[0], fields[1].strip())
+
+        return states
+
     # ----------------------------------------------------------------
     #
     def _retrieve_job(self, job_id):
@@ -846,10 +888,15 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
 
         rm, pid = self._adaptor.parse_id(job_id)
 
-        # check the state of the job
-        ret, out, _ = self.shell.run_sync(
-                        "%s | tail -n+3 | awk '($1==%s) {{print $5,$6,$7,$8}}'" % (
-                            self._commands['qstat']['path'], pid))
+        # check the state of the job, in the qstat listing shared by all jobs
+        # of the service first
+        out = self._state_cache.get(pid)
+        if out is not None:
+            ret = 0
+        else:
+            ret, out, _ = self.shell.run_sync(
+                            "%s | tail -n+3 | awk '($1==%s) {{print $5,$6,$7,$8}}'" % (
+                                self._commands['qstat']['path'], pid))
 
         out = out.strip()
 
@@ -885,6 +932,18 @@ class SGEJobService (saga.adaptors.cpi.job.Service):
                 # TODO remove the job from the queue ?
                 # self.__shell_run("%s %s" % (self._commands['qdel']['path'], pid))
 
+            prev_info = self.jobs.get(job_id)
+            if job_info is None and prev_info and prev_info.get('create_time'):
+                # the submission time and host don't change, no need for qstat -j
+                job_info = dict(
+                    state=self.__sge_to_saga_jobstate(state),
+                    exec_hosts=exec_host or prev_info.get('exec_hosts'),
+                    returncode=None,
+                    create_time=prev_info['create_time'],
+                    start_time=start_time,
+                    end_time=None,
+                    gone=False)
+
             if job_info is None: # use qstat -j pid
                 qres = self.__kvcmd_results('qstat', "-j %s | grep -E 'submission_time|sge_o_host'" % pid,
                                             key_suffix=":")
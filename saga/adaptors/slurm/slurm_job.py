@@ -15,6 +15,8 @@ import saga.url as surl
 import saga.adaptors.base
 import saga.adaptors.cpi.job
 
+from saga.utils.job import JobStateCache
+
 import re
 import os
 import time
@@ -41,7 +43,19 @@ _PTY_TIMEOUT = 2.0
 #
 _ADAPTOR_NAME          = "saga.adaptor.slurm_job"
 _ADAPTOR_SCHEMAS       = ["slurm", "slurm+ssh", "slurm+gsissh"]
-_ADAPTOR_OPTIONS       = []
+_ADAPTOR_OPTIONS       = [
+    {
+    'category'         : 'saga.adaptor.slurm_job',
+    'name'             : 'state_poll_interval',
+    'type'             : float,
+    'default'          : 1.0,
+    'documentation'    : '''Number of seconds the job states listed by a single
+                          squeue call for all jobs of the user are reused, e.g.
+                          while waiting for many jobs. Set it to 0 to query
+                          each job separately.''',
+    'env_variable'     : None
+    },
+]
 
 # --------------------------------------------------------------------
 # the adaptor capabilities & supported attributes
@@ -219,6 +233,9 @@ class Adaptor (saga.adaptors.base.Base):
         saga.adaptors.base.Base.__init__ (self, _ADAPTOR_INFO, _ADAPTOR_OPTIONS)
 
         self.id_re = re.compile ('^\[(.*)\]-\[(.*?)\]$')
+        self.opts  = self.get_config (_ADAPTOR_NAME)
+
+        self.state_poll_interval = self.opts['state_poll_interval'].get_value()
 
     # ----------------------------------------------------------------
     #
@@ -287,6 +304,11 @@ class SLURMJobService (saga.adaptors.cpi.job.Service) :
         self.jobs = {}
         self._open ()
 
+        # the states of all jobs of the user, shared by the job objects
+        self._state_cache = JobStateCache (self._list_job_states,
+                                           self._adaptor.state_poll_interval,
+                                           self._logger)
+
         return self.get_api ()
 
 
@@ -616,8 +638,34 @@ class SLURMJobService (saga.adaptors.cpi.job.Service) :
                 'gone': False
             }
 
+        # the new job is not in the cached listing yet
+        self._state_cache.invalidate ()
+
         return self.job_id
 
+    # ----------------------------------------------------------------
+    #
+    def _list_job_states (self) :
+        """ list the native ids and slurm states of all jobs of the user """
+
+        # ashleyz@login1:~$ squeue -h -t all -o "%i %T" -u ashleyz
+        # 255042 RUNNING
+        # 255035 PENDING
+        # 255028 COMPLETED
+
+        ret, out, _ = self.shell.run_sync('squeue -h -t all -o "%%i %%T" -u %s'
+                                          % self.rm.detected_username)
+        if ret != 0:
+            raise saga.NoSuccess("squeue failed (%s): %s" % (ret, out))
+
+        states = {}
+        for line in out.strip().split("\n"):
+            fields = line.split()
+            if len(fields) == 2:
+                states[fields[0]] = fields[1]
+
+        return states
+
     # ----------------  
     # FROM STAMPEDE'S SQUEUE MAN PAGE
     # 
@@ -996,6 +1044,11 @@ class SLURMJob (saga.adaptors.cpi.job.Job):
 
         rm, pid = self._adaptor.parse_id (job_id)
 
+        # jobs still known to squeue are in the listing shared by the service
+        slurm_state = self.js._state_cache.get (pid)
+        if slurm_state:
+            return self.js._slurm_to_saga_jobstate(slurm_state)
+
         try:
             ret, out, _ = self.js.shell.run_sync('scontrol show job %s' % pid)
             match       = self.js.scontrol_jobstate_re.search(out)
@@ -8,9 +8,11 @@ __license__   = "MIT"
 
 import re
 import sys
+import time
 import pprint
 import string
 import inspect
+import threading
 
 import radical.utils         as ru
 import radical.utils.config  as ruc
@@ -86,7 +88,9 @@ class Engine(ruc.Configurable):
         loading and management, and which binds adaptor instances to
         API object instances.   The Engine singleton is implicitly
         instantiated as soon as SAGA is imported into Python.  It
-        will, on creation, load all available adaptors.  Adaptors
+        will load the available adaptors on demand, when their URL
+        schema is first used (the context adaptors are loaded on
+        creation, see saga.engine.registry).  Adaptors
         modules MUST provide an 'Adaptor' class, which will register
         the adaptor in the engine with information like these
         (simplified)::
@@ -170,6 +174,12 @@ class Engine(ruc.Configurable):
         # Engine manages cpis from adaptors
         self._adaptor_registry = {}
 
+        # adaptor modules which have been loaded (successfully or not), with
+        # the time it took -- adaptors are loaded on demand, see
+        # _load_adaptors_for_schema()
+        self._loaded_modules   = {}
+        self._lock             = threading.RLock ()
+
 
         # set the configuration options for this object
         ruc.Configurable.__init__       (self, 'saga')
@@ -181,7 +191,7 @@ class Engine(ruc.Configurable):
         self._logger = rul.getLogger ('saga', 'Engine')
 
 
-        # load adaptors
+        # load the adaptors which are not loaded on demand
         self._load_adaptors ()
 
 
@@ -190,288 +200,363 @@ class Engine(ruc.Configurable):
     #-----------------------------------------------------------------
     # 
     def _load_adaptors (self, inject_registry=None):
-        """ Try to load all adaptors that are registered in 
-            saga.engine.registry.py. This method is called from the
-            constructor.  As Engine is a singleton, this method is
-            called once after the module is first loaded in any python
-            application.
-
-            :param inject_registry: Inject a fake registry. *For unit tests only*.
+        """ Try to load the adaptors that are registered in 
+            saga.engine.registry.py, but not listed in its adaptor_schemas
+            (the other ones are loaded when their URL schema is first used).
+            This method is called from the constructor.  As Engine is
+            a singleton, this method is called once after the module is
+            first loaded in any python application.
+
+            :param inject_registry: Inject a fake registry, whose adaptors are
+                                    all loaded. *For unit tests only*.
         """
 
-        # get the engine config options
-        global_config = ruc.getConfig('saga')
-
-
         # get the list of adaptors to load
-        registry = saga.engine.registry.adaptor_registry
+        registry = [module_name for module_name in saga.engine.registry.adaptor_registry
+                    if  module_name not in saga.engine.registry.adaptor_schemas]
 
 
         # check if some unit test wants to use a special registry.  If
         # so, we reset cpi infos from the earlier singleton creation.
         if inject_registry != None :
             self._adaptor_registry = {}
+            self._loaded_modules   = {}
             registry               = inject_registry
 
 
         # attempt to load all registered modules
         for module_name in registry:
+            self._load_adaptor (module_name)
 
-            self._logger.info ("Loading  adaptor %s"  %  module_name)
 
 
-            # first, import the module
-            adaptor_module = None
-            try :
-                adaptor_module = __import__ (module_name, fromlist=['Adaptor'])
+    #-----------------------------------------------------------------
+    # 
+    def _load_adaptors_for_schema (self, ctype, schema) :
+        """ Load the registered adaptors serving the given URL schema (see
+            saga.engine.registry.adaptor_schemas), in registry order, if that
+            did not happen before.  If none of them implements the given cpi
+            type for that schema, all remaining adaptors are loaded, as
+            adaptor_schemas may not be up to date with the adaptors.
+        """
 
-            except Exception as e:
-                self._logger.warn ("Skipping adaptor %s 1: module loading failed: %s" % (module_name, e))
-                continue # skip to next adaptor
+        schema = schema.lower ()
 
+        for module_name in saga.engine.registry.adaptor_registry :
+            if  schema in saga.engine.registry.adaptor_schemas.get (module_name, []) :
+                self._load_adaptor (module_name)
 
-            # we expect the module to have an 'Adaptor' class
-            # implemented, which, on calling 'register()', returns
-            # a info dict for all implemented adaptor classes.
-            adaptor_instance = None
-            adaptor_info     = None
+        if  not schema in self._adaptor_registry.get (ctype, {}) :
+            self._load_all_adaptors ()
 
-            try: 
-                adaptor_instance = adaptor_module.Adaptor ()
-                adaptor_info     = adaptor_instance.register ()
 
-            except se.SagaException as e:
-                self._logger.warn ("Skipping adaptor %s: loading failed: '%s'" % (module_name, e))
-                continue # skip to next adaptor
 
-            except Exception as e:
-                self._logger.warn ("Skipping adaptor %s: loading failed: '%s'" % (module_name, e))
-                continue # skip to next adaptor
+    #-----------------------------------------------------------------
+    # 
+    def _load_all_adaptors (self) :
+        """ Load all registered adaptors which are not loaded, yet.
+        """
 
+        for module_name in saga.engine.registry.adaptor_registry :
+            self._load_adaptor (module_name)
 
-            # the adaptor must also provide a sanity_check() method, which sould
-            # be used to confirm that the adaptor can function properly in the
-            # current runtime environment (e.g., that all pre-requisites and
-            # system dependencies are met).
-            try: 
-                adaptor_instance.sanity_check ()
 
-            except Exception as e:
-                self._logger.warn ("Skipping adaptor %s: failed self test: %s" % (module_name, e))
-                continue # skip to next adaptor
 
+    #-----------------------------------------------------------------
+    # 
+    def _load_adaptor (self, module_name) :
+        """ Load, check and register an adaptor module, once: the outcome
+            (including a failed import or sanity check) is remembered, and the
+            module is not tried again.
+        """
 
-            # check if we have a valid adaptor_info
-            if adaptor_info is None :
-                self._logger.warning ("Skipping adaptor %s: adaptor meta data are invalid" \
-                                   % module_name)
-                continue  # skip to next adaptor
+        with self._lock :
 
+            if  module_name in self._loaded_modules :
+                return
 
-            if  not 'name'    in adaptor_info or \
-                not 'cpis'    in adaptor_info or \
-                not 'version' in adaptor_info or \
-                not 'schemas' in adaptor_info    :
-                self._logger.warning ("Skipping adaptor %s: adaptor meta data are incomplete" \
-                                   % module_name)
-                continue  # skip to next adaptor
+            start = time.time ()
+            self._register_adaptor (module_name)
+            self._loaded_modules[module_name] = time.time () - start
 
+            self._logger.debug ("Loading  adaptor %s took %.3f s" \
+                              % (module_name, self._loaded_modules[module_name]))
 
-            adaptor_name    = adaptor_info['name']
-            adaptor_version = adaptor_info['version']
-            adaptor_schemas = adaptor_info['schemas']
-            adaptor_enabled = True   # default unless disabled by 'enabled' option or version filer
 
-            # disable adaptors in 'alpha' or 'beta' versions -- unless
-            # the 'load_beta_adaptors' config option is set to True
-            if not self._cfg['load_beta_adaptors'].get_value () :
 
-                if 'alpha' in adaptor_version.lower() or \
-                   'beta'  in adaptor_version.lower()    :
+    #-----------------------------------------------------------------
+    # 
+    def _register_adaptor (self, module_name) :
+        """ Import an adaptor module, instantiate and sanity check its
+            adaptor, and register its cpi classes.
+        """
+
+        # get the engine config options
+        global_config = ruc.getConfig('saga')
+
+        self._logger.info ("Loading  adaptor %s"  %  module_name)
 
-                    self._logger.warn ("Skipping adaptor %s: beta versions are disabled (%s)" \
-                                    % (module_name, adaptor_version))
-                    continue  # skip to next adaptor
 
+        # first, import the module
+        adaptor_module = None
+        try :
+            adaptor_module = __import__ (module_name, fromlist=['Adaptor'])
 
-            # get the 'enabled' option in the adaptor's config
-            # section (saga.cpi.base ensures that the option exists,
-            # if it is initialized correctly in the adaptor class.
-            adaptor_config  = None
-            adaptor_enabled = False
+        except Exception as e:
+            self._logger.warn ("Skipping adaptor %s 1: module loading failed: %s" % (module_name, e))
+            return # skip this adaptor
 
-            try :
-                adaptor_config  = global_config.get_category (adaptor_name)
-                adaptor_enabled = adaptor_config['enabled'].get_value ()
 
-            except se.SagaException as e:
-                self._logger.warn ("Skipping adaptor %s: initialization failed: %s" % (module_name, e))
-                continue # skip to next adaptor
-            except Exception as e:
-                self._logger.warn ("Skipping adaptor %s: initialization failed: %s" % (module_name, e))
-                continue # skip to next adaptor
+        # we expect the module to have an 'Adaptor' class
+        # implemented, which, on calling 'register()', returns
+        # a info dict for all implemented adaptor classes.
+        adaptor_instance = None
+        adaptor_info     = None
 
+        try: 
+            adaptor_instance = adaptor_module.Adaptor ()
+            adaptor_info     = adaptor_instance.register ()
 
-            # only load adaptor if it is not disabled via config files
-            if adaptor_enabled == False :
-                self._logger.info ("Skipping adaptor %s: 'enabled' set to False" \
-                                % (module_name))
-                continue # skip to next adaptor
+        except se.SagaException as e:
+            self._logger.warn ("Skipping adaptor %s: loading failed: '%s'" % (module_name, e))
+            return # skip this adaptor
 
+        except Exception as e:
+            self._logger.warn ("Skipping adaptor %s: loading failed: '%s'" % (module_name, e))
+            return # skip this adaptor
 
-            # check if the adaptor has anything to register
-            if 0 == len (adaptor_info['cpis']) :
-                self._logger.warn ("Skipping adaptor %s: does not register any cpis" \
+
+        # the adaptor must also provide a sanity_check() method, which sould
+        # be used to confirm that the adaptor can function properly in the
+        # current runtime environment (e.g., that all pre-requisites and
+        # system dependencies are met).
+        try: 
+            adaptor_instance.sanity_check ()
+
+        except Exception as e:
+            self._logger.warn ("Skipping adaptor %s: failed self test: %s" % (module_name, e))
+            return # skip this adaptor
+
+
+        # check if we have a valid adaptor_info
+        if adaptor_info is None :
+            self._logger.warning ("Skipping adaptor %s: adaptor meta data are invalid" \
+                               % module_name)
+            return  # skip this adaptor
+
+
+        if  not 'name'    in adaptor_info or \
+            not 'cpis'    in adaptor_info or \
+            not 'version' in adaptor_info or \
+            not 'schemas' in adaptor_info    :
+            self._logger.warning ("Skipping adaptor %s: adaptor meta data are incomplete" \
+                               % module_name)
+            return  # skip this adaptor
+
+
+        adaptor_name    = adaptor_info['name']
+        adaptor_version = adaptor_info['version']
+        adaptor_schemas = adaptor_info['schemas']
+        adaptor_enabled = True   # default unless disabled by 'enabled' option or version filer
+
+        # the engine loads the adaptors listed in registry.adaptor_schemas
+        # only for the schemas listed there: report if they are out of date
+        listed_schemas = saga.engine.registry.adaptor_schemas.get (module_name)
+        if  listed_schemas is not None and \
+            sorted (listed_schemas) != sorted ([s.lower () for s in adaptor_schemas]) :
+            self._logger.warn ("Adaptor %s serves URL schemas %s, but saga.engine.registry lists %s" \
+                             % (module_name, adaptor_schemas, listed_schemas))
+
+        # disable adaptors in 'alpha' or 'beta' versions -- unless
+        # the 'load_beta_adaptors' config option is set to True
+        if not self._cfg['load_beta_adaptors'].get_value () :
+
+            if 'alpha' in adaptor_version.lower() or \
+               'beta'  in adaptor_version.lower()    :
+
+                self._logger.warn ("Skipping adaptor %s: beta versions are disabled (%s)" \
+                                % (module_name, adaptor_version))
+                return  # skip this adaptor
+
+
+        # get the 'enabled' option in the adaptor's config
+        # section (saga.cpi.base ensures that the option exists,
+        # if it is initialized correctly in the adaptor class.
+        adaptor_config  = None
+        adaptor_enabled = False
+
+        try :
+            adaptor_config  = global_config.get_category (adaptor_name)
+            adaptor_enabled = adaptor_config['enabled'].get_value ()
+
+        except se.SagaException as e:
+            self._logger.warn ("Skipping adaptor %s: initialization failed: %s" % (module_name, e))
+            return # skip this adaptor
+        except Exception as e:
+            self._logger.warn ("Skipping adaptor %s: initialization failed: %s" % (module_name, e))
+            return # skip this adaptor
+
+
+        # only load adaptor if it is not disabled via config files
+        if adaptor_enabled == False :
+            self._logger.info ("Skipping adaptor %s: 'enabled' set to False" \
+                            % (module_name))
+            return # skip this adaptor
+
+
+        # check if the adaptor has anything to register
+        if 0 == len (adaptor_info['cpis']) :
+            self._logger.warn ("Skipping adaptor %s: does not register any cpis" \
+                            % (module_name))
+            return # skip this adaptor
+
+
+        # we got an enabled adaptor with valid info - yay!  We can
+        # now register all adaptor classes (cpi implementations).
+        for cpi_info in adaptor_info['cpis'] :
+
+            # check cpi information details for completeness
+            if  not 'type'    in cpi_info or \
+                not 'class'   in cpi_info    :
+                self._logger.info ("Skipping adaptor %s cpi: cpi info detail is incomplete" \
                                 % (module_name))
-                continue # skip to next adaptor
+                continue # skip to next cpi info
 
 
-            # we got an enabled adaptor with valid info - yay!  We can
-            # now register all adaptor classes (cpi implementations).
-            for cpi_info in adaptor_info['cpis'] :
-
-                # check cpi information details for completeness
-                if  not 'type'    in cpi_info or \
-                    not 'class'   in cpi_info    :
-                    self._logger.info ("Skipping adaptor %s cpi: cpi info detail is incomplete" \
-                                    % (module_name))
-                    continue # skip to next cpi info
-
-
-                # adaptor classes are registered for specific API types.
-                cpi_type  = cpi_info['type']
-                cpi_cname = cpi_info['class']
-                cpi_class = None
-
-                try :
-                    cpi_class = getattr (adaptor_module, cpi_cname)
-
-                except Exception as e:
-                    # this exception likely means that the adaptor does
-                    # not call the saga.adaptors.Base initializer (correctly)
-                    self._logger.warning ("Skipping adaptor %s: adaptor class invalid %s: %s" \
-                                       % (module_name, cpi_info['class'], str(e)))
-                    continue # skip to next adaptor
-
-                # make sure the cpi class is a valid cpi for the given type.
-                # We walk through the list of known modules, and try to find
-                # a modules which could have that class.  We do the following
-                # tests:
-                #
-                #   cpi_class: ShellJobService
-                #   cpi_type:  saga.job.Service
-                #   modules:   saga.adaptors.cpi.job
-                #   modules:   saga.adaptors.cpi.job.service
-                #   classes:   saga.adaptors.cpi.job.Service
-                #   classes:   saga.adaptors.cpi.job.service.Service
-                #
-                #   cpi_class: X509Context
-                #   cpi_type:  saga.Context
-                #   modules:   saga.adaptors.cpi.context
-                #   classes:   saga.adaptors.cpi.context.Context
-                #
-                # So, we add a 'adaptors.cpi' after the 'saga' namespace
-                # element, then append the rest of the given namespace.  If that
-                # gives a module which has the requested class, fine -- if not,
-                # we add a lower cased version of the class name as last
-                # namespace element, and check again.
-
-                # ->   saga .  job .  Service 
-                # <- ['saga', 'job', 'Service']
-                cpi_type_nselems = cpi_type.split ('.')
-
-                if  len(cpi_type_nselems) < 2 or \
-                    len(cpi_type_nselems) > 3    :
-                    self._logger.warn ("Skipping adaptor %s: cpi type not valid: '%s'" \
-                                     % (module_name, cpi_type))
-                    continue # skip to next cpi info
-
-                if cpi_type_nselems[0] != 'saga' :
-                    self._logger.warn ("Skipping adaptor %s: cpi namespace not valid: '%s'" \
-                                     % (module_name, cpi_type))
-                    continue # skip to next cpi info
-
-                # -> ['saga',                    'job', 'Service'] 
-                # <- ['saga', 'adaptors', 'cpi', 'job', 'Service']
-                cpi_type_nselems.insert (1, 'adaptors')
-                cpi_type_nselems.insert (2, 'cpi')
-
-                # -> ['saga', 'adaptors', 'cpi', 'job',  'Service']
-                # <- ['saga', 'adaptors', 'cpi', 'job'], 'Service'
-                cpi_type_cname = cpi_type_nselems.pop ()
-
-                # -> ['saga', 'adaptors', 'cpi', 'job'], 'Service'
-                # <-  'saga.adaptors.cpi.job
-                # <-  'saga.adaptors.cpi.job.service
-                cpi_type_modname_1 = '.'.join (cpi_type_nselems)
-                cpi_type_modname_2 = '.'.join (cpi_type_nselems + [cpi_type_cname.lower()])
-
-                # does either module exist?
-                cpi_type_modname = None
-                if  cpi_type_modname_1 in sys.modules :
-                    cpi_type_modname = cpi_type_modname_1 
-
-                if  cpi_type_modname_2 in sys.modules :
-                    cpi_type_modname = cpi_type_modname_2 
-
-                if  not cpi_type_modname :
-                    self._logger.warn ("Skipping adaptor %s: cpi type not known: '%s'" \
-                                     % (module_name, cpi_type))
-                    continue # skip to next cpi info
-
-                # so, make sure the given cpi is actually
-                # implemented by the adaptor class
-                cpi_ok = False
-                for name, cpi_obj in inspect.getmembers (sys.modules[cpi_type_modname]) :
-                    if  name == cpi_type_cname      and \
-                        inspect.isclass (cpi_obj)       :
-                        if  issubclass (cpi_class, cpi_obj) :
-                            cpi_ok = True
-
-                if not cpi_ok :
-                    self._logger.warn ("Skipping adaptor %s: doesn't implement cpi '%s (%s)'" \
-                                     % (module_name, cpi_class, cpi_type))
-                    continue # skip to next cpi info
-
-
-                # finally, register the cpi for all its schemas!
-                registered_schemas = list()
-                for adaptor_schema in adaptor_schemas:
-
-                    adaptor_schema = adaptor_schema.lower ()
-
-                    # make sure we can register that cpi type
-                    if not cpi_type in self._adaptor_registry :
-                        self._adaptor_registry[cpi_type] = {}
-
-                    # make sure we can register that schema
-                    if not adaptor_schema in self._adaptor_registry[cpi_type] :
-                        self._adaptor_registry[cpi_type][adaptor_schema] = []
-
-                    # we register the cpi class, so that we can create
-                    # instances as needed, and the adaptor instance,
-                    # as that is passed to the cpi class c'tor later
-                    # on (the adaptor instance is used to share state
-                    # between cpi instances, amongst others)
-                    info = {'cpi_cname'        : cpi_cname, 
-                            'cpi_class'        : cpi_class, 
-                            'adaptor_name'     : adaptor_name,
-                            'adaptor_instance' : adaptor_instance}
-
-                    # make sure this tuple was not registered, yet
-                    if info in self._adaptor_registry[cpi_type][adaptor_schema] :
-
-                        self._logger.warn ("Skipping adaptor %s: already registered '%s - %s'" \
-                                         % (module_name, cpi_class, adaptor_instance))
-                        continue  # skip to next cpi info
-
-                    self._adaptor_registry[cpi_type][adaptor_schema].append(info)
-                    registered_schemas.append(str("%s://" % adaptor_schema))
-
-                self._logger.info("Register adaptor %s for %s API with URL scheme(s) %s" %
-                                      (module_name,
-                                       cpi_type,
-                                       registered_schemas))
+            # adaptor classes are registered for specific API types.
+            cpi_type  = cpi_info['type']
+            cpi_cname = cpi_info['class']
+            cpi_class = None
+
+            try :
+                cpi_class = getattr (adaptor_module, cpi_cname)
+
+            except Exception as e:
+                # this exception likely means that the adaptor does
+                # not call the saga.adaptors.Base initializer (correctly)
+                self._logger.warning ("Skipping adaptor %s: adaptor class invalid %s: %s" \
+                                   % (module_name, cpi_info['class'], str(e)))
+                continue # skip to next adaptor
+
+            # make sure the cpi class is a valid cpi for the given type.
+            # We walk through the list of known modules, and try to find
+            # a modules which could have that class.  We do the following
+            # tests:
+            #
+            #   cpi_class: ShellJobService
+            #   cpi_type:  saga.job.Service
+            #   modules:   saga.adaptors.cpi.job
+            #   modules:   saga.adaptors.cpi.job.service
+            #   classes:   saga.adaptors.cpi.job.Service
+            #   classes:   saga.adaptors.cpi.job.service.Service
+            #
+            #   cpi_class: X509Context
+            #   cpi_type:  saga.Context
+            #   modules:   saga.adaptors.cpi.context
+            #   classes:   saga.adaptors.cpi.context.Context
+            #
+            # So, we add a 'adaptors.cpi' after the 'saga' namespace
+            # element, then append the rest of the given namespace.  If that
+            # gives a module which has the requested class, fine -- if not,
+            # we add a lower cased version of the class name as last
+            # namespace element, and check again.
+
+            # ->   saga .  job .  Service 
+            # <- ['saga', 'job', 'Service']
+            cpi_type_nselems = cpi_type.split ('.')
+
+            if  len(cpi_type_nselems) < 2 or \
+                len(cpi_type_nselems) > 3    :
+                self._logger.warn ("Skipping adaptor %s: cpi type not valid: '%s'" \
+                                 % (module_name, cpi_type))
+                continue # skip to next cpi info
+
+            if cpi_type_nselems[0] != 'saga' :
+                self._logger.warn ("Skipping adaptor %s: cpi namespace not valid: '%s'" \
+                                 % (module_name, cpi_type))
+                continue # skip to next cpi info
+
+            # -> ['saga',                    'job', 'Service'] 
+            # <- ['saga', 'adaptors', 'cpi', 'job', 'Service']
+            cpi_type_nselems.insert (1, 'adaptors')
+            cpi_type_nselems.insert (2, 'cpi')
+
+            # -> ['saga', 'adaptors', 'cpi', 'job',  'Service']
+            # <- ['saga', 'adaptors', 'cpi', 'job'], 'Service'
+            cpi_type_cname = cpi_type_nselems.pop ()
+
+            # -> ['saga', 'adaptors', 'cpi', 'job'], 'Service'
+            # <-  'saga.adaptors.cpi.job
+            # <-  'saga.adaptors.cpi.job.service
+            cpi_type_modname_1 = '.'.join (cpi_type_nselems)
+            cpi_type_modname_2 = '.'.join (cpi_type_nselems + [cpi_type_cname.lower()])
+
+            # does either module exist?
+            cpi_type_modname = None
+            if  cpi_type_modname_1 in sys.modules :
+                cpi_type_modname = cpi_type_modname_1 
+
+            if  cpi_type_modname_2 in sys.modules :
+                cpi_type_modname = cpi_type_modname_2 
+
+            if  not cpi_type_modname :
+                self._logger.warn ("Skipping adaptor %s: cpi type not known: '%s'" \
+                                 % (module_name, cpi_type))
+                continue # skip to next cpi info
+
+            # so, make sure the given cpi is actually
+            # implemented by the adaptor class
+            cpi_ok = False
+            for name, cpi_obj in inspect.getmembers (sys.modules[cpi_type_modname]) :
+                if  name == cpi_type_cname      and \
+                    inspect.isclass (cpi_obj)       :
+                    if  issubclass (cpi_class, cpi_obj) :
+                        cpi_ok = True
+
+            if not cpi_ok :
+                self._logger.warn ("Skipping adaptor %s: doesn't implement cpi '%s (%s)'" \
+                                 % (module_name, cpi_class, cpi_type))
+                continue # skip to next cpi info
+
+
+            # finally, register the cpi for all its schemas!
+            registered_schemas = list()
+            for adaptor_schema in adaptor_schemas:
+
+                adaptor_schema = adaptor_schema.lower ()
+
+                # make sure we can register that cpi type
+                if not cpi_type in self._adaptor_registry :
+                    self._adaptor_registry[cpi_type] = {}
+
+                # make sure we can register that schema
+                if not adaptor_schema in self._adaptor_registry[cpi_type] :
+                    self._adaptor_registry[cpi_type][adaptor_schema] = []
+
+                # we register the cpi class, so that we can create
+                # instances as needed, and the adaptor instance,
+                # as that is passed to the cpi class c'tor later
+                # on (the adaptor instance is used to share state
+                # between cpi instances, amongst others)
+                info = {'cpi_cname'        : cpi_cname, 
+                        'cpi_class'        : cpi_class, 
+                        'adaptor_name'     : adaptor_name,
+                        'adaptor_instance' : adaptor_instance}
+
+                # make sure this tuple was not registered, yet
+                if info in self._adaptor_registry[cpi_type][adaptor_schema] :
+
+                    self._logger.warn ("Skipping adaptor %s: already registered '%s - %s'" \
+                                     % (module_name, cpi_class, adaptor_instance))
+                    continue  # skip to next cpi info
+
+                self._adaptor_registry[cpi_type][adaptor_schema].append(info)
+                registered_schemas.append(str("%s://" % adaptor_schema))
+
+            self._logger.info("Register adaptor %s for %s API with URL scheme(s) %s" %
+                                  (module_name,
+                                   cpi_type,
+                                   registered_schemas))
 
 
 
@@ -486,6 +571,8 @@ class Engine(ruc.Configurable):
             name)
         '''
 
+        self._load_adaptors_for_schema (ctype, schema)
+
         if not ctype in self._adaptor_registry :
             return []
 
@@ -507,14 +594,20 @@ class Engine(ruc.Configurable):
             name.  
             
             This method is used if adaptor or API object implementation need to
-            interact with other adaptors.
+            interact with other adaptors.  If no loaded adaptor has that name,
+            all remaining adaptors are loaded.
         '''
 
-        for ctype in self._adaptor_registry.keys () :
-            for schema in self._adaptor_registry[ctype].keys () :
-                for info in self._adaptor_registry[ctype][schema] :
-                    if ( info['adaptor_name'] == adaptor_name ) :
-                        return info['adaptor_instance']
+        for attempt in range (2) :
+
+            if  attempt > 0 :
+                self._load_all_adaptors ()
+
+            for ctype in self._adaptor_registry.keys () :
+                for schema in self._adaptor_registry[ctype].keys () :
+                    for info in self._adaptor_registry[ctype][schema] :
+                        if ( info['adaptor_name'] == adaptor_name ) :
+                            return info['adaptor_instance']
 
         error_msg = "No adaptor named '%s' found" % adaptor_name
         self._logger.error(error_msg)
@@ -534,6 +627,8 @@ class Engine(ruc.Configurable):
         adaptor.
         '''
 
+        self._load_adaptors_for_schema (ctype, schema)
+
         if not ctype in self._adaptor_registry:
             error_msg = "No adaptor found for '%s' and URL scheme %s://" \
                                   % (ctype, schema)
@@ -598,6 +693,9 @@ class Engine(ruc.Configurable):
     #-----------------------------------------------------------------
     # 
     def loaded_adaptors (self):
+        """ Return the registry of the adaptors loaded so far (adaptors are
+            loaded on demand, by URL schema).
+        """
         return self._adaptor_registry
 
 
@@ -37,3 +37,34 @@ adaptor_registry = [
                     "saga.adaptors.loadl.loadljob",
                     "saga.adaptors.globus_online.go_file"
                    ]
+
+"""
+URL schemas served by the registered adaptor modules (see the adaptors'
+_ADAPTOR_SCHEMAS, in lower case).
+
+The engine only loads a module listed here when one of its schemas is first
+looked up, so that using, say, the slurm adaptor does not import and check all
+other adaptors.  Registered modules which are not listed (like the context
+adaptors, which every session needs) are loaded when the engine is created.
+If no adaptor loaded for a schema serves the requested API, all remaining
+adaptors are loaded; the engine warns when an adaptor's _ADAPTOR_SCHEMAS differ
+from its entry here.
+"""
+
+adaptor_schemas  = {
+                    "saga.adaptors.shell.shell_job"       : ["fork", "local", "ssh", "gsissh"],
+                    "saga.adaptors.shell.shell_file"      : ["file", "local", "sftp", "gsisftp", "ssh", "gsissh"],
+                    "saga.adaptors.shell.shell_resource"  : ["local", "shell"],
+                    "saga.adaptors.redis.redis_advert"    : ["redis"],
+                    "saga.adaptors.sge.sgejob"            : ["sge", "sge+ssh", "sge+gsissh"],
+                    "saga.adaptors.pbs.pbsjob"            : ["pbs", "pbs+ssh", "pbs+gsissh"],
+                    "saga.adaptors.lsf.lsfjob"            : ["lsf", "lsf+ssh", "lsf+gsissh"],
+                    "saga.adaptors.irods.irods_replica"   : ["irods"],
+                    "saga.adaptors.condor.condorjob"      : ["condor", "condor+ssh", "condor+gsissh"],
+                    "saga.adaptors.slurm.slurm_job"       : ["slurm", "slurm+ssh", "slurm+gsissh"],
+                    "saga.adaptors.http.http_file"        : ["http", "https"],
+                    "saga.adaptors.aws.ec2_resource"      : ["ec2", "ec2_keypair", "openstack", "eucalyptus",
+                                                             "euca", "aws", "amazon", "http", "https"],
+                    "saga.adaptors.loadl.loadljob"        : ["loadl", "loadl+ssh", "loadl+gsissh"],
+                    "saga.adaptors.globus_online.go_file" : ["go+gsisftp", "go+gridftp"]
+                   }
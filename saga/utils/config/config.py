@@ -146,6 +146,12 @@ class Configuration(object):
                     else:
                       raise ValueTypeError(option['category'], option['name'],
                           tmp_value, option['type'])
+                elif option['type'] in [int, float]:
+                    try:
+                      value = option['type'](tmp_value)
+                    except ValueError:
+                      raise ValueTypeError(option['category'], option['name'],
+                          tmp_value, option['type'])
                 else:
                     value = tmp_value
 
@@ -167,6 +173,12 @@ class Configuration(object):
                     else:
                       raise ValueTypeError(option['category'], option['name'],
                           tmp_value, option['type'])
+                elif option['type'] in [int, float]:
+                    try:
+                      value = option['type'](tmp_value)
+                    except ValueError:
+                      raise ValueTypeError(option['category'], option['name'],
+                          tmp_value, option['type'])
                 else:
                     value = tmp_value
             else:
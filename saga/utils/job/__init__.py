@@ -5,6 +5,7 @@ __license__   = "MIT"
 
 
 from transfer_directives import TransferDirectives
+from state_cache         import JobStateCache
 
 
 
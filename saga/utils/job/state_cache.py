@@ -0,0 +1,85 @@
+
+__copyright__ = "Copyright 2012-2013, The SAGA Project"
+__license__   = "MIT"
+
+
+''' Provides a cache of the job states of a job service, refreshed by listing
+    all jobs of the user with a single backend call.
+'''
+
+import time
+
+import saga.utils.threads as sut
+
+
+# ------------------------------------------------------------------------------
+#
+class JobStateCache (object) :
+
+    """ Caches the information the backend lists for all jobs of a job service
+    (e.g. one `squeue` call), so that polling the state of many jobs, like
+    waiting for them, costs one backend call per refresh interval instead of one
+    per job and poll.
+
+    `list_states` is called without arguments and returns a dict of the native
+    job id to the native job information (e.g. the state string).  The listing
+    is done again when the last one is older than `interval` seconds, or after
+    `invalidate()` (e.g. after a job submission).  An interval <= 0 disables the
+    cache: get() returns None, and the adaptor queries the job itself.
+    """
+
+    # --------------------------------------------------------------------------
+    #
+    def __init__ (self, list_states, interval=1.0, logger=None) :
+
+        self._list_states = list_states
+        self._interval    = interval
+        self._logger      = logger
+        self._lock        = sut.RLock ('JobStateCache')
+        self._states      = None
+        self._time        = None
+
+
+    # --------------------------------------------------------------------------
+    #
+    def get (self, native_id) :
+        """
+        Return the listed information of the job, or None if the job is not
+        listed (anymore), or the listing failed -- the caller then falls back to
+        querying the job on its own.
+        """
+
+        if  self._interval <= 0 :
+            return None
+
+        with self._lock :
+
+            now = time.time ()
+
+            if  self._time is None or now - self._time >= self._interval :
+
+                try :
+                    self._states = self._list_states ()
+
+                except Exception as e :
+                    # don't retry before the next interval
+                    self._states = None
+                    if  self._logger :
+                        self._logger.warning ("listing the job states failed: %s" % e)
+
+                self._time = now
+
+            if  self._states is None :
+                return None
+
+            return self._states.get (native_id)
+
+
+    # --------------------------------------------------------------------------
+    #
+    def invalidate (self) :
+        """ Refresh the listing on the next get() """
+
+        with self._lock :
+            self._time = None
+
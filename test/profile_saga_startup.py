@@ -0,0 +1,53 @@
+"""
+Profile the saga startup of the HPC runJobs (RunJobTitan, RunJobHopper):
+import saga, create the engine and the default session, look up the adaptors
+for the job service URL, then create the job service.
+
+  python test/profile_saga_startup.py [url]     (default: pbs://localhost)
+
+Each step prints its time and the number of saga.adaptors modules imported so
+far. Creating the job service needs the batch system tools of the URL schema.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def adaptorModules():
+    return len([m for m in sys.modules if m.startswith("saga.adaptors.") and sys.modules[m]])
+
+def step(name, func, *args):
+    """ Run and time func(*args): return its result, or None if it failed """
+
+    t0 = time.time()
+    try:
+        result = func(*args)
+    except Exception, e:
+        print "%-30s failed after %.1f ms: %s" % (name, (time.time() - t0)*1000, e)
+        return None
+    print "%-30s %8.1f ms %4d saga.adaptors modules" % (name, (time.time() - t0)*1000, adaptorModules())
+    return result
+
+def main(url):
+    schema = url.split("://")[0]
+
+    saga = step("import saga", __import__, "saga")
+    if not saga:
+        return 1
+    import saga.engine.engine
+    engine = step("engine", saga.engine.engine.Engine)
+    step("default session", saga.Session)
+    step("adaptor lookup (%s://)" % schema, engine.find_adaptors, "saga.job.Service", schema)
+    js = step("job service (%s)" % url, saga.job.Service, url)
+    if js:
+        js.close()
+
+    for module_name, dt in sorted(engine._loaded_modules.items(), key=lambda x: -x[1]):
+        print "  %-40s %8.1f ms" % (module_name, dt*1000)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else "pbs://localhost"))
@@ -0,0 +1,139 @@
+import os
+import sys
+import ssl
+import gzip
+import shutil
+import tempfile
+import unittest
+import threading
+import subprocess
+import BaseHTTPServer
+import SocketServer
+from StringIO import StringIO
+from distutils.spawn import find_executable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from HttpClient import HttpClient, HttpClientError, encodeFormData
+
+def makeCertificate(filename):
+    """ Write a self-signed certificate for localhost, followed by its key """
+
+    subprocess.check_call("openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=localhost"
+                          " -keyout %s.key -out %s 2>/dev/null && cat %s.key >> %s" %
+                          (filename, filename, filename, filename), shell=True)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Answers /ok (gzip compressed), drops the connection without an answer on /drop """
+
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.handle_one_request(self)
+        if self.close_connection:
+            self.server.closed.set()
+
+    def serve(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        body = self.rfile.read(length)
+        self.server.requests.append((self.command, self.path, body))
+        if self.path == "/drop":
+            self.close_connection = 1
+            return
+        if self.path == "/close":
+            self.close_connection = 1
+        f = StringIO()
+        g = gzip.GzipFile(fileobj=f, mode="wb")
+        g.write("%s %s %s" % (self.command, self.path, body))
+        g.close()
+        data = f.getvalue()
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = serve
+    do_POST = serve
+
+    def log_message(self, *args):
+        pass
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Local stand-in for the dispatcher """
+
+    daemon_threads = True
+
+    def __init__(self, certfile):
+        BaseHTTPServer.HTTPServer.__init__(self, ('localhost', 0), Handler)
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(certfile)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.requests = []
+        self.closed = threading.Event()
+
+    def handle_error(self, request, client_address):
+        # the client closes its connections without a TLS shutdown
+        pass
+
+@unittest.skipUnless(find_executable("openssl"), "openssl is needed to create the server certificate")
+class TestHttpClient(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cert = os.path.join(self.dir, "localhost.pem")
+        makeCertificate(self.cert)
+        self.server = Server(self.cert)
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1})
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.url = "https://localhost:%d" % (self.server.server_address[1])
+        self.client = HttpClient()
+
+    def tearDown(self):
+        self.client.closeAll()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def request(self, method, path, body=None):
+        # the server certificate is its own CA, and is presented as the client certificate
+        return self.client.request(method, self.url + path, body=body, timeout=10, sslCert=self.cert)
+
+    def testPersistentConnection(self):
+        body = encodeFormData({'state': 'running'})
+        self.assertEqual(self.request('POST', '/ok', body), (200, "POST /ok state=running"))
+        self.assertEqual(self.request('GET', '/ok?a=1'), (200, "GET /ok?a=1 "))
+        self.assertEqual(self.client.nConnections, 1)
+        self.assertEqual(self.client.nRequests, 2)
+
+    def testServerClosedIdleConnection(self):
+        self.assertEqual(self.request('GET', '/close')[0], 200)
+        self.server.closed.wait(5)
+        self.assertEqual(self.request('POST', '/ok', 'x'), (200, "POST /ok x"))
+        self.assertEqual(self.client.nConnections, 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def testSentPostIsNotResent(self):
+        self.assertEqual(self.request('GET', '/ok')[0], 200)
+        self.assertRaises(HttpClientError, self.request, 'POST', '/drop', 'x')
+        self.assertEqual([r for r in self.server.requests if r[1] == '/drop'], [('POST', '/drop', 'x')])
+
+    def testSentGetIsResent(self):
+        self.assertEqual(self.request('GET', '/ok')[0], 200)
+        self.assertRaises(HttpClientError, self.request, 'GET', '/drop')
+        # once on the reused connection, once on a new one
+        self.assertEqual(len([r for r in self.server.requests if r[1] == '/drop']), 2)
+
+    def testUnknownCertificate(self):
+        other = os.path.join(self.dir, "other.pem")
+        makeCertificate(other)
+        try:
+            self.client.request('GET', self.url + '/ok', timeout=10, sslCert=other)
+        except HttpClientError, e:
+            self.assertEqual(e.status, 35)
+        else:
+            self.fail("the server certificate was not verified")
+
+if __name__ == "__main__":
+    unittest.main()
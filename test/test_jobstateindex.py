@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from JobState import JobState
+from JobStateIndex import JobStateIndex
+
+class FakeJob:
+    def __init__(self, jobId):
+        self.jobId = jobId
+        self.result = ["running", 0, 0]
+        self.attemptNr = 1
+        self.trf = "Reco_tf.py"
+        self.ddmEndPointOut = []
+        self.ddmEndPointLog = []
+
+class FakeSite:
+    def __init__(self, workdir):
+        self.sitename = "TEST_SITE"
+        self.workdir = workdir
+
+class FakeNode:
+    pass
+
+class TestJobStateIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.workdir = os.path.join(self.dir, "Panda_Pilot_1_1")
+        os.mkdir(self.workdir)
+        self.index = JobStateIndex(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def putJob(self, jobId):
+        JS = JobState()
+        self.assertTrue(JS.put(FakeJob(jobId), FakeSite(self.workdir), FakeNode()))
+        return JS.filename
+
+    def ageManifest(self):
+        """ Make the manifest older than the work dir, as if the dir changed after the manifest was written """
+
+        t = time.time() - 60
+        os.utime(self.index.getManifestFilename(self.workdir), (t, t))
+
+    def jobIds(self):
+        return sorted([e['jobId'] for e in self.index.read()])
+
+    def testManifest(self):
+        self.putJob(1)
+        self.putJob(2)
+        self.assertTrue(os.path.exists(self.index.getManifestFilename(self.workdir)))
+        self.assertEqual(self.jobIds(), ["1", "2"])
+
+    def testJobStateFileRemovedBehindTheManifest(self):
+        self.putJob(1)
+        filename = self.putJob(2)
+        os.remove(filename)
+        self.ageManifest()
+        self.assertEqual(self.jobIds(), ["1"])
+
+    def testJobStateFileCreatedBehindTheManifest(self):
+        self.putJob(1)
+        filename = self.putJob(2)
+        self.index.remove(self.workdir, 2)
+        self.ageManifest()
+        entries = dict([(e['jobId'], e) for e in self.index.read()])
+        self.assertEqual(sorted(entries.keys()), ["1", "2"])
+        self.assertEqual(entries["2"]['job_state_file'], filename)
+
+    def testCurrentManifestIsTrusted(self):
+        self.putJob(1)
+        self.putJob(2)
+        self.index.remove(self.workdir, 2)
+        self.assertEqual(self.jobIds(), ["1"])
+
+if __name__ == "__main__":
+    unittest.main()
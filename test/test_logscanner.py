@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import LogScanner
+from pUtil import grep
+
+LINES = ["foo at the start\n",
+         "not foo at the start\n",
+         "ends with bar\n",
+         "bar does not end with it\n",
+         "qux\n",
+         " qux\n",
+         "a\n",
+         "b baz\n",
+         "foo bar\n",
+         "last foo line without newline bar"]
+
+PATTERNS = [r"^foo", r"bar$", r"^qux$", r"baz", r"a\s+b"]
+
+class TestLogScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "athena_stdout.txt")
+        f = open(self.filename, "w")
+        f.write("".join(LINES))
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def lineByLine(self, patterns):
+        """ The result of matching each line on its own """
+
+        return [line for line in LINES for pattern in patterns if re.search(pattern, line)]
+
+    def testGrepAnchoredAndUnanchoredPatterns(self):
+        self.assertEqual(grep(PATTERNS, self.filename), self.lineByLine(PATTERNS))
+        self.assertEqual(grep([r"^foo"], self.filename), ["foo at the start\n", "foo bar\n"])
+        self.assertEqual(grep([r"bar$"], self.filename), ["ends with bar\n", "foo bar\n", "last foo line without newline bar"])
+        self.assertEqual(grep([r"^qux$"], self.filename), ["qux\n"])
+        # no line matches on its own, the combined expression would match across "a\nb baz"
+        self.assertEqual(grep([r"a\s+b"], self.filename), [])
+
+    def testScannerAnchoredPattern(self):
+        LogScanner.registerPattern("test_anchored", r"^qux$")
+        try:
+            scanner = LogScanner.LogScanner(self.filename)
+            self.assertTrue(scanner.scan())
+            self.assertEqual(scanner.getMatches("test_anchored"), ["qux\n"])
+            self.assertEqual(scanner.getOffsets("test_anchored"), [len("".join(LINES[:4]))])
+            self.assertEqual(scanner.getCount("events_processed"), 0)
+        finally:
+            LogScanner.patterns[:] = [p for p in LogScanner.patterns if p[0] != "test_anchored"]
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from LogWriter import LogWriter
+
+def childLogs(writer, filename, n):
+    for i in range(n):
+        writer.put(filename, "child line %d\n" % (i))
+
+class TestLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def countLines(self, filename):
+        if not os.path.exists(filename):
+            return 0
+        return len(open(filename).readlines())
+
+    def testRelativeFilenameResolvedAtQueueTime(self):
+        first = os.path.join(self.dir, "first")
+        second = os.path.join(self.dir, "second")
+        os.mkdir(first)
+        os.mkdir(second)
+        writer = LogWriter()
+        os.chdir(first)
+        for i in range(2000):
+            writer.put("pilotlog.txt", "line %d\n" % (i))
+        os.chdir(second)
+        writer.flush()
+        writer.stop()
+        self.assertEqual(self.countLines(os.path.join(first, "pilotlog.txt")), 2000)
+        self.assertEqual(self.countLines(os.path.join(second, "pilotlog.txt")), 0)
+
+    def testMultiprocessingChildFlushesAtExit(self):
+        filename = os.path.join(self.dir, "child.txt")
+        writer = LogWriter()
+        writer.put(os.path.join(self.dir, "parent.txt"), "parent\n")
+        p = multiprocessing.Process(target=childLogs, args=(writer, filename, 500))
+        p.start()
+        p.join()
+        writer.stop()
+        self.assertEqual(p.exitcode, 0)
+        self.assertEqual(self.countLines(filename), 500)
+
+if __name__ == "__main__":
+    unittest.main()
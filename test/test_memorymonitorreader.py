@@ -0,0 +1,83 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from MemoryMonitorReader import MemoryMonitorReader
+
+HEADER = "Time\tVMEM\tPSS\tRSS\tSwap\n"
+
+def sample(t, pss):
+    return "%d\t%d\t%d\t%d\t0\n" % (t, 2*pss, pss, pss - 10)
+
+class TestMemoryMonitorReader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "memory_monitor_output.txt")
+        self.reader = MemoryMonitorReader(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, data, mode="a"):
+        f = open(self.path, mode)
+        f.write(data)
+        f.close()
+
+    def check(self, samples):
+        """ The reader values must be the ones of a full read of the samples (time, pss) """
+
+        self.assertTrue(self.reader.update())
+        pss = [p for t, p in samples]
+        summary = self.reader.getSummary()
+        self.assertEqual(self.reader.N, len(samples))
+        self.assertEqual(summary['Max']['maxPSS'], max(pss))
+        self.assertEqual(summary['Avg']['avgPSS'], sum(pss)/len(pss))
+        self.assertEqual(summary['Max']['maxVMEM'], 2*max(pss))
+        self.assertEqual(self.reader.getTimeSeries(), ([t for t, p in samples], pss))
+
+    def testAppendedLines(self):
+        self.write(HEADER + sample(60, 100) + sample(120, 200))
+        self.check([(60, 100), (120, 200)])
+        self.assertTrue(self.reader.update())
+        self.assertEqual(self.reader.N, 2)
+        self.write(sample(180, 400) + sample(240, 300))
+        self.check([(60, 100), (120, 200), (180, 400), (240, 300)])
+        self.assertAlmostEqual(self.reader.getPSSSlope(), 4.0/3)
+
+    def testPartialLastLine(self):
+        self.write(HEADER + sample(60, 100) + sample(120, 500).rstrip("\n"))
+        # the last sample of a memory monitor which exited without a newline
+        self.check([(60, 100), (120, 500)])
+        self.check([(60, 100), (120, 500)])
+        # the line is completed: it is not counted twice
+        self.write("\n" + sample(180, 200)[:4])
+        self.check([(60, 100), (120, 500)])
+        self.write(sample(180, 200)[4:])
+        self.check([(60, 100), (120, 500), (180, 200)])
+
+    def testReplacedFile(self):
+        self.write(HEADER + sample(60, 100) + sample(120, 200) + sample(180, 300))
+        self.check([(60, 100), (120, 200), (180, 300)])
+
+        # new inode, larger file
+        f = open(self.path + ".new", "w")
+        f.write(HEADER + sample(60, 40) + sample(120, 45) + sample(180, 50) + sample(240, 55))
+        f.close()
+        os.rename(self.path + ".new", self.path)
+        self.check([(60, 40), (120, 45), (180, 50), (240, 55)])
+
+        # smaller size
+        self.write(HEADER + sample(60, 30), mode="w")
+        self.check([(60, 30)])
+
+        # new header
+        self.write(HEADER.replace("Swap", "SWAP") + sample(60, 30) + sample(120, 35), mode="w")
+        self.check([(60, 30), (120, 35)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from Job import Job, FileSpec
+from movers.mover import JobMover
+from movers.checksum import checksumService
+
+# lsm-get [options] <source> <destination>: copies the local path of an srm://localhost replica
+LSM_GET = '''#!/bin/sh
+while [ $# -gt 2 ]; do shift; done
+cp "${1#srm://localhost}" "$2"
+'''
+
+class FakeExperiment:
+    def useTracingService(self):
+        return False
+
+class FakeSiteInformation:
+    """ A queue without aprotocols which allows the given copytools for stage-in """
+
+    def __init__(self, copytools):
+        self.copytools = copytools
+
+    def getExperimentObject(self):
+        return FakeExperiment()
+
+    def getQueueName(self):
+        return "TEST_QUEUE"
+
+    def resolvePandaProtocols(self, pandaqueue, activity):
+        return {pandaqueue: []}
+
+    def resolvePandaCopytools(self, pandaqueue, activity, copytools=None, masterdata=None):
+        return {pandaqueue: self.copytools}
+
+    def resolveDDMConf(self, ddmendpoints):
+        return {}
+
+class Mover(JobMover):
+    """ JobMover with the replicas found in a local storage dir instead of Rucio """
+
+    def __init__(self, job, si, storage, **kwargs):
+        super(Mover, self).__init__(job, si, **kwargs)
+        self.storage = storage
+        self.contexts = []
+
+    def resolve_replicas(self, files):
+        for fspec in files:
+            fspec.replicas = [("LOCAL_DATADISK", ["srm://localhost%s" % os.path.join(self.storage, fspec.lfn)], "", "")]
+
+    def _stagein_file(self, fnum, fdata, ctx, sitemover_objects, trace_report):
+        self.contexts.append(ctx)
+        return super(Mover, self)._stagein_file(fnum, fdata, ctx, sitemover_objects, trace_report)
+
+class TestJobMover(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.home = os.environ['HOME']
+        self.path = os.environ['PATH']
+        self.dir = tempfile.mkdtemp()
+        # no queuedata in the pilot home dir: the pilot defaults are used
+        os.environ['PilotHomeDir'] = self.dir
+        self.storage = os.path.join(self.dir, "storage")
+        self.workdir = os.path.join(self.dir, "PandaJob")
+        bindir = os.path.join(self.dir, "bin")
+        for d in self.storage, self.workdir, bindir:
+            os.mkdir(d)
+        filename = os.path.join(bindir, "lsm-get")
+        f = open(filename, "w")
+        f.write(LSM_GET)
+        f.close()
+        os.chmod(filename, 0755)
+        os.environ['PATH'] = bindir + os.pathsep + self.path
+        # mv_sitemover links the input files found in $HOME into the current dir
+        os.environ['HOME'] = self.storage
+        os.chdir(self.workdir)
+
+        self.job = Job()
+        self.job.jobId = 1234
+        self.job.jobPars = ""
+        self.job.workdir = self.workdir
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.environ['HOME'] = self.home
+        os.environ['PATH'] = self.path
+        del os.environ['PilotHomeDir']
+        shutil.rmtree(self.dir)
+
+    def putFiles(self, n):
+        """ Write n input files to the storage dir and return their FileSpecs """
+
+        files = []
+        for i in range(n):
+            lfn = "EVNT.01234567._%06d.pool.root.1" % (i + 1)
+            filename = os.path.join(self.storage, lfn)
+            f = open(filename, "w")
+            f.write("event data %d\n" % i * 1000)
+            f.close()
+            checksum = checksumService.calculate(filename, ['adler32'])['adler32']
+            files.append(FileSpec(lfn=lfn, scope="mc16_13TeV", guid="0000-%04d" % i, ddmendpoint="LOCAL_DATADISK",
+                                  filesize=os.path.getsize(filename), checksum="ad:%s" % checksum))
+        return files
+
+    def stagein(self, copytool, files):
+        si = FakeSiteInformation([(copytool, {'setup': '', 'stagein_workers': 3})])
+        mover = Mover(self.job, si, self.storage, workDir=self.workdir, stageinretry=1)
+        transferred, failed = mover.stagein_real(files)
+        self.assertEqual(failed, [])
+        self.assertEqual(len(transferred), len(files))
+        self.assertEqual([e.status for e in files], ['transferred'] * len(files))
+        # the workers do not change the protocols they share
+        protocols = mover.contexts[0]['protocols']
+        self.assertEqual(protocols, [{'resolve_scheme': True, 'copytool': copytool, 'copysetup': ''}])
+        for ctx in mover.contexts:
+            self.assertTrue(ctx['protocols'] is protocols)
+
+    def testMvSiteMover(self):
+        files = self.putFiles(4)
+        self.stagein('mv', files)
+        for e in files:
+            self.assertEqual(os.readlink(os.path.join(self.workdir, e.lfn)), os.path.join(self.storage, e.lfn))
+
+    def testLsmSiteMover(self):
+        files = self.putFiles(4)
+        self.stagein('lsm', files)
+        for e in files:
+            filename = os.path.join(self.workdir, e.lfn)
+            self.assertFalse(os.path.islink(filename))
+            self.assertEqual(open(filename).read(), open(os.path.join(self.storage, e.lfn)).read())
+            self.assertEqual(e.turl, "srm://localhost%s" % os.path.join(self.storage, e.lfn))
+
+if __name__ == "__main__":
+    unittest.main()
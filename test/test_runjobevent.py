@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from RunJobEvent import RunJobEvent
+
+class TestStageOutStorages(unittest.TestCase):
+
+    def setUp(self):
+        self.runJob = RunJobEvent()
+        self.runJob._RunJobEvent__stageoutStorages = None
+        self.resolved = []
+        self.runJob.reolve_stageout_endpoints = self.resolveStorages
+        self.runJob.is_blacklisted = lambda endpoint: False
+        self.runJob.stage_out_es_real = self.stageOut
+
+    def tearDown(self):
+        self.runJob._RunJobEvent__stageoutStorages = None
+        for name in 'reolve_stageout_endpoints', 'is_blacklisted', 'stage_out_es_real':
+            delattr(self.runJob, name)
+
+    def resolveStorages(self):
+        self.resolved.append(threading.current_thread().name)
+        time.sleep(0.1) # a slow storage lookup
+        storage = {'activity': 'es_events', 'endpoint': 'TEST_ES', 'continousErrors': 0, 'success': 0, 'failed': 0}
+        return 0, {'primary': storage, 'failover': None}
+
+    def stageOut(self, job, event_range_id, file_paths, pathConvention=None, storage=None):
+        return 0, "", 1
+
+    def testConcurrentStageOuts(self):
+        results = []
+        def worker(i):
+            results.append(self.runJob.stage_out_es(None, "range-%d" % i, ["/tmp/out-%d" % i]))
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, [(0, "", 1)] * 8)
+        self.assertEqual(len(self.resolved), 1)
+        storage = self.runJob._RunJobEvent__stageoutStorages['primary']
+        self.assertEqual((storage['success'], storage['failed'], storage['continousErrors']), (8, 0, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import saga
+import saga.engine.engine
+import saga.engine.registry as registry
+
+class TestAdaptorRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = saga.engine.engine.Engine()
+        self.adaptor_schemas = registry.adaptor_schemas
+
+    def tearDown(self):
+        registry.adaptor_schemas = self.adaptor_schemas
+        # back to the adaptors loaded when the engine is created
+        self.engine._load_adaptors(inject_registry=[m for m in registry.adaptor_registry if m not in registry.adaptor_schemas])
+
+    def testSchemasAgreeWithAdaptors(self):
+        for module_name, schemas in self.adaptor_schemas.items():
+            try:
+                module = __import__(module_name, fromlist=['Adaptor'])
+            except ImportError:
+                continue # not available here, e.g. missing redis
+            self.assertEqual(sorted(schemas), sorted([s.lower() for s in module._ADAPTOR_SCHEMAS]), module_name)
+
+    def testSchemaLookupLoadsListedAdaptorsOnly(self):
+        self.engine._load_adaptors(inject_registry=[])
+        self.assertEqual(self.engine.find_adaptors('saga.job.Service', 'slurm'), ['saga.adaptor.slurm_job'])
+        self.assertTrue('saga.adaptors.slurm.slurm_job' in self.engine._loaded_modules)
+        self.assertFalse('saga.adaptors.pbs.pbsjob' in self.engine._loaded_modules)
+
+    def testUnlistedSchemaLoadsAllAdaptors(self):
+        # slurm_job serves the schema, but the registry does not say so
+        registry.adaptor_schemas = dict(self.adaptor_schemas)
+        registry.adaptor_schemas['saga.adaptors.slurm.slurm_job'] = []
+        self.engine._load_adaptors(inject_registry=[])
+        self.assertEqual(self.engine.find_adaptors('saga.job.Service', 'slurm'), ['saga.adaptor.slurm_job'])
+        self.assertTrue('saga.adaptors.pbs.pbsjob' in self.engine._loaded_modules)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import pwd
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import saga
+
+USER = pwd.getpwuid(os.getuid())[0]
+
+# fake batch system tools: each call is logged to <dir>/calls, the job listings fail while <dir>/fail exists
+FAKE_TOOLS = {
+    'squeue': '''
+case "$*" in
+"-h -t all"*) fail; echo "101 RUNNING"; echo "102 PENDING"; echo "103 COMPLETED";;
+esac''',
+    'scontrol': '''
+case "$*" in
+"show job 101") echo "JobId=101 JobName=job1"; echo "   JobState=RUNNING Reason=None";;
+"show job 102") echo "JobId=102 JobName=job2"; echo "   JobState=PENDING Reason=Priority";;
+"show job 103") echo "JobId=103 JobName=job3"; echo "   JobState=COMPLETED Reason=None";;
+esac''',
+    'sbatch': '',
+    'scancel': '',
+    'sacct': '',
+    'pbsnodes': '''
+case "$1" in
+--version) echo "version: 4.2.6";;
+-a) echo "n1"; echo "     np = 8";;
+esac''',
+    'qstat': '''
+case "$1" in
+--version) echo "version: 4.2.6";;
+-help) echo "GE 6.2u5";;
+-u) fail
+    if [ -e FAKEDIR/sge ]; then
+        echo "job-ID prior name user state submit/start at queue slots"
+        echo "------------------------------------------------------------"
+        echo "1001 0.55500 job1 user r 06/24/2013 17:24:50 all.q@n1 1"
+        echo "1002 0.55500 job2 user qw 06/24/2013 17:24:43  1"
+    else
+        echo "server:"
+        echo "                                                                         Req'd  Req'd   Elap"
+        echo "Job ID               Username Queue    Jobname          SessID NDS   TSK Memory Time  S Time"
+        echo "-------------------- -------- -------- ---------------- ------ ----- --- ------ ----- - -----"
+        echo "1001.server          user     batch    job1              1234     1   1    --  00:10 R 00:01"
+        echo "1002.server          user     batch    job2                --     1   1    --  00:10 Q   --"
+    fi;;
+-f1) echo "    job_state = R"; echo "    exec_host = n1/0";;
+-j) echo "submission_time:            Mon Jun 24 17:24:43 2013"; echo "sge_o_host:                 sge";;
+"") echo "job-ID prior name user state submit/start at queue slots"
+    echo "------------------------------------------------------------"
+    echo "1001 0.55500 job1 user r 06/24/2013 17:24:50 all.q@n1 1"
+    echo "1002 0.55500 job2 user qw 06/24/2013 17:24:43  1";;
+esac''',
+    'qsub': '''
+case "$1" in
+--version) echo "version: 4.2.6";;
+-help) echo "GE 6.2u5";;
+esac''',
+    'qdel': '''
+[ "$1" = "-help" ] && echo "GE 6.2u5"''',
+    'qacct': '''
+[ "$1" = "-help" ] && echo "GE 6.2u5"''',
+    'qconf': '''
+case "$1" in
+-help) echo "GE 6.2u5";;
+-spl) echo "smp";;
+-sc) echo "#name shortcut type relop requestable consumable default urgency"
+     echo "h_vmem h_vmem MEMORY <= YES NO 0 0";;
+-sconf) echo "reporting_params accounting=false";;
+esac''',
+    'bjobs': '''
+case "$*" in
+-V) echo "IBM Spectrum LSF 10.1";;
+"-noheader -a") fail
+    echo "1001 user RUN normal host1 host2 job1 Nov 11 12:06"
+    echo "1002 user PEND normal host1 - job2 Nov 11 12:07";;
+"-noheader 1001") echo "1001 user RUN normal host1 host2 job1 Nov 11 12:06";;
+"-noheader 1002") echo "1002 user PEND normal host1 - job2 Nov 11 12:07";;
+esac''',
+    'bqueues': '''
+[ "$1" = "-V" ] && echo "IBM Spectrum LSF 10.1"''',
+    'bsub': '''
+[ "$1" = "-V" ] && echo "IBM Spectrum LSF 10.1"''',
+    'bkill': '''
+[ "$1" = "-V" ] && echo "IBM Spectrum LSF 10.1"''',
+}
+
+class FakeJob(object):
+    def __init__(self, job_id):
+        self._id = job_id
+
+class TestJobStateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        bindir = os.path.join(self.dir, "bin")
+        os.mkdir(bindir)
+        for name, body in FAKE_TOOLS.items():
+            filename = os.path.join(bindir, name)
+            script = '#!/bin/sh\necho "%s $*" >> FAKEDIR/calls\n' \
+                     'fail() { if [ -e FAKEDIR/fail ]; then echo "cannot connect to the batch server"; exit 1; fi; }\n' \
+                     '%s\n' % (name, body)
+            f = open(filename, "w")
+            f.write(script.replace("FAKEDIR", self.dir))
+            f.close()
+            os.chmod(filename, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = bindir + os.pathsep + self.path
+        self.js = None
+
+    def tearDown(self):
+        if self.js:
+            self.js.close()
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.dir)
+
+    def touch(self, name):
+        open(os.path.join(self.dir, name), "w").close()
+
+    def calls(self, prefix):
+        """ Return the logged calls starting with prefix """
+
+        filename = os.path.join(self.dir, "calls")
+        if not os.path.exists(filename):
+            return []
+        return [line.strip() for line in open(filename) if line.startswith(prefix)]
+
+    def resetCalls(self):
+        if os.path.exists(os.path.join(self.dir, "calls")):
+            os.remove(os.path.join(self.dir, "calls"))
+
+    def failListing(self, svc):
+        """ Let the job listings fail from now on, and reset the call log """
+
+        self.touch("fail")
+        self.resetCalls()
+        svc._state_cache.invalidate()
+
+    def service(self, url):
+        self.js = saga.job.Service(url)
+        self.resetCalls()
+        svc = self.js._adaptor
+        # no refresh of the listing during the test
+        svc._state_cache._interval = 3600
+        return svc
+
+    def testSlurm(self):
+        svc = self.service("slurm://localhost")
+        states = [self.js.get_job("[slurm://localhost]-[%s]" % pid).state for pid in ["101", "102", "103"]]
+        self.assertEqual(states, [saga.job.RUNNING, saga.job.PENDING, saga.job.DONE])
+        self.assertEqual(len(self.calls("squeue")), 1)
+        self.assertEqual(self.calls("scontrol"), [])
+
+        # the listing fails: each job is queried on its own
+        self.failListing(svc)
+        states = [self.js.get_job("[slurm://localhost]-[%s]" % pid).state for pid in ["101", "102"]]
+        self.assertEqual(states, [saga.job.RUNNING, saga.job.PENDING])
+        self.assertEqual(len(self.calls("squeue")), 1)
+        self.assertEqual(self.calls("scontrol"), ["scontrol show job 101", "scontrol show job 102"])
+
+    def testPbs(self):
+        svc = self.service("pbs://localhost")
+        self.assertEqual([svc._state_cache.get(pid) for pid in ["1001", "1002", "1003"]], ["R", "Q", None])
+        self.assertEqual(self.calls("qstat"), ["qstat -u %s" % (USER)])
+
+        # the listing fails: the monitor queries each job on its own
+        self.failListing(svc)
+        self.assertEqual([svc._state_cache.get(pid) for pid in ["1001", "1002"]], [None, None])
+        job_id = "[pbs://localhost]-[1001]"
+        svc.jobs[job_id] = {'job_id': job_id, 'state': saga.job.PENDING, 'gone': False}
+        self.assertEqual(svc._job_get_info(job_id)['state'], saga.job.RUNNING)
+        self.assertEqual(self.calls("qstat"), ["qstat -u %s" % (USER), "qstat -f1 1001"])
+
+    def testSge(self):
+        self.touch("sge")
+        svc = self.service("sge://localhost")
+        states = [svc._retrieve_job("[sge://localhost]-[%s]" % pid)['state'] for pid in ["1001", "1002"]]
+        self.assertEqual(states, [saga.job.RUNNING, saga.job.PENDING])
+        self.assertEqual([c for c in self.calls("qstat") if not c.startswith("qstat -j")], ["qstat -u %s" % (USER)])
+
+        # the listing fails: each job is looked for in the qstat output on its own
+        self.failListing(svc)
+        states = [svc._retrieve_job("[sge://localhost]-[%s]" % pid)['state'] for pid in ["1001", "1002"]]
+        self.assertEqual(states, [saga.job.RUNNING, saga.job.PENDING])
+        self.assertEqual([c for c in self.calls("qstat") if not c.startswith("qstat -j")], ["qstat -u %s" % (USER), "qstat", "qstat"])
+
+    def testLsf(self):
+        svc = self.service("lsf://localhost")
+        jobs = [FakeJob("[lsf://localhost]-[%s]" % pid) for pid in ["1001", "1002"]]
+        for job in jobs:
+            svc.jobs[job] = {'job_id': job._id, 'state': saga.job.PENDING, 'gone': False}
+        self.assertEqual([svc._job_get_info(job)['state'] for job in jobs], [saga.job.RUNNING, saga.job.PENDING])
+        self.assertEqual(self.calls("bjobs"), ["bjobs -noheader -a"])
+
+        # the listing fails: each job is queried on its own
+        self.failListing(svc)
+        self.assertEqual([svc._job_get_info(job)['state'] for job in jobs], [saga.job.RUNNING, saga.job.PENDING])
+        self.assertEqual(self.calls("bjobs"), ["bjobs -noheader -a", "bjobs -noheader 1001", "bjobs -noheader 1002"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from glob import glob
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from StateSnapshot import writeAtomic
+
+class TestWriteAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.workdir = os.path.join(self.dir, "Panda_Pilot_1_1")
+        os.mkdir(self.workdir)
+        self.filename = os.path.join(self.workdir, "jobState-1234.pickle")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def jobStateFiles(self):
+        """ The job state files found by job recovery, deferred stage-out and the site dir cleanup """
+
+        return sorted(set(glob(self.dir + "/Panda_Pilot_*/jobState-*.*") +
+                          glob(self.dir + "/*/jobState-*") +
+                          glob(self.workdir + "/jobState-*")))
+
+    def testTemporaryFileDoesNotMatchJobStateGlobs(self):
+        seen = []
+        def dump(data, f):
+            f.write(data)
+            seen.append((os.listdir(self.workdir), self.jobStateFiles()))
+            # as if the pilot was killed before the rename
+            raise KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, writeAtomic, self.filename, "state", dump=dump)
+        self.assertEqual(seen, [([".jobState-1234.pickle.tmp.%d" % os.getpid()], [])])
+        self.assertEqual(os.listdir(self.workdir), [])
+
+        writeAtomic(self.filename, "state")
+        self.assertEqual(self.jobStateFiles(), [self.filename])
+        self.assertEqual(open(self.filename).read(), "state")
+
+if __name__ == "__main__":
+    unittest.main()
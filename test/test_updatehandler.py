@@ -0,0 +1,58 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import RunJobUtilities
+from Job import Job
+from Configuration import Configuration
+from PilotTCPServer import PilotTCPServer
+from UpdateHandler import UpdateHandler
+from PandaServerClient import PandaServerClient
+
+class TestUpdateHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.env = Configuration()
+        self.env['pilot_initdir'] = self.dir
+        self.server = PilotTCPServer(UpdateHandler)
+        self.server.start()
+
+    def tearDown(self):
+        RunJobUtilities.closePilotServerConnection("localhost", self.server.port)
+        self.server.srv.shutdown()
+        self.server.srv.server_close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def testJsonUpdateThenFinalServerUpdate(self):
+        # the job of the pilot, and the same job as runJob sees it
+        job = Job()
+        job.jobId = 1234
+        self.env['jobDic'] = {'prod': [os.getpid(), job, os.getpgrp()]}
+        child = Job()
+        child.jobId = 1234
+        child.result = ["running", 0, 0]
+        child.timeSetup = 3
+        child.timeStageIn = 12
+        child.timeExe = 345
+        child.timeStageOut = 6
+        child.filesWithFAX = 2
+        child.bytesWithFAX = 1000
+
+        self.assertEqual(RunJobUtilities.updateJobInfo(child, "localhost", self.server.port), "OK")
+
+        self.assertEqual(job.filesWithFAX, 2)
+        self.assertEqual((job.timeSetup, job.timeStageIn, job.timeExe, job.timeStageOut), ("3", "12", "345", "6"))
+        params = PandaServerClient(pilot_initdir=self.dir).getFAXRecoveryParams(job)
+        self.assertEqual(params['pid'], 1234)
+        self.assertTrue(params['message'].endswith(',"bytesWithFAX":1000,"bytesWithoutFAX":0,"timeToCopy":12'))
+
+if __name__ == "__main__":
+    unittest.main()